@@ -0,0 +1,152 @@
+"""
+Cache do vínculo do usuário com o tenant (TenantMembership) e das permissões efetivas.
+
+is_tenant_admin e HasTenantPermission consultavam o TenantMembership no schema
+public a cada chamada. obter_acesso() devolve o AcessoTenant do par
+(usuário, tenant) a partir do cache compartilhado (ACESSO_TENANT_TTL segundos);
+por requisição, o ContextoUsuario (accounts.contexto) memoiza o resultado.
+
+As permissões efetivas ficam pré-calculadas num bitset (PERMISSOES), com o
+mesmo mapa de TenantMembership.has_permission. Roles customizados não têm
+permissões aqui: as ações deles são por módulo (matriz em
+accounts.matriz_permissoes).
+
+Signals de TenantMembership invalidam o cache depois do commit (antes disso
+outra requisição poderia recarregar o estado antigo).
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_tenants.utils import schema_context
+
+from core.prometheus import registrar_cache
+
+from .models import TenantMembership
+
+logger = logging.getLogger(__name__)
+
+# Ordem fixa: a posição de cada permissão é o seu bit (não reordenar, só acrescentar no fim)
+PERMISSOES = (
+    'view', 'add', 'change', 'delete',
+    'export', 'import', 'approve', 'reject', 'manage',
+    'manage_users', 'manage_permissions', 'manage_roles',
+    'manage_empresas', 'manage_filiais',
+    'manage_settings', 'manage_configurations',
+    'manage_stripe', 'manage_subscriptions', 'manage_payments',
+    'full_access',
+)
+BITS = {permissao: 1 << posicao for posicao, permissao in enumerate(PERMISSOES)}
+
+
+def mascara(permissoes):
+    """Bitset de uma lista de permissões (nomes desconhecidos são ignorados)"""
+    valor = 0
+    for permissao in permissoes:
+        valor |= BITS.get(permissao, 0)
+    return valor
+
+
+def permissoes_da_mascara(valor):
+    """Lista de permissões de um bitset, na ordem de PERMISSOES"""
+    return [permissao for permissao in PERMISSOES if valor & BITS[permissao]]
+
+
+class AcessoTenant:
+    """Vínculo de um usuário com um tenant e suas permissões efetivas"""
+
+    def __init__(self, role=None, ativo=False, permissoes=0):
+        self.role = role
+        self.ativo = ativo
+        self.permissoes = permissoes
+
+    @property
+    def is_tenant_admin(self):
+        """Mesma regra de TenantMembership.is_tenant_admin"""
+        return self.ativo and self.role == 'admin'
+
+    def tem_permissao(self, permissao):
+        """Permissão no tenant (membership ativo e bit do role)"""
+        return self.ativo and bool(self.permissoes & BITS.get(permissao, 0))
+
+    def _dados(self):
+        return {'role': self.role, 'ativo': self.ativo, 'permissoes': self.permissoes}
+
+
+def _chave(user_id, tenant_id):
+    return f'acesso_tenant:{user_id}:{tenant_id}'
+
+
+def _permissoes_do_role(role):
+    """Bitset do role (roles customizados: nenhuma permissão fora da matriz por módulo)"""
+    membro = TenantMembership(role=role)
+    return mascara(p for p in PERMISSOES if membro.has_permission(p))
+
+
+def _carregar(user_id, tenant_id):
+    with schema_context('public'):
+        membership = (
+            TenantMembership.objects.filter(user_id=user_id, tenant_id=tenant_id)
+            .only('role', 'is_active')
+            .first()
+        )
+        if membership is None or not membership.is_active:
+            return AcessoTenant(role=membership.role if membership else None)
+        return AcessoTenant(
+            role=membership.role,
+            ativo=True,
+            permissoes=_permissoes_do_role(membership.role),
+        )
+
+
+def obter_acesso(user_id, tenant_id):
+    """
+    Vínculo (role, ativo, bitset de permissões) do usuário no tenant.
+
+    Args:
+        user_id: ID do usuário
+        tenant_id: ID do tenant
+
+    Returns:
+        AcessoTenant (inativo e sem permissões se não houver membership)
+    """
+    if not user_id or not tenant_id:
+        return AcessoTenant()
+
+    chave = _chave(user_id, tenant_id)
+    try:
+        dados = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[AcessoTenant] Cache indisponível: {e}')
+        dados = None
+    registrar_cache('acesso_tenant', dados is not None)
+    if dados is not None:
+        return AcessoTenant(**dados)
+
+    acesso = _carregar(user_id, tenant_id)
+    try:
+        cache.set(chave, acesso._dados(), getattr(settings, 'ACESSO_TENANT_TTL', 300))
+    except Exception as e:
+        logger.warning(f'[AcessoTenant] Cache indisponível: {e}')
+    return acesso
+
+
+def invalidar_acesso(pares):
+    """Remove do cache os pares (user_id, tenant_id)"""
+    chaves = [_chave(user_id, tenant_id) for user_id, tenant_id in pares]
+    if not chaves:
+        return
+    try:
+        cache.delete_many(chaves)
+    except Exception as e:
+        logger.warning(f'[AcessoTenant] Erro ao invalidar cache: {e}')
+
+
+@receiver(post_save, sender=TenantMembership)
+@receiver(post_delete, sender=TenantMembership)
+def _invalidar_membership(sender, instance, **kwargs):
+    pares = [(instance.user_id, instance.tenant_id)]
+    transaction.on_commit(lambda: invalidar_acesso(pares))
@@ -28,8 +28,64 @@ class TenantMembershipSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'joined_at', 'created_at', 'updated_at']
 
 
+def contexto_em_lote(users, tenant):
+    """
+    Memberships, perfis e empresas/filiais ativas de vários usuários, em consultas únicas.
+    
+    O resultado vai no contexto do UserSerializer (listagens), que passa a não
+    consultar o banco por usuário.
+    
+    Args:
+        users: Usuários a serializar
+        tenant: Tenant atual
+    
+    Returns:
+        dict com 'user_ids', 'memberships' e 'profiles' (por user_id),
+        'empresas_ativas' e 'filiais_ativas' (ids)
+    """
+    user_ids = [user.pk for user in users]
+    contexto = {
+        'user_ids': set(user_ids),
+        'memberships': {},
+        'profiles': {},
+        'empresas_ativas': set(),
+        'filiais_ativas': set(),
+    }
+    if not user_ids or not tenant:
+        return contexto
+    
+    with schema_context('public'):
+        contexto['memberships'] = {
+            m.user_id: m for m in TenantMembership.objects.filter(tenant=tenant, user_id__in=user_ids)
+        }
+        contexto['profiles'] = {
+            p.user_id: p for p in UserProfile.objects.filter(user_id__in=user_ids)
+        }
+    
+    perfis_do_tenant = [p for p in contexto['profiles'].values() if p.current_tenant_id == tenant.pk]
+    empresa_ids = {p.current_empresa_id for p in perfis_do_tenant if p.current_empresa_id}
+    filial_ids = {p.current_filial_id for p in perfis_do_tenant if p.current_filial_id}
+    if empresa_ids or filial_ids:
+        from tenants.models import Empresa, Filial
+        with schema_context(tenant.schema_name):
+            if empresa_ids:
+                contexto['empresas_ativas'] = set(
+                    Empresa.objects.filter(id__in=empresa_ids, is_active=True).values_list('id', flat=True)
+                )
+            if filial_ids:
+                contexto['filiais_ativas'] = set(
+                    Filial.objects.filter(id__in=filial_ids, is_active=True).values_list('id', flat=True)
+                )
+    return contexto
+
+
 class UserSerializer(serializers.ModelSerializer):
-    """Serializer para User com informações do tenant"""
+    """
+    Serializer para User com informações do tenant
+    
+    Em listagens, UserViewSet passa o resultado de contexto_em_lote() no contexto
+    ('lote_usuarios'); sem ele, cada usuário é consultado individualmente.
+    """
     profile = serializers.SerializerMethodField()
     membership = serializers.SerializerMethodField()
     role = serializers.SerializerMethodField()
@@ -44,39 +100,41 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'date_joined', 'last_login']
     
+    def _lote(self, obj):
+        """Dados do usuário: do contexto em lote ou, sem ele, consultados uma vez por usuário"""
+        lote = self.context.get('lote_usuarios')
+        if lote is None or obj.pk not in lote['user_ids']:
+            individuais = self.__dict__.setdefault('_lotes_individuais', {})
+            if obj.pk not in individuais:
+                individuais[obj.pk] = contexto_em_lote([obj], self.context.get('tenant'))
+            lote = individuais[obj.pk]
+        return lote
+    
     def get_profile(self, obj):
         """Retorna informações do perfil do usuário no tenant atual"""
-        try:
-            profile = obj.profile
-            tenant = self.context.get('tenant')
-            if tenant and profile.current_tenant == tenant:
-                return {
-                    'phone': profile.phone,
-                    'current_tenant_id': profile.current_tenant.id if profile.current_tenant else None,
-                    'current_empresa_id': profile.current_empresa.id if profile.current_empresa else None,
-                    'current_filial_id': profile.current_filial.id if profile.current_filial else None,
-                }
-        except UserProfile.DoesNotExist:
-            pass
+        lote = self._lote(obj)
+        profile = lote['profiles'].get(obj.pk)
+        tenant = self.context.get('tenant')
+        if profile and tenant and profile.current_tenant_id == tenant.pk:
+            return {
+                'phone': profile.phone,
+                'current_tenant_id': profile.current_tenant_id,
+                'current_empresa_id': profile.current_empresa_id if profile.current_empresa_id in lote['empresas_ativas'] else None,
+                'current_filial_id': profile.current_filial_id if profile.current_filial_id in lote['filiais_ativas'] else None,
+            }
         return None
     
     def get_membership(self, obj):
         """Retorna informações do membership no tenant atual"""
-        tenant = self.context.get('tenant')
-        if tenant:
-            with schema_context('public'):
-                membership = TenantMembership.objects.filter(
-                    user=obj,
-                    tenant=tenant
-                ).first()
-                if membership:
-                    return {
-                        'id': membership.id,
-                        'role': membership.role,
-                        'role_display': membership.get_role_display(),
-                        'is_active': membership.is_active,
-                        'joined_at': membership.joined_at,
-                    }
+        membership = self._lote(obj)['memberships'].get(obj.pk)
+        if membership:
+            return {
+                'id': membership.id,
+                'role': membership.role,
+                'role_display': membership.get_role_display(),
+                'is_active': membership.is_active,
+                'joined_at': membership.joined_at,
+            }
         return None
     
     def get_role(self, obj):
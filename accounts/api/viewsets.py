@@ -12,7 +12,8 @@ from django_tenants.utils import schema_context
 from accounts.models import UserProfile, TenantMembership
 from accounts.permissions import IsTenantAdmin
 from .serializers import (
-    UserSerializer, UserCreateSerializer, UserUpdateSerializer, TenantMembershipSerializer
+    UserSerializer, UserCreateSerializer, UserUpdateSerializer, TenantMembershipSerializer,
+    contexto_em_lote
 )
 
 User = get_user_model()
@@ -42,16 +43,7 @@ class UserViewSet(viewsets.ModelViewSet):
         
         # Buscar usuários que têm membership no tenant atual (incluindo inativos)
         # Isso garante que todos os usuários sejam exibidos, incluindo o admin logado
-        with schema_context('public'):
-            memberships = TenantMembership.objects.filter(
-                tenant=tenant
-            ).select_related('user')
-            user_ids = [m.user_id for m in memberships]
-        
-        if not user_ids:
-            return User.objects.none()
-        
-        return User.objects.filter(id__in=user_ids).order_by('username')
+        return User.objects.filter(tenant_memberships__tenant=tenant).order_by('username')
     
     def get_serializer_class(self):
         """Retorna o serializer apropriado para cada ação"""
@@ -74,6 +66,25 @@ class UserViewSet(viewsets.ModelViewSet):
         context['tenant'] = tenant
         return context
     
+    def list(self, request, *args, **kwargs):
+        """
+        Lista os usuários do tenant.
+        
+        Memberships, perfis e empresas/filiais da página são carregados em lote
+        (contexto_em_lote): o número de consultas não depende da quantidade de usuários.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        users = page if page is not None else list(queryset)
+        
+        context = self.get_serializer_context()
+        context['lote_usuarios'] = contexto_em_lote(users, context.get('tenant'))
+        serializer = self.get_serializer_class()(users, many=True, context=context)
+        
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     def create(self, request, *args, **kwargs):
         """Cria um novo usuário no tenant"""
         serializer = self.get_serializer(data=request.data)
@@ -179,8 +190,15 @@ class UserViewSet(viewsets.ModelViewSet):
         return result
     
     def _get_user_permissions(self, user, request):
-        """Helper para obter permissões de um usuário"""
-        from accounts.models_roles import CustomRole, ModulePermission
+        """
+        Helper para obter permissões de um usuário.
+        
+        Usa a matriz compilada do role (accounts.matriz_permissoes) e o membership em
+        cache (accounts.acesso). Responde com ETag; se o If-None-Match do cliente for
+        igual à versão atual, retorna 304 sem corpo.
+        """
+        from accounts.acesso import obter_acesso
+        from accounts.matriz_permissoes import matriz_do_role
         
         tenant = getattr(connection, 'tenant', None)
         if not tenant:
@@ -199,133 +217,28 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        with schema_context('public'):
-            membership = TenantMembership.objects.filter(
-                user=user,
-                tenant=tenant
-            ).first()
-            
-            if not membership:
-                return Response(
-                    {'error': 'Membership não encontrado'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            role_code = membership.role
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f'[_get_user_permissions] Role do usuário: {role_code}')
-            
-            # Verificar se é role do sistema ou customizado
-            system_roles = [choice[0] for choice in TenantMembership.ROLE_CHOICES]
-            logger.info(f'[_get_user_permissions] Roles do sistema: {system_roles}')
-            
-            if role_code in system_roles:
-                # Role do sistema - usar permission_map padrão
-                permission_map = {
-                    'admin': [
-                        'view', 'add', 'change', 'delete',
-                        'manage_users', 'manage_permissions', 'manage_roles',
-                        'manage_empresas', 'manage_filiais',
-                        'manage_settings', 'manage_configurations',
-                        'manage_stripe', 'manage_subscriptions', 'manage_payments',
-                        'full_access',
-                    ],
-                    'manager': ['view', 'add', 'change'],
-                    'user': ['view', 'add'],
-                    'viewer': ['view'],
-                }
-                
-                permissions = permission_map.get(role_code, [])
-                
-                # Roles do sistema têm acesso a todos os módulos
-                # Retornar todos os módulos disponíveis com as ações permitidas
-                from accounts.modules_registry import get_available_modules
-                available_modules = get_available_modules()
-                modules = {}
-                for module in available_modules:
-                    # Para roles do sistema, verificar quais ações são permitidas
-                    if role_code == 'admin':
-                        modules[module['code']] = {
-                            'name': module['name'],
-                            'actions': module['actions'],  # Todas as ações
-                        }
-                    elif role_code == 'manager':
-                        modules[module['code']] = {
-                            'name': module['name'],
-                            'actions': ['view', 'add', 'change'],
-                        }
-                    elif role_code == 'user':
-                        modules[module['code']] = {
-                            'name': module['name'],
-                            'actions': ['view', 'add'],
-                        }
-                    elif role_code == 'viewer':
-                        modules[module['code']] = {
-                            'name': module['name'],
-                            'actions': ['view'],
-                        }
-            else:
-                # Role customizado - buscar permissões do CustomRole
-                logger.info(f'[_get_user_permissions] Buscando role customizado: {role_code} para tenant: {tenant}')
-                try:
-                    custom_role = CustomRole.objects.get(
-                        tenant=tenant,
-                        code=role_code,
-                        is_active=True
-                    )
-                    logger.info(f'[_get_user_permissions] Role customizado encontrado: {custom_role.name}')
-                    
-                    # Buscar permissões por módulo
-                    module_perms = ModulePermission.objects.filter(
-                        role=custom_role
-                    ).select_related('role')
-                    
-                    logger.info(f'[_get_user_permissions] Permissões de módulo encontradas: {module_perms.count()}')
-                    
-                    modules = {}
-                    permissions = []
-                    
-                    for perm in module_perms:
-                        logger.info(f'[_get_user_permissions] Módulo: {perm.module}, Ações: {perm.actions}')
-                        modules[perm.module] = {
-                            'name': perm.module_display or perm.module,
-                            'actions': perm.actions or [],
-                        }
-                        # Adicionar ações como permissões globais também
-                        permissions.extend(perm.actions or [])
-                    
-                    # Remover duplicatas
-                    permissions = list(set(permissions))
-                    
-                    logger.info(f'[_get_user_permissions] Módulos finais: {list(modules.keys())}')
-                    logger.info(f'[_get_user_permissions] Permissões finais: {permissions}')
-                    
-                    role_display = custom_role.name
-                except CustomRole.DoesNotExist:
-                    # Role customizado não encontrado
-                    logger.warning(f'[_get_user_permissions] Role customizado não encontrado: {role_code}')
-                    return Response({
-                        'role': role_code,
-                        'role_display': 'Role não encontrado',
-                        'permissions': [],
-                        'modules': {},
-                    })
-            
-            # Obter role_display
-            if role_code in system_roles:
-                role_display = dict(TenantMembership.ROLE_CHOICES).get(role_code, role_code)
-            else:
-                try:
-                    custom_role = CustomRole.objects.get(tenant=tenant, code=role_code)
-                    role_display = custom_role.name
-                except CustomRole.DoesNotExist:
-                    role_display = role_code
-            
+        role_code = obter_acesso(user.pk, tenant.pk).role
+        if not role_code:
+            return Response(
+                {'error': 'Membership não encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        matriz, versao = matriz_do_role(tenant.pk, role_code)
+        etag = f'"{versao}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        if matriz is None:
+            # Role customizado não encontrado
             return Response({
                 'role': role_code,
-                'role_display': role_display,
-                'permissions': permissions,
-                'modules': modules,  # Módulos e suas ações permitidas
-            })
+                'role_display': 'Role não encontrado',
+                'permissions': [],
+                'modules': {},
+            }, headers=headers)
+        
+        return Response(matriz, headers=headers)
 
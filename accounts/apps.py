@@ -6,3 +6,11 @@ class AccountsConfig(AppConfig):
     name = 'accounts'
     verbose_name = 'Accounts'
 
+    def ready(self):
+        # Invalidação do cache de contexto do usuário (signals de UserProfile)
+        from . import contexto  # noqa: F401
+        # Invalidação do cache de membership/permissões (signals de TenantMembership/CustomRole/ModulePermission)
+        from . import acesso  # noqa: F401
+        # Matrizes de permissões dos roles do sistema (ModuleRegistry) e invalidação das customizadas
+        from .matriz_permissoes import compilar_roles_sistema
+        compilar_roles_sistema()
@@ -0,0 +1,81 @@
+"""
+Autenticação JWT com o token validado uma única vez por requisição.
+
+O TenantDomainHeaderMiddleware valida o token (assinatura, expiração e tipo)
+para rotear o tenant pelo claim `tenant_schema` e guarda o token validado no
+request. CachedJWTAuthentication e as permissões (accounts.permissions)
+reutilizam esse token em vez de decodificá-lo de novo.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+
+def _request_django(request):
+    # rest_framework.request.Request -> HttpRequest (o atributo fica no request original)
+    return getattr(request, '_request', request)
+
+
+def token_validado(request, raw_token=None):
+    """
+    Token JWT validado da requisição (memoizado no request).
+
+    Args:
+        request: HttpRequest ou Request do DRF
+        raw_token: Token bruto (bytes); padrão: extraído do header Authorization
+
+    Returns:
+        Token validado, ou None se não houver token ou ele for inválido
+    """
+    django_request = _request_django(request)
+    autenticacao = JWTAuthentication()
+    
+    if raw_token is None:
+        header = autenticacao.get_header(django_request)
+        if header is None:
+            return None
+        try:
+            raw_token = autenticacao.get_raw_token(header)
+        except AuthenticationFailed:
+            return None
+        if raw_token is None:
+            return None
+    
+    memo = getattr(django_request, '_jwt_validado', None)
+    if memo is not None and memo[0] == raw_token:
+        return memo[1]
+    
+    try:
+        token = autenticacao.get_validated_token(raw_token)
+    except InvalidToken:
+        token = None
+    django_request._jwt_validado = (raw_token, token)
+    return token
+
+
+def token_da_requisicao(request):
+    """Token da requisição: request.auth (DRF) ou o validado pelo middleware"""
+    token = getattr(request, 'auth', None)
+    if token is not None and hasattr(token, 'get'):
+        return token
+    memo = getattr(_request_django(request), '_jwt_validado', None)
+    return memo[1] if memo is not None else None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que reutiliza o token já validado no middleware"""
+    
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        
+        validated_token = token_validado(request, raw_token)
+        if validated_token is None:
+            # Validar de novo só para levantar InvalidToken com os detalhes do erro
+            validated_token = self.get_validated_token(raw_token)
+        
+        return self.get_user(validated_token), validated_token
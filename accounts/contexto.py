@@ -0,0 +1,172 @@
+"""
+Contexto do usuário na requisição (tenant, empresa e filial atuais).
+
+UserProfile.current_empresa/current_filial fazem SQL no tenants_tenant, trocam
+de schema e buscam a Empresa/Filial a cada acesso. O contexto é montado uma vez
+por requisição (memoizado no request) e guardado no cache compartilhado por
+CONTEXTO_USUARIO_TTL segundos, com chave usuário + schema da requisição.
+
+O cache é invalidado quando o UserProfile é salvo (select_empresa_filial, login)
+ou excluído; alterações em Empresa/Filial valem após o TTL.
+
+Uso:
+    contexto = contexto_do_usuario(request)
+    contexto.empresa, contexto.filial, contexto.is_tenant_admin
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_tenants.utils import schema_context
+
+from core.prometheus import registrar_cache
+from tenants.models import Empresa, Filial
+
+from .models import TenantMembership, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _chave(user_id, schema_name):
+    return f'contexto_usuario:{user_id}:{schema_name}'
+
+
+class ContextoUsuario:
+    """Tenant/empresa/filial atuais de um usuário (dados do UserProfile)"""
+
+    def __init__(self, user=None, tenant_id=None, schema_name=None, empresa=None, filial=None):
+        self.user = user
+        self.tenant_id = tenant_id
+        self.schema_name = schema_name
+        self.empresa = empresa
+        self.filial = filial
+        self._acesso = None
+
+    @property
+    def empresa_filial(self):
+        return (self.empresa, self.filial)
+
+    @property
+    def acesso(self):
+        """Vínculo com o tenant do perfil (accounts.acesso), memoizado por requisição"""
+        if self._acesso is None:
+            from .acesso import obter_acesso
+            self._acesso = obter_acesso(getattr(self.user, 'pk', None), self.tenant_id)
+        return self._acesso
+
+    @property
+    def is_tenant_admin(self):
+        """Mesma regra de accounts.permissions.is_tenant_admin, sem consulta com cache quente"""
+        return self.acesso.is_tenant_admin
+
+    def _dados(self):
+        return {
+            'tenant_id': self.tenant_id,
+            'schema_name': self.schema_name,
+            'empresa': self.empresa,
+            'filial': self.filial,
+        }
+
+
+def _carregar(user):
+    """Monta o contexto a partir do UserProfile (mesmas regras de current_empresa/current_filial)"""
+    profile = UserProfile.objects.select_related('current_tenant').filter(user_id=user.pk).first()
+    if not profile or not profile.current_tenant:
+        return ContextoUsuario(user)
+
+    schema_name = profile.current_tenant.schema_name
+    empresa = filial = None
+    with schema_context(schema_name):
+        if profile.current_empresa_id:
+            empresa = Empresa.objects.filter(id=profile.current_empresa_id, is_active=True).first()
+        if profile.current_filial_id:
+            filial = Filial.objects.select_related('empresa').filter(
+                id=profile.current_filial_id, is_active=True
+            ).first()
+    return ContextoUsuario(user, profile.current_tenant_id, schema_name, empresa, filial)
+
+
+def obter_contexto(user):
+    """
+    Contexto do usuário no schema atual, pelo cache compartilhado.
+
+    Args:
+        user: Instância de User
+
+    Returns:
+        ContextoUsuario (vazio para usuário anônimo ou sem perfil)
+    """
+    if not user or not user.is_authenticated:
+        return ContextoUsuario(user)
+
+    chave = _chave(user.pk, connection.schema_name)
+    try:
+        dados = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[ContextoUsuario] Cache indisponível: {e}')
+        dados = None
+
+    registrar_cache('contexto_usuario', dados is not None)
+    if dados is not None:
+        return ContextoUsuario(user, **dados)
+
+    contexto = _carregar(user)
+    try:
+        cache.set(chave, contexto._dados(), getattr(settings, 'CONTEXTO_USUARIO_TTL', 60))
+    except Exception as e:
+        logger.warning(f'[ContextoUsuario] Cache indisponível: {e}')
+    return contexto
+
+
+def contexto_do_usuario(request):
+    """
+    Contexto do usuário autenticado da requisição, memoizado no request.
+
+    Aceita HttpRequest ou Request do DRF (o memo fica no HttpRequest, compartilhado
+    entre viewset, serializers e permissões).
+    """
+    django_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+
+    contexto = getattr(django_request, '_contexto_usuario', None)
+    if contexto is not None and user is not None and contexto.user is not None and contexto.user.pk == user.pk:
+        return contexto
+
+    contexto = obter_contexto(user)
+    if user is not None and user.is_authenticated:
+        django_request._contexto_usuario = contexto
+    return contexto
+
+
+def invalidar_contexto_usuario(user_id, schemas=None):
+    """
+    Remove o contexto do usuário do cache compartilhado.
+
+    Args:
+        user_id: ID do usuário
+        schemas: Schemas a invalidar (padrão: public + tenants dos quais o usuário é membro)
+    """
+    if schemas is None:
+        with schema_context('public'):
+            schemas = set(
+                TenantMembership.objects.filter(user_id=user_id)
+                .values_list('tenant__schema_name', flat=True)
+            )
+            schemas.update(
+                UserProfile.objects.filter(user_id=user_id, current_tenant__isnull=False)
+                .values_list('current_tenant__schema_name', flat=True)
+            )
+        schemas.add('public')
+    try:
+        cache.delete_many([_chave(user_id, schema) for schema in schemas])
+    except Exception as e:
+        logger.warning(f'[ContextoUsuario] Erro ao invalidar cache: {e}')
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _invalidar_contexto_perfil(sender, instance, **kwargs):
+    invalidar_contexto_usuario(instance.user_id)
@@ -0,0 +1,195 @@
+"""
+Matriz compilada de permissões por role (módulo -> ações).
+
+UserViewSet._get_user_permissions montava o mapa a cada chamada (mapas fixos,
+get_available_modules() e ModulePermission). Aqui a matriz de cada role é
+compilada uma vez:
+
+- roles do sistema (admin, manager, user, viewer): a partir do ModuleRegistry,
+  na inicialização (AccountsConfig.ready)
+- roles customizados: a partir dos ModulePermission do CustomRole, guardada no
+  cache compartilhado com a versão de permissões do tenant na chave
+
+A versão do tenant muda (valor aleatório novo) depois do commit de cada alteração
+de CustomRole ou ModulePermission, o que invalida as matrizes antigas. versao_permissoes() gera o
+valor usado no ETag de my_permissions/permissions e no claim `perm_version` do JWT.
+"""
+import hashlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_tenants.utils import schema_context
+
+from core.prometheus import registrar_cache
+
+from .acesso import PERMISSOES
+from .models import TenantMembership
+from .models_roles import CustomRole, ModulePermission
+from .modules_registry import get_available_modules
+
+logger = logging.getLogger(__name__)
+
+# Ações de cada role do sistema nos módulos (admin: todas as ações do módulo)
+ACOES_MODULO_SISTEMA = {
+    'manager': ['view', 'add', 'change'],
+    'user': ['view', 'add'],
+    'viewer': ['view'],
+}
+
+# role -> matriz compilada dos roles do sistema
+_matrizes_sistema = {}
+# Hash do ModuleRegistry usado na compilação (versão das matrizes do sistema)
+_versao_sistema = None
+
+
+def _ttl():
+    return getattr(settings, 'MATRIZ_PERMISSOES_TTL', 3600)
+
+
+def compilar_roles_sistema():
+    """Compila as matrizes dos roles do sistema a partir do ModuleRegistry"""
+    global _versao_sistema
+    modulos = get_available_modules()
+    membro = TenantMembership()
+    roles = dict(TenantMembership.ROLE_CHOICES)
+
+    matrizes = {}
+    for role, role_display in roles.items():
+        membro.role = role
+        permissions = [p for p in PERMISSOES if membro.has_permission(p)]
+        matrizes[role] = {
+            'role': role,
+            'role_display': role_display,
+            'permissions': permissions,
+            'modules': {
+                modulo['code']: {
+                    'name': modulo['name'],
+                    'actions': list(modulo['actions']) if role == 'admin' else list(ACOES_MODULO_SISTEMA.get(role, [])),
+                }
+                for modulo in modulos
+            },
+        }
+
+    _matrizes_sistema.clear()
+    _matrizes_sistema.update(matrizes)
+    _versao_sistema = hashlib.sha1(json.dumps(matrizes, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _chave_versao(tenant_id):
+    return f'matriz_permissoes:versao:{tenant_id}'
+
+
+def versao_tenant(tenant_id):
+    """Versão atual das permissões customizadas do tenant (criada se não existir)"""
+    chave = _chave_versao(tenant_id)
+    try:
+        versao = cache.get(chave)
+        if versao is None:
+            cache.add(chave, uuid.uuid4().hex[:12], None)
+            versao = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[MatrizPermissoes] Cache indisponível: {e}')
+        versao = None
+    # Sem cache: versão descartável (ETag nunca coincide, resposta sempre completa)
+    return versao or uuid.uuid4().hex[:12]
+
+
+def renovar_versao_tenant(tenant_id):
+    """Nova versão de permissões do tenant (matrizes e ETags antigos deixam de valer)"""
+    try:
+        cache.set(_chave_versao(tenant_id), uuid.uuid4().hex[:12], None)
+    except Exception as e:
+        logger.warning(f'[MatrizPermissoes] Erro ao renovar versão: {e}')
+
+
+def _e_role_sistema(role):
+    return role in dict(TenantMembership.ROLE_CHOICES)
+
+
+def versao_permissoes(tenant_id, role):
+    """
+    Versão da matriz do role no tenant (ETag e claim `perm_version` do JWT).
+
+    Muda quando o role do usuário, o ModuleRegistry (roles do sistema) ou os
+    roles customizados do tenant mudam.
+    """
+    if not _matrizes_sistema:
+        compilar_roles_sistema()
+    if _e_role_sistema(role):
+        return f'{role}.{_versao_sistema}'
+    return f'{role}.{versao_tenant(tenant_id)}'
+
+
+def _compilar_role_customizado(tenant_id, role):
+    with schema_context('public'):
+        custom_role = CustomRole.objects.filter(tenant_id=tenant_id, code=role, is_active=True).first()
+        if custom_role is None:
+            return None
+
+        modules = {}
+        permissions = []
+        for perm in ModulePermission.objects.filter(role=custom_role).order_by('module'):
+            modules[perm.module] = {
+                'name': perm.module_display or perm.module,
+                'actions': perm.actions or [],
+            }
+            # Ações também valem como permissões globais
+            permissions.extend(a for a in (perm.actions or []) if a not in permissions)
+
+    return {
+        'role': role,
+        'role_display': custom_role.name,
+        'permissions': permissions,
+        'modules': modules,
+    }
+
+
+def matriz_do_role(tenant_id, role):
+    """
+    Matriz do role (formato de UserViewSet.my_permissions).
+
+    Returns:
+        Tupla (matriz, versão); matriz é None se o role customizado não existir
+    """
+    versao = versao_permissoes(tenant_id, role)
+    if _e_role_sistema(role):
+        return _matrizes_sistema[role], versao
+
+    chave = f'matriz_permissoes:{tenant_id}:{versao}'
+    try:
+        matriz = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[MatrizPermissoes] Cache indisponível: {e}')
+        matriz = None
+    registrar_cache('matriz_permissoes', matriz is not None)
+    if matriz is None:
+        matriz = _compilar_role_customizado(tenant_id, role) or {}
+        try:
+            cache.set(chave, matriz, _ttl())
+        except Exception as e:
+            logger.warning(f'[MatrizPermissoes] Cache indisponível: {e}')
+    return (matriz or None), versao
+
+
+@receiver(post_save, sender=CustomRole)
+@receiver(post_delete, sender=CustomRole)
+def _renovar_versao_custom_role(sender, instance, **kwargs):
+    # Só depois do commit: antes disso outra requisição compilaria as linhas
+    # antigas e as guardaria na versão nova
+    tenant_id = instance.tenant_id
+    transaction.on_commit(lambda: renovar_versao_tenant(tenant_id))
+
+
+@receiver(post_save, sender=ModulePermission)
+@receiver(post_delete, sender=ModulePermission)
+def _renovar_versao_module_permission(sender, instance, **kwargs):
+    # Tenant resolvido agora: depois do commit o role pode ter sido excluído junto (cascade)
+    tenant_id = CustomRole.all_objects.filter(pk=instance.role_id).values_list('tenant_id', flat=True).first()
+    if tenant_id:
+        transaction.on_commit(lambda: renovar_versao_tenant(tenant_id))
@@ -4,12 +4,17 @@ Permissões customizadas baseadas no papel (role) do usuário no tenant atual.
 A role é armazenada no TenantMembership e também incluída no token JWT
 no campo `role` (ver accounts.views.login). Aqui usamos esse campo do token
 para evitar consultas extras ao banco a cada requisição.
+
+O vínculo com o tenant (admin, permissões efetivas) vem do cache de
+accounts.acesso, memoizado por requisição no contexto do usuário.
 """
 
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 from django.db import connection
-from django_tenants.utils import schema_context
-from .models import TenantMembership, UserProfile
+from .acesso import obter_acesso
+from .authentication import token_da_requisicao
+from .contexto import contexto_do_usuario
+from .models import UserProfile
 
 
 class HasProdutoPermission(BasePermission):
@@ -49,8 +54,9 @@ class HasProdutoPermission(BasePermission):
             return True
 
         # Tentar obter a role do token JWT (campo 'role' adicionado em accounts.views.login)
+        # O token já foi validado uma vez (middleware/autenticação) e é reutilizado aqui
         role = None
-        token = getattr(request, "auth", None)
+        token = token_da_requisicao(request)
         if token is not None:
             # `token` é um AccessToken (dict-like)
             role = token.get("role", None)
@@ -108,18 +114,8 @@ def is_tenant_admin(user, tenant=None):
     if not tenant:
         return False
     
-    # Verificar membership no schema público
-    with schema_context('public'):
-        membership = TenantMembership.objects.filter(
-            user=user,
-            tenant=tenant,
-            is_active=True
-        ).first()
-        
-        if membership and membership.is_tenant_admin():
-            return True
-    
-    return False
+    # Verificar membership (cache compartilhado de accounts.acesso, sem consulta com cache quente)
+    return obter_acesso(user.pk, tenant.pk).is_tenant_admin
 
 
 class IsTenantAdmin(BasePermission):
@@ -134,7 +130,7 @@ class IsTenantAdmin(BasePermission):
     """
     
     def has_permission(self, request, view):
-        return is_tenant_admin(request.user)
+        return contexto_do_usuario(request).is_tenant_admin
 
 
 class HasTenantPermission(BasePermission):
@@ -163,21 +159,10 @@ class HasTenantPermission(BasePermission):
             return False
         
         # Verificar se é admin do tenant (tem acesso total)
-        if is_tenant_admin(user):
+        contexto = contexto_do_usuario(request)
+        if contexto.is_tenant_admin:
             return True
         
-        # Tentar obter a role do token JWT
-        role = None
-        token = getattr(request, "auth", None)
-        if token is not None:
-            role = token.get("role", None)
-        
-        if not role:
-            # Sem role no token → ser conservador e negar acesso de escrita
-            return request.method in SAFE_METHODS
-        
-        allowed_perms = self.permission_map.get(str(role), set())
-        
         # Mapear método HTTP para permissão lógica
         if request.method in SAFE_METHODS:
             required_perm = "view"
@@ -190,7 +175,21 @@ class HasTenantPermission(BasePermission):
         else:
             return False
         
-        return required_perm in allowed_perms
+        # Permissões efetivas do membership (bitset em cache)
+        if contexto.acesso.ativo:
+            return contexto.acesso.tem_permissao(required_perm)
+        
+        # Sem membership ativo no tenant do perfil → usar a role do token JWT
+        role = None
+        token = token_da_requisicao(request)
+        if token is not None:
+            role = token.get("role", None)
+        
+        if not role:
+            # Sem role no token → ser conservador e negar acesso de escrita
+            return request.method in SAFE_METHODS
+        
+        return required_perm in self.permission_map.get(str(role), set())
     
     def has_object_permission(self, request, view, obj):
         """
@@ -198,7 +197,7 @@ class HasTenantPermission(BasePermission):
         Admin do tenant tem acesso a todos os objetos do tenant.
         """
         # Admin do tenant tem acesso a todos os objetos do tenant
-        if is_tenant_admin(request.user):
+        if contexto_do_usuario(request).is_tenant_admin:
             return True
         
         # Para outros usuários, verificar permissão básica
@@ -1,12 +1,27 @@
 """
 Testes para autenticação e contas
 """
-from django.test import TestCase, override_settings
+from unittest import mock
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from rest_framework.request import Request
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django_tenants.utils import schema_context
-from tenants.models import Tenant, Domain
+from accounts.authentication import CachedJWTAuthentication, token_da_requisicao
+from accounts.contexto import contexto_do_usuario
+from accounts.matriz_permissoes import matriz_do_role, versao_permissoes
+from accounts.models_roles import CustomRole, ModulePermission
+from accounts.permissions import HasTenantPermission
+from cadastros.utils import get_current_empresa_filial
+from siscr.middleware import TenantDomainHeaderMiddleware
+from tenants.models import Tenant, Domain, Empresa, Filial
 from accounts.models import UserProfile, TenantMembership
 from subscriptions.models import Plan
 
@@ -193,3 +208,213 @@ class AuthenticationTests(TestCase):
             status.HTTP_400_BAD_REQUEST,  # Se não conseguiu identificar tenant
             status.HTTP_401_UNAUTHORIZED  # Se credenciais inválidas
         ])
+    
+    def test_token_validado_uma_vez_por_requisicao(self):
+        """Middleware valida o token para rotear o tenant; autenticação e permissões reutilizam"""
+        access = RefreshToken.for_user(self.user).access_token
+        access['tenant_schema'] = self.tenant.schema_name
+        access['role'] = 'admin'
+        request = RequestFactory().get('/api/cadastros/produtos/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        middleware = TenantDomainHeaderMiddleware(lambda r: HttpResponse())
+        
+        with mock.patch.object(
+            JWTAuthentication, 'get_validated_token', autospec=True,
+            side_effect=JWTAuthentication.get_validated_token
+        ) as validar:
+            middleware(request)
+            self.assertEqual(request.tenant.schema_name, 'test_tenant')
+            
+            connection.set_schema_to_public()
+            drf_request = Request(request)
+            user, token = CachedJWTAuthentication().authenticate(drf_request)
+            self.assertEqual(user, self.user)
+            self.assertEqual(token_da_requisicao(drf_request)['role'], 'admin')
+        
+        self.assertEqual(validar.call_count, 1)
+    
+    def test_token_invalido_nao_roteia_tenant(self):
+        """Token com assinatura inválida não seleciona tenant pelo claim"""
+        access = RefreshToken.for_user(self.user).access_token
+        access['tenant_schema'] = self.tenant.schema_name
+        request = RequestFactory().get('/api/cadastros/produtos/', HTTP_AUTHORIZATION=f'Bearer {access}x')
+        
+        TenantDomainHeaderMiddleware(lambda r: HttpResponse())(request)
+        
+        self.assertFalse(getattr(request, '_tenant_identified_by_header', False))
+        self.assertIsNone(token_da_requisicao(request))
+    
+    def test_my_permissions_etag(self):
+        """my_permissions responde com ETag = claim perm_version do JWT e 304 se não mudou"""
+        login_response = self.client.post('/api/auth/login/', {
+            'username': 'testuser',
+            'password': 'testpass123',
+            'domain': 'test.localhost'
+        }, format='json')
+        self.assertEqual(login_response.status_code, status.HTTP_200_OK)
+        access = login_response.data['access']
+        versao = AccessToken(access)['perm_version']
+        
+        url = '/api/accounts/usuarios/me/permissions/'
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {access}', 'HTTP_X_TENANT_DOMAIN': 'test.localhost'}
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{versao}"')
+        self.assertEqual(response.data['role'], 'admin')
+        self.assertIn('cadastros', response.data['modules'])
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{versao}"', **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def _criar_membros(self, quantidade, inicio=0):
+        with schema_context('public'):
+            for i in range(inicio, inicio + quantidade):
+                membro = User.objects.create_user(username=f'membro{i}', password='testpass123')
+                UserProfile.objects.create(user=membro, current_tenant=self.tenant)
+                TenantMembership.objects.create(user=membro, tenant=self.tenant, role='user', is_active=True)
+    
+    def test_listagem_usuarios_consultas_constantes(self):
+        """Listar usuários do tenant faz o mesmo número de consultas para 3 ou 13 usuários"""
+        self.client.force_authenticate(user=self.user)
+        url = '/api/accounts/usuarios/'
+        
+        def contar_consultas():
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(url, HTTP_X_TENANT_DOMAIN='test.localhost')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(consultas), response.data
+        
+        self._criar_membros(2)
+        contar_consultas()  # Aquece os caches de tenant/contexto/membership
+        poucos, dados = contar_consultas()
+        self.assertEqual(dados['count'], 3)
+        
+        self._criar_membros(10, inicio=2)
+        muitos, dados = contar_consultas()
+        self.assertEqual(dados['count'], 13)
+        self.assertEqual(muitos, poucos)
+        self.assertEqual({u['role'] for u in dados['results']}, {'admin', 'user'})
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+class UserContextTests(TestCase):
+    """Testes do contexto do usuário (empresa/filial atuais)"""
+    
+    def setUp(self):
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_contexto',
+                name='Tenant Contexto',
+                is_active=True
+            )
+            self.user = User.objects.create_user(username='contexto', password='testpass123')
+            TenantMembership.objects.create(user=self.user, tenant=self.tenant, role='user', is_active=True)
+        
+        with schema_context(self.tenant.schema_name):
+            self.empresa = Empresa.objects.create(
+                tenant=self.tenant,
+                nome='Empresa Contexto',
+                razao_social='Empresa Contexto LTDA',
+                cnpj='12345678000199',
+                is_active=True
+            )
+            self.filial_a = Filial.objects.create(empresa=self.empresa, nome='Filial A', codigo_filial='FA', is_active=True)
+            self.filial_b = Filial.objects.create(empresa=self.empresa, nome='Filial B', codigo_filial='FB', is_active=True)
+        
+        with schema_context('public'):
+            self.profile = UserProfile.objects.create(user=self.user, current_tenant=self.tenant)
+            self.profile.current_empresa = self.empresa
+            self.profile.current_filial = self.filial_a
+            self.profile.save()
+    
+    def _request(self):
+        request = RequestFactory().get('/api/cadastros/produtos/')
+        request.user = self.user
+        return request
+    
+    def test_contexto_memoizado_e_em_cache(self):
+        """Contexto montado uma vez por requisição e reutilizado entre requisições"""
+        with schema_context(self.tenant.schema_name):
+            request = self._request()
+            empresa, filial = get_current_empresa_filial(self.user, request)
+            self.assertEqual((empresa.id, filial.id), (self.empresa.id, self.filial_a.id))
+            
+            with self.assertNumQueries(0):
+                # Mesma requisição: memo; nova requisição: cache compartilhado
+                self.assertIs(contexto_do_usuario(request), contexto_do_usuario(request))
+                empresa, filial = get_current_empresa_filial(self.user, self._request())
+                self.assertEqual(filial.empresa.id, self.empresa.id)
+    
+    def test_invalidacao_ao_trocar_filial(self):
+        """Salvar o perfil (select_empresa_filial) invalida o contexto em cache"""
+        with schema_context(self.tenant.schema_name):
+            get_current_empresa_filial(self.user, self._request())
+        
+        with schema_context('public'):
+            self.profile.current_filial = self.filial_b
+            self.profile.save()
+        
+        with schema_context(self.tenant.schema_name):
+            _, filial = get_current_empresa_filial(self.user, self._request())
+        self.assertEqual(filial.id, self.filial_b.id)
+    
+    def test_autorizacao_sem_consultas_com_cache_quente(self):
+        """is_tenant_admin/HasTenantPermission usam o cache de membership (invalidado por signals)"""
+        with schema_context(self.tenant.schema_name):
+            request = self._request()
+            self.assertFalse(contexto_do_usuario(request).is_tenant_admin)
+            
+            request = RequestFactory().delete('/api/cadastros/produtos/1/')
+            request.user = self.user
+            with self.assertNumQueries(0):
+                self.assertFalse(contexto_do_usuario(self._request()).is_tenant_admin)
+                self.assertFalse(HasTenantPermission().has_permission(request, None))
+        
+        with schema_context('public'), self.captureOnCommitCallbacks(execute=True):
+            TenantMembership.objects.filter(user=self.user).update(role='admin')
+            TenantMembership.objects.get(user=self.user).save()
+        with schema_context(self.tenant.schema_name):
+            self.assertTrue(contexto_do_usuario(self._request()).is_tenant_admin)
+    
+    def test_permissoes_de_role_customizado(self):
+        """Role customizado: membership ativo, mas as ações por módulo não valem no tenant inteiro"""
+        with schema_context('public'), self.captureOnCommitCallbacks(execute=True):
+            role = CustomRole.objects.create(tenant=self.tenant, name='Financeiro', code='financeiro')
+            ModulePermission.objects.create(role=role, module='financeiro', actions=['view', 'delete'])
+            TenantMembership.objects.filter(user=self.user).update(role='financeiro')
+            TenantMembership.objects.get(user=self.user).save()
+        
+        with schema_context(self.tenant.schema_name):
+            acesso = contexto_do_usuario(self._request()).acesso
+            self.assertTrue(acesso.ativo)
+            self.assertFalse(acesso.tem_permissao('view'))
+            
+            request = RequestFactory().delete('/api/financeiro/contas-receber/1/')
+            request.user = self.user
+            self.assertFalse(HasTenantPermission().has_permission(request, None))
+    
+    def test_matriz_role_customizado_versionada(self):
+        """Alterar ModulePermission gera nova versão e nova matriz do role customizado"""
+        with schema_context('public'):
+            role = CustomRole.objects.create(tenant=self.tenant, name='Financeiro', code='financeiro')
+            ModulePermission.objects.create(role=role, module='financeiro', actions=['view'])
+        
+        matriz, versao = matriz_do_role(self.tenant.pk, 'financeiro')
+        self.assertEqual(matriz['modules']['financeiro']['actions'], ['view'])
+        with self.assertNumQueries(0):
+            self.assertEqual(matriz_do_role(self.tenant.pk, 'financeiro'), (matriz, versao))
+        
+        with schema_context('public'), self.captureOnCommitCallbacks(execute=True):
+            ModulePermission.objects.create(role=role, module='cadastros', actions=['view', 'add'])
+            # Versão renovada só depois do commit
+            self.assertEqual(versao_permissoes(self.tenant.pk, 'financeiro'), versao)
+        
+        matriz_nova, versao_nova = matriz_do_role(self.tenant.pk, 'financeiro')
+        self.assertNotEqual(versao_nova, versao)
+        self.assertEqual(set(matriz_nova['modules']), {'cadastros', 'financeiro'})
+        self.assertEqual(matriz_nova['permissions'], ['view', 'add'])
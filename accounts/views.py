@@ -17,6 +17,7 @@ from django.conf import settings
 from django.db import transaction
 from .models import UserProfile, TenantMembership
 from .decorators import rate_limit_login, rate_limit_password_reset
+from .matriz_permissoes import versao_permissoes
 from tenants.models import Empresa, Filial, Tenant
 
 User = get_user_model()
@@ -397,6 +398,8 @@ def login(request):
     access['tenant_name'] = tenant.name
     access['tenant_schema'] = tenant.schema_name
     access['role'] = membership.role
+    # Versão das permissões (mesmo valor do ETag de /usuarios/me/permissions/)
+    access['perm_version'] = versao_permissoes(tenant.id, membership.role)
     
     response_data = {
         'access': str(access),
@@ -38,7 +38,7 @@ class PessoaSerializer(serializers.ModelSerializer):
         # Definir empresa/filial automaticamente se não fornecidos
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            empresa, filial = get_current_empresa_filial(user)
+            empresa, filial = get_current_empresa_filial(user, self.context.get('request'))
             if 'empresa' not in validated_data or validated_data.get('empresa') is None:
                 validated_data['empresa'] = empresa
             if 'filial' not in validated_data or validated_data.get('filial') is None:
@@ -83,7 +83,7 @@ class ProdutoSerializer(serializers.ModelSerializer):
         # Definir empresa/filial automaticamente se não fornecidos
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            empresa, filial = get_current_empresa_filial(user)
+            empresa, filial = get_current_empresa_filial(user, self.context.get('request'))
             if 'empresa' not in validated_data or validated_data.get('empresa') is None:
                 validated_data['empresa'] = empresa
             if 'filial' not in validated_data or validated_data.get('filial') is None:
@@ -128,7 +128,7 @@ class ServicoSerializer(serializers.ModelSerializer):
         # Definir empresa/filial automaticamente se não fornecidos
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            empresa, filial = get_current_empresa_filial(user)
+            empresa, filial = get_current_empresa_filial(user, self.context.get('request'))
             if 'empresa' not in validated_data or validated_data.get('empresa') is None:
                 validated_data['empresa'] = empresa
             if 'filial' not in validated_data or validated_data.get('filial') is None:
@@ -171,7 +171,7 @@ class ContaReceberSerializer(serializers.ModelSerializer):
         # Definir empresa/filial automaticamente se não fornecidos
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            empresa, filial = get_current_empresa_filial(user)
+            empresa, filial = get_current_empresa_filial(user, self.context.get('request'))
             if 'empresa' not in validated_data or validated_data.get('empresa') is None:
                 validated_data['empresa'] = empresa
             if 'filial' not in validated_data or validated_data.get('filial') is None:
@@ -213,7 +213,7 @@ class ContaPagarSerializer(serializers.ModelSerializer):
         # Definir empresa/filial automaticamente se não fornecidos
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            empresa, filial = get_current_empresa_filial(user)
+            empresa, filial = get_current_empresa_filial(user, self.context.get('request'))
             if 'empresa' not in validated_data or validated_data.get('empresa') is None:
                 validated_data['empresa'] = empresa
             if 'filial' not in validated_data or validated_data.get('filial') is None:
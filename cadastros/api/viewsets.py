@@ -31,8 +31,8 @@ class PessoaViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtra pessoas por empresa/filial atual do usuário. Admin do tenant vê todos os dados."""
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
-        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user, request=self.request)
 
     @action(detail=False, methods=['get'])
     def proximo_codigo(self, request):
@@ -59,8 +59,8 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtra produtos por empresa/filial atual do usuário. Admin do tenant vê todos os dados."""
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
-        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user, request=self.request)
 
     @action(detail=False, methods=['get'])
     def proximo_codigo(self, request):
@@ -84,8 +84,8 @@ class ServicoViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtra serviços por empresa/filial atual do usuário. Admin do tenant vê todos os dados."""
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
-        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user, request=self.request)
 
     @action(detail=False, methods=['get'])
     def proximo_codigo(self, request):
@@ -108,8 +108,8 @@ class ContaReceberViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtra contas a receber por empresa/filial atual do usuário. Admin do tenant vê todos os dados."""
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
-        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user, request=self.request)
     
     @action(detail=False, methods=['get'])
     def proximo_codigo(self, request):
@@ -131,8 +131,8 @@ class ContaPagarViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtra contas a pagar por empresa/filial atual do usuário. Admin do tenant vê todos os dados."""
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
-        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        return filter_by_empresa_filial(queryset, empresa=empresa, filial=filial, user=self.request.user, request=self.request)
     
     @action(detail=False, methods=['get'])
     def proximo_codigo(self, request):
@@ -3,10 +3,11 @@ Utilitários para o app cadastros
 """
 from django.db.models import Q
 from django.db import models
+from accounts.contexto import contexto_do_usuario, obter_contexto
 from accounts.permissions import is_tenant_admin
 
 
-def filter_by_empresa_filial(queryset, empresa=None, filial=None, user=None):
+def filter_by_empresa_filial(queryset, empresa=None, filial=None, user=None, request=None):
     """
     Filtra um queryset por empresa e/ou filial.
     
@@ -23,12 +24,16 @@ def filter_by_empresa_filial(queryset, empresa=None, filial=None, user=None):
         empresa: Instância de Empresa ou None
         filial: Instância de Filial ou None
         user: Instância de User (opcional, para verificar se é admin do tenant)
+        request: Request atual (opcional); usa o contexto do usuário memoizado na requisição
     
     Returns:
         QuerySet filtrado
     """
     # Se o usuário for admin do tenant, retornar todos os dados do tenant (sem filtro)
-    if user and is_tenant_admin(user):
+    if request is not None:
+        if contexto_do_usuario(request).is_tenant_admin:
+            return queryset
+    elif user and is_tenant_admin(user):
         return queryset
     
     if filial:
@@ -59,19 +64,21 @@ def filter_by_empresa_filial(queryset, empresa=None, filial=None, user=None):
     return queryset
 
 
-def get_current_empresa_filial(user):
+def get_current_empresa_filial(user, request=None):
     """
     Obtém a empresa e filial atual do usuário a partir do UserProfile.
     
+    Usa o contexto do usuário (accounts.contexto): memoizado na requisição quando
+    `request` é informado e guardado em cache compartilhado por usuário + tenant.
+    
     Args:
         user: Instância de User
+        request: Request atual (opcional)
     
     Returns:
         tuple: (empresa, filial) ou (None, None)
     """
-    if not user or not hasattr(user, 'profile'):
-        return (None, None)
-    
-    profile = user.profile
-    return (profile.current_empresa, profile.current_filial)
+    if request is not None:
+        return contexto_do_usuario(request).empresa_filial
+    return obter_contexto(user).empresa_filial
 
@@ -1,7 +1,7 @@
 """
 Testes para APIs do core
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.core.cache import cache
@@ -55,6 +55,51 @@ class HealthCheckTests(TestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_liveness(self):
+        """Liveness responde sem verificar dependências"""
+        response = self.client.get('/api/health/live/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'alive')
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+class HealthProbesTests(TestCase):
+    """Testes das probes de saúde em cache (core/health.py)"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_readiness_usa_probes_em_cache(self):
+        """Com probes recentes no cache, o readiness não consulta banco nem Celery"""
+        from core import health
+        
+        health.atualizar_probes()
+        with self.assertNumQueries(0):
+            dados, saudavel = health.estado_readiness()
+        
+        self.assertTrue(saudavel)
+        self.assertEqual(dados['services']['database']['status'], 'healthy')
+        self.assertIn('configuration', dados['services'])
+    
+    def test_celery_pelo_heartbeat(self):
+        """O estado do Celery vem da idade do heartbeat gravado pela task periódica"""
+        from core import health
+        
+        self.assertEqual(health.verificar_celery()['status'], 'degraded')
+        
+        health.registrar_heartbeat_celery()
+        self.assertEqual(health.verificar_celery()['status'], 'healthy')
+        
+        cache.set(health.CHAVE_HEARTBEAT_CELERY, 0, None)
+        self.assertEqual(health.verificar_celery()['status'], 'degraded')
 
 
 class APIRootTests(TestCase):
@@ -92,3 +137,134 @@ class APIRootTests(TestCase):
         
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+class MetricsCollectorTests(TestCase):
+    """Testes do agregador de métricas em processo (core/metrics.py)"""
+    
+    def test_histograma_percentis(self):
+        """Percentis do histograma log-linear com erro relativo pequeno"""
+        from core.metrics import Histograma, indice_faixa, limite_faixa
+        
+        for valor in (0, 15, 16, 33, 1000, 123456):
+            self.assertGreaterEqual(limite_faixa(indice_faixa(valor)), valor)
+            self.assertLessEqual(limite_faixa(indice_faixa(valor)), valor * 1.07 + 1)
+        
+        histograma = Histograma()
+        for valor in range(1, 1001):
+            histograma.registrar(valor * 1000)
+        self.assertAlmostEqual(histograma.percentil(50), 500_000, delta=500_000 * 0.07)
+        self.assertAlmostEqual(histograma.percentil(99), 990_000, delta=990_000 * 0.07)
+    
+    def test_rota_e_agregacao(self):
+        """Requisições são agregadas pelo template da rota, não pelo path"""
+        import os
+        from django.test import RequestFactory
+        from django.urls import resolve
+        from core.metrics import ColetorMetricas, ContadorQueries, rota_da_requisicao
+        
+        request = RequestFactory().get('/api/email-settings/42/')
+        request.resolver_match = resolve('/api/email-settings/42/')
+        rota = rota_da_requisicao(request)
+        self.assertIn('{pk}', rota)
+        self.assertNotIn('42', rota)
+        
+        coletor = ColetorMetricas()
+        coletor._pid = os.getpid()  # Sem thread de envio no teste
+        coletor.registrar('GET', rota, 200, 1500, queries=2, tenant='t1')
+        coletor.registrar('GET', rota, 503, 2500, queries=1, tenant='t1')
+        rotas, status_classes, tenants, _, recentes = coletor._trocar_buffer()
+        
+        dados = rotas[f'GET {rota}']
+        self.assertEqual((dados.contagem, dados.erros, dados.queries), (2, 1, 3))
+        self.assertEqual(status_classes, {'2xx': 1, '5xx': 1})
+        self.assertEqual(tenants, {'t1': 2})
+        self.assertEqual(recentes, [1.5, 2.5])
+        
+        contador = ContadorQueries()
+        with connection.execute_wrapper(contador):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        self.assertEqual(contador.quantidade, 1)
+
+
+@override_settings(PROMETHEUS_METRICS_TOKEN='segredo')
+class PrometheusMetricsTests(TestCase):
+    """Testes da exposição de métricas no formato Prometheus"""
+    
+    url = '/api/metrics/prometheus/'
+    
+    def test_exige_token(self):
+        """Sem o token Bearer configurado o scrape é recusado"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer outro')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_exposicao_com_rota_nomeada(self):
+        """Requisições são expostas com o nome da rota, não com o path"""
+        from django.test import RequestFactory
+        from django.urls import resolve
+        from core import prometheus
+        
+        request = RequestFactory().get('/api/email-settings/42/')
+        request.resolver_match = resolve('/api/email-settings/42/')
+        prometheus.registrar_requisicao(request, 200, 12_000, queries=3, queries_us=800, tenant='empresa_teste')
+        prometheus.registrar_cache('tenant_resolver', True)
+        prometheus.registrar_task('reports.tasks.teste', 1.5, 'SUCCESS')
+        
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        conteudo = response.content.decode()
+        
+        self.assertIn('route="api:email-settings-detail"', conteudo)
+        self.assertNotIn('/42/', conteudo)
+        self.assertIn('siscr_db_queries_per_request_bucket', conteudo)
+        self.assertIn('siscr_tenant_requests_total{tenant="empresa_teste"}', conteudo)
+        self.assertIn('siscr_cache_lookups_total{cache="tenant_resolver",result="hit"}', conteudo)
+        self.assertIn('siscr_celery_task_duration_seconds_count{state="SUCCESS",task="reports.tasks.teste"}', conteudo)
+
+
+class SQLProfilerTests(TestCase):
+    """Testes do profiler de SQL (core/sql_profiler.py)"""
+    
+    def test_fingerprint_ignora_parametros(self):
+        """Consultas que só diferem em literais, parâmetros ou tamanho de IN têm o mesmo fingerprint"""
+        from core.sql_profiler import fingerprint, normalizar_sql
+        
+        self.assertEqual(
+            fingerprint('SELECT * FROM "produto" WHERE "id" IN (%s, %s, %s) AND "nome" = \'abc\''),
+            fingerprint('SELECT *  FROM "produto" WHERE "id" IN (%s) AND "nome" = \'x\''),
+        )
+        self.assertNotEqual(
+            fingerprint('SELECT * FROM "produto" WHERE "id" = %s'),
+            fingerprint('SELECT * FROM "pessoa" WHERE "id" = %s'),
+        )
+        self.assertEqual(
+            normalizar_sql('SELECT "tabela1"."id" FROM "tabela1" LIMIT 21'),
+            'SELECT "tabela1"."id" FROM "tabela1" LIMIT ?',
+        )
+    
+    @override_settings(SQL_PROFILER_EXPLAIN_MS=0)
+    def test_agregacao_por_schema_e_explain(self):
+        """Consultas são agregadas por (schema, fingerprint) e os SELECTs lentos ganham plano"""
+        from core.sql_profiler import ProfilerRequisicao, ProfilerSQL, fingerprint
+        
+        perfil = ProfilerRequisicao()
+        with connection.execute_wrapper(perfil):
+            with connection.cursor() as cursor:
+                for valor in (1, 2, 3):
+                    cursor.execute('SELECT %s', [valor])
+        self.assertEqual(len(perfil.consultas), 3)
+        
+        profiler = ProfilerSQL()
+        profiler.registrar('empresa_teste', perfil)
+        consultas, textos, planos = profiler._trocar_buffer()
+        
+        chave = ('empresa_teste', fingerprint('SELECT %s'))
+        self.assertEqual(list(consultas), [chave])
+        self.assertEqual(consultas[chave].contagem, 3)
+        self.assertEqual(textos[chave[1]], 'SELECT ?')
+        # Um único EXPLAIN por fingerprint no intervalo
+        self.assertEqual(len(planos), 1)
+        self.assertEqual(planos[0][0], chave)
@@ -16,7 +16,10 @@ router.register(r'email-settings', views.EmailSettingsViewSet, basename='email-s
 urlpatterns = [
     path('', views.api_root, name='api-root'),
     path('health/', views.health_check, name='health-check'),
+    path('health/live/', views.health_live, name='health-live'),
+    path('health/ready/', views.health_check, name='health-ready'),
     path('metrics/', views.metrics, name='metrics'),
+    path('metrics/prometheus/', views.metrics_prometheus, name='metrics-prometheus'),
     path('observability/', views.observability_dashboard, name='observability-dashboard'),
     path('tenant/backup/', views.backup_tenant, name='tenant-backup'),
     path('tenant/backup-info/', views.tenant_backup_info, name='tenant-backup-info'),
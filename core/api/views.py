@@ -2,11 +2,12 @@
 API Views for core app
 """
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse
+from django.views.decorators.http import require_GET
 from django.core.management import call_command
 from django.db import connection
 from django.core.cache import cache
@@ -18,6 +19,9 @@ from django.conf import settings
 from django.core.mail import send_mail, EmailMessage
 from public.models import EmailSettings
 from core.api.serializers import EmailSettingsSerializer
+from core.health import estado_readiness
+from core.utils import ler_ultimas_linhas
+import hmac
 import os
 import tempfile
 import glob
@@ -36,158 +40,20 @@ except ImportError:
 
 User = get_user_model()
 
+# Linhas finais do errors.log analisadas no dashboard de observabilidade
+LINHAS_ANALISE_LOG = 5000
+
 
 @api_view(['GET'])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def health_check(request):
     """
-    Health check endpoint para monitoramento e deploy
-    Verifica status de serviços críticos (DB, Redis, Celery, Stripe, etc.)
+    Health check (readiness) para monitoramento, deploy e load balancers
+    Status de serviços críticos (DB, Redis, Celery, Stripe, etc.) a partir das
+    probes em cache (core/health.py): nenhuma chamada aos workers do Celery
     """
-    import time
-    start_time = time.time()
-    
-    health_status = {
-        'status': 'healthy',
-        'timestamp': timezone.now().isoformat(),
-        'version': os.environ.get('APP_VERSION', '1.0.0'),
-        'environment': getattr(settings, 'ENVIRONMENT', 'unknown'),
-        'services': {}
-    }
-    
-    overall_healthy = True
-    
-    # Verificar banco de dados
-    try:
-        db_start = time.time()
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
-        db_duration = round((time.time() - db_start) * 1000, 2)
-        health_status['services']['database'] = {
-            'status': 'healthy',
-            'message': 'Database connection successful',
-            'response_time_ms': db_duration
-        }
-    except Exception as e:
-        overall_healthy = False
-        health_status['services']['database'] = {
-            'status': 'unhealthy',
-            'message': f'Database connection failed: {str(e)}'
-        }
-    
-    # Verificar Redis/Cache
-    try:
-        cache_start = time.time()
-        cache.set('health_check', 'ok', 10)
-        cache_result = cache.get('health_check')
-        cache_duration = round((time.time() - cache_start) * 1000, 2)
-        if cache_result == 'ok':
-            health_status['services']['cache'] = {
-                'status': 'healthy',
-                'message': 'Cache (Redis) connection successful',
-                'response_time_ms': cache_duration
-            }
-        else:
-            raise Exception('Cache test failed')
-    except Exception as e:
-        overall_healthy = False
-        health_status['services']['cache'] = {
-            'status': 'unhealthy',
-            'message': f'Cache (Redis) connection failed: {str(e)}'
-        }
-    
-    # Verificar Celery (opcional - apenas se configurado)
-    try:
-        from celery import current_app
-        celery_start = time.time()
-        # Verificar se há workers ativos
-        inspect = current_app.control.inspect()
-        active_workers = inspect.active()
-        celery_duration = round((time.time() - celery_start) * 1000, 2)
-        
-        if active_workers is not None:
-            worker_count = len(active_workers)
-            health_status['services']['celery'] = {
-                'status': 'healthy',
-                'message': f'Celery is running with {worker_count} worker(s)',
-                'workers': worker_count,
-                'response_time_ms': celery_duration
-            }
-        else:
-            health_status['services']['celery'] = {
-                'status': 'degraded',
-                'message': 'Celery workers not responding (may be normal if no workers are running)',
-                'response_time_ms': celery_duration
-            }
-    except Exception as e:
-        # Celery não é crítico, apenas avisar
-        health_status['services']['celery'] = {
-            'status': 'unknown',
-            'message': f'Could not check Celery status: {str(e)}'
-        }
-    
-    # Verificar Stripe (opcional - apenas se configurado)
-    try:
-        stripe_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
-        if stripe_key:
-            health_status['services']['stripe'] = {
-                'status': 'configured',
-                'message': 'Stripe is configured',
-                'mode': getattr(settings, 'STRIPE_MODE', 'unknown')
-            }
-        else:
-            health_status['services']['stripe'] = {
-                'status': 'not_configured',
-                'message': 'Stripe is not configured'
-            }
-    except Exception as e:
-        health_status['services']['stripe'] = {
-            'status': 'unknown',
-            'message': f'Could not check Stripe status: {str(e)}'
-        }
-    
-    # Verificar configurações básicas
-    try:
-        required_settings = ['SECRET_KEY', 'DATABASES']
-        missing_settings = []
-        for setting in required_settings:
-            if not hasattr(settings, setting) or not getattr(settings, setting, None):
-                missing_settings.append(setting)
-        
-        if missing_settings:
-            raise Exception(f'Missing required settings: {", ".join(missing_settings)}')
-        
-        health_status['services']['configuration'] = {
-            'status': 'healthy',
-            'message': 'Required settings are configured'
-        }
-    except Exception as e:
-        overall_healthy = False
-        health_status['services']['configuration'] = {
-            'status': 'unhealthy',
-            'message': f'Configuration check failed: {str(e)}'
-        }
-    
-    # Verificar Sentry (se configurado)
-    sentry_dsn = getattr(settings, 'SENTRY_DSN', None)
-    if sentry_dsn:
-        health_status['services']['sentry'] = {
-            'status': 'configured',
-            'message': 'Sentry error tracking is configured'
-        }
-    else:
-        health_status['services']['sentry'] = {
-            'status': 'not_configured',
-            'message': 'Sentry is not configured'
-        }
-    
-    # Calcular tempo total do health check
-    total_duration = round((time.time() - start_time) * 1000, 2)
-    health_status['health_check_duration_ms'] = total_duration
-    
-    # Atualizar status geral
-    health_status['status'] = 'healthy' if overall_healthy else 'unhealthy'
+    health_status, overall_healthy = estado_readiness()
     
     # Retornar status HTTP apropriado
     http_status = status.HTTP_200_OK if overall_healthy else status.HTTP_503_SERVICE_UNAVAILABLE
@@ -195,6 +61,16 @@ def health_check(request):
     return Response(health_status, status=http_status)
 
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_live(request):
+    """
+    Liveness: o processo está respondendo (sem acesso a banco, cache ou Celery)
+    """
+    return Response({'status': 'alive', 'timestamp': timezone.now().isoformat()})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_root(request):
@@ -341,6 +217,40 @@ def metrics(request):
         })
 
 
+@require_GET
+def metrics_prometheus(request):
+    """
+    Métricas de performance no formato de exposição do Prometheus (core/prometheus.py)
+
+    Latência por rota nomeada, queries SQL por requisição, taxa de acerto dos
+    caches, duração das tasks do Celery e requisições por tenant.
+
+    Autenticação: header `Authorization: Bearer <PROMETHEUS_METRICS_TOKEN>`.
+    Sem token configurado, o endpoint só responde com DEBUG ativo.
+    """
+    from core import prometheus
+    
+    token = getattr(settings, 'PROMETHEUS_METRICS_TOKEN', '')
+    if token:
+        recebido = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(recebido.encode(), f'Bearer {token}'.encode()):
+            return JsonResponse({'error': 'Token de métricas inválido'}, status=status.HTTP_401_UNAUTHORIZED)
+    elif not settings.DEBUG:
+        return JsonResponse(
+            {'error': 'Configure PROMETHEUS_METRICS_TOKEN para expor as métricas'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if not prometheus.PROMETHEUS_DISPONIVEL:
+        return JsonResponse(
+            {'error': 'prometheus_client não instalado'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    
+    conteudo, content_type = prometheus.exportar()
+    return HttpResponse(conteudo, content_type=content_type)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def backup_tenant(request):
@@ -479,14 +389,9 @@ def observability_dashboard(request):
             'health': None,
         }
         
-        # Status dos serviços (chamar health_check diretamente)
+        # Status dos serviços (probes em cache, mesmo resultado do /api/health/)
         try:
-            # Criar uma requisição fake para o health check
-            from django.test import RequestFactory
-            factory = RequestFactory()
-            health_request = factory.get('/api/health/')
-            health_response = health_check(health_request)
-            dashboard_data['health'] = health_response.data
+            dashboard_data['health'], _ = estado_readiness()
         except Exception as e:
             dashboard_data['health'] = {'error': str(e)}
         
@@ -512,12 +417,10 @@ def observability_dashboard(request):
             # Tentar ler últimas linhas do log de erros
             if errors_log.exists():
                 try:
-                    with open(errors_log, 'r', encoding='utf-8', errors='ignore') as f:
-                        lines = f.readlines()
-                        last_errors = lines[-5:] if len(lines) > 5 else lines
-                        dashboard_data['logging']['last_errors'] = [
-                            line.strip() for line in last_errors if line.strip()
-                        ][-3:]  # Últimos 3 erros
+                    last_errors = ler_ultimas_linhas(errors_log, 5)
+                    dashboard_data['logging']['last_errors'] = [
+                        line.strip() for line in last_errors if line.strip()
+                    ][-3:]  # Últimos 3 erros
                 except:
                     dashboard_data['logging']['last_errors'] = []
         else:
@@ -647,139 +550,139 @@ def observability_dashboard(request):
             
             if errors_log.exists():
                 try:
-                    with open(errors_log, 'r', encoding='utf-8', errors='ignore') as f:
-                        lines = f.readlines()
+                    # Últimas linhas do log (leitura a partir do fim do arquivo, sem carregar tudo)
+                    lines = ler_ultimas_linhas(errors_log, LINHAS_ANALISE_LOG)
+                    
+                    # Analisar as últimas LINHAS_ANALISE_LOG linhas
+                    # para ter dados das últimas 24 horas
+                    now = timezone.now()
+                    twenty_four_hours_ago = now - timedelta(hours=24)
+                    
+                    # Estruturas para análise
+                    errors_by_hour = defaultdict(int)  # {hora: quantidade}
+                    error_types = Counter()  # {tipo: quantidade}
+                    error_count = 0
+                    warning_count = 0
+                    
+                    # Inicializar todas as horas das últimas 24h com 0
+                    for i in range(24):
+                        hour_key = (now - timedelta(hours=i)).strftime('%Y-%m-%d %H:00')
+                        errors_by_hour[hour_key] = 0
+                    
+                    # Processar linhas (de trás para frente para otimizar)
+                    for line in reversed(lines):
+                        if not line.strip():
+                            continue
                         
-                        # Analisar todas as linhas (não apenas últimas 100)
-                        # para ter dados das últimas 24 horas
-                        now = timezone.now()
-                        twenty_four_hours_ago = now - timedelta(hours=24)
+                        # Verificar se é erro ou warning
+                        is_error = 'ERROR' in line.upper()
+                        is_warning = 'WARNING' in line.upper()
                         
-                        # Estruturas para análise
-                        errors_by_hour = defaultdict(int)  # {hora: quantidade}
-                        error_types = Counter()  # {tipo: quantidade}
-                        error_count = 0
-                        warning_count = 0
+                        if is_error:
+                            error_count += 1
+                        elif is_warning:
+                            warning_count += 1
                         
-                        # Inicializar todas as horas das últimas 24h com 0
-                        for i in range(24):
-                            hour_key = (now - timedelta(hours=i)).strftime('%Y-%m-%d %H:00')
-                            errors_by_hour[hour_key] = 0
+                        # Tentar extrair timestamp e tipo de exceção
+                        timestamp = None
+                        exception_type = None
                         
-                        # Processar linhas (de trás para frente para otimizar)
-                        for line in reversed(lines):
-                            if not line.strip():
-                                continue
-                            
-                            # Verificar se é erro ou warning
-                            is_error = 'ERROR' in line.upper()
-                            is_warning = 'WARNING' in line.upper()
-                            
-                            if is_error:
-                                error_count += 1
-                            elif is_warning:
-                                warning_count += 1
-                            
-                            # Tentar extrair timestamp e tipo de exceção
-                            timestamp = None
-                            exception_type = None
+                        # Formato JSON (produção)
+                        try:
+                            # Tentar parsear como JSON
+                            log_data = json_lib.loads(line.strip())
                             
-                            # Formato JSON (produção)
-                            try:
-                                # Tentar parsear como JSON
-                                log_data = json_lib.loads(line.strip())
-                                
-                                # Extrair timestamp
-                                if 'asctime' in log_data:
-                                    try:
-                                        timestamp = datetime.fromisoformat(log_data['asctime'].replace('Z', '+00:00'))
-                                        # Garantir que é timezone-aware
-                                        if timestamp.tzinfo is None:
-                                            timestamp = timezone.make_aware(timestamp)
-                                    except:
-                                        # Tentar outros formatos
-                                        try:
-                                            timestamp = datetime.strptime(log_data['asctime'], '%Y-%m-%d %H:%M:%S,%f')
-                                            # Converter para timezone-aware
-                                            if timestamp.tzinfo is None:
-                                                timestamp = timezone.make_aware(timestamp)
-                                        except:
-                                            pass
-                                
-                                # Extrair tipo de exceção
-                                if 'exception_type' in log_data:
-                                    exception_type = log_data['exception_type']
-                                elif 'message' in log_data:
-                                    # Tentar extrair do message
-                                    msg = log_data['message']
-                                    # Procurar por padrões como "ValueError", "KeyError", etc.
-                                    match = re.search(r'(\w+Error|\w+Exception)', msg)
-                                    if match:
-                                        exception_type = match.group(1)
-                                
-                            except (json_lib.JSONDecodeError, ValueError):
-                                # Formato texto (desenvolvimento)
-                                # Tentar extrair timestamp de formatos comuns
-                                # Exemplo: "2024-01-15 10:30:45,123 ERROR ..."
-                                timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2})', line)
-                                if timestamp_match:
+                            # Extrair timestamp
+                            if 'asctime' in log_data:
+                                try:
+                                    timestamp = datetime.fromisoformat(log_data['asctime'].replace('Z', '+00:00'))
+                                    # Garantir que é timezone-aware
+                                    if timestamp.tzinfo is None:
+                                        timestamp = timezone.make_aware(timestamp)
+                                except:
+                                    # Tentar outros formatos
                                     try:
-                                        timestamp_str = timestamp_match.group(1)
-                                        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+                                        timestamp = datetime.strptime(log_data['asctime'], '%Y-%m-%d %H:%M:%S,%f')
                                         # Converter para timezone-aware
                                         if timestamp.tzinfo is None:
                                             timestamp = timezone.make_aware(timestamp)
                                     except:
                                         pass
-                                
-                                # Tentar extrair tipo de exceção do texto
-                                exception_match = re.search(r'(\w+Error|\w+Exception)', line)
-                                if exception_match:
-                                    exception_type = exception_match.group(1)
                             
-                            # Se encontrou timestamp e está nas últimas 24h
-                            # Garantir que timestamp é timezone-aware antes de comparar
-                            if timestamp:
-                                if timestamp.tzinfo is None:
-                                    timestamp = timezone.make_aware(timestamp)
-                                if timestamp >= twenty_four_hours_ago:
-                                    # Agrupar por hora
-                                    hour_key = timestamp.replace(minute=0, second=0, microsecond=0).strftime('%Y-%m-%d %H:00')
-                                    if is_error:
-                                        errors_by_hour[hour_key] += 1
+                            # Extrair tipo de exceção
+                            if 'exception_type' in log_data:
+                                exception_type = log_data['exception_type']
+                            elif 'message' in log_data:
+                                # Tentar extrair do message
+                                msg = log_data['message']
+                                # Procurar por padrões como "ValueError", "KeyError", etc.
+                                match = re.search(r'(\w+Error|\w+Exception)', msg)
+                                if match:
+                                    exception_type = match.group(1)
                             
-                            # Contar tipos de exceção (top 5)
-                            if exception_type and is_error:
-                                error_types[exception_type] += 1
-                        
-                        # Preparar dados para gráfico de erros por hora
-                        # Ordenar por hora (mais antigo primeiro)
-                        sorted_hours = sorted([k for k in errors_by_hour.keys() if errors_by_hour[k] > 0])
-                        if not sorted_hours:
-                            # Se não há erros, mostrar últimas 24 horas vazias
-                            sorted_hours = sorted(errors_by_hour.keys())[-24:]
-                        
-                        errors_by_hour_data = {
-                            'labels': sorted_hours[-24:],  # Últimas 24 horas
-                            'data': [errors_by_hour[h] for h in sorted_hours[-24:]]
-                        }
-                        
-                        # Top 5 tipos de erro
-                        top_error_types = error_types.most_common(5)
-                        top_error_types_data = {
-                            'labels': [t[0] for t in top_error_types],
-                            'data': [t[1] for t in top_error_types]
-                        }
+                        except (json_lib.JSONDecodeError, ValueError):
+                            # Formato texto (desenvolvimento)
+                            # Tentar extrair timestamp de formatos comuns
+                            # Exemplo: "2024-01-15 10:30:45,123 ERROR ..."
+                            timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2})', line)
+                            if timestamp_match:
+                                try:
+                                    timestamp_str = timestamp_match.group(1)
+                                    timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+                                    # Converter para timezone-aware
+                                    if timestamp.tzinfo is None:
+                                        timestamp = timezone.make_aware(timestamp)
+                                except:
+                                    pass
+                            
+                            # Tentar extrair tipo de exceção do texto
+                            exception_match = re.search(r'(\w+Error|\w+Exception)', line)
+                            if exception_match:
+                                exception_type = exception_match.group(1)
                         
-                        dashboard_data['errors_analysis'] = {
-                            'total_recent_errors': error_count,
-                            'total_recent_warnings': warning_count,
-                            'ok_lines': max(0, len(lines) - error_count - warning_count),
-                            'lines_analyzed': len(lines),
-                            'errors_by_hour': errors_by_hour_data,
-                            'top_error_types': top_error_types_data,
-                        }
+                        # Se encontrou timestamp e está nas últimas 24h
+                        # Garantir que timestamp é timezone-aware antes de comparar
+                        if timestamp:
+                            if timestamp.tzinfo is None:
+                                timestamp = timezone.make_aware(timestamp)
+                            if timestamp >= twenty_four_hours_ago:
+                                # Agrupar por hora
+                                hour_key = timestamp.replace(minute=0, second=0, microsecond=0).strftime('%Y-%m-%d %H:00')
+                                if is_error:
+                                    errors_by_hour[hour_key] += 1
                         
+                        # Contar tipos de exceção (top 5)
+                        if exception_type and is_error:
+                            error_types[exception_type] += 1
+                    
+                    # Preparar dados para gráfico de erros por hora
+                    # Ordenar por hora (mais antigo primeiro)
+                    sorted_hours = sorted([k for k in errors_by_hour.keys() if errors_by_hour[k] > 0])
+                    if not sorted_hours:
+                        # Se não há erros, mostrar últimas 24 horas vazias
+                        sorted_hours = sorted(errors_by_hour.keys())[-24:]
+                    
+                    errors_by_hour_data = {
+                        'labels': sorted_hours[-24:],  # Últimas 24 horas
+                        'data': [errors_by_hour[h] for h in sorted_hours[-24:]]
+                    }
+                    
+                    # Top 5 tipos de erro
+                    top_error_types = error_types.most_common(5)
+                    top_error_types_data = {
+                        'labels': [t[0] for t in top_error_types],
+                        'data': [t[1] for t in top_error_types]
+                    }
+                    
+                    dashboard_data['errors_analysis'] = {
+                        'total_recent_errors': error_count,
+                        'total_recent_warnings': warning_count,
+                        'ok_lines': max(0, len(lines) - error_count - warning_count),
+                        'lines_analyzed': len(lines),
+                        'errors_by_hour': errors_by_hour_data,
+                        'top_error_types': top_error_types_data,
+                    }
+                    
                 except Exception as e:
                     dashboard_data['errors_analysis'] = {
                         'total_recent_errors': 0,
@@ -1097,22 +1000,16 @@ def observability_dashboard(request):
                 'error': f'Erro ao coletar métricas: {str(e)}'
             }
         
-        # Métricas de Performance
+        # Métricas de Performance (agregadas por core.metrics, por template de rota)
         try:
-            import json
+            from core.metrics import ler_metricas
+            metricas = ler_metricas()
+            response_times = metricas['recentes']
             
             # 1. Tempos de resposta (últimas 100 requisições)
-            response_times = []
-            try:
-                times = cache.lrange('metrics:response_times', 0, -1)
-                response_times = [float(t) for t in times]  # Converter para float
-            except:
-                pass
-            
-            # Calcular estatísticas
             if response_times:
                 dashboard_data['performance'] = {
-                    'response_times': response_times[-50:],  # Últimas 50 para o gráfico
+                    'response_times': response_times[:50][::-1],  # Últimas 50 para o gráfico
                     'avg_response_time': round(sum(response_times) / len(response_times), 2),
                     'min_response_time': round(min(response_times), 2),
                     'max_response_time': round(max(response_times), 2),
@@ -1128,52 +1025,14 @@ def observability_dashboard(request):
                 }
             
             # 2. Top 10 Requisições Mais Lentas
-            slow_requests = []
-            try:
-                slow_data = cache.lrange('metrics:slow_requests', 0, -1)
-                slow_requests = [json_lib.loads(r) for r in slow_data]
-                # Ordenar por duração (mais lento primeiro)
-                slow_requests.sort(key=lambda x: x.get('duration_ms', 0), reverse=True)
-            except Exception as e:
-                logger.debug(f'Erro ao buscar requisições lentas: {str(e)}')
+            dashboard_data['performance']['slow_requests'] = metricas['lentas'][:10]
             
-            dashboard_data['performance']['slow_requests'] = slow_requests[:10]  # Top 10
-            
-            # 3. Endpoints Mais Acessados
-            try:
-                # Buscar todas as chaves de endpoints
-                # Nota: Redis não tem comando direto para buscar por padrão
-                # Vamos usar uma abordagem alternativa: armazenar lista de endpoints
-                endpoints_list_key = 'metrics:endpoints_list'
-                endpoints_data = cache.get(endpoints_list_key)
-                
-                top_endpoints = []
-                if endpoints_data:
-                    endpoints_list = json_lib.loads(endpoints_data)
-                    for endpoint_info in endpoints_list[:10]:  # Top 10
-                        method = endpoint_info.get('method', '')
-                        path = endpoint_info.get('path', '')
-                        count_key = f'metrics:endpoint:{method}:{path}'
-                        avg_key = f'metrics:endpoint_avg:{method}:{path}'
-                        
-                        count = cache.get(count_key, 0)
-                        avg_time = cache.get(avg_key, 0)
-                        
-                        if count > 0:
-                            top_endpoints.append({
-                                'path': path,
-                                'method': method,
-                                'count': int(count),
-                                'avg_time_ms': round(float(avg_time), 2) if avg_time else 0,
-                            })
-                    
-                    # Ordenar por número de requisições
-                    top_endpoints.sort(key=lambda x: x['count'], reverse=True)
-                
-                dashboard_data['performance']['top_endpoints'] = top_endpoints[:10]
-            except Exception as e:
-                logger.debug(f'Erro ao buscar endpoints: {str(e)}')
-                dashboard_data['performance']['top_endpoints'] = []
+            # 3. Endpoints Mais Acessados (com percentis do histograma de latência)
+            dashboard_data['performance']['top_endpoints'] = [
+                {**rota, 'path': rota['route']} for rota in metricas['rotas']
+            ]
+            dashboard_data['performance']['status'] = metricas['status']
+            dashboard_data['performance']['tenants'] = metricas['tenants']
                 
         except Exception as e:
             logger.error(f'Erro ao coletar métricas de performance: {str(e)}', exc_info=True)
@@ -1181,6 +1040,20 @@ def observability_dashboard(request):
                 'error': f'Erro ao coletar métricas: {str(e)}'
             }
         
+        # Consultas SQL que mais pesam, por schema (core.sql_profiler, amostrado)
+        try:
+            from core import sql_profiler
+            dashboard_data['sql_profiler'] = {
+                'enabled': sql_profiler.ativo(),
+                'sample_rate': getattr(settings, 'SQL_PROFILER_AMOSTRAGEM', 0.05),
+                'top_queries': sql_profiler.relatorio(limite=10),
+            }
+        except Exception as e:
+            logger.error(f'Erro ao coletar profiler de SQL: {str(e)}', exc_info=True)
+            dashboard_data['sql_profiler'] = {
+                'error': f'Erro ao coletar profiler de SQL: {str(e)}'
+            }
+        
         # Verificar se o cliente quer HTML ou JSON
         accept_header = request.META.get('HTTP_ACCEPT', '')
         format_param = request.GET.get('format', '')
@@ -0,0 +1,229 @@
+"""
+Verificações de saúde (liveness/readiness) com probes em cache.
+
+- liveness (/api/health/live/): o processo responde; sem I/O
+- readiness (/api/health/ready/ e /api/health/): resultado das probes de banco,
+  cache e Celery guardado no cache compartilhado
+
+As probes são atualizadas pela task periódica core.tasks.atualizar_health
+(Celery beat, a cada HEALTH_PROBES_INTERVALO segundos), que também grava o
+heartbeat do Celery: se a task rodou há pouco, beat, broker e pelo menos um
+worker estão funcionando, sem broadcast (control.inspect) aos workers.
+
+Se o resultado compartilhado estiver velho ou indisponível (sem beat em
+desenvolvimento, Redis fora), o processo roda as probes localmente, no máximo
+uma vez a cada HEALTH_PROBES_TTL segundos.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHAVE_PROBES = 'health:probes'
+CHAVE_HEARTBEAT_CELERY = 'health:celery:heartbeat'
+
+# Serviços que tornam a aplicação indisponível (Celery é só informativo)
+SERVICOS_CRITICOS = ('database', 'cache')
+
+_lock = threading.Lock()
+_probes_locais = None
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _duracao_ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 2)
+
+
+def verificar_banco():
+    try:
+        inicio = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        return {
+            'status': 'healthy',
+            'message': 'Database connection successful',
+            'response_time_ms': _duracao_ms(inicio),
+        }
+    except Exception as e:
+        return {
+            'status': 'unhealthy',
+            'message': f'Database connection failed: {str(e)}',
+        }
+
+
+def verificar_cache():
+    try:
+        inicio = time.perf_counter()
+        cache.set('health_check', 'ok', 10)
+        if cache.get('health_check') != 'ok':
+            raise Exception('Cache test failed')
+        return {
+            'status': 'healthy',
+            'message': 'Cache (Redis) connection successful',
+            'response_time_ms': _duracao_ms(inicio),
+        }
+    except Exception as e:
+        return {
+            'status': 'unhealthy',
+            'message': f'Cache (Redis) connection failed: {str(e)}',
+        }
+
+
+def registrar_heartbeat_celery():
+    """Grava o instante atual como heartbeat do Celery (chamado pela task periódica)"""
+    cache.set(CHAVE_HEARTBEAT_CELERY, time.time(), None)
+
+
+def verificar_celery():
+    """Estado do Celery pela idade do heartbeat (sem falar com os workers)"""
+    try:
+        heartbeat = cache.get(CHAVE_HEARTBEAT_CELERY)
+    except Exception as e:
+        return {
+            'status': 'unknown',
+            'message': f'Could not check Celery status: {str(e)}',
+        }
+
+    if heartbeat is None:
+        return {
+            'status': 'degraded',
+            'message': 'No Celery heartbeat recorded (beat/workers may not be running)',
+        }
+
+    idade = round(time.time() - heartbeat, 1)
+    if idade > _config('HEALTH_CELERY_HEARTBEAT_MAX_IDADE', 180):
+        return {
+            'status': 'degraded',
+            'message': f'Last Celery heartbeat {idade}s ago (beat or workers may be stopped)',
+            'heartbeat_age_s': idade,
+        }
+    return {
+        'status': 'healthy',
+        'message': 'Celery beat and workers are processing tasks',
+        'heartbeat_age_s': idade,
+    }
+
+
+def executar_probes():
+    """Roda as probes de banco, cache e Celery"""
+    return {
+        'checked_at': time.time(),
+        'services': {
+            'database': verificar_banco(),
+            'cache': verificar_cache(),
+            'celery': verificar_celery(),
+        },
+    }
+
+
+def atualizar_probes():
+    """Roda as probes e publica o resultado no cache compartilhado"""
+    probes = executar_probes()
+    try:
+        cache.set(CHAVE_PROBES, probes, _config('HEALTH_PROBES_TTL', 60) * 2)
+    except Exception as e:
+        logger.warning(f'[Health] Erro ao publicar probes: {e}')
+    return probes
+
+
+def _atual(probes):
+    return probes is not None and time.time() - probes['checked_at'] <= _config('HEALTH_PROBES_TTL', 60)
+
+
+def obter_probes():
+    """
+    Resultado mais recente das probes.
+
+    Returns:
+        dict com 'checked_at' (epoch) e 'services'
+    """
+    global _probes_locais
+    try:
+        probes = cache.get(CHAVE_PROBES)
+    except Exception:
+        probes = None
+    if _atual(probes):
+        return probes
+
+    with _lock:
+        if not _atual(_probes_locais):
+            _probes_locais = executar_probes()
+        return _probes_locais
+
+
+def _servicos_configurados():
+    """Stripe, configuração e Sentry (só settings, sem I/O)"""
+    servicos = {}
+
+    if getattr(settings, 'STRIPE_SECRET_KEY', None):
+        servicos['stripe'] = {
+            'status': 'configured',
+            'message': 'Stripe is configured',
+            'mode': getattr(settings, 'STRIPE_MODE', 'unknown'),
+        }
+    else:
+        servicos['stripe'] = {
+            'status': 'not_configured',
+            'message': 'Stripe is not configured',
+        }
+
+    missing_settings = [nome for nome in ('SECRET_KEY', 'DATABASES') if not getattr(settings, nome, None)]
+    if missing_settings:
+        servicos['configuration'] = {
+            'status': 'unhealthy',
+            'message': f'Configuration check failed: Missing required settings: {", ".join(missing_settings)}',
+        }
+    else:
+        servicos['configuration'] = {
+            'status': 'healthy',
+            'message': 'Required settings are configured',
+        }
+
+    if getattr(settings, 'SENTRY_DSN', None):
+        servicos['sentry'] = {
+            'status': 'configured',
+            'message': 'Sentry error tracking is configured',
+        }
+    else:
+        servicos['sentry'] = {
+            'status': 'not_configured',
+            'message': 'Sentry is not configured',
+        }
+    return servicos
+
+
+def estado_readiness():
+    """
+    Estado de prontidão (formato da resposta de /api/health/).
+
+    Returns:
+        Tupla (dados, saudável)
+    """
+    inicio = time.perf_counter()
+    probes = obter_probes()
+    servicos = {**probes['services'], **_servicos_configurados()}
+    saudavel = all(
+        servicos[nome]['status'] == 'healthy'
+        for nome in (*SERVICOS_CRITICOS, 'configuration')
+    )
+    dados = {
+        'status': 'healthy' if saudavel else 'unhealthy',
+        'timestamp': timezone.now().isoformat(),
+        'version': os.environ.get('APP_VERSION', '1.0.0'),
+        'environment': _config('ENVIRONMENT', 'unknown'),
+        'services': servicos,
+        'probes_age_s': round(time.time() - probes['checked_at'], 1),
+        'health_check_duration_ms': _duracao_ms(inicio),
+    }
+    return dados, saudavel
@@ -0,0 +1,83 @@
+"""
+Comando Django para listar as consultas SQL que mais pesam (core/sql_profiler.py)
+Uso: python manage.py sql_profile [--top 20] [--schema <schema>] [--ordenar total|count|avg] [--explain] [--json] [--limpar]
+"""
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import sql_profiler
+
+
+class Command(BaseCommand):
+    help = 'Relatório top-N de fingerprints de SQL por schema (requer SQL_PROFILER_ATIVO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Quantidade de fingerprints no relatório (padrão: 20)'
+        )
+        parser.add_argument(
+            '--schema',
+            type=str,
+            help='Filtrar por schema (tenant)'
+        )
+        parser.add_argument(
+            '--ordenar',
+            choices=sorted(sql_profiler.ORDENACOES),
+            default='total',
+            help='Critério: tempo total (padrão), quantidade ou tempo médio'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Saída em JSON'
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Incluir os planos de execução capturados'
+        )
+        parser.add_argument(
+            '--limpar',
+            action='store_true',
+            help='Apagar os dados acumulados do profiler'
+        )
+
+    def handle(self, *args, **options):
+        if options['limpar']:
+            sql_profiler.limpar()
+            self.stdout.write(self.style.SUCCESS('✅ Dados do profiler de SQL removidos'))
+            return
+
+        if not getattr(settings, 'SQL_PROFILER_ATIVO', False):
+            self.stdout.write(self.style.WARNING('⚠️  SQL_PROFILER_ATIVO está desligado: o relatório mostra só dados antigos'))
+
+        itens = sql_profiler.relatorio(
+            limite=max(1, options['top']),
+            schema=options['schema'],
+            ordenar=options['ordenar'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(itens, indent=2, ensure_ascii=False))
+            return
+
+        if not itens:
+            self.stdout.write('Nenhuma consulta registrada (o cache precisa ser Redis)')
+            return
+
+        self.stdout.write(f"{'#':>3}  {'schema':<20} {'qtd':>8} {'total ms':>12} {'média ms':>10} {'p95 ms':>10}")
+        for posicao, item in enumerate(itens, 1):
+            self.stdout.write(
+                f"{posicao:>3}  {item['schema'][:20]:<20} {item['count']:>8} "
+                f"{item['total_ms']:>12.2f} {item['avg_ms']:>10.2f} {item['p95_ms']:>10.2f}"
+            )
+            self.stdout.write(f"     [{item['fingerprint']}] {item['sql'] or ''}")
+            if options['explain'] and item['plan']:
+                for linha in item['plan']['plan'].splitlines():
+                    self.stdout.write(f'       {linha}')
+            self.stdout.write('')
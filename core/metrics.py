@@ -0,0 +1,357 @@
+"""
+Agregação de métricas de requisições em processo, com envio em lote ao Redis.
+
+O MetricsMiddleware só chama coletor.registrar() (operações em memória sob um
+lock); uma thread em segundo plano envia o acumulado ao Redis a cada
+METRICS_FLUSH_INTERVALO segundos, num único pipeline. Por rota (template da
+URL, não o path literal) são mantidos:
+
+- contagem, erros (5xx) e contagem por classe de status
+- histograma de latência log-linear (estilo HDR: 16 sub-faixas por potência de 2,
+  erro relativo < 7%), em microssegundos
+- quantidade e tempo de queries no banco (medidos com connection.execute_wrapper)
+
+Também são mantidos contadores por tenant, as requisições lentas e as últimas
+latências (gráfico do dashboard). ler_metricas() lê o consolidado de todos os
+processos no Redis.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = 'metrics:v2'
+TTL_CHAVES = 86400
+
+# Histograma: 2^4 sub-faixas lineares por potência de 2
+_SUB_BITS = 4
+_SUB = 1 << _SUB_BITS
+
+
+def indice_faixa(valor):
+    """Índice da faixa do histograma para um valor inteiro não negativo"""
+    valor = int(valor)
+    if valor < _SUB:
+        return max(valor, 0)
+    expoente = valor.bit_length() - _SUB_BITS - 1
+    return (expoente + 1) * _SUB + ((valor >> expoente) - _SUB)
+
+
+def limite_faixa(indice):
+    """Maior valor contido na faixa"""
+    if indice < _SUB:
+        return indice
+    expoente = indice // _SUB - 1
+    mantissa = indice % _SUB + _SUB
+    return ((mantissa + 1) << expoente) - 1
+
+
+class Histograma:
+    """Histograma log-linear esparso (faixa -> contagem)"""
+
+    def __init__(self, faixas=None):
+        self.faixas = dict(faixas or {})
+
+    def registrar(self, valor):
+        indice = indice_faixa(valor)
+        self.faixas[indice] = self.faixas.get(indice, 0) + 1
+
+    def total(self):
+        return sum(self.faixas.values())
+
+    def percentil(self, p):
+        """Valor (limite superior da faixa) abaixo do qual estão p% das amostras"""
+        total = self.total()
+        if not total:
+            return 0
+        alvo = max(1, -(-total * p // 100))
+        acumulado = 0
+        for indice in sorted(self.faixas):
+            acumulado += self.faixas[indice]
+            if acumulado >= alvo:
+                return limite_faixa(indice)
+        return limite_faixa(max(self.faixas))
+
+
+_RE_GRUPO_NOMEADO = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+_RE_CONVERSOR = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+def rota_da_requisicao(request):
+    """
+    Template da rota resolvida (ex: 'api/cadastros/produtos/{pk}/'), ou
+    '<nao_resolvida>' para 404 sem rota. Mantém a cardinalidade limitada.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<nao_resolvida>'
+    rota = match.route or match.view_name or ''
+    rota = _RE_GRUPO_NOMEADO.sub(r'{\1}', rota)
+    rota = _RE_CONVERSOR.sub(r'{\1}', rota)
+    return rota.replace('^', '').replace('$', '').replace('\\', '').replace('/?', '/') or '/'
+
+
+class _Rota:
+    __slots__ = ('contagem', 'erros', 'soma_us', 'queries', 'queries_us', 'histograma')
+
+    def __init__(self):
+        self.contagem = 0
+        self.erros = 0
+        self.soma_us = 0
+        self.queries = 0
+        self.queries_us = 0
+        self.histograma = Histograma()
+
+
+class ColetorMetricas:
+    """Buffer de métricas do processo (thread-safe) e thread de envio ao Redis"""
+
+    MAX_LENTAS = 10
+    MAX_RECENTES = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._parar = threading.Event()
+        self._envios = []
+        self._zerar()
+
+    def _zerar(self):
+        self._rotas = {}
+        self._status = {}
+        self._tenants = {}
+        self._lentas = []
+        self._recentes = []
+
+    def registrar(self, metodo, rota, status_code, duracao_us, queries=0, queries_us=0, tenant=None, lenta=None):
+        """
+        Registra uma requisição (apenas memória; sem I/O).
+
+        Args:
+            lenta: dict com os detalhes, se a requisição deve entrar no top de lentas
+        """
+        self._garantir_thread()
+        chave = f'{metodo} {rota}'
+        classe = f'{status_code // 100}xx'
+        with self._lock:
+            dados = self._rotas.get(chave)
+            if dados is None:
+                dados = self._rotas[chave] = _Rota()
+            dados.contagem += 1
+            dados.soma_us += duracao_us
+            dados.queries += queries
+            dados.queries_us += queries_us
+            dados.histograma.registrar(duracao_us)
+            if status_code >= 500:
+                dados.erros += 1
+            self._status[classe] = self._status.get(classe, 0) + 1
+            if tenant:
+                self._tenants[tenant] = self._tenants.get(tenant, 0) + 1
+            if len(self._recentes) < self.MAX_RECENTES:
+                self._recentes.append(round(duracao_us / 1000, 2))
+            if lenta is not None:
+                self._lentas.append(lenta)
+                if len(self._lentas) > self.MAX_LENTAS:
+                    self._lentas.sort(key=lambda item: item['duration_ms'], reverse=True)
+                    del self._lentas[self.MAX_LENTAS:]
+
+    def registrar_envio(self, envio):
+        """
+        Acrescenta um envio ao flush periódico (ex.: core.sql_profiler).
+
+        Args:
+            envio: Função que recebe o pipeline do Redis (ou None, sem Redis:
+                   deve apenas descartar o acumulado)
+        """
+        if envio not in self._envios:
+            self._envios.append(envio)
+
+    def _trocar_buffer(self):
+        with self._lock:
+            buffer = (self._rotas, self._status, self._tenants, self._lentas, self._recentes)
+            self._zerar()
+        return buffer
+
+    def flush(self):
+        """Envia o acumulado ao Redis num único pipeline; sem Redis, descarta"""
+        rotas, status_classes, tenants, lentas, recentes = self._trocar_buffer()
+        cliente = _cliente_redis()
+        if cliente is None:
+            for envio in self._envios:
+                envio(None)
+            return
+
+        pipe = cliente.pipeline(transaction=False)
+        for envio in self._envios:
+            envio(pipe)
+        if not (rotas or status_classes or tenants or len(pipe)):
+            return
+        chave_rotas = f'{PREFIXO}:rotas'
+        for chave, dados in rotas.items():
+            pipe.hincrby(chave_rotas, f'{chave}|count', dados.contagem)
+            pipe.hincrby(chave_rotas, f'{chave}|errors', dados.erros)
+            pipe.hincrby(chave_rotas, f'{chave}|sum_us', dados.soma_us)
+            pipe.hincrby(chave_rotas, f'{chave}|queries', dados.queries)
+            pipe.hincrby(chave_rotas, f'{chave}|queries_us', dados.queries_us)
+            chave_hist = f'{PREFIXO}:hist:{chave}'
+            for indice, contagem in dados.histograma.faixas.items():
+                pipe.hincrby(chave_hist, indice, contagem)
+            pipe.expire(chave_hist, TTL_CHAVES)
+        for classe, contagem in status_classes.items():
+            pipe.hincrby(f'{PREFIXO}:status', classe, contagem)
+        for tenant, contagem in tenants.items():
+            pipe.hincrby(f'{PREFIXO}:tenants', tenant, contagem)
+        if lentas:
+            pipe.lpush(f'{PREFIXO}:lentas', *[json.dumps(item) for item in lentas])
+            pipe.ltrim(f'{PREFIXO}:lentas', 0, 49)
+        if recentes:
+            pipe.lpush(f'{PREFIXO}:recentes', *recentes)
+            pipe.ltrim(f'{PREFIXO}:recentes', 0, self.MAX_RECENTES - 1)
+        for sufixo in ('rotas', 'status', 'tenants', 'lentas', 'recentes'):
+            pipe.expire(f'{PREFIXO}:{sufixo}', TTL_CHAVES)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f'[METRICS] Erro ao enviar métricas ao Redis: {e}')
+
+    def _garantir_thread(self):
+        # Depois do fork (gunicorn), cada worker precisa da sua própria thread
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                self._zerar()
+            self._pid = pid
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name='metrics-flush', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        intervalo = getattr(settings, 'METRICS_FLUSH_INTERVALO', 5)
+        while not self._parar.wait(intervalo):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.debug(f'[METRICS] Erro no envio periódico: {e}')
+
+    def parar(self):
+        self._parar.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+coletor = ColetorMetricas()
+atexit.register(coletor.parar)
+
+
+def _cliente_redis():
+    """Cliente redis-py do cache padrão, ou None se o cache não for Redis"""
+    from django.core.cache import cache
+    try:
+        return cache._cache.get_client(write=True)
+    except Exception:
+        return None
+
+
+def ler_metricas(limite_rotas=10):
+    """
+    Métricas consolidadas (todos os processos) a partir do Redis.
+
+    Returns:
+        dict com 'rotas' (top por contagem, com p50/p95/p99 em ms), 'status',
+        'tenants', 'lentas' e 'recentes'; vazio se o cache não for Redis
+    """
+    cliente = _cliente_redis()
+    if cliente is None:
+        return {'rotas': [], 'status': {}, 'tenants': {}, 'lentas': [], 'recentes': []}
+
+    pipe = cliente.pipeline(transaction=False)
+    pipe.hgetall(f'{PREFIXO}:rotas')
+    pipe.hgetall(f'{PREFIXO}:status')
+    pipe.hgetall(f'{PREFIXO}:tenants')
+    pipe.lrange(f'{PREFIXO}:lentas', 0, -1)
+    pipe.lrange(f'{PREFIXO}:recentes', 0, -1)
+    brutas, status_classes, tenants, lentas, recentes = pipe.execute()
+
+    rotas = {}
+    for campo, valor in brutas.items():
+        chave, metrica = campo.decode().rsplit('|', 1)
+        rotas.setdefault(chave, {})[metrica] = int(valor)
+    top = sorted(rotas.items(), key=lambda item: item[1].get('count', 0), reverse=True)[:limite_rotas]
+
+    pipe = cliente.pipeline(transaction=False)
+    for chave, _ in top:
+        pipe.hgetall(f'{PREFIXO}:hist:{chave}')
+    histogramas = pipe.execute() if top else []
+
+    resultado_rotas = []
+    for (chave, dados), faixas in zip(top, histogramas):
+        metodo, rota = chave.split(' ', 1)
+        histograma = Histograma({int(k): int(v) for k, v in faixas.items()})
+        contagem = dados.get('count', 0) or 1
+        resultado_rotas.append({
+            'method': metodo,
+            'route': rota,
+            'count': dados.get('count', 0),
+            'errors': dados.get('errors', 0),
+            'avg_time_ms': round(dados.get('sum_us', 0) / contagem / 1000, 2),
+            'p50_ms': round(histograma.percentil(50) / 1000, 2),
+            'p95_ms': round(histograma.percentil(95) / 1000, 2),
+            'p99_ms': round(histograma.percentil(99) / 1000, 2),
+            'avg_queries': round(dados.get('queries', 0) / contagem, 2),
+            'avg_query_time_ms': round(dados.get('queries_us', 0) / contagem / 1000, 2),
+        })
+
+    return {
+        'rotas': resultado_rotas,
+        'status': {k.decode(): int(v) for k, v in status_classes.items()},
+        'tenants': {k.decode(): int(v) for k, v in tenants.items()},
+        'lentas': sorted((json.loads(item) for item in lentas), key=lambda item: item['duration_ms'], reverse=True),
+        'recentes': [float(item) for item in recentes],
+    }
+
+
+class ContadorQueries:
+    """execute_wrapper que conta queries e soma o tempo no banco (funciona sem DEBUG)"""
+
+    __slots__ = ('quantidade', 'tempo_us')
+
+    def __init__(self):
+        self.quantidade = 0
+        self.tempo_us = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.quantidade += 1
+            self.tempo_us += (time.perf_counter_ns() - inicio) // 1000
+
+
+def detalhes_requisicao_lenta(metodo, rota, path, status_code, duracao_ms, queries, tenant, username):
+    return {
+        'path': path,
+        'route': rota,
+        'method': metodo,
+        'duration_ms': duracao_ms,
+        'status_code': status_code,
+        'query_count': queries,
+        'tenant': tenant,
+        'username': username,
+        'timestamp': timezone.now().isoformat(),
+    }
@@ -1,191 +1,150 @@
 """
 Middleware para coletar métricas básicas de performance
 """
-import time
-import json
 import logging
 import sys
-from django.utils.deprecation import MiddlewareMixin
+import time
+
+from django.conf import settings
 from django.db import connection
-from django.core.cache import cache
-from django.utils import timezone
+
+from core import prometheus, sql_profiler
+from core.metrics import ContadorQueries, coletor, detalhes_requisicao_lenta, rota_da_requisicao
 
 logger = logging.getLogger(__name__)
 
 
-class MetricsMiddleware(MiddlewareMixin):
+def _tenant_da_requisicao(request):
+    tenant = getattr(request, 'tenant', None) or getattr(connection, 'tenant', None)
+    return getattr(tenant, 'schema_name', None)
+
+
+def _usuario_da_requisicao(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.id, user.username
+    return None, None
+
+
+class MetricsMiddleware:
     """
     Middleware que coleta métricas básicas de performance:
     - Tempo de resposta das requisições
-    - Número de queries do banco de dados
+    - Número e tempo das queries do banco de dados (connection.execute_wrapper)
     - Status HTTP das respostas
+
+    As métricas são agregadas em memória (core.metrics.coletor), por template de
+    rota, e enviadas ao Redis em lote por uma thread em segundo plano: a
+    requisição não faz nenhuma chamada ao Redis. Os coletores Prometheus
+    (core.prometheus) recebem os mesmos valores.
+
+    Com SQL_PROFILER_ATIVO, uma amostra das requisições passa também pelo
+    profiler de SQL (core.sql_profiler).
     """
-    
-    def process_request(self, request):
-        """Inicia o timer e reseta contadores"""
-        request._start_time = time.time()
-        request._query_count_start = len(connection.queries)
-        
-    def process_response(self, request, response):
-        """Registra métricas ao final da requisição"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
         # Desabilitar em modo de teste para reduzir logs
-        from django.conf import settings
-        if getattr(settings, 'TESTING', False) or 'test' in sys.argv:
-            return response
-            
-        if not hasattr(request, '_start_time'):
-            return response
-        
-        # Calcular tempo de resposta
-        duration = time.time() - request._start_time
-        
-        # Contar queries do banco
-        query_count = len(connection.queries) - request._query_count_start
-        
-        # Extrair informações da requisição
+        self.ativo = not (getattr(settings, 'TESTING', False) or 'test' in sys.argv)
+
+    def __call__(self, request):
+        if not self.ativo:
+            return self.get_response(request)
+
+        contador = ContadorQueries()
+        request._metrics_queries = contador
+        inicio = request._metrics_inicio = time.perf_counter_ns()
+        perfil = sql_profiler.ProfilerRequisicao() if sql_profiler.amostrar() else None
+        with connection.execute_wrapper(contador):
+            if perfil is None:
+                response = self.get_response(request)
+            else:
+                with connection.execute_wrapper(perfil):
+                    response = self.get_response(request)
+        duracao_us = (time.perf_counter_ns() - inicio) // 1000
+
+        if perfil is not None:
+            try:
+                sql_profiler.profiler.registrar(_tenant_da_requisicao(request) or 'public', perfil)
+            except Exception as e:
+                logger.debug(f'Erro ao registrar profiler de SQL: {str(e)}')
+
+        try:
+            self._registrar(request, response, duracao_us, contador)
+        except Exception as e:
+            # Não quebrar a requisição se houver erro ao registrar métricas
+            logger.debug(f'Erro ao registrar métricas: {str(e)}')
+
+        return response
+
+    def _registrar(self, request, response, duracao_us, contador):
+        """Registra métricas ao final da requisição"""
+        duracao_ms = round(duracao_us / 1000, 2)
+        query_count = contador.quantidade
         method = request.method
         path = request.path
         status_code = response.status_code
-        
-        # Identificar tenant se disponível
-        tenant_name = None
-        if hasattr(connection, 'tenant') and connection.tenant:
-            tenant_name = connection.tenant.schema_name
-        
-        # Identificar usuário se autenticado
-        user_id = None
-        username = None
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            user_id = request.user.id
-            username = request.user.username
-        
-        # Log de métricas (apenas para requisições que demoram mais ou têm muitas queries)
-        if duration > 1.0 or query_count > 10:
-            logger.warning(
-                f"[METRICS] Requisição lenta ou com muitas queries",
-                extra={
-                    'method': method,
-                    'path': path,
-                    'status_code': status_code,
-                    'duration_ms': round(duration * 1000, 2),
-                    'query_count': query_count,
-                    'tenant': tenant_name,
-                    'user_id': user_id,
-                    'username': username,
-                }
-            )
-        
-        # Log de erros
-        if status_code >= 400:
-            logger.warning(
-                f"[METRICS] Requisição com erro",
-                extra={
-                    'method': method,
-                    'path': path,
-                    'status_code': status_code,
-                    'duration_ms': round(duration * 1000, 2),
-                    'query_count': query_count,
-                    'tenant': tenant_name,
-                    'user_id': user_id,
-                    'username': username,
-                }
+        tenant_name = _tenant_da_requisicao(request)
+
+        # Log de métricas (apenas para requisições que demoram mais, têm muitas queries ou erro)
+        if duracao_ms > 1000 or query_count > 10 or status_code >= 400:
+            user_id, username = _usuario_da_requisicao(request)
+            extra = {
+                'method': method,
+                'path': path,
+                'status_code': status_code,
+                'duration_ms': duracao_ms,
+                'query_count': query_count,
+                'tenant': tenant_name,
+                'user_id': user_id,
+                'username': username,
+            }
+            if duracao_ms > 1000 or query_count > 10:
+                logger.warning(f"[METRICS] Requisição lenta ou com muitas queries", extra=extra)
+            if status_code >= 400:
+                logger.warning(f"[METRICS] Requisição com erro", extra=extra)
+
+        # Ignorar requisições estáticas e do próprio dashboard
+        if path.startswith('/static/') or path.startswith('/media/') or '/observability/' in path:
+            return
+
+        rota = rota_da_requisicao(request)
+        lenta = None
+        if duracao_ms > 500:
+            _, username = _usuario_da_requisicao(request)
+            lenta = detalhes_requisicao_lenta(
+                method, rota, path, status_code, duracao_ms, query_count, tenant_name, username
             )
-        
-        # Armazenar métricas no Redis para análise
-        try:
-            duration_ms = round(duration * 1000, 2)
-            
-            # 1. Armazenar tempo de resposta (últimas 100 requisições)
-            cache.lpush('metrics:response_times', duration_ms)
-            cache.ltrim('metrics:response_times', 0, 99)  # Manter apenas 100
-            
-            # 2. Armazenar requisições lentas (top 10, >500ms)
-            if duration > 0.5:
-                slow_request = {
-                    'path': path,
-                    'method': method,
-                    'duration_ms': duration_ms,
-                    'status_code': status_code,
-                    'query_count': query_count,
-                    'tenant': tenant_name,
-                    'username': username,
-                    'timestamp': timezone.now().isoformat(),
-                }
-                cache.lpush('metrics:slow_requests', json.dumps(slow_request))
-                cache.ltrim('metrics:slow_requests', 0, 9)  # Top 10
-            
-            # 3. Contar requisições por endpoint
-            # Ignorar requisições estáticas e do próprio dashboard
-            if not path.startswith('/static/') and not path.startswith('/media/') and '/observability/' not in path:
-                endpoint_key = f'metrics:endpoint:{method}:{path}'
-                cache.incr(endpoint_key)
-                cache.expire(endpoint_key, 86400)  # Expirar após 24 horas
-                
-                # Armazenar tempo médio por endpoint
-                avg_key = f'metrics:endpoint_avg:{method}:{path}'
-                current_avg = cache.get(avg_key)
-                if current_avg:
-                    # Calcular média móvel (simplificado)
-                    new_avg = (float(current_avg) + duration_ms) / 2
-                else:
-                    new_avg = duration_ms
-                cache.set(avg_key, new_avg, 86400)
-                
-                # Manter lista de endpoints únicos (para buscar depois)
-                endpoints_list_key = 'metrics:endpoints_list'
-                endpoints_list = []
-                try:
-                    existing = cache.get(endpoints_list_key)
-                    if existing:
-                        endpoints_list = json.loads(existing)
-                except:
-                    pass
-                
-                # Adicionar endpoint se não existir
-                endpoint_info = {'method': method, 'path': path}
-                if endpoint_info not in endpoints_list:
-                    endpoints_list.append(endpoint_info)
-                    # Manter apenas últimos 100 endpoints
-                    if len(endpoints_list) > 100:
-                        endpoints_list = endpoints_list[-100:]
-                    cache.set(endpoints_list_key, json.dumps(endpoints_list), 86400)
-        except Exception as e:
-            # Não quebrar a requisição se houver erro ao armazenar métricas
-            logger.debug(f'Erro ao armazenar métricas: {str(e)}')
-        
+        coletor.registrar(
+            method, rota, status_code, duracao_us,
+            queries=query_count, queries_us=contador.tempo_us, tenant=tenant_name, lenta=lenta,
+        )
+        prometheus.registrar_requisicao(
+            request, status_code, duracao_us,
+            queries=query_count, queries_us=contador.tempo_us, tenant=tenant_name,
+        )
+
         # Adicionar headers de métricas na resposta (opcional, útil para debugging)
-        if hasattr(request, 'user') and request.user.is_staff:
-            response['X-Response-Time'] = f"{round(duration * 1000, 2)}ms"
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['X-Response-Time'] = f"{duracao_ms}ms"
             response['X-Query-Count'] = str(query_count)
-        
-        return response
-    
+
     def process_exception(self, request, exception):
         """Registra métricas quando há exceção"""
-        if not hasattr(request, '_start_time'):
+        contador = getattr(request, '_metrics_queries', None)
+        if contador is None:
             return None
-        
-        duration = time.time() - request._start_time
-        query_count = len(connection.queries) - request._query_count_start
-        
-        tenant_name = None
-        if hasattr(connection, 'tenant') and connection.tenant:
-            tenant_name = connection.tenant.schema_name
-        
-        user_id = None
-        username = None
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            user_id = request.user.id
-            username = request.user.username
-        
+
+        user_id, username = _usuario_da_requisicao(request)
         logger.error(
             f"[METRICS] Exceção durante requisição: {type(exception).__name__}",
             extra={
                 'method': request.method,
                 'path': request.path,
-                'duration_ms': round(duration * 1000, 2),
-                'query_count': query_count,
-                'tenant': tenant_name,
+                'duration_ms': round((time.perf_counter_ns() - request._metrics_inicio) / 1_000_000, 2),
+                'query_count': contador.quantidade,
+                'tenant': _tenant_da_requisicao(request),
                 'user_id': user_id,
                 'username': username,
                 'exception_type': type(exception).__name__,
@@ -193,6 +152,5 @@ class MetricsMiddleware(MiddlewareMixin):
             },
             exc_info=True,
         )
-        
-        return None
 
+        return None
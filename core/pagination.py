@@ -0,0 +1,219 @@
+"""
+Paginação da API.
+
+OptionalCursorPagination mantém o comportamento do PageNumberPagination e
+acrescenta dois modos opcionais, escolhidos pelo cliente via query params:
+
+- ``?sem_total=1``: paginação por página sem o ``COUNT(*)`` do total.
+- ``?paginacao=cursor`` (ou ``?cursor=...``): paginação por chave (keyset),
+  ordenada pelos campos de ``cursor_ordering`` da view. Cada página é uma
+  consulta ``WHERE (campo, id) < (valor, id) ORDER BY ... LIMIT n``, com custo
+  constante independente da profundidade (sem OFFSET e sem contagem).
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _param_verdadeiro(valor):
+    return str(valor).lower() in ('1', 'true', 'sim', 'yes')
+
+
+class KeysetPagination:
+    """
+    Paginação keyset (somente avanço, ideal para rolagem infinita).
+
+    A ordenação é uma tupla de campos, sendo o último um campo único (ex: id),
+    como ``('-data_movimentacao', '-id')``. O cursor é opaco para o cliente:
+    contém os valores desses campos na última linha da página atual.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, ordering, page_size, max_page_size=None):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.next_values = None
+
+    @staticmethod
+    def _campo(ordem):
+        return ordem.lstrip('-')
+
+    def _codificar(self, valores):
+        def normalizar(valor):
+            if isinstance(valor, (datetime, date)):
+                return valor.isoformat()
+            if isinstance(valor, Decimal):
+                return str(valor)
+            return valor
+
+        dados = json.dumps([normalizar(v) for v in valores], separators=(',', ':'))
+        return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii')
+
+    def _decodificar(self, cursor):
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (ValueError, TypeError, UnicodeError):
+            raise NotFound('Cursor inválido.')
+        if not isinstance(valores, list) or len(valores) != len(self.ordering):
+            raise NotFound('Cursor inválido.')
+        return valores
+
+    def _filtro_apos(self, valores):
+        """
+        Monta o predicado "linha vem depois de (valores)" na ordenação.
+
+        Para (a DESC, id DESC): a <= va AND (a < va OR (a = va AND id < vid))
+
+        O termo redundante "a <= va" é o que o PostgreSQL usa como condição do
+        índice; só com o OR ele percorre o índice desde o início e filtra.
+        """
+        filtro = Q()
+        igualdade = {}
+        for ordem, valor in zip(self.ordering, valores):
+            campo = self._campo(ordem)
+            lookup = 'lt' if ordem.startswith('-') else 'gt'
+            filtro |= Q(**igualdade, **{f'{campo}__{lookup}': valor})
+            igualdade[campo] = valor
+        if len(self.ordering) > 1:
+            primeira = self.ordering[0]
+            lookup = 'lte' if primeira.startswith('-') else 'gte'
+            filtro = Q(**{f'{self._campo(primeira)}__{lookup}': valores[0]}) & filtro
+        return filtro
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                tamanho = int(request.query_params[self.page_size_query_param])
+                if tamanho > 0:
+                    if self.max_page_size:
+                        return min(tamanho, self.max_page_size)
+                    return tamanho
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._filtro_apos(self._decodificar(cursor)))
+
+        # Buscar uma linha a mais para saber se existe próxima página
+        resultados = list(queryset[:page_size + 1])
+        self.next_values = None
+        if len(resultados) > page_size:
+            resultados = resultados[:page_size]
+            ultimo = resultados[-1]
+            self.next_values = [self._valor(ultimo, self._campo(ordem)) for ordem in self.ordering]
+        return resultados
+
+    @staticmethod
+    def _valor(obj, campo):
+        for parte in campo.split('__'):
+            obj = getattr(obj, parte)
+        return obj
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._codificar(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """
+    Paginação padrão da API com modos opcionais.
+
+    Sem parâmetros extras o comportamento é idêntico ao PageNumberPagination
+    (``count``/``next``/``previous``/``results``). Views que definem
+    ``cursor_ordering`` aceitam ``?paginacao=cursor``; todas aceitam
+    ``?sem_total=1`` para omitir o ``count``.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    modo_query_param = 'paginacao'
+    sem_total_query_param = 'sem_total'
+
+    def __init__(self):
+        self._keyset = None
+        self._sem_total = False
+
+    def _usar_cursor(self, request, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if not ordering:
+            return None
+        if (request.query_params.get(self.modo_query_param) == 'cursor'
+                or request.query_params.get(KeysetPagination.cursor_query_param)):
+            return ordering
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self._usar_cursor(request, view)
+        if ordering:
+            self._keyset = KeysetPagination(ordering, self.page_size, self.max_page_size)
+            return self._keyset.paginate_queryset(queryset, request, view)
+
+        self._sem_total = _param_verdadeiro(request.query_params.get(self.sem_total_query_param))
+        if self._sem_total:
+            return self._paginar_sem_total(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def _paginar_sem_total(self, queryset, request):
+        """Paginação por página sem COUNT: busca page_size + 1 linhas para saber se há próxima."""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            numero = int(request.query_params.get(self.page_query_param, 1))
+            if numero < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound('Página inválida.')
+
+        inicio = (numero - 1) * page_size
+        resultados = list(queryset[inicio:inicio + page_size + 1])
+        self._numero = numero
+        self._tem_proxima = len(resultados) > page_size
+        return resultados[:page_size]
+
+    def get_paginated_response(self, data):
+        if self._keyset is not None:
+            return self._keyset.get_paginated_response(data)
+
+        if self._sem_total:
+            url = self.request.build_absolute_uri()
+            proxima = replace_query_param(url, self.page_query_param, self._numero + 1) if self._tem_proxima else None
+            if self._numero <= 1:
+                anterior = None
+            elif self._numero == 2:
+                anterior = remove_query_param(url, self.page_query_param)
+            else:
+                anterior = replace_query_param(url, self.page_query_param, self._numero - 1)
+            return Response({
+                'next': proxima,
+                'previous': anterior,
+                'results': data,
+            })
+
+        return super().get_paginated_response(data)
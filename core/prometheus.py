@@ -0,0 +1,168 @@
+"""
+Métricas no formato Prometheus/OpenMetrics (exposição em /api/metrics/prometheus/).
+
+Coletores em processo (prometheus_client), alimentados por:
+- MetricsMiddleware: latência, queries por requisição e requisições por tenant
+- Caches da aplicação (tenants.resolver, accounts.contexto/acesso/matriz_permissoes):
+  acertos e faltas, para a taxa de acerto por cache
+- Signals do Celery (siscr/celery.py): duração das tasks
+
+O label de rota é o nome da URL resolvida (resolver_match.view_name, ex.:
+'api:health-check'), nunca o path, para não multiplicar séries por ID.
+
+Com vários processos (workers do gunicorn, filhos do worker prefork do
+Celery), definir a variável de ambiente PROMETHEUS_MULTIPROC_DIR com um
+diretório vazio a cada inicialização: cada processo grava os valores em
+arquivos mmap nesse diretório e a exposição soma todos. No hook child_exit do
+gunicorn, chamar processo_encerrado(worker.pid); no Celery, o signal
+worker_process_shutdown (siscr/celery.py) faz o mesmo.
+
+As métricas das tasks são gravadas pelos processos do worker do Celery, não
+pelo web que atende o scrape. Cada serviço usa o próprio diretório (os PIDs de
+containers diferentes se repetem) num volume compartilhado, e o web soma
+também os diretórios de PROMETHEUS_MULTIPROC_DIRS_EXTRAS (ex.: o do worker;
+ver docker-compose.yml).
+
+Sem prometheus_client instalado, as funções de registro não fazem nada.
+"""
+import glob
+import logging
+import os
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    PROMETHEUS_DISPONIVEL = True
+except ImportError:
+    PROMETHEUS_DISPONIVEL = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+ROTA_NAO_RESOLVIDA = '<nao_resolvida>'
+
+# Buckets de latência (segundos) e de quantidade de queries por requisição
+_BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_BUCKETS_QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+_BUCKETS_TASKS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+if PROMETHEUS_DISPONIVEL:
+    REQUISICAO_DURACAO = Histogram(
+        'siscr_http_request_duration_seconds',
+        'Duração das requisições HTTP',
+        ['method', 'route', 'status'],
+        buckets=_BUCKETS_LATENCIA,
+    )
+    REQUISICAO_QUERIES = Histogram(
+        'siscr_db_queries_per_request',
+        'Quantidade de queries SQL por requisição',
+        ['route'],
+        buckets=_BUCKETS_QUERIES,
+    )
+    REQUISICAO_QUERIES_DURACAO = Histogram(
+        'siscr_db_query_duration_seconds',
+        'Tempo total em queries SQL por requisição',
+        ['route'],
+        buckets=_BUCKETS_LATENCIA,
+    )
+    TENANT_REQUISICOES = Counter(
+        'siscr_tenant_requests',
+        'Requisições HTTP por tenant',
+        ['tenant'],
+    )
+    CACHE_CONSULTAS = Counter(
+        'siscr_cache_lookups',
+        'Consultas aos caches da aplicação (result=hit|miss)',
+        ['cache', 'result'],
+    )
+    TASK_DURACAO = Histogram(
+        'siscr_celery_task_duration_seconds',
+        'Duração das tasks do Celery',
+        ['task', 'state'],
+        buckets=_BUCKETS_TASKS,
+    )
+
+
+def rota_nomeada(request):
+    """
+    Nome da URL resolvida da requisição (label `route`).
+
+    Returns:
+        view_name (com namespace) ou ROTA_NAO_RESOLVIDA (404, rotas sem nome)
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return ROTA_NAO_RESOLVIDA
+    return match.view_name
+
+
+def registrar_requisicao(request, status_code, duracao_us, queries=0, queries_us=0, tenant=None):
+    """Registra uma requisição finalizada (chamado pelo MetricsMiddleware)"""
+    if not PROMETHEUS_DISPONIVEL:
+        return
+    rota = rota_nomeada(request)
+    REQUISICAO_DURACAO.labels(request.method, rota, str(status_code)).observe(duracao_us / 1_000_000)
+    REQUISICAO_QUERIES.labels(rota).observe(queries)
+    REQUISICAO_QUERIES_DURACAO.labels(rota).observe(queries_us / 1_000_000)
+    TENANT_REQUISICOES.labels(tenant or 'public').inc()
+
+
+def registrar_cache(nome, acerto):
+    """
+    Registra uma consulta a um cache da aplicação.
+
+    Args:
+        nome: Nome do cache (ex.: 'tenant_resolver')
+        acerto: True se o valor estava no cache
+    """
+    if PROMETHEUS_DISPONIVEL:
+        CACHE_CONSULTAS.labels(nome, 'hit' if acerto else 'miss').inc()
+
+
+def registrar_task(nome, duracao_s, estado):
+    """Registra a duração de uma task do Celery"""
+    if PROMETHEUS_DISPONIVEL:
+        TASK_DURACAO.labels(nome, estado or 'UNKNOWN').observe(duracao_s)
+
+
+def multiprocesso():
+    """True se os valores são compartilhados entre processos (PROMETHEUS_MULTIPROC_DIR)"""
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir'))
+
+
+class _ColetorDiretorios:
+    """Soma os arquivos mmap de vários diretórios multiprocesso (este serviço e os extras)"""
+
+    def __init__(self, diretorios):
+        self.diretorios = diretorios
+
+    def collect(self):
+        arquivos = []
+        for diretorio in self.diretorios:
+            arquivos.extend(glob.glob(os.path.join(diretorio, '*.db')))
+        return multiprocess.MultiProcessCollector.merge(arquivos, accumulate=True)
+
+
+def exportar():
+    """
+    Métricas de todos os processos no formato de exposição do Prometheus.
+
+    Returns:
+        Tupla (conteúdo em bytes, content type)
+    """
+    if multiprocesso():
+        diretorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+        extras = [d for d in getattr(settings, 'PROMETHEUS_MULTIPROC_DIRS_EXTRAS', []) if os.path.isdir(d)]
+        registry = CollectorRegistry()
+        registry.register(_ColetorDiretorios([diretorio, *extras]))
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def processo_encerrado(pid):
+    """Remove os valores de gauges do processo encerrado (child_exit do gunicorn, worker_process_shutdown do Celery)"""
+    if PROMETHEUS_DISPONIVEL and multiprocesso():
+        multiprocess.mark_process_dead(pid)
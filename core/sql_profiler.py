@@ -0,0 +1,272 @@
+"""
+Profiler de SQL por fingerprint e por schema (tenant), com amostragem.
+
+Com SQL_PROFILER_ATIVO, o MetricsMiddleware sorteia SQL_PROFILER_AMOSTRAGEM das
+requisições e instala ProfilerRequisicao como connection.execute_wrapper. Na
+requisição só são guardados (sql, duração); ao final, cada SQL é normalizado
+(fingerprint: literais, parâmetros e listas IN trocados por `?`) e agregado em
+memória por (schema, fingerprint):
+
+- contagem, tempo total e histograma de duração (p95), em microssegundos
+- plano (EXPLAIN, sem ANALYZE) de SELECTs acima de SQL_PROFILER_EXPLAIN_MS,
+  no máximo um por fingerprint a cada SQL_PROFILER_EXPLAIN_INTERVALO segundos
+
+O acumulado segue para o Redis no flush periódico de core.metrics.coletor.
+relatorio() lê o top-N de todos os processos (dashboard de observabilidade e
+comando `manage.py sql_profile`).
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.metrics import TTL_CHAVES, Histograma, _cliente_redis, coletor
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = 'sqlprof:v1'
+MAX_SQL = 2000
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_PARAMETRO = re.compile(r'%s|%\([^)]+\)s|\$\d+')
+_RE_LISTA_IN = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_RE_VALUES = re.compile(r'\bVALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*', re.IGNORECASE)
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def ativo():
+    return _config('SQL_PROFILER_ATIVO', False)
+
+
+def amostrar():
+    """Sorteia se a requisição atual será perfilada"""
+    return ativo() and random.random() < _config('SQL_PROFILER_AMOSTRAGEM', 0.05)
+
+
+@lru_cache(maxsize=4096)
+def normalizar_sql(sql):
+    """
+    Texto normalizado do SQL: literais e parâmetros viram `?`, listas IN e
+    VALUES de qualquer tamanho viram uma só forma.
+    """
+    texto = _RE_STRING.sub('?', sql)
+    texto = _RE_PARAMETRO.sub('?', texto)
+    texto = _RE_NUMERO.sub('?', texto)
+    texto = _RE_LISTA_IN.sub('IN (...)', texto)
+    texto = _RE_VALUES.sub('VALUES (...)', texto)
+    return _RE_ESPACOS.sub(' ', texto).strip()
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Identificador curto (sha1) do SQL normalizado"""
+    return hashlib.sha1(normalizar_sql(sql).encode()).hexdigest()[:16]
+
+
+class ProfilerRequisicao:
+    """execute_wrapper de uma requisição amostrada: só anota (sql, parâmetros, duração)"""
+
+    __slots__ = ('consultas',)
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, params, many, (time.perf_counter_ns() - inicio) // 1000))
+
+
+class _Consulta:
+    __slots__ = ('contagem', 'soma_us', 'histograma')
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma_us = 0
+        self.histograma = Histograma()
+
+
+class ProfilerSQL:
+    """Agregado do processo por (schema, fingerprint), enviado pelo flush de core.metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._consultas = {}
+        self._textos = {}
+        self._planos = []
+        # (schema, fingerprint) -> instante do último EXPLAIN
+        self._explicados = {}
+
+    def registrar(self, schema, profiler_requisicao):
+        """
+        Agrega as consultas de uma requisição amostrada e captura planos das lentas.
+
+        Deve ser chamado fora do execute_wrapper (o EXPLAIN usa a conexão).
+        """
+        limite_explain_us = _config('SQL_PROFILER_EXPLAIN_MS', 100) * 1000
+        lentas = []
+        with self._lock:
+            for sql, params, many, duracao_us in profiler_requisicao.consultas:
+                chave = (schema, fingerprint(sql))
+                dados = self._consultas.get(chave)
+                if dados is None:
+                    dados = self._consultas[chave] = _Consulta()
+                    self._textos[chave[1]] = normalizar_sql(sql)[:MAX_SQL]
+                dados.contagem += 1
+                dados.soma_us += duracao_us
+                dados.histograma.registrar(duracao_us)
+                if duracao_us >= limite_explain_us and not many and self._deve_explicar(chave):
+                    lentas.append((chave, sql, params, duracao_us))
+
+        for chave, sql, params, duracao_us in lentas:
+            plano = explicar(sql, params)
+            if plano is not None:
+                with self._lock:
+                    self._planos.append((chave, {
+                        'plan': plano,
+                        'duration_ms': round(duracao_us / 1000, 2),
+                        'timestamp': timezone.now().isoformat(),
+                    }))
+
+    def _deve_explicar(self, chave):
+        agora = time.monotonic()
+        if len(self._explicados) > 10000:
+            self._explicados.clear()
+        ultimo = self._explicados.get(chave)
+        if ultimo is not None and agora - ultimo < _config('SQL_PROFILER_EXPLAIN_INTERVALO', 3600):
+            return False
+        self._explicados[chave] = agora
+        return True
+
+    def _trocar_buffer(self):
+        with self._lock:
+            buffer = (self._consultas, self._textos, self._planos)
+            self._consultas, self._textos, self._planos = {}, {}, []
+        return buffer
+
+    def enviar(self, pipe):
+        """Acrescenta o acumulado ao pipeline do flush de core.metrics (None: descarta)"""
+        consultas, textos, planos = self._trocar_buffer()
+        if pipe is None or not (consultas or planos):
+            return
+
+        chave_stats = f'{PREFIXO}:stats'
+        for (schema, fp), dados in consultas.items():
+            campo = f'{schema}|{fp}'
+            pipe.hincrby(chave_stats, f'{campo}|count', dados.contagem)
+            pipe.hincrby(chave_stats, f'{campo}|sum_us', dados.soma_us)
+            chave_hist = f'{PREFIXO}:hist:{campo}'
+            for indice, contagem in dados.histograma.faixas.items():
+                pipe.hincrby(chave_hist, indice, contagem)
+            pipe.expire(chave_hist, TTL_CHAVES)
+        if textos:
+            pipe.hset(f'{PREFIXO}:sql', mapping=textos)
+        for (schema, fp), plano in planos:
+            pipe.hset(f'{PREFIXO}:planos', f'{schema}|{fp}', json.dumps(plano))
+        for sufixo in ('stats', 'sql', 'planos'):
+            pipe.expire(f'{PREFIXO}:{sufixo}', TTL_CHAVES)
+
+
+profiler = ProfilerSQL()
+coletor.registrar_envio(profiler.enviar)
+
+
+def explicar(sql, params):
+    """Plano de execução (EXPLAIN, sem executar) de um SELECT, ou None"""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    try:
+        # Savepoint: um erro no EXPLAIN não invalida a transação em andamento
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(linha[0] for linha in cursor.fetchall())
+    except Exception as e:
+        logger.debug(f'[SQLProfiler] Erro no EXPLAIN: {e}')
+        return None
+
+
+ORDENACOES = {
+    'total': lambda item: item['total_ms'],
+    'count': lambda item: item['count'],
+    'avg': lambda item: item['avg_ms'],
+}
+
+
+def relatorio(limite=20, schema=None, ordenar='total'):
+    """
+    Top-N de fingerprints (todos os processos) a partir do Redis.
+
+    Args:
+        limite: Quantidade de fingerprints
+        schema: Filtrar por schema (tenant)
+        ordenar: 'total' (tempo total), 'count' ou 'avg'
+
+    Returns:
+        Lista de dicts com schema, fingerprint, sql, count, total_ms, avg_ms,
+        p95_ms e plan (None se não capturado); vazia sem Redis
+    """
+    cliente = _cliente_redis()
+    if cliente is None:
+        return []
+
+    agregados = {}
+    for campo, valor in cliente.hgetall(f'{PREFIXO}:stats').items():
+        schema_fp, metrica = campo.decode().rsplit('|', 1)
+        agregados.setdefault(schema_fp, {})[metrica] = int(valor)
+
+    itens = []
+    for schema_fp, dados in agregados.items():
+        schema_item, fp = schema_fp.split('|', 1)
+        if schema and schema_item != schema:
+            continue
+        contagem = dados.get('count', 0) or 1
+        itens.append({
+            'schema': schema_item,
+            'fingerprint': fp,
+            'count': dados.get('count', 0),
+            'total_ms': round(dados.get('sum_us', 0) / 1000, 2),
+            'avg_ms': round(dados.get('sum_us', 0) / contagem / 1000, 2),
+        })
+    itens.sort(key=ORDENACOES.get(ordenar, ORDENACOES['total']), reverse=True)
+    itens = itens[:limite]
+    if not itens:
+        return []
+
+    pipe = cliente.pipeline(transaction=False)
+    for item in itens:
+        pipe.hgetall(f"{PREFIXO}:hist:{item['schema']}|{item['fingerprint']}")
+    pipe.hmget(f'{PREFIXO}:sql', [item['fingerprint'] for item in itens])
+    pipe.hmget(f'{PREFIXO}:planos', [f"{item['schema']}|{item['fingerprint']}" for item in itens])
+    *histogramas, textos, planos = pipe.execute()
+
+    for item, faixas, texto, plano in zip(itens, histogramas, textos, planos):
+        histograma = Histograma({int(k): int(v) for k, v in faixas.items()})
+        item['p95_ms'] = round(histograma.percentil(95) / 1000, 2)
+        item['sql'] = texto.decode() if texto else None
+        item['plan'] = json.loads(plano) if plano else None
+    return itens
+
+
+def limpar():
+    """Remove os dados do profiler do Redis"""
+    cliente = _cliente_redis()
+    if cliente is None:
+        return
+    chaves = list(cliente.scan_iter(match=f'{PREFIXO}:*', count=500))
+    if chaves:
+        cliente.delete(*chaves)
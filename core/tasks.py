@@ -0,0 +1,16 @@
+"""
+Tarefas periódicas do core
+"""
+from celery import shared_task
+
+from core.health import atualizar_probes, registrar_heartbeat_celery
+
+
+@shared_task(ignore_result=True)
+def atualizar_health():
+    """
+    Heartbeat do Celery e atualização das probes de saúde (core/health.py).
+    Executa a cada HEALTH_PROBES_INTERVALO segundos (Celery beat).
+    """
+    registrar_heartbeat_celery()
+    atualizar_probes()
@@ -0,0 +1,239 @@
+"""
+Fan-out de tarefas periódicas por tenant (schema).
+
+Em vez de uma tarefa percorrer todos os schemas em série num único worker,
+disparar_por_tenant() divide os schemas em lotes e dispara um subtask Celery
+por lote (group + chord). O callback consolida os resultados e registra o
+tempo de cada tenant.
+
+Uso:
+    def _expirar_reservas_tenant(schema_name, **kwargs):
+        ...  # já executa dentro de schema_context(schema_name)
+        return {'expired': n}
+
+    @shared_task
+    def expirar_soft_reservations():
+        return disparar_por_tenant(
+            'expirar_soft_reservations',
+            'estoque.tasks._expirar_reservas_tenant',
+            tabelas=['estoque_reservaestoque'],
+        )
+
+- Concorrência: no máximo TENANT_FANOUT_MAX_PARALELO subtasks por execução
+  (cada subtask processa seu lote de schemas em série), para não esgotar
+  conexões do banco.
+- Tabelas existentes por schema: consultadas uma vez no information_schema e
+  guardadas em cache (processo + cache compartilhado) por TENANT_FANOUT_CACHE_TABELAS segundos.
+"""
+import logging
+import time
+
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.utils import ProgrammingError
+from django.utils.module_loading import import_string
+from django_tenants.utils import schema_context
+
+logger = logging.getLogger(__name__)
+
+# Cache em processo: schema -> (expira_em, frozenset de tabelas)
+_tabelas_por_schema = {}
+
+
+def _ttl_cache_tabelas():
+    return getattr(settings, 'TENANT_FANOUT_CACHE_TABELAS', 600)
+
+
+def get_active_tenant_schemas():
+    """
+    Schemas dos tenants ativos (sem o public).
+    Retorna uma lista vazia se a tabela de tenants não existir ou houver erro.
+    """
+    from tenants.models import Tenant
+
+    if 'tenants_tenant' not in tabelas_do_schema('public'):
+        logger.warning("[CELERY] Tabela tenants_tenant não existe ainda. Retornando lista vazia...")
+        return []
+
+    try:
+        with schema_context('public'):
+            return list(
+                Tenant.objects.filter(is_active=True)
+                .exclude(schema_name='public')
+                .order_by('schema_name')
+                .values_list('schema_name', flat=True)
+            )
+    except Exception as e:
+        logger.error(f"[CELERY] Erro ao buscar tenants: {e}")
+        return []
+
+
+def tabelas_do_schema(schema_name):
+    """
+    Conjunto de tabelas existentes no schema, com cache (processo + cache compartilhado).
+    """
+    agora = time.monotonic()
+    em_memoria = _tabelas_por_schema.get(schema_name)
+    if em_memoria and em_memoria[0] > agora:
+        return em_memoria[1]
+
+    chave = f'tenant_fanout:tabelas:{schema_name}'
+    try:
+        tabelas = cache.get(chave)
+    except Exception:
+        tabelas = None
+
+    if tabelas is None:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT table_name FROM information_schema.tables WHERE table_schema = %s",
+                    [schema_name]
+                )
+                tabelas = frozenset(linha[0] for linha in cursor.fetchall())
+        except Exception as e:
+            logger.warning(f"[CELERY] Erro ao listar tabelas do schema {schema_name}: {e}")
+            return frozenset()
+        # Schema sem tabelas pode estar sendo migrado: não guardar em cache
+        if tabelas:
+            try:
+                cache.set(chave, tabelas, _ttl_cache_tabelas())
+            except Exception:
+                pass
+
+    if tabelas:
+        _tabelas_por_schema[schema_name] = (agora + _ttl_cache_tabelas(), tabelas)
+    return tabelas
+
+
+def invalidar_cache_tabelas(schema_name):
+    """Descarta o cache de tabelas do schema (ex: após migrar um tenant)"""
+    _tabelas_por_schema.pop(schema_name, None)
+    try:
+        cache.delete(f'tenant_fanout:tabelas:{schema_name}')
+    except Exception:
+        pass
+
+
+def executar_no_tenant(funcao_path, schema_name, tabelas=(), kwargs=None):
+    """
+    Executa a função de um tenant dentro do seu schema e mede o tempo.
+
+    Returns:
+        Dict com schema, status ('ok', 'skipped' ou 'error'), result e duration_ms
+    """
+    inicio = time.perf_counter()
+    resultado = {'schema': schema_name, 'status': 'ok', 'result': None}
+
+    try:
+        faltantes = [t for t in tabelas if t not in tabelas_do_schema(schema_name)]
+        if faltantes:
+            logger.debug(f"[CELERY] Tabela(s) {', '.join(faltantes)} não existe(m) no tenant {schema_name}. Pulando...")
+            resultado['status'] = 'skipped'
+        else:
+            funcao = import_string(funcao_path)
+            with schema_context(schema_name):
+                resultado['result'] = funcao(schema_name, **(kwargs or {}))
+    except ProgrammingError as e:
+        if 'does not exist' in str(e):
+            logger.debug(f"[CELERY] Tabelas não existem no tenant {schema_name}. Pulando...")
+            invalidar_cache_tabelas(schema_name)
+            resultado['status'] = 'skipped'
+        else:
+            logger.error(f"[CELERY] Erro ao processar tenant {schema_name}: {str(e)}", exc_info=True)
+            resultado.update(status='error', error=str(e))
+    except Exception as e:
+        logger.error(f"[CELERY] Erro ao processar tenant {schema_name}: {str(e)}", exc_info=True)
+        resultado.update(status='error', error=str(e))
+
+    resultado['duration_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+@shared_task
+def executar_lote_tenants(funcao_path, schemas, tabelas=(), kwargs=None):
+    """Subtask do fan-out: processa um lote de schemas em série"""
+    return [executar_no_tenant(funcao_path, schema, tabelas, kwargs) for schema in schemas]
+
+
+@shared_task
+def consolidar_resultados_tenants(lotes, nome):
+    """
+    Callback do fan-out: soma os contadores numéricos de todos os tenants
+    e registra o tempo por tenant.
+    """
+    resultados = [r for lote in lotes for r in (lote or [])]
+    totais = {}
+    for r in resultados:
+        for chave, valor in (r.get('result') or {}).items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                totais[chave] = totais.get(chave, 0) + valor
+
+    por_status = {'ok': 0, 'skipped': 0, 'error': 0}
+    for r in resultados:
+        por_status[r['status']] = por_status.get(r['status'], 0) + 1
+
+    duracoes = {r['schema']: r['duration_ms'] for r in resultados}
+    mais_lentos = sorted(duracoes.items(), key=lambda item: item[1], reverse=True)[:5]
+
+    logger.info(
+        f"[CELERY] {nome} concluída: {por_status['ok']} tenant(s) ok, {por_status['skipped']} pulado(s), "
+        f"{por_status['error']} erro(s); totais={totais}; mais lentos (ms)={mais_lentos}"
+    )
+    return {
+        **totais,
+        'tenants': por_status,
+        'errors': totais.get('errors', 0) + por_status['error'],
+        'duration_ms': duracoes,
+    }
+
+
+def _dividir_em_lotes(schemas, max_paralelo):
+    quantidade = max(1, min(max_paralelo, len(schemas)))
+    # Distribuição alternada: tenants grandes (ordem alfabética não indica tamanho) se espalham entre lotes
+    return [schemas[i::quantidade] for i in range(quantidade)]
+
+
+def disparar_por_tenant(nome, funcao_path, tabelas=(), kwargs=None, schemas=None, max_paralelo=None):
+    """
+    Dispara funcao_path para cada schema, em paralelo (group + chord).
+
+    Args:
+        nome: Nome da tarefa (para logs)
+        funcao_path: Caminho da função por tenant, chamada como funcao(schema_name, **kwargs)
+            dentro de schema_context(schema_name); deve retornar um dict serializável
+        tabelas: Tabelas que precisam existir no schema (senão o tenant é pulado)
+        kwargs: Argumentos extras (serializáveis em JSON) para a função
+        schemas: Lista de schemas (padrão: tenants ativos)
+        max_paralelo: Máximo de subtasks simultâneos (padrão: TENANT_FANOUT_MAX_PARALELO)
+
+    Returns:
+        Em modo eager (testes/desenvolvimento) o resultado consolidado;
+        senão um dict com o id do chord e a quantidade de tenants/lotes.
+    """
+    if schemas is None:
+        schemas = get_active_tenant_schemas()
+    if not schemas:
+        logger.warning(f"[CELERY] {nome}: nenhum tenant ativo encontrado. Pulando execução...")
+        return {'tenants': 0}
+
+    tabelas = list(tabelas)
+    if max_paralelo is None:
+        max_paralelo = getattr(settings, 'TENANT_FANOUT_MAX_PARALELO', 8)
+    lotes = _dividir_em_lotes(list(schemas), max_paralelo)
+
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        resultados = [executar_lote_tenants(funcao_path, lote, tabelas, kwargs) for lote in lotes]
+        return consolidar_resultados_tenants(resultados, nome)
+
+    logger.info(f"[CELERY] {nome}: disparando {len(schemas)} tenant(s) em {len(lotes)} lote(s)")
+    resultado = chord(
+        group(executar_lote_tenants.s(funcao_path, lote, tabelas, kwargs) for lote in lotes)
+    )(consolidar_resultados_tenants.s(nome))
+    return {
+        'chord_id': resultado.id,
+        'tenants': len(schemas),
+        'lotes': len(lotes),
+    }
@@ -0,0 +1,37 @@
+"""
+Testes para o fan-out de tarefas por tenant (core/tenant_tasks.py)
+"""
+from django.test import TestCase
+
+
+class TenantFanoutTests(TestCase):
+    """Testes para o fan-out de tarefas por tenant (core/tenant_tasks.py)"""
+    
+    def test_dividir_em_lotes(self):
+        """Schemas são distribuídos entre no máximo max_paralelo lotes"""
+        from core.tenant_tasks import _dividir_em_lotes
+        
+        lotes = _dividir_em_lotes(['a', 'b', 'c', 'd', 'e'], 2)
+        self.assertEqual(lotes, [['a', 'c', 'e'], ['b', 'd']])
+        self.assertEqual(_dividir_em_lotes(['a'], 8), [['a']])
+    
+    def test_consolidar_resultados(self):
+        """Contadores numéricos são somados e erros/pulos contados por tenant"""
+        from core.tenant_tasks import consolidar_resultados_tenants
+        
+        lotes = [
+            [
+                {'schema': 't1', 'status': 'ok', 'result': {'expired': 2}, 'duration_ms': 10.0},
+                {'schema': 't2', 'status': 'skipped', 'result': None, 'duration_ms': 1.0},
+            ],
+            [
+                {'schema': 't3', 'status': 'ok', 'result': {'expired': 3, 'errors': 1}, 'duration_ms': 5.0},
+                {'schema': 't4', 'status': 'error', 'result': None, 'error': 'x', 'duration_ms': 2.0},
+            ],
+        ]
+        resultado = consolidar_resultados_tenants(lotes, 'teste')
+        
+        self.assertEqual(resultado['expired'], 5)
+        self.assertEqual(resultado['errors'], 2)
+        self.assertEqual(resultado['tenants'], {'ok': 2, 'skipped': 1, 'error': 1})
+        self.assertEqual(resultado['duration_ms']['t1'], 10.0)
@@ -96,3 +96,36 @@ def validate_required_fields(data, required_fields):
     
     return (True, [], None)
 
+
+def ler_ultimas_linhas(caminho, quantidade, tamanho_bloco=8192):
+    """
+    Lê as últimas linhas de um arquivo de texto a partir do fim (sem ler o arquivo inteiro)
+    
+    Args:
+        caminho: Caminho do arquivo
+        quantidade: Número de linhas desejadas
+        tamanho_bloco: Bytes lidos por vez, do fim para o início
+    
+    Returns:
+        Lista com até `quantidade` linhas (str, sem quebra de linha), da mais antiga para a mais recente
+    """
+    if quantidade <= 0:
+        return []
+    
+    with open(caminho, 'rb') as f:
+        f.seek(0, 2)
+        posicao = f.tell()
+        blocos = []
+        quebras = 0
+        # Uma quebra a mais para descartar a primeira linha, possivelmente parcial
+        while posicao > 0 and quebras <= quantidade:
+            leitura = min(tamanho_bloco, posicao)
+            posicao -= leitura
+            f.seek(posicao)
+            bloco = f.read(leitura)
+            blocos.append(bloco)
+            quebras += bloco.count(b'\n')
+    
+    conteudo = b''.join(reversed(blocos)).decode('utf-8', errors='ignore')
+    linhas = conteudo.splitlines()
+    return linhas[-quantidade:]
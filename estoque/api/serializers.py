@@ -199,7 +199,7 @@ class EstoqueConsolidadoSerializer(serializers.Serializer):
 
 
 class ProcessarMultiplasEntradasSerializer(serializers.Serializer):
-    """Serializer para processar múltiplas entradas de estoque (modo desenvolvimento)"""
+    """Serializer para processar múltiplas entradas de estoque em lote"""
     entradas = serializers.ListField(
         child=serializers.DictField(
             child=serializers.CharField()
@@ -5,15 +5,19 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Sum
-from decimal import Decimal
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
 
 from estoque.models import (
     Location, Estoque, MovimentacaoEstoque,
-    ReservaEstoque, PrevisaoMovimentacao, GrupoFilial
+    ReservaEstoque, PrevisaoMovimentacao, GrupoFilial, IndicadorEstoque
 )
 from estoque.services import (
     processar_entrada_estoque,
+    processar_entradas_em_lote,
     processar_saida_estoque,
     processar_transferencia,
     cancelar_transferencia,
@@ -24,7 +28,11 @@ from estoque.services import (
 )
 from cadastros.models import Produto
 from cadastros.utils import filter_by_empresa_filial, get_current_empresa_filial
-from accounts.permissions import is_tenant_admin
+from accounts.contexto import contexto_do_usuario
+from core.pagination import OptionalCursorPagination
+from estoque.consolidacao import obter_estoque_consolidado
+from estoque.indicadores import CAMPOS_SOMA, calcular_metricas, somar_indicadores
+from reports import exportacao
 from .serializers import (
     LocationSerializer,
     EstoqueSerializer,
@@ -58,7 +66,7 @@ class LocationViewSet(viewsets.ModelViewSet):
         Isso garante isolamento total entre empresas dentro do mesmo tenant.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa/filial do usuário (mesmo para admin)
         # Isso garante que usuário da empresa A não veja locations da empresa B
@@ -88,6 +96,10 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     search_fields = ['produto__nome', 'produto__codigo', 'location__nome']
     filterset_fields = ['empresa', 'location', 'produto']
+    pagination_class = OptionalCursorPagination
+    # Ordenação do modo ?paginacao=cursor (keyset): só colunas do próprio Estoque, para o
+    # predicado do cursor e o ORDER BY usarem o índice (empresa, produto, id) sem join
+    cursor_ordering = ('produto_id', 'id')
     
     def get_queryset(self):
         """
@@ -97,7 +109,7 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         Isso garante isolamento total entre empresas dentro do mesmo tenant.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa/filial do usuário (mesmo para admin)
         if not empresa:
@@ -110,7 +122,7 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             queryset = queryset.filter(empresa=empresa)
         
-        return queryset.select_related('produto', 'location', 'empresa').order_by('produto__nome')
+        return queryset.select_related('produto', 'location', 'empresa').order_by('produto__nome', 'id')
     
     def partial_update(self, request, *args, **kwargs):
         """Permite atualização parcial (ex: estoque_minimo, estoque_maximo)"""
@@ -126,13 +138,13 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = EstoqueConsolidadoSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         produto_id = serializer.validated_data.get('produto_id')
         empresa_id = serializer.validated_data.get('empresa_id')
         grupo_filial_id = serializer.validated_data.get('grupo_filial_id')
         
         # Se não for admin, usar empresa/filial do usuário
-        if not is_tenant_admin(request.user):
+        if not contexto_do_usuario(request).is_tenant_admin:
             empresa_id = empresa.id if empresa else None
         
         if grupo_filial_id:
@@ -140,8 +152,9 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
             try:
                 grupo = GrupoFilial.objects.get(id=grupo_filial_id, empresa=empresa)
                 if produto_id:
-                    produto = Produto.objects.get(id=produto_id)
-                    consolidado = grupo.get_estoque_consolidado(produto)
+                    consolidado = obter_estoque_consolidado(
+                        'GRUPO', grupo.empresa_id, grupo_id=grupo.id, produto_id=produto_id
+                    )
                     return Response(consolidado)
                 else:
                     return Response({'error': 'produto_id é obrigatório para grupo de filiais'}, 
@@ -155,30 +168,10 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
             from tenants.models import Empresa
             try:
                 empresa_consolidada = Empresa.objects.get(id=empresa_id)
-                estoques = Estoque.objects.filter(empresa=empresa_consolidada)
-                
-                if produto_id:
-                    estoques = estoques.filter(produto_id=produto_id)
-                
-                consolidado = estoques.aggregate(
-                    total_atual=Sum('quantidade_atual'),
-                    total_reservada=Sum('quantidade_reservada'),
-                    total_disponivel=Sum('quantidade_disponivel'),
-                    total_prevista_entrada=Sum('quantidade_prevista_entrada'),
-                    total_prevista_saida=Sum('quantidade_prevista_saida'),
+                consolidado = obter_estoque_consolidado(
+                    'EMPRESA', empresa_consolidada.id, produto_id=produto_id
                 )
-                
-                valor_total = sum(e.valor_total for e in estoques)
-                
-                return Response({
-                    'quantidade_atual': consolidado['total_atual'] or Decimal('0.000'),
-                    'quantidade_reservada': consolidado['total_reservada'] or Decimal('0.000'),
-                    'quantidade_disponivel': consolidado['total_disponivel'] or Decimal('0.000'),
-                    'quantidade_prevista_entrada': consolidado['total_prevista_entrada'] or Decimal('0.000'),
-                    'quantidade_prevista_saida': consolidado['total_prevista_saida'] or Decimal('0.000'),
-                    'valor_total': Decimal(str(valor_total)),
-                    'locations': estoques.values('location').distinct().count(),
-                })
+                return Response(consolidado)
             except Empresa.DoesNotExist:
                 return Response({'error': 'Empresa não encontrada'}, 
                               status=status.HTTP_404_NOT_FOUND)
@@ -192,7 +185,7 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = ProcessarEntradaSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         if not empresa:
             return Response({'error': 'Empresa não configurada para o usuário'}, 
                           status=status.HTTP_400_BAD_REQUEST)
@@ -237,7 +230,7 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = ProcessarSaidaSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         if not empresa:
             return Response({'error': 'Empresa não configurada para o usuário'}, 
                           status=status.HTTP_400_BAD_REQUEST)
@@ -296,7 +289,7 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = ProcessarTransferenciaSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         if not empresa:
             return Response({'error': 'Empresa não configurada para o usuário'}, 
                           status=status.HTTP_400_BAD_REQUEST)
@@ -338,83 +331,82 @@ class EstoqueViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['post'])
     def entrada_multipla(self, request):
         """
-        Processa múltiplas entradas de estoque (modo desenvolvimento).
-        Apenas disponível quando ENVIRONMENT=development.
+        Processa múltiplas entradas de estoque em lote (ex: recebimento de pedido de compra).
+        Todas as linhas são gravadas em uma única transação: se alguma falhar, nada é gravado.
         """
-        from django.conf import settings
-        
-        # Verificar se está em modo desenvolvimento
-        if getattr(settings, 'ENVIRONMENT', 'production') != 'development':
-            return Response(
-                {'error': 'Este recurso está disponível apenas em modo de desenvolvimento'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
         serializer = ProcessarMultiplasEntradasSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         if not empresa:
             return Response({'error': 'Empresa não configurada para o usuário'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        resultados = []
-        erros = []
+        linhas = serializer.validated_data['entradas']
         
-        for idx, entrada_data in enumerate(serializer.validated_data['entradas']):
-            try:
-                # Produto usa codigo_produto como chave primária, não id
-                produto = Produto.objects.get(codigo_produto=int(entrada_data['produto_id']))
-                location = Location.objects.get(id=int(entrada_data['location_id']))
-                
-                # Validar que location pertence à empresa
-                if location.empresa != empresa:
-                    erros.append(f"Linha {idx + 1}: Location não pertence à empresa do usuário")
-                    continue
-                
-                # Validar que location permite entrada
-                if not location.permite_entrada:
-                    erros.append(f"Linha {idx + 1}: Location '{location.nome}' não permite entrada")
-                    continue
-                
-                quantidade = Decimal(str(entrada_data['quantidade']))
-                valor_unitario = Decimal(str(entrada_data.get('valor_unitario', '0.00')))
-                
-                resultado = processar_entrada_estoque(
-                    produto=produto,
-                    location=location,
-                    empresa=empresa,
-                    quantidade=quantidade,
-                    valor_unitario=valor_unitario,
-                    origem=entrada_data.get('origem', 'COMPRA'),
-                    documento_referencia=entrada_data.get('documento_referencia'),
-                    observacoes=entrada_data.get('observacoes'),
-                )
-                
-                resultados.append({
-                    'linha': idx + 1,
-                    'produto': produto.nome,
-                    'location': location.nome,
-                    'quantidade': str(quantidade),
-                    'estoque_id': resultado['estoque'].id,
-                })
-                
-            except Produto.DoesNotExist:
+        # Resolver produtos e locations em uma query cada (não uma por linha)
+        # Produto usa codigo_produto como chave primária, não id
+        try:
+            produtos = Produto.objects.in_bulk({int(e['produto_id']) for e in linhas})
+            locations = Location.objects.in_bulk({int(e['location_id']) for e in linhas})
+        except (ValueError, TypeError):
+            return Response({'error': 'produto_id e location_id devem ser numéricos'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        entradas = []
+        erros = []
+        for idx, entrada_data in enumerate(linhas):
+            produto = produtos.get(int(entrada_data['produto_id']))
+            location = locations.get(int(entrada_data['location_id']))
+            
+            if produto is None:
                 erros.append(f"Linha {idx + 1}: Produto não encontrado")
-            except Location.DoesNotExist:
+                continue
+            if location is None:
                 erros.append(f"Linha {idx + 1}: Location não encontrada")
-            except EstoqueServiceError as e:
-                erros.append(f"Linha {idx + 1}: {str(e)}")
-            except Exception as e:
-                erros.append(f"Linha {idx + 1}: Erro inesperado - {str(e)}")
+                continue
+            
+            try:
+                entradas.append({
+                    'produto': produto,
+                    'location': location,
+                    'quantidade': Decimal(str(entrada_data['quantidade'])),
+                    'valor_unitario': Decimal(str(entrada_data.get('valor_unitario') or '0.00')),
+                    'origem': entrada_data.get('origem'),
+                    'documento_referencia': entrada_data.get('documento_referencia'),
+                    'observacoes': entrada_data.get('observacoes'),
+                })
+            except InvalidOperation:
+                erros.append(f"Linha {idx + 1}: quantidade ou valor_unitario inválido")
         
         if erros:
             return Response({
                 'error': 'Alguns itens falharam',
                 'erros': erros,
-                'resultados': resultados,
+                'resultados': [],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            resultado = processar_entradas_em_lote(empresa=empresa, entradas=entradas)
+        except EstoqueServiceError as e:
+            return Response({
+                'error': 'Alguns itens falharam',
+                'erros': [str(e)],
+                'resultados': [],
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        resultados = [
+            {
+                'linha': idx + 1,
+                'produto': entrada['produto'].nome,
+                'location': entrada['location'].nome,
+                'quantidade': str(entrada['quantidade']),
+                'estoque_id': linha['estoque'].id,
+                'movimentacao_id': linha['movimentacao'].id,
+            }
+            for idx, (entrada, linha) in enumerate(zip(entradas, resultado['linhas']))
+        ]
+        
         return Response({
             'success': True,
             'processados': len(resultados),
@@ -429,6 +421,9 @@ class MovimentacaoEstoqueViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     search_fields = ['estoque__produto__nome', 'documento_referencia', 'numero_nota_fiscal']
     filterset_fields = ['tipo', 'origem', 'status', 'estoque', 'estoque__location']
+    pagination_class = OptionalCursorPagination
+    # Ordenação do modo ?paginacao=cursor (keyset)
+    cursor_ordering = ('-data_movimentacao', '-id')
     
     def get_queryset(self):
         """
@@ -437,7 +432,7 @@ class MovimentacaoEstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         IMPORTANTE: Mesmo admin do tenant só vê movimentações da empresa/filial configurada.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa do usuário (mesmo para admin)
         if not empresa:
@@ -445,22 +440,14 @@ class MovimentacaoEstoqueViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             queryset = queryset.filter(estoque__empresa=empresa)
         
-        return queryset.select_related('estoque', 'estoque__produto', 'estoque__location').order_by('-data_movimentacao')
+        return queryset.select_related('estoque', 'estoque__produto', 'estoque__location').order_by('-data_movimentacao', '-id')
     
-    @action(detail=False, methods=['get'])
-    def transferencias(self, request):
+    def _get_transferencias_queryset(self, empresa):
         """
-        Retorna transferências agrupadas (uma linha por transferência, não duas movimentações separadas).
-        Agrupa movimentações de SAIDA e ENTRADA com origem='TRANSFERENCIA' que têm o mesmo documento_referencia
-        e location_origem/location_destino.
+        Queryset base das transferências: uma linha por SAIDA, com a ENTRADA
+        correspondente identificada pelo par explícito (movimentacao_par).
         """
-        empresa, filial = get_current_empresa_filial(request.user)
-        if not empresa:
-            return Response({'error': 'Empresa não configurada para o usuário'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        # Buscar movimentações de transferência (apenas SAIDA, pois ENTRADA é o par)
-        transferencias_saida = MovimentacaoEstoque.objects.filter(
+        return MovimentacaoEstoque.objects.filter(
             estoque__empresa=empresa,
             origem='TRANSFERENCIA',
             tipo='SAIDA',
@@ -470,108 +457,123 @@ class MovimentacaoEstoqueViewSet(viewsets.ReadOnlyModelViewSet):
             'estoque__produto',
             'location_origem',
             'location_destino'
-        ).order_by('-data_movimentacao', '-created_at')
-        
-        # Agrupar e formatar transferências
-        transferencias_formatadas = []
-        for mov_saida in transferencias_saida:
-            # Buscar a movimentação de entrada correspondente
-            mov_entrada = MovimentacaoEstoque.objects.filter(
-                origem='TRANSFERENCIA',
-                tipo='ENTRADA',
-                location_origem=mov_saida.location_origem,
-                location_destino=mov_saida.location_destino,
-                estoque__produto=mov_saida.estoque.produto,
-                documento_referencia=mov_saida.documento_referencia,
-                data_movimentacao=mov_saida.data_movimentacao,
-                created_at=mov_saida.created_at
-            ).select_related('estoque__produto', 'location_origem', 'location_destino').first()
-            
-            transferencias_formatadas.append({
-                'id': mov_saida.id,  # Usar ID da saída como identificador principal
-                'produto_id': mov_saida.estoque.produto.codigo_produto,
-                'produto_nome': mov_saida.estoque.produto.nome,
-                'produto_codigo': str(mov_saida.estoque.produto.codigo_produto),
-                'location_origem_id': mov_saida.location_origem.id,
-                'location_origem_nome': mov_saida.location_origem.nome,
-                'location_origem_codigo': mov_saida.location_origem.codigo,
-                'location_destino_id': mov_saida.location_destino.id,
-                'location_destino_nome': mov_saida.location_destino.nome,
-                'location_destino_codigo': mov_saida.location_destino.codigo,
-                'quantidade': str(mov_saida.quantidade),
-                'valor_unitario': str(mov_saida.valor_unitario),
-                'valor_total': str(mov_saida.valor_unitario * mov_saida.quantidade),
-                'documento_referencia': mov_saida.documento_referencia,
-                'observacoes': mov_saida.observacoes,
-                'data_movimentacao': mov_saida.data_movimentacao.isoformat() if mov_saida.data_movimentacao else None,
-                'created_at': mov_saida.created_at.isoformat() if mov_saida.created_at else None,
-                'movimentacao_saida_id': mov_saida.id,
-                'movimentacao_entrada_id': mov_entrada.id if mov_entrada else None,
-                'status': mov_saida.status,
-                'motivo_cancelamento': mov_saida.motivo_cancelamento,
-            })
+        )
+    
+    @staticmethod
+    def _formatar_transferencia(mov_saida):
+        """Formata uma movimentação de SAIDA como uma transferência (saída + entrada)"""
+        return {
+            'id': mov_saida.id,  # Usar ID da saída como identificador principal
+            'produto_id': mov_saida.estoque.produto.codigo_produto,
+            'produto_nome': mov_saida.estoque.produto.nome,
+            'produto_codigo': str(mov_saida.estoque.produto.codigo_produto),
+            'location_origem_id': mov_saida.location_origem.id,
+            'location_origem_nome': mov_saida.location_origem.nome,
+            'location_origem_codigo': mov_saida.location_origem.codigo,
+            'location_destino_id': mov_saida.location_destino.id,
+            'location_destino_nome': mov_saida.location_destino.nome,
+            'location_destino_codigo': mov_saida.location_destino.codigo,
+            'quantidade': str(mov_saida.quantidade),
+            'valor_unitario': str(mov_saida.valor_unitario),
+            'valor_total': str(mov_saida.valor_unitario * mov_saida.quantidade),
+            'documento_referencia': mov_saida.documento_referencia,
+            'observacoes': mov_saida.observacoes,
+            'data_movimentacao': mov_saida.data_movimentacao.isoformat() if mov_saida.data_movimentacao else None,
+            'created_at': mov_saida.created_at.isoformat() if mov_saida.created_at else None,
+            'movimentacao_saida_id': mov_saida.id,
+            'movimentacao_entrada_id': mov_saida.movimentacao_par_id,
+            'status': mov_saida.status,
+            'motivo_cancelamento': mov_saida.motivo_cancelamento,
+        }
+    
+    @action(detail=False, methods=['get'])
+    def transferencias(self, request):
+        """
+        Retorna transferências agrupadas (uma linha por transferência, não duas movimentações separadas).
+        
+        A listagem é uma única consulta paginada no banco: cada SAIDA com origem='TRANSFERENCIA'
+        já carrega o id da ENTRADA correspondente em movimentacao_par.
+        
+        Filtros (query params):
+            data_inicio / data_fim: intervalo de data_movimentacao (YYYY-MM-DD)
+            location_id: location de origem OU destino
+            location_origem_id / location_destino_id: location específica
+            produto_id: código do produto
+            status: status da transferência (ex: CONFIRMADA, CANCELADA)
+        """
+        empresa, filial = get_current_empresa_filial(request.user, request)
+        if not empresa:
+            return Response({'error': 'Empresa não configurada para o usuário'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = self._get_transferencias_queryset(empresa)
+        params = request.query_params
+        
+        # Intervalo de datetime (início do dia / início do dia seguinte): o lookup __date
+        # aplica uma função sobre a coluna e impede o uso do índice de data_movimentacao
+        for param, lookup, dias in (('data_inicio', 'data_movimentacao__gte', 0),
+                                    ('data_fim', 'data_movimentacao__lt', 1)):
+            valor = params.get(param)
+            if valor:
+                data = parse_date(valor)
+                if data is None:
+                    return Response({'error': f'{param} inválida (use YYYY-MM-DD)'}, 
+                                  status=status.HTTP_400_BAD_REQUEST)
+                limite = timezone.make_aware(datetime.combine(data + timedelta(days=dias), time.min))
+                queryset = queryset.filter(**{lookup: limite})
+        
+        ids = {}
+        for param in ('location_id', 'location_origem_id', 'location_destino_id', 'produto_id'):
+            if params.get(param):
+                try:
+                    ids[param] = int(params[param])
+                except ValueError:
+                    return Response({'error': f'{param} deve ser numérico'}, 
+                                  status=status.HTTP_400_BAD_REQUEST)
+        
+        if 'location_id' in ids:
+            queryset = queryset.filter(
+                Q(location_origem_id=ids['location_id']) | Q(location_destino_id=ids['location_id'])
+            )
+        if 'location_origem_id' in ids:
+            queryset = queryset.filter(location_origem_id=ids['location_origem_id'])
+        if 'location_destino_id' in ids:
+            queryset = queryset.filter(location_destino_id=ids['location_destino_id'])
+        if 'produto_id' in ids:
+            queryset = queryset.filter(estoque__produto_id=ids['produto_id'])
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        
+        queryset = queryset.order_by('-data_movimentacao', '-id')
         
-        # Paginação manual
         from rest_framework.pagination import PageNumberPagination
         paginator = PageNumberPagination()
-        paginator.page_size = int(request.query_params.get('page_size', 20))
-        page = paginator.paginate_queryset(transferencias_formatadas, request)
+        paginator.page_size_query_param = 'page_size'
+        paginator.max_page_size = 1000
+        page = paginator.paginate_queryset(queryset, request)
         
         if page is not None:
-            return paginator.get_paginated_response(page)
+            return paginator.get_paginated_response([self._formatar_transferencia(mov) for mov in page])
         
-        return Response(transferencias_formatadas)
+        return Response([self._formatar_transferencia(mov) for mov in queryset])
     
     @action(detail=False, methods=['get'], url_path='transferencias/(?P<transferencia_id>[^/.]+)')
     def get_transferencia(self, request, transferencia_id=None):
         """
         Busca uma transferência específica pelo ID da movimentação de saída.
         """
+        empresa, filial = get_current_empresa_filial(request.user, request)
+        if not empresa:
+            return Response({'error': 'Empresa não configurada para o usuário'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            movimentacao_saida = MovimentacaoEstoque.objects.select_related(
-                'estoque', 'estoque__produto', 'location_origem', 'location_destino'
-            ).get(id=transferencia_id, origem='TRANSFERENCIA', tipo='SAIDA')
-        except MovimentacaoEstoque.DoesNotExist:
+            movimentacao_saida = self._get_transferencias_queryset(empresa).get(id=transferencia_id)
+        except (MovimentacaoEstoque.DoesNotExist, ValueError):
             return Response({'error': 'Transferência não encontrada'}, 
                           status=status.HTTP_404_NOT_FOUND)
         
-        # Buscar movimentação de entrada correspondente
-        movimentacao_entrada = MovimentacaoEstoque.objects.filter(
-            origem='TRANSFERENCIA',
-            tipo='ENTRADA',
-            location_origem=movimentacao_saida.location_origem,
-            location_destino=movimentacao_saida.location_destino,
-            estoque__produto=movimentacao_saida.estoque.produto,
-            documento_referencia=movimentacao_saida.documento_referencia,
-            data_movimentacao=movimentacao_saida.data_movimentacao,
-            created_at=movimentacao_saida.created_at
-        ).select_related('estoque').first()
-        
-        transferencia_formatada = {
-            'id': movimentacao_saida.id,
-            'produto_id': movimentacao_saida.estoque.produto.codigo_produto,
-            'produto_nome': movimentacao_saida.estoque.produto.nome,
-            'produto_codigo': str(movimentacao_saida.estoque.produto.codigo_produto),
-            'location_origem_id': movimentacao_saida.location_origem.id,
-            'location_origem_nome': movimentacao_saida.location_origem.nome,
-            'location_origem_codigo': movimentacao_saida.location_origem.codigo,
-            'location_destino_id': movimentacao_saida.location_destino.id,
-            'location_destino_nome': movimentacao_saida.location_destino.nome,
-            'location_destino_codigo': movimentacao_saida.location_destino.codigo,
-            'quantidade': str(movimentacao_saida.quantidade),
-            'valor_unitario': str(movimentacao_saida.valor_unitario),
-            'valor_total': str(movimentacao_saida.valor_unitario * movimentacao_saida.quantidade),
-            'documento_referencia': movimentacao_saida.documento_referencia,
-            'observacoes': movimentacao_saida.observacoes,
-            'data_movimentacao': movimentacao_saida.data_movimentacao.isoformat() if movimentacao_saida.data_movimentacao else None,
-            'created_at': movimentacao_saida.created_at.isoformat() if movimentacao_saida.created_at else None,
-            'movimentacao_saida_id': movimentacao_saida.id,
-            'movimentacao_entrada_id': movimentacao_entrada.id if movimentacao_entrada else None,
-            'status': movimentacao_saida.status,
-            'motivo_cancelamento': movimentacao_saida.motivo_cancelamento,
-        }
-        
-        return Response(transferencia_formatada)
+        return Response(self._formatar_transferencia(movimentacao_saida))
     
     @action(detail=True, methods=['post'], url_path='cancelar-transferencia')
     def cancelar_transferencia(self, request, pk=None):
@@ -624,7 +626,7 @@ class ReservaEstoqueViewSet(viewsets.ModelViewSet):
         IMPORTANTE: Mesmo admin do tenant só vê reservas da empresa/filial configurada.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa do usuário (mesmo para admin)
         if not empresa:
@@ -639,7 +641,7 @@ class ReservaEstoqueViewSet(viewsets.ModelViewSet):
         serializer = CriarReservaSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        empresa, filial = get_current_empresa_filial(request.user)
+        empresa, filial = get_current_empresa_filial(request.user, request)
         if not empresa:
             return Response({'error': 'Empresa não configurada para o usuário'}, 
                           status=status.HTTP_400_BAD_REQUEST)
@@ -722,7 +724,7 @@ class PrevisaoMovimentacaoViewSet(viewsets.ModelViewSet):
         IMPORTANTE: Mesmo admin do tenant só vê previsões da empresa/filial configurada.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa do usuário (mesmo para admin)
         if not empresa:
@@ -748,7 +750,7 @@ class GrupoFilialViewSet(viewsets.ModelViewSet):
         IMPORTANTE: Mesmo admin do tenant só vê grupos da empresa configurada.
         """
         queryset = super().get_queryset()
-        empresa, filial = get_current_empresa_filial(self.request.user)
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
         
         # SEMPRE filtrar por empresa do usuário (mesmo para admin)
         if not empresa:
@@ -803,24 +805,85 @@ class RelatorioViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def indicadores(self, request):
-        """Indicadores de estoque"""
-        # TODO: Implementar lógica de relatório
-        return Response({
-            'rotatividade': '0.00',
-            'giro_estoque': '0.00',
-            'dias_estoque': 0,
-            'produtos_parados': 0,
-            'produtos_estoque_minimo': 0,
-            'valor_total_estoque': '0.00',
-            'custo_medio_geral': '0.00'
-        })
+        """
+        Indicadores de estoque (giro, rotatividade, dias de cobertura, produtos
+        parados e abaixo do mínimo), lidos dos snapshots calculados pela tarefa
+        calcular_indicadores_estoque.
+        
+        Filtros opcionais: location, produto. Sem filtros, retorna a empresa
+        (ou as locations da filial do usuário).
+        """
+        empresa, filial = get_current_empresa_filial(request.user, request)
+        if not empresa:
+            return Response({'error': 'Usuário sem empresa configurada'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            location_id = int(request.query_params['location']) if request.query_params.get('location') else None
+            produto_id = int(request.query_params['produto']) if request.query_params.get('produto') else None
+        except ValueError:
+            return Response({'error': 'location e produto devem ser ids numéricos'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        snapshots = IndicadorEstoque.objects.filter(empresa=empresa)
+        if produto_id:
+            # Produto: soma dos snapshots por estoque (uma linha por location)
+            snapshots = snapshots.filter(nivel='ESTOQUE', produto_id=produto_id)
+            if location_id:
+                snapshots = snapshots.filter(location_id=location_id)
+        elif location_id:
+            snapshots = snapshots.filter(nivel='LOCATION', location_id=location_id)
+        elif filial:
+            snapshots = snapshots.filter(nivel='LOCATION').filter(
+                Q(location__filial=filial) | Q(location__filial__isnull=True)
+            )
+        else:
+            snapshots = snapshots.filter(nivel='EMPRESA')
+        
+        if filial and (produto_id or location_id):
+            snapshots = snapshots.filter(Q(location__filial=filial) | Q(location__filial__isnull=True))
+        
+        indicadores = somar_indicadores(snapshots)
+        if indicadores is None:
+            # Indicadores ainda não calculados para este filtro
+            indicadores = calcular_metricas({campo: None for campo in CAMPOS_SOMA})
+        return Response(indicadores)
     
     @action(detail=False, methods=['get'])
     def exportar(self, request):
-        """Exportar relatório"""
-        formato = request.query_params.get('formato', 'xlsx')
-        # TODO: Implementar exportação
-        return Response({
-            'message': f'Exportação em {formato} ainda não implementada'
-        }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        """
+        Exporta um relatório de estoque em CSV ou XLSX, por streaming.
+        
+        Parâmetros: tipo (estoque-por-location, estoque-consolidado ou
+        movimentacoes; padrão: estoque-por-location), formato (csv ou xlsx;
+        padrão: xlsx) e os filtros do relatório (location_id, produto_id;
+        movimentações também tipo_movimentacao, origem, status, data_inicio e
+        data_fim). Com filial atual, só as locations da filial e as sem filial.
+        """
+        empresa, filial = get_current_empresa_filial(request.user, request)
+        if not empresa:
+            return Response({'error': 'Usuário sem empresa configurada'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        params = request.query_params
+        filtros = {
+            nome: params.get(nome)
+            for nome in ('location_id', 'produto_id', 'origem', 'status', 'data_inicio', 'data_fim')
+            if params.get(nome)
+        }
+        # "tipo" já identifica o relatório; o tipo da movimentação vem em tipo_movimentacao
+        if params.get('tipo_movimentacao'):
+            filtros['tipo'] = params['tipo_movimentacao']
+        
+        try:
+            return exportacao.exportar(
+                'estoque',
+                params.get('tipo', 'estoque-por-location'),
+                params.get('formato', 'xlsx'),
+                empresa,
+                filtros,
+                filial=filial,
+            )
+        except exportacao.FiltroInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
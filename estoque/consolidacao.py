@@ -0,0 +1,331 @@
+"""
+Manutenção da tabela materializada de estoque consolidado (EstoqueConsolidado).
+
+- aplicar_variacoes_estoque: atualização incremental a partir da diferença entre o
+  estado anterior e o atual de Estoques (UPDATE ... SET campo = campo + delta).
+- reconstruir_estoque_consolidado: reconstrução completa (por schema) a partir de Estoque.
+  É também o que aplica alterações de grupos (filiais, ativação), periodicamente.
+- obter_estoque_consolidado: leitura de uma linha (O(1)), com cálculo em tempo real
+  como fallback enquanto a linha ainda não foi materializada. O total da empresa
+  (todos os produtos) é somado na leitura a partir das linhas por produto: uma
+  linha única por empresa seria atualizada por toda movimentação da empresa.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Estoque, EstoqueConsolidado, GrupoFilial
+
+CAMPOS_QUANTIDADE = (
+    'quantidade_atual',
+    'quantidade_reservada',
+    'quantidade_disponivel',
+    'quantidade_prevista_entrada',
+    'quantidade_prevista_saida',
+    'valor_total',
+)
+
+
+def _somas():
+    return {campo: Sum(campo) for campo in CAMPOS_QUANTIDADE}
+
+
+def _como_gravado(campo, valor):
+    """Arredonda como o PostgreSQL grava numeric(p, s) (ex: valor_total calculado em memória)"""
+    casas = Estoque._meta.get_field(campo).decimal_places
+    return Decimal(valor or 0).quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+
+
+def snapshot_estoque(estoque):
+    """
+    Estado de um Estoque relevante para a consolidação.
+
+    Returns:
+        Dict com chaves (empresa/produto/location) e valores, ou None se o
+        estoque não conta para a consolidação (excluído).
+    """
+    if estoque.is_deleted:
+        return None
+    estado = {campo: _como_gravado(campo, getattr(estoque, campo)) for campo in CAMPOS_QUANTIDADE}
+    estado['empresa_id'] = estoque.empresa_id
+    estado['produto_id'] = estoque.produto_id
+    estado['location_id'] = estoque.location_id
+    estado['estoque_id'] = estoque.pk
+    return estado
+
+
+def snapshot_estoque_no_banco(estoque_id):
+    """
+    Mesmo formato de snapshot_estoque(), lido (e bloqueado) do banco.
+
+    Returns:
+        Dict com o estado gravado, ou None se não existe / está excluído
+    """
+    campos = CAMPOS_QUANTIDADE + ('empresa_id', 'produto_id', 'location_id', 'is_deleted')
+    gravado = Estoque.all_objects.select_for_update().filter(pk=estoque_id).values(*campos).first()
+    if gravado is None or gravado.pop('is_deleted'):
+        return None
+    gravado['estoque_id'] = estoque_id
+    return gravado
+
+
+def _grupos_da_location(empresa_id, location_id):
+    """Grupos ativos da empresa cujas filiais contêm a location (ativa)"""
+    return list(
+        GrupoFilial.objects.filter(
+            empresa_id=empresa_id,
+            is_active=True,
+            filiais__locations__id=location_id,
+            filiais__locations__empresa_id=empresa_id,
+            filiais__locations__is_active=True,
+            filiais__locations__is_deleted=False,
+        ).values_list('id', flat=True).distinct()
+    )
+
+
+def _filtro_chave(escopo, empresa_id, grupo_id, produto_id):
+    if escopo == 'GRUPO':
+        return {'escopo': 'GRUPO', 'grupo_id': grupo_id, 'produto_id': produto_id}
+    return {'escopo': 'EMPRESA', 'empresa_id': empresa_id, 'produto_id': produto_id, 'grupo__isnull': True}
+
+
+def _estoques_da_chave(escopo, empresa_id, grupo_id, produto_id):
+    """Queryset de Estoque que compõe uma linha consolidada"""
+    if escopo == 'GRUPO':
+        grupo = GrupoFilial.objects.get(id=grupo_id)
+        estoques = Estoque.objects.filter(
+            empresa_id=grupo.empresa_id,
+            location__empresa_id=grupo.empresa_id,
+            location__filial__in=grupo.filiais.all(),
+            location__is_active=True,
+            location__is_deleted=False,
+        )
+    else:
+        estoques = Estoque.objects.filter(empresa_id=empresa_id)
+    if produto_id is not None:
+        estoques = estoques.filter(produto_id=produto_id)
+    return estoques
+
+
+def calcular_estoque_consolidado(escopo, empresa_id, grupo_id=None, produto_id=None):
+    """
+    Calcula uma linha consolidada diretamente de Estoque (agregação no banco).
+
+    Returns:
+        Dict no formato de EstoqueConsolidado.as_dict()
+    """
+    estoques = _estoques_da_chave(escopo, empresa_id, grupo_id, produto_id)
+    totais = estoques.aggregate(**_somas(), locations=Count('location', distinct=True))
+    resultado = {campo: totais[campo] or Decimal('0') for campo in CAMPOS_QUANTIDADE}
+    resultado['locations'] = totais['locations'] or 0
+    return resultado
+
+
+def _aplicar_delta(escopo, empresa_id, grupo_id, produto_id, delta, delta_locations):
+    """Soma o delta na linha consolidada; materializa a linha se ainda não existir."""
+    if not any(delta.values()) and not delta_locations:
+        return
+
+    filtro = _filtro_chave(escopo, empresa_id, grupo_id, produto_id)
+    alteracoes = {campo: F(campo) + valor for campo, valor in delta.items() if valor}
+    if delta_locations:
+        alteracoes['locations'] = F('locations') + delta_locations
+    alteracoes['atualizado_em'] = timezone.now()
+
+    if EstoqueConsolidado.objects.filter(**filtro).update(**alteracoes):
+        return
+
+    # Linha ainda não materializada: calcular do zero (já inclui esta alteração)
+    valores = calcular_estoque_consolidado(escopo, empresa_id, grupo_id, produto_id)
+    try:
+        with transaction.atomic():
+            EstoqueConsolidado.objects.create(
+                escopo=escopo,
+                empresa_id=empresa_id,
+                grupo_id=grupo_id,
+                produto_id=produto_id,
+                **valores
+            )
+    except IntegrityError:
+        # Criada por uma transação concorrente, sem esta alteração: aplicar o delta
+        EstoqueConsolidado.objects.filter(**filtro).update(**alteracoes)
+
+
+def _variacoes(anterior, atual):
+    """(estado, delta, delta_locations) da alteração de um Estoque"""
+    if anterior is None and atual is None:
+        return []
+
+    mesma_chave = (
+        anterior is not None and atual is not None
+        and all(anterior[k] == atual[k] for k in ('empresa_id', 'produto_id', 'location_id'))
+    )
+    if mesma_chave:
+        # Mesma chave: uma única diferença por linha consolidada
+        return [(atual, {campo: atual[campo] - anterior[campo] for campo in CAMPOS_QUANTIDADE}, 0)]
+
+    # Estoque novo, excluído ou movido de chave: retira a contribuição antiga e soma a nova
+    variacoes = []
+    if anterior is not None:
+        variacoes.append((anterior, {campo: -anterior[campo] for campo in CAMPOS_QUANTIDADE}, -1))
+    if atual is not None:
+        variacoes.append((atual, {campo: atual[campo] for campo in CAMPOS_QUANTIDADE}, 1))
+    return variacoes
+
+
+def _ordem_de_bloqueio(chave):
+    escopo, empresa_id, grupo_id, produto_id = chave
+    return (escopo, empresa_id, grupo_id or 0, produto_id)
+
+
+def aplicar_variacoes_estoque(alteracoes):
+    """
+    Atualiza incrementalmente o estoque consolidado a partir de alterações de Estoque.
+
+    Os deltas de todas as alterações são somados por linha consolidada e aplicados
+    numa ordem fixa (escopo, empresa, grupo, produto): transações concorrentes
+    bloqueiam as linhas consolidadas na mesma ordem e não entram em deadlock.
+
+    Deve ser chamada na mesma transação da escrita dos Estoques, com as linhas de
+    Estoque bloqueadas (os serviços de estoque já usam select_for_update).
+
+    Args:
+        alteracoes: Pares (anterior, atual) de snapshot_estoque(); anterior é None
+                    para estoque novo e atual é None para estoque excluído
+    """
+    acumulados = {}
+    grupos_por_location = {}
+    for anterior, atual in alteracoes:
+        for estado, delta, delta_locations in _variacoes(anterior, atual):
+            empresa_id = estado['empresa_id']
+            produto_id = estado['produto_id']
+            location = (empresa_id, estado['location_id'])
+            if location not in grupos_por_location:
+                grupos_por_location[location] = _grupos_da_location(*location)
+
+            chaves = [('EMPRESA', empresa_id, None, produto_id)] + [
+                ('GRUPO', empresa_id, grupo_id, produto_id) for grupo_id in grupos_por_location[location]
+            ]
+            for chave in chaves:
+                soma, locations = acumulados.get(chave, ({campo: Decimal('0') for campo in CAMPOS_QUANTIDADE}, 0))
+                for campo, valor in delta.items():
+                    soma[campo] += valor
+                acumulados[chave] = (soma, locations + delta_locations)
+
+    for chave in sorted(acumulados, key=_ordem_de_bloqueio):
+        delta, delta_locations = acumulados[chave]
+        _aplicar_delta(*chave, delta, delta_locations)
+
+
+def aplicar_variacao_estoque(anterior, atual):
+    """
+    Atualiza incrementalmente o estoque consolidado a partir da alteração de um Estoque.
+
+    Args:
+        anterior: snapshot_estoque() antes da alteração (None se novo/excluído)
+        atual: snapshot_estoque() depois da alteração (None se excluído)
+    """
+    aplicar_variacoes_estoque([(anterior, atual)])
+
+
+def _linhas_empresa(empresa_id=None):
+    estoques = Estoque.objects.all()
+    if empresa_id is not None:
+        estoques = estoques.filter(empresa_id=empresa_id)
+
+    return [
+        EstoqueConsolidado(escopo='EMPRESA', **totais)
+        for totais in estoques.values('empresa_id', 'produto_id').annotate(
+            **_somas(), locations=Count('location', distinct=True)
+        ).order_by()
+    ]
+
+
+def _linhas_grupos(grupo_ids=None):
+    # Todas as condições sobre o grupo num único filter(), para usar o mesmo JOIN
+    filtro = {
+        'location__is_active': True,
+        'location__is_deleted': False,
+        'location__empresa_id': F('empresa_id'),
+        'location__filial__grupos__is_active': True,
+        'location__filial__grupos__is_deleted': False,
+        'location__filial__grupos__empresa_id': F('empresa_id'),
+    }
+    if grupo_ids is not None:
+        filtro['location__filial__grupos__id__in'] = grupo_ids
+
+    return [
+        EstoqueConsolidado(escopo='GRUPO', **totais)
+        for totais in Estoque.objects.filter(**filtro).values(
+            'empresa_id', 'produto_id', grupo_id=F('location__filial__grupos__id')
+        ).annotate(
+            **_somas(), locations=Count('location', distinct=True)
+        ).order_by()
+    ]
+
+
+def _bloquear_tabela_consolidada():
+    """
+    Bloqueia escritas concorrentes na tabela durante a reconstrução: movimentações
+    em andamento terminam antes, e as seguintes aplicam seus deltas sobre a nova base.
+    """
+    tabela = connection.ops.quote_name(EstoqueConsolidado._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {tabela} IN SHARE ROW EXCLUSIVE MODE')
+
+
+@transaction.atomic
+def reconstruir_estoque_consolidado():
+    """
+    Reconstrói toda a tabela consolidada do schema atual a partir de Estoque.
+
+    Returns:
+        Quantidade de linhas consolidadas geradas
+    """
+    _bloquear_tabela_consolidada()
+    EstoqueConsolidado.objects.all().delete()
+    linhas = _linhas_empresa() + _linhas_grupos()
+    EstoqueConsolidado.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+def _total_empresa(empresa_id):
+    """Totais de todos os produtos da empresa, somados das linhas consolidadas por produto"""
+    totais = EstoqueConsolidado.objects.filter(
+        escopo='EMPRESA', empresa_id=empresa_id
+    ).aggregate(**_somas(), produtos=Count('id'))
+    if not totais['produtos']:
+        # Tabela ainda não reconstruída
+        return calcular_estoque_consolidado('EMPRESA', empresa_id)
+
+    resultado = {campo: totais[campo] or Decimal('0') for campo in CAMPOS_QUANTIDADE}
+    # Locations distintas não são somáveis entre produtos: índice (empresa, location) de Estoque
+    resultado['locations'] = Estoque.objects.filter(
+        empresa_id=empresa_id
+    ).values('location_id').distinct().count()
+    return resultado
+
+
+def obter_estoque_consolidado(escopo, empresa_id, grupo_id=None, produto_id=None):
+    """
+    Lê o estoque consolidado materializado (uma linha, O(1)).
+
+    Se a linha ainda não existe (produto sem estoque no escopo, ou tabela ainda
+    não reconstruída), calcula em tempo real a partir de Estoque.
+
+    Sem produto_id, o total da empresa é a soma das suas linhas por produto.
+
+    Returns:
+        Dict no formato de EstoqueConsolidado.as_dict()
+    """
+    if escopo == 'EMPRESA' and produto_id is None:
+        return _total_empresa(empresa_id)
+
+    linha = EstoqueConsolidado.objects.filter(
+        **_filtro_chave(escopo, empresa_id, grupo_id, produto_id)
+    ).first()
+    if linha is not None:
+        return linha.as_dict()
+    return calcular_estoque_consolidado(escopo, empresa_id, grupo_id, produto_id)
@@ -0,0 +1,302 @@
+"""
+Motor de custos de estoque (custo médio ponderado e FIFO).
+
+Cada Estoque tem um estado de custo persistido (CustoEstoque) com a marca d'água
+da última movimentação incorporada. processar_custos() descobre os estoques com
+movimentações novas, incorpora apenas essas movimentações ao estado e grava o
+custo resultante em Estoque.valor_custo_medio. O trabalho de cada execução é
+proporcional às movimentações novas, não ao tamanho do catálogo.
+
+- MEDIO: entradas recalculam o custo médio a partir da quantidade anterior
+  registrada na movimentação (mesma fórmula de calcular_custo_medio_ponderado);
+  saídas não alteram o custo.
+- FIFO: entradas criam camadas; saídas consomem as camadas mais antigas.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .consolidacao import aplicar_variacoes_estoque, reconstruir_estoque_consolidado, snapshot_estoque
+from .models import ControleCustoEstoque, CustoEstoque, Estoque, MovimentacaoEstoque
+
+METODOS_CUSTO = ('MEDIO', 'FIFO')
+
+# Estoques bloqueados e processados por transação
+TAMANHO_LOTE_CUSTOS = 500
+
+# Acima deste número de estoques com custo alterado num lote, reconstruir o
+# consolidado é mais barato que aplicar um delta por estoque
+LIMITE_DELTAS_CUSTOS = 200
+
+# Movimentações revertidas aconteceram (a reversão é outra movimentação)
+STATUS_INCORPORADOS = ('CONFIRMADA', 'REVERTIDA')
+
+CAMPOS_MOVIMENTACAO = (
+    'id', 'estoque_id', 'tipo', 'status', 'quantidade',
+    'quantidade_anterior', 'valor_unitario', 'movimentacao_original_id',
+)
+
+ZERO = Decimal('0')
+CASAS_CUSTO = Decimal('0.000001')
+
+
+def metodo_custo_padrao():
+    """Método de custeio configurado (settings.ESTOQUE_METODO_CUSTO)"""
+    metodo = getattr(settings, 'ESTOQUE_METODO_CUSTO', 'MEDIO')
+    return metodo if metodo in METODOS_CUSTO else 'MEDIO'
+
+
+def _ler_camadas(estado):
+    return [[Decimal(quantidade), Decimal(custo)] for quantidade, custo in estado.camadas or []]
+
+
+def _gravar_camadas(camadas):
+    return [[str(quantidade), str(custo)] for quantidade, custo in camadas if quantidade > 0]
+
+
+def _consumir_camadas(camadas, quantidade):
+    """Retira a quantidade das camadas mais antigas"""
+    while quantidade > 0 and camadas:
+        if camadas[0][0] <= quantidade:
+            quantidade -= camadas.pop(0)[0]
+        else:
+            camadas[0][0] -= quantidade
+            quantidade = ZERO
+
+
+def _ajustar_camadas(camadas, quantidade, custo):
+    """
+    Alinha o total das camadas a uma quantidade conhecida (registro da
+    movimentação ou Estoque.quantidade_atual): cobre ajustes e cancelamentos
+    que não geram movimentação própria.
+    """
+    if quantidade <= 0:
+        camadas.clear()
+        return
+    total = sum((q for q, _ in camadas), ZERO)
+    if total > quantidade:
+        _consumir_camadas(camadas, total - quantidade)
+    elif total < quantidade:
+        camadas.append([quantidade - total, custo])
+
+
+def _custo_camadas(camadas, padrao):
+    quantidade = sum((q for q, _ in camadas), ZERO)
+    if quantidade <= 0:
+        return padrao
+    return (sum((q * c for q, c in camadas), ZERO) / quantidade).quantize(CASAS_CUSTO)
+
+
+def incorporar_movimentacoes(estado, movimentacoes, quantidade_atual):
+    """
+    Incorpora movimentações ao estado de custo (alterado em memória).
+
+    Args:
+        estado: CustoEstoque do estoque
+        movimentacoes: Dicts com CAMPOS_MOVIMENTACAO, em ordem crescente de id,
+            todos com id maior que estado.ultima_movimentacao_id
+        quantidade_atual: Quantidade atual do Estoque (bloqueado), para
+            ressincronizar o estado ao final
+    """
+    custo = estado.custo_unitario
+    camadas = _ler_camadas(estado) if estado.metodo == 'FIFO' else None
+
+    for mov in movimentacoes:
+        estado.ultima_movimentacao_id = mov['id']
+        if mov['status'] not in STATUS_INCORPORADOS or mov['tipo'] not in ('ENTRADA', 'SAIDA'):
+            continue
+
+        quantidade = mov['quantidade']
+        anterior = mov['quantidade_anterior']
+        if camadas is not None:
+            _ajustar_camadas(camadas, anterior, custo)
+
+        if mov['tipo'] == 'ENTRADA':
+            # Reversão de uma saída volta ao custo corrente, não ao valor da saída
+            custo_entrada = custo if mov['movimentacao_original_id'] else mov['valor_unitario']
+            if camadas is not None:
+                camadas.append([quantidade, custo_entrada])
+                custo = _custo_camadas(camadas, custo_entrada)
+            elif anterior <= 0:
+                custo = custo_entrada
+            else:
+                custo = ((anterior * custo + quantidade * custo_entrada) / (anterior + quantidade)).quantize(CASAS_CUSTO)
+        elif camadas is not None:
+            _consumir_camadas(camadas, quantidade)
+            custo = _custo_camadas(camadas, custo)
+
+    if camadas is not None:
+        _ajustar_camadas(camadas, quantidade_atual, custo)
+        custo = _custo_camadas(camadas, custo)
+        estado.camadas = _gravar_camadas(camadas)
+    estado.custo_unitario = Decimal(custo).quantize(CASAS_CUSTO)
+    estado.quantidade = quantidade_atual
+
+
+def _trocar_metodo(estado, metodo):
+    """Troca de método: o custo atual vira a base (uma camada) e vale daqui em diante"""
+    estado.metodo = metodo
+    if metodo == 'FIFO' and estado.quantidade > 0:
+        estado.camadas = _gravar_camadas([[estado.quantidade, estado.custo_unitario]])
+    else:
+        estado.camadas = []
+
+
+def _semear_estados(metodo):
+    """
+    Primeira execução no schema: estado inicial = custo atual de cada Estoque,
+    com marca d'água na sua última movimentação (sem reprocessar o histórico).
+
+    Returns:
+        Quantidade de estados criados
+    """
+    tabela_custo = connection.ops.quote_name(CustoEstoque._meta.db_table)
+    tabela_estoque = connection.ops.quote_name(Estoque._meta.db_table)
+    tabela_mov = connection.ops.quote_name(MovimentacaoEstoque._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {tabela_custo}
+                (estoque_id, metodo, quantidade, custo_unitario, camadas, ultima_movimentacao_id, atualizado_em)
+            SELECT e.id, %s, e.quantidade_atual, e.valor_custo_medio,
+                   CASE WHEN %s = 'FIFO' AND e.quantidade_atual > 0
+                        THEN jsonb_build_array(jsonb_build_array(e.quantidade_atual::text, e.valor_custo_medio::text))
+                        ELSE '[]'::jsonb END,
+                   COALESCE((SELECT MAX(m.id) FROM {tabela_mov} m WHERE m.estoque_id = e.id), 0),
+                   NOW()
+            FROM {tabela_estoque} e
+            WHERE NOT EXISTS (SELECT 1 FROM {tabela_custo} c WHERE c.estoque_id = e.id)
+        """, [metodo, metodo])
+        return cursor.rowcount
+
+
+@transaction.atomic
+def _processar_lote(estoque_ids, metodo, agora):
+    """
+    Incorpora as movimentações novas de um lote de estoques.
+
+    Os estoques são bloqueados (em ordem de id) antes de ler as movimentações:
+    como toda movimentação de um estoque é gravada com ele bloqueado, nenhuma
+    movimentação do lote fica pela metade, e o custo gravado não sobrescreve
+    uma entrada concorrente.
+    """
+    estoques = list(Estoque.all_objects.select_for_update().filter(id__in=estoque_ids).order_by('id'))
+    estados = {estado.estoque_id: estado for estado in CustoEstoque.objects.filter(estoque_id__in=estoque_ids)}
+
+    novos = []
+    for estoque in estoques:
+        if estoque.id not in estados:
+            # Estoque sem estado (criado após a semeadura): histórico completo,
+            # com o custo atual como base de um eventual saldo inicial sem movimentação
+            estado = CustoEstoque(estoque=estoque, metodo=metodo, custo_unitario=estoque.valor_custo_medio)
+            estados[estoque.id] = estado
+            novos.append(estado)
+        elif estados[estoque.id].metodo != metodo:
+            _trocar_metodo(estados[estoque.id], metodo)
+
+    # Uma condição (estoque, id > marca d'água) por estoque: usa o índice (estoque, id)
+    filtro = reduce(or_, (
+        Q(estoque_id=estoque_id, id__gt=estado.ultima_movimentacao_id)
+        for estoque_id, estado in estados.items()
+    ), Q(pk__in=[]))
+    movimentacoes = defaultdict(list)
+    for mov in MovimentacaoEstoque.objects.filter(filtro).order_by('estoque_id', 'id').values(*CAMPOS_MOVIMENTACAO):
+        movimentacoes[mov['estoque_id']].append(mov)
+
+    incorporadas = 0
+    alterados = []
+    for estoque in estoques:
+        estado = estados[estoque.id]
+        incorporar_movimentacoes(estado, movimentacoes[estoque.id], estoque.quantidade_atual)
+        estado.atualizado_em = agora
+        incorporadas += len(movimentacoes[estoque.id])
+
+        novo_custo = estado.custo_unitario.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        if novo_custo != estoque.valor_custo_medio:
+            anterior = snapshot_estoque(estoque)
+            estoque.valor_custo_medio = novo_custo
+            estoque.calcular_campos_derivados()
+            estoque.updated_at = agora
+            alterados.append((estoque, anterior))
+
+    campos_estado = ['metodo', 'quantidade', 'custo_unitario', 'camadas', 'ultima_movimentacao_id', 'atualizado_em']
+    CustoEstoque.objects.bulk_create(novos, batch_size=1000)
+    CustoEstoque.objects.bulk_update(
+        [estado for estado in estados.values() if estado.pk], campos_estado, batch_size=1000
+    )
+
+    precisa_reconstruir = len(alterados) > LIMITE_DELTAS_CUSTOS
+    if alterados:
+        Estoque.all_objects.bulk_update(
+            [estoque for estoque, _ in alterados],
+            ['valor_custo_medio', 'valor_total', 'quantidade_disponivel', 'updated_at'],
+            batch_size=1000
+        )
+        if not precisa_reconstruir:
+            aplicar_variacoes_estoque(
+                (anterior, snapshot_estoque(estoque)) for estoque, anterior in alterados
+            )
+
+    return incorporadas, len(alterados), precisa_reconstruir
+
+
+def processar_custos(metodo=None, tamanho_lote=TAMANHO_LOTE_CUSTOS):
+    """
+    Incorpora ao custo dos estoques do schema atual as movimentações novas
+    desde a última execução.
+
+    Args:
+        metodo: 'MEDIO' ou 'FIFO' (padrão: settings.ESTOQUE_METODO_CUSTO)
+        tamanho_lote: Estoques processados por transação
+
+    Returns:
+        Dict com movimentacoes (incorporadas), estoques (processados),
+        atualizados (custo gravado alterado) e semeados (estados criados na
+        primeira execução)
+    """
+    metodo = metodo or metodo_custo_padrao()
+    agora = timezone.now()
+    maior_id = MovimentacaoEstoque.all_objects.aggregate(maior=Max('id'))['maior'] or 0
+    resultado = {'movimentacoes': 0, 'estoques': 0, 'atualizados': 0, 'semeados': 0}
+
+    with transaction.atomic():
+        controle, criado = ControleCustoEstoque.objects.select_for_update().get_or_create(id=1)
+        if criado:
+            resultado['semeados'] = _semear_estados(metodo)
+            controle.ultima_movimentacao_id = controle.limite_seguro_id = maior_id
+            controle.executado_em = agora
+            controle.save()
+            return resultado
+        limite = controle.limite_seguro_id
+        ultima_anterior = controle.ultima_movimentacao_id
+
+    estoque_ids = sorted(set(
+        MovimentacaoEstoque.all_objects.filter(id__gt=limite).values_list('estoque_id', flat=True).distinct()
+    ))
+
+    reconstruir = False
+    for inicio in range(0, len(estoque_ids), tamanho_lote):
+        incorporadas, atualizados, precisa_reconstruir = _processar_lote(
+            estoque_ids[inicio:inicio + tamanho_lote], metodo, agora
+        )
+        resultado['movimentacoes'] += incorporadas
+        resultado['atualizados'] += atualizados
+        reconstruir = reconstruir or precisa_reconstruir
+    resultado['estoques'] = len(estoque_ids)
+
+    if reconstruir:
+        reconstruir_estoque_consolidado()
+
+    # Avançar a marca d'água só depois de todos os lotes: a próxima execução
+    # redescobre a partir do máximo visto na execução anterior
+    ControleCustoEstoque.objects.filter(id=controle.id).update(
+        limite_seguro_id=max(limite, ultima_anterior),
+        ultima_movimentacao_id=max(ultima_anterior, maior_id),
+        executado_em=agora
+    )
+    return resultado
@@ -0,0 +1,300 @@
+"""
+Indicadores de estoque (giro, rotatividade, dias de cobertura, produtos parados
+e abaixo do mínimo), materializados em IndicadorEstoque.
+
+calcular_indicadores() roda por schema (tarefa semanal calcular_indicadores_estoque):
+
+1. Estoques com movimentações desde o início do período anterior (ou sem
+   snapshot) são recalculados a partir do livro de movimentações, agregado por
+   dia no banco com funções de janela (saldo no fim de cada dia e saldo médio
+   ponderado pelo tempo). Só os dias até data_referencia entram no período; as
+   movimentações posteriores apenas levam do saldo atual ao saldo nessa data.
+2. Nos demais, saídas e estoque médio do período não mudaram: apenas
+   quantidade, valor e as flags de parado/abaixo do mínimo são atualizados,
+   num único UPDATE a partir de Estoque.
+3. Os níveis LOCATION e EMPRESA são somados a partir dos snapshots por estoque.
+
+O endpoint de indicadores lê apenas os snapshots (não consulta o livro).
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .models import Estoque, IndicadorEstoque, MovimentacaoEstoque
+
+# Estoques recalculados por instrução SQL
+TAMANHO_LOTE_INDICADORES = 2000
+
+CAMPOS_SOMA = (
+    'saidas_periodo', 'estoque_medio', 'quantidade_atual', 'valor_total',
+    'produtos', 'produtos_parados', 'produtos_estoque_minimo',
+)
+
+SQL_INDICADORES_ESTOQUE = """
+    WITH movimentos AS (
+        SELECT m.estoque_id,
+               (m.data_movimentacao AT TIME ZONE %(tz)s)::date AS dia,
+               SUM(CASE WHEN m.tipo = 'ENTRADA' THEN m.quantidade ELSE -m.quantidade END) AS liquido,
+               SUM(CASE WHEN m.tipo = 'SAIDA' THEN m.quantidade ELSE 0 END) AS saidas
+        FROM {movimentacao} m
+        WHERE m.estoque_id = ANY(%(ids)s)
+          AND m.is_deleted = false
+          AND m.status IN ('CONFIRMADA', 'REVERTIDA')
+          AND m.tipo IN ('ENTRADA', 'SAIDA')
+          AND m.data_movimentacao >= %(inicio)s
+        GROUP BY 1, 2
+    ),
+    diario AS (
+        SELECT * FROM movimentos WHERE dia <= %(fim)s::date
+    ),
+    finais AS (
+        -- Saldo no fim do período: quantidade atual menos o líquido posterior ao período
+        SELECT e.id AS estoque_id,
+               e.quantidade_atual - COALESCE((
+                   SELECT SUM(p.liquido) FROM movimentos p
+                   WHERE p.estoque_id = e.id AND p.dia > %(fim)s::date
+               ), 0) AS saldo_final,
+               EXISTS (SELECT 1 FROM diario d WHERE d.estoque_id = e.id) AS movimentado
+        FROM {estoque} e
+        WHERE e.id = ANY(%(ids)s)
+    ),
+    saldos AS (
+        SELECT d.estoque_id, d.dia, d.saidas,
+               -- Saldo no fim do dia: saldo final menos o líquido dos dias seguintes do período
+               f.saldo_final - COALESCE(SUM(d.liquido) OVER (
+                   PARTITION BY d.estoque_id ORDER BY d.dia DESC
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS saldo_fim_dia,
+               LEAD(d.dia) OVER (PARTITION BY d.estoque_id ORDER BY d.dia) AS proximo_dia,
+               ROW_NUMBER() OVER (PARTITION BY d.estoque_id ORDER BY d.dia) AS ordem,
+               f.saldo_final - SUM(d.liquido) OVER (PARTITION BY d.estoque_id) AS saldo_inicial
+        FROM diario d
+        JOIN finais f ON f.estoque_id = d.estoque_id
+    )
+    SELECT estoque_id,
+           SUM(saidas),
+           -- Saldo x dias em que vigorou (do dia até a próxima movimentação ou o fim do período),
+           -- mais o saldo inicial até a primeira movimentação
+           SUM(saldo_fim_dia * (COALESCE(proximo_dia, %(fim)s::date + 1) - dia))
+             + SUM(CASE WHEN ordem = 1 THEN saldo_inicial * (dia - %(inicio_dia)s::date) ELSE 0 END),
+           MAX(dia) FILTER (WHERE saidas > 0)
+    FROM saldos
+    GROUP BY estoque_id
+    UNION ALL
+    -- Sem movimentação no período: saldo constante (o saldo final) no período inteiro
+    SELECT estoque_id, 0, saldo_final * (%(fim)s::date + 1 - %(inicio_dia)s::date), NULL
+    FROM finais
+    WHERE NOT movimentado
+"""
+
+SQL_ATUALIZAR_SNAPSHOTS = """
+    UPDATE {indicador} AS i
+    SET quantidade_atual = e.quantidade_atual,
+        valor_total = e.valor_total,
+        produtos = 1,
+        produtos_estoque_minimo = CASE WHEN e.quantidade_atual < e.estoque_minimo THEN 1 ELSE 0 END,
+        produtos_parados = CASE
+            WHEN e.quantidade_atual > 0 AND (i.ultima_saida IS NULL OR i.ultima_saida < %(limite_parado)s)
+            THEN 1 ELSE 0 END,
+        periodo_inicio = %(inicio)s,
+        periodo_fim = %(fim)s,
+        calculado_em = %(agora)s
+    FROM {estoque} AS e
+    WHERE i.estoque_id = e.id AND i.nivel = 'ESTOQUE'
+"""
+
+
+def periodo_dias():
+    """Dias do período dos indicadores (settings.ESTOQUE_INDICADORES_PERIODO_DIAS)"""
+    return max(1, int(getattr(settings, 'ESTOQUE_INDICADORES_PERIODO_DIAS', 90)))
+
+
+def _quantizar(valor, casas='0.01'):
+    return Decimal(valor).quantize(Decimal(casas), rounding=ROUND_HALF_UP)
+
+
+def calcular_metricas(somas):
+    """
+    Indicadores a partir das somas de um ou mais snapshots.
+
+    - giro_estoque: saídas do período / estoque médio do período
+    - rotatividade: giro anualizado
+    - dias_estoque: dias de cobertura (quantidade atual / saída média diária);
+      None se não houve saídas no período
+    """
+    dias = (somas['periodo_fim'] - somas['periodo_inicio']).days + 1 if somas.get('periodo_fim') else periodo_dias()
+    saidas = somas['saidas_periodo'] or Decimal('0')
+    estoque_medio = somas['estoque_medio'] or Decimal('0')
+    quantidade = somas['quantidade_atual'] or Decimal('0')
+    valor = somas['valor_total'] or Decimal('0')
+
+    giro = saidas / estoque_medio if estoque_medio > 0 else Decimal('0')
+    dias_estoque = None
+    if saidas > 0:
+        dias_estoque = int((quantidade * dias / saidas).to_integral_value(rounding=ROUND_HALF_UP))
+
+    return {
+        'rotatividade': str(_quantizar(giro * 365 / dias)),
+        'giro_estoque': str(_quantizar(giro)),
+        'dias_estoque': dias_estoque,
+        'produtos': somas['produtos'] or 0,
+        'produtos_parados': somas['produtos_parados'] or 0,
+        'produtos_estoque_minimo': somas['produtos_estoque_minimo'] or 0,
+        'valor_total_estoque': str(_quantizar(valor)),
+        'custo_medio_geral': str(_quantizar(valor / quantidade)) if quantidade > 0 else '0.00',
+        'periodo_inicio': somas.get('periodo_inicio'),
+        'periodo_fim': somas.get('periodo_fim'),
+        'calculado_em': somas.get('calculado_em'),
+    }
+
+
+def somar_indicadores(queryset):
+    """
+    Soma snapshots (ex: locations de uma filial, estoques de um produto).
+
+    Returns:
+        Dict de calcular_metricas(), ou None se não há snapshots
+    """
+    somas = queryset.aggregate(
+        **{campo: Sum(campo) for campo in CAMPOS_SOMA},
+        periodo_inicio=Min('periodo_inicio'),
+        periodo_fim=Max('periodo_fim'),
+        calculado_em=Min('calculado_em'),
+        linhas=Count('id'),
+    )
+    if not somas.pop('linhas'):
+        return None
+    return calcular_metricas(somas)
+
+
+def _calcular_estoques(estoque_ids, inicio, inicio_dia, fim):
+    """Saídas, saldo x dias e última saída do período, por estoque (funções de janela)"""
+    sql = SQL_INDICADORES_ESTOQUE.format(
+        movimentacao=connection.ops.quote_name(MovimentacaoEstoque._meta.db_table),
+        estoque=connection.ops.quote_name(Estoque._meta.db_table),
+    )
+    resultado = {}
+    with connection.cursor() as cursor:
+        for i in range(0, len(estoque_ids), TAMANHO_LOTE_INDICADORES):
+            cursor.execute(sql, {
+                'tz': settings.TIME_ZONE,
+                'ids': estoque_ids[i:i + TAMANHO_LOTE_INDICADORES],
+                'inicio': inicio,
+                'inicio_dia': inicio_dia,
+                'fim': fim,
+            })
+            for estoque_id, saidas, saldo_dias, ultima_saida in cursor.fetchall():
+                resultado[estoque_id] = (saidas, saldo_dias, ultima_saida)
+    return resultado
+
+
+def _recalcular_estoques(estoque_ids, inicio, inicio_dia, fim, dias):
+    """Recria os snapshots ESTOQUE dos estoques informados a partir do livro"""
+    calculados = _calcular_estoques(estoque_ids, inicio, inicio_dia, fim)
+    ultimas_saidas = dict(
+        IndicadorEstoque.objects.filter(nivel='ESTOQUE', estoque_id__in=estoque_ids)
+        .values_list('estoque_id', 'ultima_saida')
+    )
+
+    linhas = []
+    for estoque in Estoque.objects.filter(id__in=estoque_ids).values(
+        'id', 'empresa_id', 'location_id', 'produto_id', 'quantidade_atual'
+    ):
+        saidas, saldo_dias, ultima_saida = calculados.get(estoque['id'], (None, None, None))
+        linhas.append(IndicadorEstoque(
+            nivel='ESTOQUE',
+            estoque_id=estoque['id'],
+            empresa_id=estoque['empresa_id'],
+            location_id=estoque['location_id'],
+            produto_id=estoque['produto_id'],
+            periodo_inicio=inicio_dia,
+            periodo_fim=fim,
+            saidas_periodo=saidas or Decimal('0'),
+            # Sem movimentação no período o saldo foi constante
+            estoque_medio=_quantizar(saldo_dias / dias, '0.001') if saldo_dias is not None else estoque['quantidade_atual'],
+            # Fora do período, vale a última saída já registrada
+            ultima_saida=ultima_saida or ultimas_saidas.get(estoque['id']),
+        ))
+
+    IndicadorEstoque.objects.filter(nivel='ESTOQUE', estoque_id__in=estoque_ids).delete()
+    IndicadorEstoque.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+def _agregar_niveis():
+    """Recria os snapshots LOCATION e EMPRESA somando os snapshots ESTOQUE"""
+    IndicadorEstoque.objects.exclude(nivel='ESTOQUE').delete()
+    base = IndicadorEstoque.objects.filter(nivel='ESTOQUE')
+    somas = {campo: Sum(campo) for campo in CAMPOS_SOMA}
+    periodo = {'periodo_inicio': Min('periodo_inicio'), 'periodo_fim': Max('periodo_fim')}
+
+    linhas = [
+        IndicadorEstoque(nivel='LOCATION', **valores)
+        for valores in base.values('empresa_id', 'location_id').annotate(**somas, **periodo).order_by()
+    ] + [
+        IndicadorEstoque(nivel='EMPRESA', **valores)
+        for valores in base.values('empresa_id').annotate(**somas, **periodo).order_by()
+    ]
+    IndicadorEstoque.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+@transaction.atomic
+def calcular_indicadores(data_referencia=None):
+    """
+    Atualiza os snapshots de indicadores do schema atual.
+
+    Args:
+        data_referencia: Último dia do período (padrão: hoje)
+
+    Returns:
+        Dict com recalculados (estoques lidos do livro), snapshots (total de
+        estoques) e agregados (linhas LOCATION/EMPRESA)
+    """
+    dias = periodo_dias()
+    fim = data_referencia or timezone.localdate()
+    inicio_dia = fim - timedelta(days=dias - 1)
+    inicio = timezone.make_aware(datetime.combine(inicio_dia, time.min))
+    limite_parado = fim - timedelta(days=int(getattr(settings, 'ESTOQUE_DIAS_PRODUTO_PARADO', dias)) - 1)
+
+    # Saídas/estoque médio mudam para estoques com movimentações no período
+    # anterior ou no atual; os demais mantêm os valores (saldo constante, sem saídas)
+    inicio_anterior = IndicadorEstoque.objects.filter(nivel='ESTOQUE').aggregate(
+        inicio=Min('periodo_inicio')
+    )['inicio']
+    desde = min(inicio_dia, inicio_anterior) if inicio_anterior else inicio_dia
+    movimentados = set(
+        MovimentacaoEstoque.objects.filter(
+            data_movimentacao__gte=timezone.make_aware(datetime.combine(desde, time.min))
+        ).values_list('estoque_id', flat=True).distinct()
+    )
+    sem_snapshot = set(
+        Estoque.objects.exclude(
+            id__in=IndicadorEstoque.objects.filter(nivel='ESTOQUE').values('estoque_id')
+        ).values_list('id', flat=True)
+    )
+    IndicadorEstoque.objects.filter(nivel='ESTOQUE', estoque__is_deleted=True).delete()
+
+    recalculados = _recalcular_estoques(sorted(movimentados | sem_snapshot), inicio, inicio_dia, fim, dias)
+
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_ATUALIZAR_SNAPSHOTS.format(
+            indicador=connection.ops.quote_name(IndicadorEstoque._meta.db_table),
+            estoque=connection.ops.quote_name(Estoque._meta.db_table),
+        ), {
+            'limite_parado': limite_parado,
+            'inicio': inicio_dia,
+            'fim': fim,
+            'agora': timezone.now(),
+        })
+        snapshots = cursor.rowcount
+
+    return {
+        'recalculados': recalculados,
+        'snapshots': snapshots,
+        'agregados': _agregar_niveis(),
+    }
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:06
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def emparelhar_transferencias(apps, schema_editor):
+    """
+    Liga as transferências já existentes (SAIDA <-> ENTRADA).
+    
+    Antes deste campo a entrada correspondente era encontrada por heurística
+    (mesmas locations, produto e quantidade, criada no mesmo momento). Aqui a
+    mesma regra é aplicada uma única vez para gravar o par de forma explícita.
+    """
+    MovimentacaoEstoque = apps.get_model('estoque', 'MovimentacaoEstoque')
+    
+    def chave(mov):
+        return (
+            mov.location_origem_id,
+            mov.location_destino_id,
+            mov.estoque.produto_id,
+            mov.quantidade,
+        )
+    
+    entradas_por_chave = {}
+    entradas = MovimentacaoEstoque.objects.filter(
+        origem='TRANSFERENCIA', tipo='ENTRADA', movimentacao_par__isnull=True
+    ).select_related('estoque').order_by('created_at', 'id')
+    for entrada in entradas.iterator(chunk_size=2000):
+        entradas_por_chave.setdefault(chave(entrada), []).append(entrada)
+    
+    saidas = MovimentacaoEstoque.objects.filter(
+        origem='TRANSFERENCIA', tipo='SAIDA', movimentacao_par__isnull=True
+    ).select_related('estoque').order_by('created_at', 'id')
+    
+    tolerancia = timedelta(minutes=5)
+    atualizar = []
+    for saida in saidas.iterator(chunk_size=2000):
+        candidatas = entradas_por_chave.get(chave(saida))
+        if not candidatas:
+            continue
+        # A entrada mais próxima no tempo (dentro da tolerância) é o par
+        melhor = min(candidatas, key=lambda e: abs(e.created_at - saida.created_at))
+        if abs(melhor.created_at - saida.created_at) > tolerancia:
+            continue
+        candidatas.remove(melhor)
+        saida.movimentacao_par_id = melhor.id
+        melhor.movimentacao_par_id = saida.id
+        atualizar.extend([saida, melhor])
+    
+    MovimentacaoEstoque.objects.bulk_update(atualizar, ['movimentacao_par'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0003_grupofilial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='movimentacao_par',
+            field=models.OneToOneField(blank=True, help_text='Movimentação correspondente da transferência (SAIDA <-> ENTRADA)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='estoque.movimentacaoestoque', verbose_name='Movimentação Par'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['origem', 'tipo', 'data_movimentacao'], name='estoque_mov_origem_446a4d_idx'),
+        ),
+        migrations.RunPython(emparelhar_transferencias, migrations.RunPython.noop),
+    ]
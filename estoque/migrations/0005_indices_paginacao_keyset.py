@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_movimentacao_par_transferencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_movimentacao', 'id'], name='estoque_mov_data_mo_4d5bd3_idx'),
+        ),
+    ]
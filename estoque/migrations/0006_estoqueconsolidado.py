@@ -0,0 +1,50 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_last_backup_at'),
+        ('cadastros', '0003_remove_contareceber_cliente_and_more'),
+        ('estoque', '0005_indices_paginacao_keyset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstoqueConsolidado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escopo', models.CharField(choices=[('EMPRESA', 'Empresa'), ('GRUPO', 'Grupo de Filiais')], max_length=10, verbose_name='Escopo')),
+                ('quantidade_atual', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('quantidade_reservada', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('quantidade_disponivel', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('quantidade_prevista_entrada', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('quantidade_prevista_saida', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('locations', models.IntegerField(default=0, help_text='Quantidade de locations com estoque no escopo', verbose_name='Locations')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estoques_consolidados', to='tenants.empresa', verbose_name='Empresa')),
+                ('grupo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estoques_consolidados', to='estoque.grupofilial', verbose_name='Grupo de Filiais')),
+                ('produto', models.ForeignKey(blank=True, help_text='Vazio = totais de todos os produtos do escopo', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estoques_consolidados', to='cadastros.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Estoque Consolidado',
+                'verbose_name_plural': 'Estoques Consolidados',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estoqueconsolidado',
+            constraint=models.UniqueConstraint(condition=models.Q(('escopo', 'EMPRESA'), ('produto__isnull', False)), fields=('empresa', 'produto'), name='estoque_consolidado_empresa_produto_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='estoqueconsolidado',
+            constraint=models.UniqueConstraint(condition=models.Q(('escopo', 'EMPRESA'), ('produto__isnull', True)), fields=('empresa',), name='estoque_consolidado_empresa_total_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='estoqueconsolidado',
+            constraint=models.UniqueConstraint(condition=models.Q(('escopo', 'GRUPO')), fields=('grupo', 'produto'), name='estoque_consolidado_grupo_produto_uniq'),
+        ),
+    ]
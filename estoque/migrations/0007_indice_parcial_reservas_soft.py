@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_estoqueconsolidado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservaestoque',
+            index=models.Index(condition=models.Q(('status', 'ATIVA'), ('tipo', 'SOFT')), fields=['data_expiracao'], name='estoque_reserva_soft_exp_idx'),
+        ),
+    ]
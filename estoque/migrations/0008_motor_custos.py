@@ -0,0 +1,52 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0007_indice_parcial_reservas_soft'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ControleCustoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima_movimentacao_id', models.BigIntegerField(default=0)),
+                ('limite_seguro_id', models.BigIntegerField(default=0)),
+                ('executado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Controle de Custo de Estoque',
+                'verbose_name_plural': 'Controle de Custo de Estoque',
+            },
+        ),
+        migrations.CreateModel(
+            name='CustoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metodo', models.CharField(choices=[('MEDIO', 'Custo Médio Ponderado'), ('FIFO', 'PEPS (FIFO)')], default='MEDIO', max_length=10, verbose_name='Método de Custeio')),
+                ('quantidade', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('custo_unitario', models.DecimalField(decimal_places=6, default=0, max_digits=18)),
+                ('camadas', models.JSONField(blank=True, default=list, help_text='[[quantidade, custo_unitario], ...] como texto decimal', verbose_name='Camadas FIFO')),
+                ('ultima_movimentacao_id', models.BigIntegerField(default=0, help_text='Id da última movimentação incorporada ao custo', verbose_name='Última Movimentação')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Custo de Estoque',
+                'verbose_name_plural': 'Custos de Estoque',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['estoque', 'id'], name='estoque_mov_estoque_c584f5_idx'),
+        ),
+        migrations.AddField(
+            model_name='custoestoque',
+            name='estoque',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='custo', to='estoque.estoque', verbose_name='Estoque'),
+        ),
+    ]
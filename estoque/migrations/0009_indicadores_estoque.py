@@ -0,0 +1,55 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_last_backup_at'),
+        ('cadastros', '0003_remove_contareceber_cliente_and_more'),
+        ('estoque', '0008_motor_custos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicadorEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('ESTOQUE', 'Produto na Location'), ('LOCATION', 'Location'), ('EMPRESA', 'Empresa')], max_length=10, verbose_name='Nível')),
+                ('periodo_inicio', models.DateField(verbose_name='Início do Período')),
+                ('periodo_fim', models.DateField(verbose_name='Fim do Período')),
+                ('saidas_periodo', models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ('estoque_medio', models.DecimalField(decimal_places=3, default=0, help_text='Saldo médio diário no período (ponderado pelo tempo)', max_digits=16)),
+                ('quantidade_atual', models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('ultima_saida', models.DateField(blank=True, null=True, verbose_name='Última Saída')),
+                ('produtos', models.IntegerField(default=0)),
+                ('produtos_parados', models.IntegerField(default=0)),
+                ('produtos_estoque_minimo', models.IntegerField(default=0)),
+                ('calculado_em', models.DateTimeField(auto_now=True, verbose_name='Calculado em')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indicadores_estoque', to='tenants.empresa', verbose_name='Empresa')),
+                ('estoque', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indicadores', to='estoque.estoque', verbose_name='Estoque')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indicadores', to='estoque.location', verbose_name='Location')),
+                ('produto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indicadores_estoque', to='cadastros.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Indicador de Estoque',
+                'verbose_name_plural': 'Indicadores de Estoque',
+                'indexes': [models.Index(fields=['nivel', 'empresa', 'produto'], name='estoque_ind_nivel_126dd0_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='indicadorestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('nivel', 'ESTOQUE')), fields=('estoque',), name='indicador_estoque_estoque_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='indicadorestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('nivel', 'LOCATION')), fields=('location',), name='indicador_estoque_location_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='indicadorestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('nivel', 'EMPRESA')), fields=('empresa',), name='indicador_estoque_empresa_uniq'),
+        ),
+    ]
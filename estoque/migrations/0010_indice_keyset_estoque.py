@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0009_indicadores_estoque'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='estoque',
+            name='estoque_est_empresa_4488bb_idx',
+        ),
+        migrations.AddIndex(
+            model_name='estoque',
+            index=models.Index(fields=['empresa', 'produto', 'id'], name='estoque_est_empresa_514d6e_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remover_totais_empresa(apps, schema_editor):
+    """Linhas de total da empresa (produto vazio): o total passa a ser somado na leitura"""
+    EstoqueConsolidado = apps.get_model('estoque', 'EstoqueConsolidado')
+    EstoqueConsolidado.objects.filter(produto__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0003_remove_contareceber_cliente_and_more'),
+        ('estoque', '0010_indice_keyset_estoque'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_totais_empresa, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='estoqueconsolidado',
+            name='estoque_consolidado_empresa_total_uniq',
+        ),
+        migrations.RemoveConstraint(
+            model_name='estoqueconsolidado',
+            name='estoque_consolidado_empresa_produto_uniq',
+        ),
+        migrations.AlterField(
+            model_name='estoqueconsolidado',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estoques_consolidados', to='cadastros.produto', verbose_name='Produto'),
+        ),
+        migrations.AddConstraint(
+            model_name='estoqueconsolidado',
+            constraint=models.UniqueConstraint(condition=models.Q(('escopo', 'EMPRESA')), fields=('empresa', 'produto'), name='estoque_consolidado_empresa_produto_uniq'),
+        ),
+    ]
@@ -1,11 +1,11 @@
 """
 Models para o módulo de Estoque
 """
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from decimal import Decimal
-from core.base_models import SiscrModelBase
+from core.base_models import ModelBase, SiscrModelBase
 
 # Estados brasileiros (reutilizando do cadastros)
 ESTADOS_CHOICES = [
@@ -293,18 +293,42 @@ class Estoque(SiscrModelBase):
             models.Index(fields=['empresa', 'location']),
             models.Index(fields=['produto', 'location']),
             models.Index(fields=['location', 'is_deleted']),
-            models.Index(fields=['empresa', 'produto']),
+            # Também atende a paginação keyset (produto_id, id) filtrada por empresa
+            models.Index(fields=['empresa', 'produto', 'id']),
         ]
     
     def save(self, *args, **kwargs):
-        """Override save para calcular campos derivados"""
+        """Override save para calcular campos derivados e atualizar o estoque consolidado"""
+        from .consolidacao import aplicar_variacao_estoque, snapshot_estoque, snapshot_estoque_no_banco
+        
+        self.calcular_campos_derivados()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & {
+            'quantidade_atual', 'quantidade_reservada', 'valor_custo_medio'
+        }:
+            # Campos derivados acompanham seus campos de origem (ex: save(update_fields=['valor_custo_medio']))
+            kwargs['update_fields'] = set(update_fields) | {'quantidade_disponivel', 'valor_total'}
+        with transaction.atomic():
+            # Estado gravado (e bloqueado) antes da escrita: base exata para o delta
+            anterior = snapshot_estoque_no_banco(self.pk) if self.pk else None
+            super().save(*args, **kwargs)
+            if update_fields is not None and self.pk:
+                # Escrita parcial: o estado em memória pode não refletir o banco
+                atual = snapshot_estoque_no_banco(self.pk)
+            else:
+                atual = snapshot_estoque(self)
+            aplicar_variacao_estoque(anterior, atual)
+
+    def calcular_campos_derivados(self):
+        """
+        Calcula quantidade_disponivel e valor_total em memória.
+        Usado pelo save() e por escritas em lote (bulk_update), que não chamam save().
+        """
         # Calcular quantidade disponível
         self.quantidade_disponivel = self.quantidade_atual - self.quantidade_reservada
-        
+
         # Calcular valor total
         self.valor_total = self.quantidade_atual * self.valor_custo_medio
-        
-        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.produto} - {self.location.nome} ({self.quantidade_atual})"
@@ -330,14 +354,13 @@ class Estoque(SiscrModelBase):
     @classmethod
     def get_consolidado_empresa(cls, produto, empresa):
         """Retorna estoque consolidado de uma empresa"""
-        estoques = cls.objects.filter(
-            produto=produto,
-            empresa=empresa
-        )
+        from .consolidacao import obter_estoque_consolidado
+        
+        consolidado = obter_estoque_consolidado('EMPRESA', empresa.pk, produto_id=produto.pk)
         return {
-            'total': sum(e.quantidade_atual for e in estoques),
-            'reservado': sum(e.quantidade_reservada for e in estoques),
-            'disponivel': sum(e.quantidade_disponivel for e in estoques),
+            'total': consolidado['quantidade_atual'],
+            'reservado': consolidado['quantidade_reservada'],
+            'disponivel': consolidado['quantidade_disponivel'],
         }
 
 
@@ -482,6 +505,17 @@ class MovimentacaoEstoque(SiscrModelBase):
         help_text='Motivo do cancelamento ou retorno'
     )
     
+    # Para transferências: liga a SAIDA na origem à ENTRADA no destino (e vice-versa)
+    movimentacao_par = models.OneToOneField(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Movimentação Par',
+        help_text='Movimentação correspondente da transferência (SAIDA <-> ENTRADA)'
+    )
+    
     observacoes = models.TextField(blank=True, null=True, verbose_name='Observações')
     data_movimentacao = models.DateTimeField(auto_now_add=True, verbose_name='Data da Movimentação')
     data_prevista = models.DateTimeField(
@@ -501,6 +535,11 @@ class MovimentacaoEstoque(SiscrModelBase):
             models.Index(fields=['origem', 'status']),
             models.Index(fields=['numero_nota_fiscal', 'serie_nota_fiscal']),
             models.Index(fields=['location_origem', 'location_destino']),
+            models.Index(fields=['origem', 'tipo', 'data_movimentacao']),
+            # Paginação keyset (data_movimentacao, id)
+            models.Index(fields=['data_movimentacao', 'id']),
+            # Motor de custos: movimentações de um estoque após a marca d'água
+            models.Index(fields=['estoque', 'id']),
         ]
     
     def clean(self):
@@ -676,6 +715,12 @@ class ReservaEstoque(SiscrModelBase):
             models.Index(fields=['tipo', 'status']),
             models.Index(fields=['data_expiracao', 'status']),
             models.Index(fields=['origem', 'status']),
+            # Expiração em lote: só as reservas SOFT ativas, ordenadas por vencimento
+            models.Index(
+                fields=['data_expiracao'],
+                name='estoque_reserva_soft_exp_idx',
+                condition=models.Q(tipo='SOFT', status='ATIVA'),
+            ),
         ]
     
     def __str__(self):
@@ -690,12 +735,15 @@ class ReservaEstoque(SiscrModelBase):
             })
         
         # Validar quantidade não excede estoque disponível (se HARD)
+        # Base é quantidade_atual menos todas as outras reservas HARD que seguram estoque
+        # (ATIVA e CONFIRMADA, as mesmas somadas em quantidade_reservada); partir de
+        # quantidade_disponivel e descontá-las de novo contaria em dobro
         if self.tipo == 'HARD' and self.status == 'ATIVA':
-            estoque_disponivel = self.estoque.quantidade_disponivel
+            estoque_disponivel = self.estoque.quantidade_atual
             outras_reservas_hard = ReservaEstoque.objects.filter(
                 estoque=self.estoque,
                 tipo='HARD',
-                status='ATIVA'
+                status__in=('ATIVA', 'CONFIRMADA')
             ).exclude(id=self.id).aggregate(
                 total=models.Sum('quantidade')
             )['total'] or Decimal('0.000')
@@ -1095,51 +1143,18 @@ class GrupoFilial(SiscrModelBase):
         """
         Retorna estoque consolidado do produto em todas as filiais do grupo
         
+        Lê a linha materializada em EstoqueConsolidado (mantida a cada movimentação
+        e reconstruída pela tarefa atualizar_estoque_consolidado_grupos).
+        
         Args:
             produto: Produto a consultar
             
         Returns:
             Dict com totais consolidados
         """
-        from django.db.models import Sum
+        from .consolidacao import obter_estoque_consolidado
         
-        # Buscar todas as locations das filiais do grupo
-        locations = Location.objects.filter(
-            empresa=self.empresa,
-            filial__in=self.filiais.all(),
-            is_active=True
-        )
-        
-        # Buscar estoques
-        estoques = Estoque.objects.filter(
-            produto=produto,
-            location__in=locations,
-            empresa=self.empresa
-        )
-        
-        # Consolidar
-        consolidado = estoques.aggregate(
-            total_atual=Sum('quantidade_atual'),
-            total_reservada=Sum('quantidade_reservada'),
-            total_disponivel=Sum('quantidade_disponivel'),
-            total_prevista_entrada=Sum('quantidade_prevista_entrada'),
-            total_prevista_saida=Sum('quantidade_prevista_saida'),
-        )
-        
-        # Calcular valor total consolidado
-        valor_total = sum(
-            estoque.valor_total for estoque in estoques
-        )
-        
-        return {
-            'quantidade_atual': consolidado['total_atual'] or Decimal('0.000'),
-            'quantidade_reservada': consolidado['total_reservada'] or Decimal('0.000'),
-            'quantidade_disponivel': consolidado['total_disponivel'] or Decimal('0.000'),
-            'quantidade_prevista_entrada': consolidado['total_prevista_entrada'] or Decimal('0.000'),
-            'quantidade_prevista_saida': consolidado['total_prevista_saida'] or Decimal('0.000'),
-            'valor_total': Decimal(str(valor_total)),
-            'locations': locations.count(),
-        }
+        return obter_estoque_consolidado('GRUPO', self.empresa_id, grupo_id=self.id, produto_id=produto.pk)
     
     def determinar_melhor_filial(self, produto, quantidade, filial_origem=None):
         """
@@ -1215,3 +1230,275 @@ class GrupoFilial(SiscrModelBase):
             # Default: maior estoque disponível
             melhor_estoque = max(estoques_suficientes, key=lambda e: e.quantidade_disponivel)
             return melhor_estoque.location.filial
+
+
+class EstoqueConsolidado(ModelBase):
+    """
+    Estoque consolidado materializado (por empresa ou grupo de filiais × produto)
+    
+    Tabela derivada de Estoque, mantida por estoque.consolidacao:
+    - Atualizada incrementalmente a cada alteração de Estoque (Estoque.save e escritas em lote)
+    - Reconstruída por completo pela tarefa atualizar_estoque_consolidado_grupos, que também
+      aplica as alterações de grupos (filiais, ativação)
+    
+    Escopos:
+    - EMPRESA: totais do produto em todas as locations da empresa (o total da empresa
+      é somado na leitura)
+    - GRUPO: totais do produto nas locations ativas das filiais do grupo
+    """
+    ESCOPO_CHOICES = [
+        ('EMPRESA', 'Empresa'),
+        ('GRUPO', 'Grupo de Filiais'),
+    ]
+    
+    escopo = models.CharField(
+        max_length=10,
+        choices=ESCOPO_CHOICES,
+        verbose_name='Escopo'
+    )
+    empresa = models.ForeignKey(
+        'tenants.Empresa',
+        on_delete=models.CASCADE,
+        related_name='estoques_consolidados',
+        verbose_name='Empresa'
+    )
+    grupo = models.ForeignKey(
+        GrupoFilial,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='estoques_consolidados',
+        verbose_name='Grupo de Filiais'
+    )
+    produto = models.ForeignKey(
+        'cadastros.Produto',
+        on_delete=models.CASCADE,
+        related_name='estoques_consolidados',
+        verbose_name='Produto'
+    )
+    
+    quantidade_atual = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    quantidade_reservada = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    quantidade_disponivel = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    quantidade_prevista_entrada = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    quantidade_prevista_saida = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    valor_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    locations = models.IntegerField(
+        default=0,
+        verbose_name='Locations',
+        help_text='Quantidade de locations com estoque no escopo'
+    )
+    
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+    
+    class Meta:
+        verbose_name = 'Estoque Consolidado'
+        verbose_name_plural = 'Estoques Consolidados'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'produto'],
+                condition=models.Q(escopo='EMPRESA'),
+                name='estoque_consolidado_empresa_produto_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['grupo', 'produto'],
+                condition=models.Q(escopo='GRUPO'),
+                name='estoque_consolidado_grupo_produto_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        alvo = self.grupo.nome if self.grupo_id else self.empresa.nome
+        return f"{alvo} - {self.produto} ({self.quantidade_atual})"
+    
+    def as_dict(self):
+        """Formato retornado pelos endpoints de estoque consolidado"""
+        return {
+            'quantidade_atual': self.quantidade_atual,
+            'quantidade_reservada': self.quantidade_reservada,
+            'quantidade_disponivel': self.quantidade_disponivel,
+            'quantidade_prevista_entrada': self.quantidade_prevista_entrada,
+            'quantidade_prevista_saida': self.quantidade_prevista_saida,
+            'valor_total': self.valor_total,
+            'locations': self.locations,
+        }
+
+
+class CustoEstoque(ModelBase):
+    """
+    Estado do custo de um Estoque, mantido pelo motor de custos (estoque.custos)
+    
+    O motor incorpora as movimentações com id maior que ultima_movimentacao_id
+    e grava o resultado em Estoque.valor_custo_medio:
+    - MEDIO: custo médio ponderado (custo_unitario com precisão total)
+    - FIFO: camadas [[quantidade, custo], ...] da mais antiga para a mais recente
+    """
+    METODO_CHOICES = [
+        ('MEDIO', 'Custo Médio Ponderado'),
+        ('FIFO', 'PEPS (FIFO)'),
+    ]
+    
+    estoque = models.OneToOneField(
+        Estoque,
+        on_delete=models.CASCADE,
+        related_name='custo',
+        verbose_name='Estoque'
+    )
+    metodo = models.CharField(
+        max_length=10,
+        choices=METODO_CHOICES,
+        default='MEDIO',
+        verbose_name='Método de Custeio'
+    )
+    quantidade = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    custo_unitario = models.DecimalField(max_digits=18, decimal_places=6, default=0)
+    camadas = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Camadas FIFO',
+        help_text='[[quantidade, custo_unitario], ...] como texto decimal'
+    )
+    ultima_movimentacao_id = models.BigIntegerField(
+        default=0,
+        verbose_name='Última Movimentação',
+        help_text='Id da última movimentação incorporada ao custo'
+    )
+    
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+    
+    class Meta:
+        verbose_name = 'Custo de Estoque'
+        verbose_name_plural = 'Custos de Estoque'
+    
+    def __str__(self):
+        return f"{self.estoque} - {self.get_metodo_display()} ({self.custo_unitario})"
+
+
+class ControleCustoEstoque(ModelBase):
+    """
+    Marca d'água do motor de custos no schema (linha única)
+    
+    As movimentações novas são descobertas a partir de limite_seguro_id, que fica
+    uma execução atrás de ultima_movimentacao_id: transações ainda abertas na
+    execução anterior (ids menores, gravados depois) não são perdidas.
+    """
+    ultima_movimentacao_id = models.BigIntegerField(default=0)
+    limite_seguro_id = models.BigIntegerField(default=0)
+    executado_em = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Controle de Custo de Estoque'
+        verbose_name_plural = 'Controle de Custo de Estoque'
+    
+    def __str__(self):
+        return f"Custos até movimentação {self.ultima_movimentacao_id}"
+
+
+class IndicadorEstoque(ModelBase):
+    """
+    Snapshot dos indicadores de estoque (giro, cobertura, produtos parados,
+    abaixo do mínimo), mantido por estoque.indicadores
+    
+    Níveis:
+    - ESTOQUE: produto em uma location (base, calculada do livro de movimentações)
+    - LOCATION: soma dos estoques da location
+    - EMPRESA: soma dos estoques da empresa
+    
+    Os campos guardam somas (saídas, estoque médio, contagens); os indicadores
+    em si são calculados em as_dict(), o que permite somar snapshots de níveis
+    diferentes (ex: locations de uma filial) sem reprocessar o livro.
+    """
+    NIVEL_CHOICES = [
+        ('ESTOQUE', 'Produto na Location'),
+        ('LOCATION', 'Location'),
+        ('EMPRESA', 'Empresa'),
+    ]
+    
+    nivel = models.CharField(max_length=10, choices=NIVEL_CHOICES, verbose_name='Nível')
+    empresa = models.ForeignKey(
+        'tenants.Empresa',
+        on_delete=models.CASCADE,
+        related_name='indicadores_estoque',
+        verbose_name='Empresa'
+    )
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='indicadores',
+        verbose_name='Location'
+    )
+    produto = models.ForeignKey(
+        'cadastros.Produto',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='indicadores_estoque',
+        verbose_name='Produto'
+    )
+    estoque = models.ForeignKey(
+        Estoque,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='indicadores',
+        verbose_name='Estoque'
+    )
+    
+    periodo_inicio = models.DateField(verbose_name='Início do Período')
+    periodo_fim = models.DateField(verbose_name='Fim do Período')
+    saidas_periodo = models.DecimalField(max_digits=16, decimal_places=3, default=0)
+    estoque_medio = models.DecimalField(
+        max_digits=16,
+        decimal_places=3,
+        default=0,
+        help_text='Saldo médio diário no período (ponderado pelo tempo)'
+    )
+    quantidade_atual = models.DecimalField(max_digits=16, decimal_places=3, default=0)
+    valor_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    ultima_saida = models.DateField(null=True, blank=True, verbose_name='Última Saída')
+    produtos = models.IntegerField(default=0)
+    produtos_parados = models.IntegerField(default=0)
+    produtos_estoque_minimo = models.IntegerField(default=0)
+    
+    calculado_em = models.DateTimeField(auto_now=True, verbose_name='Calculado em')
+    
+    class Meta:
+        verbose_name = 'Indicador de Estoque'
+        verbose_name_plural = 'Indicadores de Estoque'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['estoque'],
+                condition=models.Q(nivel='ESTOQUE'),
+                name='indicador_estoque_estoque_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['location'],
+                condition=models.Q(nivel='LOCATION'),
+                name='indicador_estoque_location_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['empresa'],
+                condition=models.Q(nivel='EMPRESA'),
+                name='indicador_estoque_empresa_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['nivel', 'empresa', 'produto']),
+        ]
+    
+    def __str__(self):
+        alvo = self.estoque or self.location or self.empresa
+        return f"Indicadores {self.get_nivel_display()} - {alvo}"
+    
+    def as_dict(self):
+        """Formato retornado pelo endpoint de indicadores"""
+        from .indicadores import calcular_metricas
+        return calcular_metricas({
+            campo: getattr(self, campo) for campo in (
+                'periodo_inicio', 'periodo_fim', 'saidas_periodo', 'estoque_medio',
+                'quantidade_atual', 'valor_total', 'produtos', 'produtos_parados',
+                'produtos_estoque_minimo', 'calculado_em',
+            )
+        })
@@ -2,12 +2,20 @@
 Serviços de lógica de negócio para o módulo de Estoque
 """
 from django.core.exceptions import ValidationError
-from django.db import transaction
-from decimal import Decimal
-from typing import Optional, Dict, Any
+from django.db import connection, transaction
+from django.db.models import Q
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Dict, Any, List
 from .models import Location, Estoque, MovimentacaoEstoque, ReservaEstoque, PrevisaoMovimentacao
+from .consolidacao import (
+    CAMPOS_QUANTIDADE,
+    aplicar_variacoes_estoque,
+    reconstruir_estoque_consolidado,
+    snapshot_estoque,
+)
 from cadastros.models import Produto
 from tenants.models import Empresa, Filial
+from core.middleware import get_current_user
 from django.utils import timezone
 from datetime import timedelta
 
@@ -132,6 +140,28 @@ def calcular_custo_medio_ponderado(
     return custo_medio_ponderado.quantize(Decimal('0.01'))
 
 
+def bloquear_estoques(*estoque_ids: int) -> Dict[int, Estoque]:
+    """
+    Bloqueia (SELECT ... FOR UPDATE) os estoques informados em uma única query
+    
+    Os locks são adquiridos sempre em ordem crescente de id, para que transações
+    concorrentes que tocam os mesmos estoques (ex: transferências A->B e B->A)
+    não entrem em deadlock. Deve ser chamado dentro de transaction.atomic.
+    
+    Args:
+        estoque_ids: IDs dos estoques a bloquear
+        
+    Returns:
+        Dict {id: Estoque} com os valores atuais (lidos após o lock)
+    """
+    return {
+        estoque.id: estoque
+        for estoque in Estoque.objects.select_for_update().filter(
+            id__in=estoque_ids
+        ).order_by('id')
+    }
+
+
 @transaction.atomic
 def processar_entrada_estoque(
     produto: Produto,
@@ -191,8 +221,8 @@ def processar_entrada_estoque(
             f"A location '{location.nome}' não pertence à empresa '{empresa.nome}'."
         )
     
-    # Buscar ou criar estoque
-    estoque, created = Estoque.objects.get_or_create(
+    # Buscar ou criar estoque (bloqueado até o fim da transação)
+    estoque, created = Estoque.objects.select_for_update().get_or_create(
         produto=produto,
         location=location,
         defaults={
@@ -257,6 +287,206 @@ def processar_entrada_estoque(
     }
 
 
+@transaction.atomic
+def processar_entradas_em_lote(
+    empresa: Empresa,
+    entradas: List[Dict[str, Any]],
+    origem: str = 'COMPRA',
+    documento_referencia: Optional[str] = None,
+    numero_nota_fiscal: Optional[str] = None,
+    serie_nota_fiscal: Optional[str] = None,
+    observacoes: Optional[str] = None,
+    atualizar_previsao: bool = True
+) -> Dict[str, Any]:
+    """
+    Processa várias entradas de estoque (ex: recebimento de um pedido de compra) em lote
+    
+    Equivalente a chamar processar_entrada_estoque() para cada linha, mas com escritas
+    set-based em uma única transação:
+    1. Valida todas as linhas antes de escrever qualquer coisa
+    2. Bloqueia (SELECT ... FOR UPDATE) todos os estoques afetados em uma query
+    3. Cria os estoques inexistentes com bulk_create
+    4. Calcula custo médio ponderado em memória (linha a linha, na ordem recebida)
+    5. Grava estoques com bulk_update e movimentações (tipo=ENTRADA) com bulk_create
+    
+    Args:
+        empresa: Empresa proprietária
+        entradas: Lista de dicts com 'produto', 'location', 'quantidade' e 'valor_unitario'.
+                  Cada linha pode sobrescrever 'origem', 'documento_referencia' e 'observacoes'.
+        origem: Origem padrão das entradas (COMPRA, DEVOLUCAO, etc.)
+        documento_referencia: Documento de referência padrão (ex: OC-001)
+        numero_nota_fiscal: Número da nota fiscal
+        serie_nota_fiscal: Série da nota fiscal
+        observacoes: Observações padrão
+        atualizar_previsao: Se deve atualizar quantidade_prevista_entrada
+        
+    Returns:
+        Dict com estoques atualizados, movimentações criadas e resultado por linha
+        
+    Raises:
+        EstoqueServiceError: Se qualquer linha for inválida (nada é gravado)
+    """
+    if not entradas:
+        raise EstoqueServiceError("Nenhuma entrada informada.")
+    
+    # Validações (todas as linhas antes de qualquer escrita)
+    for idx, entrada in enumerate(entradas):
+        try:
+            faltando = [
+                campo for campo in ('produto', 'location', 'quantidade', 'valor_unitario')
+                if entrada.get(campo) is None
+            ]
+            if faltando:
+                raise EstoqueServiceError(f"Campo(s) obrigatório(s) ausente(s): {', '.join(faltando)}.")
+            
+            location = entrada['location']
+            if entrada['quantidade'] <= 0:
+                raise EstoqueServiceError("Quantidade deve ser maior que zero.")
+            
+            if entrada['valor_unitario'] < 0:
+                raise EstoqueServiceError("Valor unitário não pode ser negativo.")
+            
+            validar_location_permite_entrada(location)
+            
+            if location.empresa_id != empresa.id:
+                raise EstoqueServiceError(
+                    f"A location '{location.nome}' não pertence à empresa '{empresa.nome}'."
+                )
+        except EstoqueServiceError as e:
+            raise EstoqueServiceError(f"Linha {idx + 1}: {e}")
+    
+    chaves = {(e['produto'].pk, e['location'].pk) for e in entradas}
+    
+    def _bloquear_estoques(pares):
+        # Só os pares (produto, location) do lote: produto_id__in x location_id__in
+        # bloquearia também combinações que não estão no lote.
+        # Ordenação por id garante ordem determinística de lock entre transações concorrentes
+        filtro = Q()
+        for produto_id, location_id in sorted(pares):
+            filtro |= Q(produto_id=produto_id, location_id=location_id)
+        return {
+            (estoque.produto_id, estoque.location_id): estoque
+            for estoque in Estoque.objects.select_for_update().filter(filtro).order_by('id')
+        }
+    
+    estoques = _bloquear_estoques(chaves)
+    # Estado anterior para o estoque consolidado (bulk_update não passa pelo save)
+    anteriores = {chave: snapshot_estoque(estoque) for chave, estoque in estoques.items()}
+    
+    # Criar estoques inexistentes (ignore_conflicts cobre criação concorrente do mesmo par)
+    faltantes = chaves - set(estoques)
+    if faltantes:
+        usuario = get_current_user()
+        Estoque.objects.bulk_create(
+            [
+                Estoque(
+                    produto_id=produto_id,
+                    location_id=location_id,
+                    empresa=empresa,
+                    quantidade_atual=Decimal('0.000'),
+                    quantidade_reservada=Decimal('0.000'),
+                    valor_custo_medio=Decimal('0.00'),
+                    created_by=usuario,
+                    owner=usuario,
+                )
+                for produto_id, location_id in faltantes
+            ],
+            ignore_conflicts=True
+        )
+        estoques.update(_bloquear_estoques(faltantes))
+        
+        nao_encontrados = chaves - set(estoques)
+        if nao_encontrados:
+            raise EstoqueServiceError(
+                f"Não foi possível criar estoque para {len(nao_encontrados)} par(es) produto/location "
+                f"(registro excluído existente)."
+            )
+    
+    # Aplicar entradas em memória, na ordem das linhas
+    movimentacoes = []
+    linhas = []
+    for entrada in entradas:
+        produto = entrada['produto']
+        location = entrada['location']
+        quantidade = entrada['quantidade']
+        valor_unitario = entrada['valor_unitario']
+        estoque = estoques[(produto.pk, location.pk)]
+        
+        if estoque.empresa_id != empresa.id:
+            estoque.empresa = empresa
+        
+        quantidade_anterior = estoque.quantidade_atual
+        custo_medio_anterior = estoque.valor_custo_medio
+        novo_custo_medio = calcular_custo_medio_ponderado(estoque, quantidade, valor_unitario)
+        
+        estoque.quantidade_atual += quantidade
+        estoque.valor_custo_medio = novo_custo_medio
+        
+        if atualizar_previsao and estoque.quantidade_prevista_entrada > 0:
+            estoque.quantidade_prevista_entrada = max(
+                Decimal('0.000'),
+                estoque.quantidade_prevista_entrada - quantidade
+            )
+        
+        movimentacoes.append(MovimentacaoEstoque(
+            estoque=estoque,
+            tipo='ENTRADA',
+            origem=entrada.get('origem') or origem,
+            status='CONFIRMADA',
+            quantidade=quantidade,
+            quantidade_anterior=quantidade_anterior,
+            quantidade_posterior=estoque.quantidade_atual,
+            valor_unitario=valor_unitario,
+            valor_total=(valor_unitario * quantidade).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+            location_destino=location,
+            documento_referencia=entrada.get('documento_referencia') or documento_referencia,
+            numero_nota_fiscal=numero_nota_fiscal,
+            serie_nota_fiscal=serie_nota_fiscal,
+            observacoes=entrada.get('observacoes') or observacoes,
+        ))
+        linhas.append({
+            'estoque': estoque,
+            'custo_medio_anterior': custo_medio_anterior,
+            'custo_medio_novo': novo_custo_medio,
+        })
+    
+    # Escritas set-based
+    agora = timezone.now()
+    usuario = get_current_user()
+    for estoque in estoques.values():
+        estoque.calcular_campos_derivados()
+        estoque.updated_at = agora
+        if usuario:
+            estoque.updated_by = usuario
+    
+    Estoque.objects.bulk_update(
+        list(estoques.values()),
+        fields=[
+            'empresa', 'quantidade_atual', 'quantidade_disponivel', 'quantidade_prevista_entrada',
+            'valor_custo_medio', 'valor_total', 'updated_at', 'updated_by',
+        ],
+        batch_size=500
+    )
+    aplicar_variacoes_estoque(
+        (anteriores.get(chave), snapshot_estoque(estoque)) for chave, estoque in estoques.items()
+    )
+    
+    if usuario:
+        for movimentacao in movimentacoes:
+            movimentacao.created_by = usuario
+            movimentacao.owner = usuario
+    movimentacoes = MovimentacaoEstoque.objects.bulk_create(movimentacoes, batch_size=500)
+    
+    for linha, movimentacao in zip(linhas, movimentacoes):
+        linha['movimentacao'] = movimentacao
+    
+    return {
+        'estoques': list(estoques.values()),
+        'movimentacoes': movimentacoes,
+        'linhas': linhas,
+    }
+
+
 @transaction.atomic
 def processar_saida_estoque(
     produto: Produto,
@@ -319,9 +549,9 @@ def processar_saida_estoque(
             f"A location '{location.nome}' não pertence à empresa '{empresa.nome}'."
         )
     
-    # Buscar estoque
+    # Buscar estoque (bloqueado até o fim da transação para evitar lost update)
     try:
-        estoque = Estoque.objects.get(
+        estoque = Estoque.objects.select_for_update().get(
             produto=produto,
             location=location,
             empresa=empresa
@@ -432,9 +662,9 @@ def criar_reserva(
             f"A location '{location.nome}' não pertence à empresa '{empresa.nome}'."
         )
     
-    # Buscar estoque
+    # Buscar estoque (bloqueado até o fim da transação para evitar lost update)
     try:
-        estoque = Estoque.objects.get(
+        estoque = Estoque.objects.select_for_update().get(
             produto=produto,
             location=location,
             empresa=empresa
@@ -455,17 +685,20 @@ def criar_reserva(
             minutos_expiracao = 30  # Default: 30 minutos
         data_expiracao = timezone.now() + timedelta(minutes=minutos_expiracao)
     
-    # Criar reserva
-    reserva = ReservaEstoque.objects.create(
-        estoque=estoque,
-        tipo=tipo,
-        origem=origem,
-        status='ATIVA',
-        quantidade=quantidade,
-        data_expiracao=data_expiracao,
-        documento_referencia=documento_referencia,
-        observacoes=observacoes
-    )
+    # Criar reserva (save() executa full_clean)
+    try:
+        reserva = ReservaEstoque.objects.create(
+            estoque=estoque,
+            tipo=tipo,
+            origem=origem,
+            status='ATIVA',
+            quantidade=quantidade,
+            data_expiracao=data_expiracao,
+            documento_referencia=documento_referencia,
+            observacoes=observacoes
+        )
+    except ValidationError as e:
+        raise EstoqueServiceError(' '.join(e.messages))
     
     # Se é HARD, atualizar quantidade_reservada
     if tipo == 'HARD':
@@ -492,13 +725,17 @@ def confirmar_reserva(reserva: ReservaEstoque) -> Dict[str, Any]:
     Raises:
         EstoqueServiceError: Se houver erro de validação ou estoque insuficiente
     """
+    # Bloquear estoque antes de ler o status: toda alteração de reserva passa pelo
+    # lock do estoque, então o status relido abaixo já é o definitivo
+    estoque = bloquear_estoques(reserva.estoque_id)[reserva.estoque_id]
+    reserva.estoque = estoque
+    reserva.refresh_from_db(fields=['tipo', 'status', 'quantidade', 'data_expiracao'])
+    
     if reserva.status != 'ATIVA':
         raise EstoqueServiceError(
             f"Reserva não está ativa. Status atual: {reserva.status}"
         )
     
-    estoque = reserva.estoque
-    
     # Se é SOFT, validar estoque disponível antes de converter
     if reserva.tipo == 'SOFT':
         validar_estoque_disponivel(estoque, reserva.quantidade)
@@ -527,13 +764,15 @@ def cancelar_reserva(reserva: ReservaEstoque, motivo: Optional[str] = None) -> D
     Raises:
         EstoqueServiceError: Se houver erro de validação
     """
+    estoque = bloquear_estoques(reserva.estoque_id)[reserva.estoque_id]
+    reserva.estoque = estoque
+    reserva.refresh_from_db(fields=['tipo', 'status', 'quantidade', 'observacoes'])
+    
     if reserva.status in ['CANCELADA', 'EXPIRADA']:
         raise EstoqueServiceError(
             f"Reserva já está {reserva.status.lower()}"
         )
     
-    estoque = reserva.estoque
-    
     # Cancelar reserva (libera estoque se HARD)
     reserva.cancelar(motivo=motivo)
     
@@ -543,6 +782,29 @@ def cancelar_reserva(reserva: ReservaEstoque, motivo: Optional[str] = None) -> D
     }
 
 
+def expirar_reservas_soft(agora=None) -> int:
+    """
+    Expira, numa única instrução UPDATE, todas as reservas SOFT ativas vencidas
+    do schema atual (usa o índice parcial de ReservaEstoque sobre data_expiracao).
+    
+    Reservas SOFT não alteram quantidade_reservada, então nenhum contador de
+    Estoque precisa ser ajustado. O UPDATE reavalia tipo/status de cada linha
+    após o lock: reservas confirmadas ou canceladas em paralelo não são expiradas.
+    
+    Args:
+        agora: Instante de referência (padrão: timezone.now())
+        
+    Returns:
+        Quantidade de reservas expiradas
+    """
+    agora = agora or timezone.now()
+    return ReservaEstoque.objects.filter(
+        tipo='SOFT',
+        status='ATIVA',
+        data_expiracao__lte=agora
+    ).update(status='EXPIRADA', updated_at=agora)
+
+
 @transaction.atomic
 def processar_transferencia(
     produto: Produto,
@@ -564,7 +826,7 @@ def processar_transferencia(
        - Saída na origem (tipo=SAIDA, origem=TRANSFERENCIA)
        - Entrada no destino (tipo=ENTRADA, origem=TRANSFERENCIA)
     4. Atualiza estoques
-    5. Rastreia transferência
+    5. Rastreia transferência (liga saída e entrada via movimentacao_par)
     
     Args:
         produto: Produto a ser transferido
@@ -623,9 +885,6 @@ def processar_transferencia(
             f"Estoque não encontrado para produto '{produto.nome}' na location de origem '{location_origem.nome}'."
         )
     
-    # Validar estoque disponível na origem
-    validar_estoque_disponivel(estoque_origem, quantidade)
-    
     # Buscar ou criar estoque no destino
     estoque_destino, created = Estoque.objects.get_or_create(
         produto=produto,
@@ -638,6 +897,15 @@ def processar_transferencia(
         }
     )
     
+    # Bloquear origem e destino juntos, em ordem de id (evita deadlock entre A->B e B->A)
+    # e reler os valores atuais após o lock
+    bloqueados = bloquear_estoques(estoque_origem.id, estoque_destino.id)
+    estoque_origem = bloqueados[estoque_origem.id]
+    estoque_destino = bloqueados[estoque_destino.id]
+    
+    # Validar estoque disponível na origem
+    validar_estoque_disponivel(estoque_origem, quantidade)
+    
     # Se estoque já existia mas empresa estava diferente, atualizar
     if not created and estoque_destino.empresa != empresa:
         estoque_destino.empresa = empresa
@@ -696,8 +964,15 @@ def processar_transferencia(
         location_origem=location_origem,
         location_destino=location_destino,
         documento_referencia=documento_referencia,
-        observacoes=observacoes
+        observacoes=observacoes,
+        movimentacao_par=movimentacao_saida
+    )
+    
+    # Fechar o par na saída (update direto, sem reexecutar save/auditoria)
+    MovimentacaoEstoque.objects.filter(pk=movimentacao_saida.pk).update(
+        movimentacao_par=movimentacao_entrada
     )
+    movimentacao_saida.movimentacao_par = movimentacao_entrada
     
     return {
         'movimentacao_saida': movimentacao_saida,
@@ -747,31 +1022,17 @@ def cancelar_transferencia(
     if movimentacao_saida.status in ['CANCELADA', 'REVERTIDA']:
         raise EstoqueServiceError("Esta transferência já foi cancelada.")
     
-    # Buscar movimentação de entrada correspondente
-    # Usar campos essenciais que identificam a transferência
-    # A entrada tem location_origem e location_destino invertidos em relação à saída
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    # Buscar movimentação de entrada criada no mesmo período (até 5 minutos de diferença)
-    # para permitir pequenas diferenças de timestamp
-    tempo_tolerancia = timedelta(minutes=5)
-    data_inicio = movimentacao_saida.created_at - tempo_tolerancia
-    data_fim = movimentacao_saida.created_at + tempo_tolerancia
+    # Buscar movimentação de entrada correspondente pelo par explícito
+    movimentacao_entrada = None
+    if movimentacao_saida.movimentacao_par_id:
+        movimentacao_entrada = MovimentacaoEstoque.objects.filter(
+            id=movimentacao_saida.movimentacao_par_id
+        ).select_related('estoque').first()
     
-    movimentacao_entrada = MovimentacaoEstoque.objects.filter(
-        origem='TRANSFERENCIA',
-        tipo='ENTRADA',
-        location_origem=movimentacao_saida.location_origem,  # Mesma origem
-        location_destino=movimentacao_saida.location_destino,  # Mesmo destino
-        estoque__produto=movimentacao_saida.estoque.produto,  # Mesmo produto
-        quantidade=movimentacao_saida.quantidade,  # Mesma quantidade
-        created_at__gte=data_inicio,
-        created_at__lte=data_fim
-    ).select_related('estoque').first()
-    
-    # Se não encontrou, tentar busca mais flexível (sem documento_referencia e data_movimentacao)
+    # Transferências antigas sem par gravado: buscar entrada com as mesmas
+    # locations, produto e quantidade criada no mesmo período (até 5 minutos)
     if not movimentacao_entrada:
+        tempo_tolerancia = timedelta(minutes=5)
         movimentacao_entrada = MovimentacaoEstoque.objects.filter(
             origem='TRANSFERENCIA',
             tipo='ENTRADA',
@@ -779,8 +1040,8 @@ def cancelar_transferencia(
             location_destino=movimentacao_saida.location_destino,
             estoque__produto=movimentacao_saida.estoque.produto,
             quantidade=movimentacao_saida.quantidade,
-            created_at__gte=data_inicio,
-            created_at__lte=data_fim
+            created_at__gte=movimentacao_saida.created_at - tempo_tolerancia,
+            created_at__lte=movimentacao_saida.created_at + tempo_tolerancia
         ).select_related('estoque').first()
     
     if not movimentacao_entrada:
@@ -790,16 +1051,25 @@ def cancelar_transferencia(
             f"Origem: {movimentacao_saida.location_origem.nome}, Destino: {movimentacao_saida.location_destino.nome}"
         )
     
+    # Bloquear os dois estoques (em ordem de id) e reler o status das movimentações,
+    # para que dois cancelamentos simultâneos não revertam a mesma transferência duas vezes
+    bloqueados = bloquear_estoques(movimentacao_saida.estoque_id, movimentacao_entrada.estoque_id)
+    estoque_origem = bloqueados[movimentacao_saida.estoque_id]
+    estoque_destino = bloqueados[movimentacao_entrada.estoque_id]
+    movimentacao_saida.refresh_from_db(fields=['status'])
+    movimentacao_entrada.refresh_from_db(fields=['status'])
+    
+    if movimentacao_saida.status in ['CANCELADA', 'REVERTIDA']:
+        raise EstoqueServiceError("Esta transferência já foi cancelada.")
+    
     if movimentacao_entrada.status in ['CANCELADA', 'REVERTIDA']:
         raise EstoqueServiceError("A movimentação de entrada já foi cancelada.")
     
     # Reverter estoque na origem (adicionar quantidade de volta)
-    estoque_origem = movimentacao_saida.estoque
     estoque_origem.quantidade_atual += movimentacao_saida.quantidade
     estoque_origem.save()
     
     # Reverter estoque no destino (remover quantidade)
-    estoque_destino = movimentacao_entrada.estoque
     estoque_destino.quantidade_atual -= movimentacao_entrada.quantidade
     
     # Recalcular custo médio no destino se necessário
@@ -823,3 +1093,82 @@ def cancelar_transferencia(
         'estoque_destino': estoque_destino,
     }
 
+
+# Acima deste número de linhas corrigidas, reconstruir o consolidado é mais barato
+# que aplicar um delta por estoque
+LIMITE_DELTAS_CONSOLIDADO = 200
+
+
+@transaction.atomic
+def reconciliar_quantidade_disponivel(somente_relatorio: bool = False) -> Dict[str, Any]:
+    """
+    Reconcilia quantidade_disponivel (= atual - reservada) de todos os estoques do schema atual.
+    
+    Executa uma única instrução set-based:
+    - somente_relatorio=False: UPDATE ... WHERE quantidade_disponivel <> atual - reservada RETURNING id
+    - somente_relatorio=True: SELECT com as estatísticas de divergência, sem gravar nada
+    
+    Args:
+        somente_relatorio: Apenas medir a divergência, sem corrigir
+        
+    Returns:
+        Dict com divergentes (quantidade de estoques), divergencia_total e
+        divergencia_maxima (em valor absoluto) e ids corrigidos
+    """
+    tabela = connection.ops.quote_name(Estoque._meta.db_table)
+    
+    if somente_relatorio:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT COUNT(*),
+                       COALESCE(SUM(ABS(quantidade_disponivel - (quantidade_atual - quantidade_reservada))), 0),
+                       COALESCE(MAX(ABS(quantidade_disponivel - (quantidade_atual - quantidade_reservada))), 0)
+                FROM {tabela}
+                WHERE is_deleted = false
+                  AND quantidade_disponivel <> quantidade_atual - quantidade_reservada
+            """)
+            divergentes, divergencia_total, divergencia_maxima = cursor.fetchone()
+        return {
+            'divergentes': divergentes,
+            'divergencia_total': divergencia_total,
+            'divergencia_maxima': divergencia_maxima,
+            'ids': [],
+        }
+    
+    # Subconsulta com FOR UPDATE (em ordem de id) devolve o valor anterior já bloqueado
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {tabela} AS e
+            SET quantidade_disponivel = e.quantidade_atual - e.quantidade_reservada
+            FROM (
+                SELECT id, quantidade_disponivel
+                FROM {tabela}
+                WHERE is_deleted = false
+                  AND quantidade_disponivel <> quantidade_atual - quantidade_reservada
+                ORDER BY id
+                FOR UPDATE
+            ) AS anterior
+            WHERE e.id = anterior.id
+            RETURNING e.id, e.empresa_id, e.produto_id, e.location_id,
+                      anterior.quantidade_disponivel, e.quantidade_disponivel
+        """)
+        corrigidos = cursor.fetchall()
+    
+    # Manter o estoque consolidado coerente com a correção
+    if len(corrigidos) > LIMITE_DELTAS_CONSOLIDADO:
+        reconstruir_estoque_consolidado()
+    else:
+        alteracoes = []
+        for estoque_id, empresa_id, produto_id, location_id, anterior, atual in corrigidos:
+            base = {campo: Decimal('0') for campo in CAMPOS_QUANTIDADE}
+            base.update(estoque_id=estoque_id, empresa_id=empresa_id, produto_id=produto_id, location_id=location_id)
+            alteracoes.append((dict(base, quantidade_disponivel=anterior), dict(base, quantidade_disponivel=atual)))
+        aplicar_variacoes_estoque(alteracoes)
+    
+    diferencas = [abs(anterior - atual) for _, _, _, _, anterior, atual in corrigidos]
+    return {
+        'divergentes': len(corrigidos),
+        'divergencia_total': sum(diferencas, Decimal('0')),
+        'divergencia_maxima': max(diferencas, default=Decimal('0')),
+        'ids': [linha[0] for linha in corrigidos],
+    }
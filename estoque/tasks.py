@@ -1,73 +1,33 @@
 """
 Tarefas periódicas e assíncronas do Celery para o módulo de Estoque
+
+As tarefas periódicas usam core.tenant_tasks.disparar_por_tenant: cada uma
+define a função que processa um único tenant (executada já dentro do schema)
+e o fan-out dispara os tenants em paralelo nos workers.
 """
 import logging
 from celery import shared_task
-from django.utils import timezone
-from django.db import transaction, connection
-from django.db.models import Q, Sum, F
-from django.db.utils import ProgrammingError
-from django_tenants.utils import schema_context
+from django.conf import settings
+from django.db.models import F
 from decimal import Decimal
-from .models import ReservaEstoque, Estoque, MovimentacaoEstoque, GrupoFilial
-from tenants.models import Tenant
+from core.tenant_tasks import disparar_por_tenant
+from .models import Estoque, GrupoFilial
+from .consolidacao import reconstruir_estoque_consolidado
+from .custos import processar_custos
+from .indicadores import calcular_indicadores
+from .services import expirar_reservas_soft, reconciliar_quantidade_disponivel
 
 logger = logging.getLogger(__name__)
 
 
-def _tabela_existe(nome_tabela):
-    """
-    Verifica se uma tabela existe no schema atual
-    """
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = current_schema()
-                    AND table_name = %s
-                );
-            """, [nome_tabela])
-            return cursor.fetchone()[0]
-    except Exception:
-        return False
-
-
-def _get_active_tenants():
-    """
-    Busca todos os tenants ativos no schema público.
-    Retorna uma lista vazia se a tabela não existir ou houver erro.
-    """
-    try:
-        # Verificar se a tabela tenants_tenant existe antes de tentar acessá-la
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'tenants_tenant'
-                    );
-                """)
-                tabela_existe = cursor.fetchone()[0]
-        except Exception as e:
-            logger.warning(f"[CELERY] Erro ao verificar existência da tabela tenants_tenant: {e}")
-            return []
-        
-        if not tabela_existe:
-            logger.warning("[CELERY] Tabela tenants_tenant não existe ainda. Retornando lista vazia...")
-            return []
-        
-        # Buscar todos os tenants ativos no schema público
-        try:
-            with schema_context('public'):
-                return list(Tenant.objects.filter(is_active=True))
-        except Exception as e:
-            logger.error(f"[CELERY] Erro ao buscar tenants: {e}")
-            return []
-    except Exception as e:
-        logger.error(f"[CELERY] Erro inesperado ao buscar tenants: {e}")
-        return []
+def _expirar_reservas_tenant(schema_name):
+    """Expira as reservas SOFT vencidas de um tenant (um único UPDATE set-based)"""
+    count = expirar_reservas_soft()
+    
+    if count > 0:
+        logger.info(f"[CELERY] Tenant {schema_name}: {count} reserva(s) expirada(s)")
+    
+    return {'expired': count}
 
 
 @shared_task
@@ -78,359 +38,156 @@ def expirar_soft_reservations():
     Processa reservas de todos os tenants ativos.
     """
     logger.info("[CELERY] Iniciando expiração de reservas SOFT...")
+    return disparar_por_tenant(
+        'Expiração de reservas SOFT',
+        'estoque.tasks._expirar_reservas_tenant',
+        tabelas=['estoque_reservaestoque', 'estoque_estoque'],
+    )
+
+
+def _reconciliar_tenant(schema_name, somente_relatorio=False):
+    """Reconcilia quantidade_disponivel de um tenant (um único UPDATE set-based)"""
+    resultado = reconciliar_quantidade_disponivel(somente_relatorio=somente_relatorio)
     
-    total_count = 0
-    total_errors = 0
+    if resultado['divergentes']:
+        logger.info(
+            f"[CELERY] Tenant {schema_name}: {resultado['divergentes']} estoque(s) divergente(s) "
+            f"(divergência total {resultado['divergencia_total']}, máxima {resultado['divergencia_maxima']})"
+            + ('' if somente_relatorio else ' reconciliado(s)')
+        )
     
-    try:
-        # Buscar todos os tenants ativos no schema público
-        tenants = _get_active_tenants()
-        if not tenants:
-            logger.warning("[CELERY] Nenhum tenant ativo encontrado ou tabela não existe. Pulando execução...")
-            return
-        
-        agora = timezone.now()
-        
-        # Processar cada tenant
-        for tenant in tenants:
-            try:
-                with schema_context(tenant.schema_name):
-                    # Verificar se a tabela existe antes de tentar acessá-la
-                    if not _tabela_existe('estoque_reservaestoque'):
-                        logger.debug(f"[CELERY] Tabela estoque_reservaestoque não existe no tenant {tenant.schema_name}. Pulando...")
-                        continue
-                    
-                    # Buscar reservas SOFT ativas que expiraram neste tenant
-                    try:
-                        reservas_expiradas = ReservaEstoque.objects.filter(
-                            tipo='SOFT',
-                            status='ATIVA',
-                            data_expiracao__lte=agora
-                        )
-                    except ProgrammingError as e:
-                        if 'does not exist' in str(e):
-                            logger.debug(f"[CELERY] Tabela estoque_reservaestoque não existe no tenant {tenant.schema_name}. Pulando...")
-                            continue
-                        raise
-                    
-                    count = 0
-                    errors = 0
-                    
-                    for reserva in reservas_expiradas:
-                        try:
-                            with transaction.atomic():
-                                reserva.expirar()
-                            count += 1
-                            logger.debug(f"[CELERY] Reserva {reserva.id} expirada com sucesso (tenant: {tenant.schema_name})")
-                        except Exception as e:
-                            errors += 1
-                            logger.error(f"[CELERY] Erro ao expirar reserva {reserva.id} (tenant: {tenant.schema_name}): {str(e)}")
-                    
-                    total_count += count
-                    total_errors += errors
-                    
-                    if count > 0:
-                        logger.info(f"[CELERY] Tenant {tenant.schema_name}: {count} reserva(s) expirada(s)")
-                        
-            except ProgrammingError as e:
-                if 'does not exist' in str(e):
-                    logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                    continue
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-            except Exception as e:
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-        
-        logger.info(f"[CELERY] Expiração concluída: {total_count} reserva(s) expirada(s), {total_errors} erro(s)")
-        return {
-            'expired': total_count,
-            'errors': total_errors
-        }
-        
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar expiração de reservas: {str(e)}", exc_info=True)
-        raise
+    return {
+        'reconciled': 0 if somente_relatorio else resultado['divergentes'],
+        'drift': resultado['divergentes'],
+        'drift_total': float(resultado['divergencia_total']),
+    }
 
 
 @shared_task
-def reconciliar_estoque_disponivel():
+def reconciliar_estoque_disponivel(somente_relatorio=None):
     """
     Reconcilia quantidade_disponivel de todos os estoques.
     Executa a cada 30 minutos para garantir consistência.
-    Processa estoques de todos os tenants ativos.
+    Processa estoques de todos os tenants ativos, com um único UPDATE set-based por schema.
+    
+    Args:
+        somente_relatorio: Apenas medir a divergência, sem corrigir
+            (padrão: settings.ESTOQUE_RECONCILIACAO_SOMENTE_RELATORIO)
     """
-    logger.info("[CELERY] Iniciando reconciliação de estoque disponível...")
+    if somente_relatorio is None:
+        somente_relatorio = getattr(settings, 'ESTOQUE_RECONCILIACAO_SOMENTE_RELATORIO', False)
     
-    total_count = 0
-    total_errors = 0
+    modo = 'somente relatório' if somente_relatorio else 'correção'
+    logger.info(f"[CELERY] Iniciando reconciliação de estoque disponível ({modo})...")
+    return disparar_por_tenant(
+        f'Reconciliação de estoque disponível ({modo})',
+        'estoque.tasks._reconciliar_tenant',
+        tabelas=['estoque_estoque'],
+        kwargs={'somente_relatorio': somente_relatorio},
+    )
+
+
+def _atualizar_custo_medio_tenant(schema_name):
+    """Incorpora ao custo dos estoques de um tenant as movimentações desde a última execução"""
+    resultado = processar_custos()
     
-    try:
-        # Buscar todos os tenants ativos no schema público
-        # Buscar todos os tenants ativos no schema público
-        tenants = _get_active_tenants()
-        if not tenants:
-            logger.warning("[CELERY] Nenhum tenant ativo encontrado ou tabela não existe. Pulando execução...")
-            return
-        
-        # Processar cada tenant
-        for tenant in tenants:
-            try:
-                with schema_context(tenant.schema_name):
-                    # Verificar se a tabela existe antes de tentar acessá-la
-                    if not _tabela_existe('estoque_estoque'):
-                        logger.debug(f"[CELERY] Tabela estoque_estoque não existe no tenant {tenant.schema_name}. Pulando...")
-                        continue
-                    
-                    # Buscar todos os estoques ativos deste tenant
-                    try:
-                        estoques = Estoque.objects.filter(is_deleted=False)
-                    except ProgrammingError as e:
-                        if 'does not exist' in str(e):
-                            logger.debug(f"[CELERY] Tabela estoque_estoque não existe no tenant {tenant.schema_name}. Pulando...")
-                            continue
-                        raise
-                    
-                    count = 0
-                    errors = 0
-                    
-                    for estoque in estoques:
-                        try:
-                            with transaction.atomic():
-                                # Recalcular quantidade_disponivel
-                                quantidade_disponivel_calculada = (
-                                    estoque.quantidade_atual - estoque.quantidade_reservada
-                                )
-                                
-                                # Se houver diferença, atualizar
-                                if estoque.quantidade_disponivel != quantidade_disponivel_calculada:
-                                    estoque.quantidade_disponivel = quantidade_disponivel_calculada
-                                    estoque.save(update_fields=['quantidade_disponivel'])
-                                    count += 1
-                                    logger.debug(
-                                        f"[CELERY] Estoque {estoque.id} reconciliado (tenant: {tenant.schema_name}): "
-                                        f"{estoque.quantidade_disponivel} -> {quantidade_disponivel_calculada}"
-                                    )
-                        except Exception as e:
-                            errors += 1
-                            logger.error(f"[CELERY] Erro ao reconciliar estoque {estoque.id} (tenant: {tenant.schema_name}): {str(e)}")
-                    
-                    total_count += count
-                    total_errors += errors
-                    
-                    if count > 0:
-                        logger.info(f"[CELERY] Tenant {tenant.schema_name}: {count} estoque(s) reconciliado(s)")
-                        
-            except ProgrammingError as e:
-                if 'does not exist' in str(e):
-                    logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                    continue
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-            except Exception as e:
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-        
-        logger.info(f"[CELERY] Reconciliação concluída: {total_count} estoque(s) atualizado(s), {total_errors} erro(s)")
-        return {
-            'reconciled': total_count,
-            'errors': total_errors
-        }
-        
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar reconciliação: {str(e)}", exc_info=True)
-        raise
+    if resultado['semeados']:
+        logger.info(f"[CELERY] Tenant {schema_name}: estado de custo inicial criado para {resultado['semeados']} estoque(s)")
+    if resultado['atualizados']:
+        logger.info(
+            f"[CELERY] Tenant {schema_name}: {resultado['movimentacoes']} movimentação(ões) incorporada(s), "
+            f"{resultado['atualizados']} custo(s) atualizado(s)"
+        )
+    
+    return {
+        'updated': resultado['atualizados'],
+        'movements': resultado['movimentacoes'],
+        'stocks': resultado['estoques'],
+        'seeded': resultado['semeados'],
+    }
 
 
 @shared_task
 def atualizar_custo_medio_produtos():
     """
-    Atualiza custo médio de produtos baseado nas últimas entradas.
+    Atualiza o custo dos estoques (médio ponderado ou FIFO, conforme
+    settings.ESTOQUE_METODO_CUSTO) de forma incremental: apenas as movimentações
+    novas desde a última execução são processadas.
     Executa a cada 1 hora.
     Processa estoques de todos os tenants ativos.
     """
     logger.info("[CELERY] Iniciando atualização de custo médio...")
+    return disparar_por_tenant(
+        'Atualização de custo médio',
+        'estoque.tasks._atualizar_custo_medio_tenant',
+        tabelas=['estoque_estoque', 'estoque_movimentacaoestoque', 'estoque_custoestoque', 'estoque_controlecustoestoque'],
+    )
+
+
+def _reconstruir_consolidado_tenant(schema_name):
+    """Valida as filiais dos grupos e reconstrói o estoque consolidado de um tenant"""
+    # Validar que todas as filiais dos grupos pertencem à empresa do grupo
+    grupos_invalidos = GrupoFilial.filiais.through.objects.filter(
+        grupofilial__is_active=True
+    ).exclude(
+        filial__empresa_id=F('grupofilial__empresa_id')
+    ).values_list('grupofilial_id', flat=True).distinct()
+    for grupo_id in grupos_invalidos:
+        logger.warning(
+            f"[CELERY] Grupo {grupo_id} tem filiais de empresas diferentes (tenant: {schema_name}). "
+            f"Essas filiais não entram no consolidado."
+        )
     
-    total_count = 0
-    total_errors = 0
-    
-    try:
-        # Buscar todos os tenants ativos no schema público
-        with schema_context('public'):
-            tenants = Tenant.objects.filter(is_active=True)
-        
-        # Buscar todos os estoques com movimentações recentes
-        # Atualizar apenas estoques que tiveram entradas nas últimas 24 horas
-        desde = timezone.now() - timezone.timedelta(hours=24)
-        
-        # Processar cada tenant
-        for tenant in tenants:
-            try:
-                with schema_context(tenant.schema_name):
-                    # Verificar se as tabelas existem antes de tentar acessá-las
-                    if not _tabela_existe('estoque_estoque') or not _tabela_existe('estoque_movimentacaoestoque'):
-                        logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                        continue
-                    
-                    try:
-                        estoques_com_entradas = Estoque.objects.filter(
-                            movimentacoes__tipo='ENTRADA',
-                            movimentacoes__data_movimentacao__gte=desde,
-                            movimentacoes__status='CONFIRMADA'
-                        ).distinct()
-                    except ProgrammingError as e:
-                        if 'does not exist' in str(e):
-                            logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                            continue
-                        raise
-                    
-                    count = 0
-                    errors = 0
-                    
-                    for estoque in estoques_com_entradas:
-                        try:
-                            with transaction.atomic():
-                                # Buscar últimas entradas confirmadas
-                                entradas = MovimentacaoEstoque.objects.filter(
-                                    estoque=estoque,
-                                    tipo='ENTRADA',
-                                    status='CONFIRMADA'
-                                ).order_by('-data_movimentacao')[:10]  # Últimas 10 entradas
-                                
-                                if not entradas.exists():
-                                    continue
-                                
-                                # Calcular custo médio ponderado das últimas entradas
-                                total_quantidade = sum(e.quantidade for e in entradas)
-                                total_valor = sum(e.valor_total for e in entradas)
-                                
-                                if total_quantidade > 0:
-                                    novo_custo_medio = total_valor / total_quantidade
-                                    
-                                    # Atualizar apenas se houver diferença significativa (> 0.01)
-                                    if abs(estoque.valor_custo_medio - novo_custo_medio) > Decimal('0.01'):
-                                        estoque.valor_custo_medio = novo_custo_medio.quantize(Decimal('0.01'))
-                                        estoque.save(update_fields=['valor_custo_medio'])
-                                        count += 1
-                                        logger.debug(
-                                            f"[CELERY] Custo médio atualizado para estoque {estoque.id} (tenant: {tenant.schema_name}): "
-                                            f"{estoque.valor_custo_medio}"
-                                        )
-                        except Exception as e:
-                            errors += 1
-                            logger.error(f"[CELERY] Erro ao atualizar custo médio do estoque {estoque.id} (tenant: {tenant.schema_name}): {str(e)}")
-                    
-                    total_count += count
-                    total_errors += errors
-                    
-                    if count > 0:
-                        logger.info(f"[CELERY] Tenant {tenant.schema_name}: {count} estoque(s) atualizado(s)")
-                        
-            except ProgrammingError as e:
-                if 'does not exist' in str(e):
-                    logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                    continue
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-            except Exception as e:
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-        
-        logger.info(f"[CELERY] Atualização de custo médio concluída: {total_count} estoque(s) atualizado(s), {total_errors} erro(s)")
-        return {
-            'updated': total_count,
-            'errors': total_errors
-        }
-        
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar atualização de custo médio: {str(e)}", exc_info=True)
-        raise
+    linhas = reconstruir_estoque_consolidado()
+    logger.info(f"[CELERY] Tenant {schema_name}: {linhas} linha(s) de estoque consolidado")
+    return {'linhas': linhas}
 
 
 @shared_task
 def atualizar_estoque_consolidado_grupos():
     """
-    Atualiza estoque consolidado de grupos de filiais.
+    Reconstrói a tabela de estoque consolidado (EstoqueConsolidado) de cada tenant.
     Executa a cada 15 minutos.
-    Processa grupos de todos os tenants ativos.
+    
+    A tabela é mantida incrementalmente a cada movimentação; a reconstrução
+    completa aplica as alterações de grupos (filiais, ativação/desativação),
+    corrige qualquer divergência (ex: location desativada) e valida as
+    filiais dos grupos.
     """
     logger.info("[CELERY] Iniciando atualização de estoque consolidado de grupos...")
+    return disparar_por_tenant(
+        'Reconstrução do estoque consolidado',
+        'estoque.tasks._reconstruir_consolidado_tenant',
+        tabelas=['estoque_estoqueconsolidado', 'estoque_grupofilial'],
+    )
+
+
+def _verificar_estoque_minimo_tenant(schema_name):
+    """Registra alertas dos estoques abaixo do mínimo de um tenant"""
+    estoques_abaixo_minimo = Estoque.objects.filter(
+        is_deleted=False,
+        estoque_minimo__gt=0
+    ).annotate(
+        diferenca=F('quantidade_atual') - F('estoque_minimo')
+    ).filter(
+        quantidade_atual__lt=F('estoque_minimo')
+    )
     
-    total_count = 0
-    total_errors = 0
+    count = estoques_abaixo_minimo.count()
     
-    try:
-        # Buscar todos os tenants ativos no schema público
-        # Buscar todos os tenants ativos no schema público
-        tenants = _get_active_tenants()
-        if not tenants:
-            logger.warning("[CELERY] Nenhum tenant ativo encontrado ou tabela não existe. Pulando execução...")
-            return
-        
-        # Processar cada tenant
-        for tenant in tenants:
-            try:
-                with schema_context(tenant.schema_name):
-                    # Verificar se a tabela existe antes de tentar acessá-la
-                    if not _tabela_existe('estoque_grupofilial'):
-                        logger.debug(f"[CELERY] Tabela estoque_grupofilial não existe no tenant {tenant.schema_name}. Pulando...")
-                        continue
-                    
-                    # Esta tarefa é mais para garantir consistência
-                    # O método get_estoque_consolidado() já calcula em tempo real
-                    # Aqui podemos fazer cache ou validações se necessário
-                    
-                    try:
-                        grupos = GrupoFilial.objects.filter(is_active=True)
-                    except ProgrammingError as e:
-                        if 'does not exist' in str(e):
-                            logger.debug(f"[CELERY] Tabela estoque_grupofilial não existe no tenant {tenant.schema_name}. Pulando...")
-                            continue
-                        raise
-                    
-                    count = 0
-                    errors = 0
-                    
-                    for grupo in grupos:
-                        try:
-                            # Validar que todas as filiais do grupo pertencem à empresa
-                            filiais_invalidas = grupo.filiais.exclude(empresa=grupo.empresa)
-                            if filiais_invalidas.exists():
-                                logger.warning(
-                                    f"[CELERY] Grupo {grupo.id} tem filiais de empresas diferentes (tenant: {tenant.schema_name}). "
-                                    f"Filiais inválidas: {[f.id for f in filiais_invalidas]}"
-                                )
-                            else:
-                                count += 1
-                        except Exception as e:
-                            errors += 1
-                            logger.error(f"[CELERY] Erro ao validar grupo {grupo.id} (tenant: {tenant.schema_name}): {str(e)}")
-                    
-                    total_count += count
-                    total_errors += errors
-                    
-                    if count > 0:
-                        logger.info(f"[CELERY] Tenant {tenant.schema_name}: {count} grupo(s) válido(s)")
-                        
-            except ProgrammingError as e:
-                if 'does not exist' in str(e):
-                    logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                    continue
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-            except Exception as e:
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-                total_errors += 1
-        
-        logger.info(f"[CELERY] Validação de grupos concluída: {total_count} grupo(s) válido(s), {total_errors} erro(s)")
-        return {
-            'validated': total_count,
-            'errors': total_errors
-        }
+    if count > 0:
+        logger.warning(
+            f"[CELERY] Tenant {schema_name}: {count} produto(s) com estoque abaixo do mínimo encontrado(s)"
+        )
         
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar atualização de grupos: {str(e)}", exc_info=True)
-        raise
+        # Log detalhado dos produtos
+        for estoque in estoques_abaixo_minimo.select_related('produto', 'location', 'empresa')[:50]:  # Limitar a 50 para não sobrecarregar
+            logger.warning(
+                f"[CELERY] ALERTA ({schema_name}): {estoque.produto.nome} na {estoque.location.nome} "
+                f"({estoque.empresa.nome}): {estoque.quantidade_atual} < {estoque.estoque_minimo}"
+            )
+    
+    return {'alerts': count}
 
 
 @shared_task
@@ -441,100 +198,39 @@ def verificar_estoque_minimo():
     Processa estoques de todos os tenants ativos.
     """
     logger.info("[CELERY] Iniciando verificação de estoque mínimo...")
+    return disparar_por_tenant(
+        'Verificação de estoque mínimo',
+        'estoque.tasks._verificar_estoque_minimo_tenant',
+        tabelas=['estoque_estoque'],
+    )
+
+
+def _calcular_indicadores_tenant(schema_name):
+    """Atualiza os snapshots de indicadores de estoque de um tenant"""
+    resultado = calcular_indicadores()
     
-    total_count = 0
+    logger.info(
+        f"[CELERY] Tenant {schema_name}: indicadores de {resultado['snapshots']} estoque(s) atualizados "
+        f"({resultado['recalculados']} recalculado(s) a partir das movimentações)"
+    )
     
-    try:
-        # Buscar todos os tenants ativos no schema público
-        # Buscar todos os tenants ativos no schema público
-        tenants = _get_active_tenants()
-        if not tenants:
-            logger.warning("[CELERY] Nenhum tenant ativo encontrado ou tabela não existe. Pulando execução...")
-            return
-        
-        # Processar cada tenant
-        for tenant in tenants:
-            try:
-                with schema_context(tenant.schema_name):
-                    # Verificar se a tabela existe antes de tentar acessá-la
-                    if not _tabela_existe('estoque_estoque'):
-                        logger.debug(f"[CELERY] Tabela estoque_estoque não existe no tenant {tenant.schema_name}. Pulando...")
-                        continue
-                    
-                    try:
-                        estoques_abaixo_minimo = Estoque.objects.filter(
-                            is_deleted=False,
-                            estoque_minimo__gt=0
-                        ).annotate(
-                            diferenca=F('quantidade_atual') - F('estoque_minimo')
-                        ).filter(
-                            quantidade_atual__lt=F('estoque_minimo')
-                        )
-                    except ProgrammingError as e:
-                        if 'does not exist' in str(e):
-                            logger.debug(f"[CELERY] Tabela estoque_estoque não existe no tenant {tenant.schema_name}. Pulando...")
-                            continue
-                        raise
-                    
-                    count = estoques_abaixo_minimo.count()
-                    total_count += count
-                    
-                    if count > 0:
-                        logger.warning(
-                            f"[CELERY] Tenant {tenant.schema_name}: {count} produto(s) com estoque abaixo do mínimo encontrado(s)"
-                        )
-                        
-                        # Log detalhado dos produtos
-                        for estoque in estoques_abaixo_minimo.select_related('produto', 'location', 'empresa')[:50]:  # Limitar a 50 para não sobrecarregar
-                            logger.warning(
-                                f"[CELERY] ALERTA ({tenant.schema_name}): {estoque.produto.nome} na {estoque.location.nome} "
-                                f"({estoque.empresa.nome}): {estoque.quantidade_atual} < {estoque.estoque_minimo}"
-                            )
-                        
-            except ProgrammingError as e:
-                if 'does not exist' in str(e):
-                    logger.debug(f"[CELERY] Tabelas do estoque não existem no tenant {tenant.schema_name}. Pulando...")
-                    continue
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-            except Exception as e:
-                logger.error(f"[CELERY] Erro ao processar tenant {tenant.schema_name}: {str(e)}", exc_info=True)
-        
-        logger.info(f"[CELERY] Verificação concluída: {total_count} alerta(s) gerado(s)")
-        return {
-            'alerts': total_count
-        }
-        
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar verificação de estoque mínimo: {str(e)}", exc_info=True)
-        raise
+    return resultado
 
 
 @shared_task
 def calcular_indicadores_estoque():
     """
-    Calcula indicadores de estoque (giro, rotatividade, etc.).
+    Calcula indicadores de estoque (giro, rotatividade, dias de cobertura,
+    produtos parados e abaixo do mínimo) e grava os snapshots servidos
+    pelo endpoint de indicadores.
     Executa semanalmente.
     """
     logger.info("[CELERY] Iniciando cálculo de indicadores de estoque...")
-    
-    try:
-        # Esta tarefa pode calcular métricas como:
-        # - Giro de estoque
-        # - Produtos parados
-        # - Rotatividade
-        # - Tempo médio de permanência
-        
-        # Por enquanto, apenas logamos que a tarefa foi executada
-        # Implementação completa pode ser feita conforme necessidade
-        
-        logger.info("[CELERY] Cálculo de indicadores concluído")
-        return {
-            'status': 'completed'
-        }
-        
-    except Exception as e:
-        logger.error(f"[CELERY] Erro ao processar cálculo de indicadores: {str(e)}")
-        raise
+    return disparar_por_tenant(
+        'Cálculo de indicadores de estoque',
+        'estoque.tasks._calcular_indicadores_tenant',
+        tabelas=['estoque_estoque', 'estoque_movimentacaoestoque', 'estoque_indicadorestoque'],
+    )
 
 
 @shared_task
@@ -1,7 +1,10 @@
 """
 Testes unitários para os modelos do módulo de Estoque
 """
-from django.test import TestCase, override_settings
+import threading
+import time
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django_tenants.utils import schema_context
@@ -9,8 +12,11 @@ from decimal import Decimal
 from tenants.models import Tenant, Domain, Empresa, Filial
 from cadastros.models import Produto
 from estoque.models import Location, Estoque, MovimentacaoEstoque, ReservaEstoque, PrevisaoMovimentacao
+from estoque.custos import processar_custos
+from estoque.indicadores import calcular_indicadores
 from estoque.services import (
     processar_entrada_estoque,
+    processar_entradas_em_lote,
     processar_saida_estoque,
     calcular_custo_medio_ponderado,
     validar_location_permite_entrada,
@@ -20,10 +26,12 @@ from estoque.services import (
     criar_reserva,
     confirmar_reserva,
     cancelar_reserva,
+    expirar_reservas_soft,
     processar_transferencia,
+    reconciliar_quantidade_disponivel,
     EstoqueServiceError
 )
-from estoque.models import GrupoFilial
+from estoque.models import GrupoFilial, IndicadorEstoque
 from django.utils import timezone
 from datetime import timedelta
 from subscriptions.models import Plan
@@ -428,7 +436,72 @@ class EstoqueModelTests(TestCase):
                     quantidade_atual=Decimal('50.000'),
                     valor_custo_medio=Decimal('10.50')
                 )
-
+    
+    def test_paginacao_keyset_estoques(self):
+        """Testa a paginação keyset de estoques por (produto_id, id), com limite na coluna do índice"""
+        from urllib.parse import urlparse, parse_qs
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from core.pagination import KeysetPagination
+        from estoque.api.viewsets import EstoqueViewSet
+        
+        with schema_context(self.tenant.schema_name):
+            outra_location = Location.objects.create(
+                empresa=self.empresa,
+                nome='Depósito',
+                codigo='LOC002',
+                tipo='LOJA',
+                logradouro='Rua Teste',
+                numero='456',
+                bairro='Centro',
+                cidade='São Paulo',
+                estado='SP',
+                cep='01234-567',
+                is_active=True
+            )
+            produtos = [self.produto] + [
+                Produto.objects.create(
+                    codigo_produto=codigo,
+                    nome=f'Produto {codigo}',
+                    ativo=True,
+                    unidade_medida='UN',
+                    valor_custo=Decimal('10.00'),
+                    valor_venda=Decimal('15.00'),
+                    codigo_ncm='12345678',
+                    origem_mercadoria='0',
+                    aliquota_icms=Decimal('18.00'),
+                    aliquota_ipi=Decimal('0.00')
+                )
+                for codigo in (2, 3)
+            ]
+            for produto in produtos:
+                for location in (self.location, outra_location):
+                    Estoque.objects.create(produto=produto, location=location, empresa=self.empresa)
+            esperados = list(
+                Estoque.objects.order_by('produto_id', 'id').values_list('id', flat=True)
+            )
+            
+            factory = APIRequestFactory()
+            vistos = []
+            cursor = None
+            for _ in range(10):
+                params = {'page_size': 4}
+                if cursor:
+                    params['cursor'] = cursor
+                request = Request(factory.get('/api/estoque/estoques/', params))
+                paginator = KeysetPagination(EstoqueViewSet.cursor_ordering, page_size=20)
+                with CaptureQueriesContext(connection) as consultas:
+                    pagina = paginator.paginate_queryset(Estoque.objects.filter(empresa=self.empresa), request)
+                if cursor:
+                    self.assertIn('"produto_id" >= ', consultas[-1]['sql'])
+                vistos.extend(estoque.id for estoque in pagina)
+                proxima = paginator.get_next_link()
+                if not proxima:
+                    break
+                cursor = parse_qs(urlparse(proxima).query)['cursor'][0]
+            
+            self.assertEqual(vistos, esperados)
 
 @override_settings(
     CACHES={
@@ -554,6 +627,92 @@ class MovimentacaoEstoqueModelTests(TestCase):
             self.assertEqual(movimentacao.quantidade, Decimal('50.000'))
             self.assertEqual(movimentacao.valor_total, Decimal('50.000') * Decimal('10.50'))
     
+    def test_paginacao_keyset_movimentacoes(self):
+        """Testa que a paginação keyset percorre todas as movimentações sem repetir, mesmo com datas empatadas"""
+        from urllib.parse import urlparse, parse_qs
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from core.pagination import KeysetPagination
+        
+        with schema_context(self.tenant.schema_name):
+            for i in range(5):
+                MovimentacaoEstoque.objects.create(
+                    estoque=self.estoque,
+                    tipo='ENTRADA',
+                    origem='COMPRA',
+                    status='CONFIRMADA',
+                    quantidade=Decimal('1.000'),
+                    quantidade_anterior=Decimal('100.000'),
+                    quantidade_posterior=Decimal('101.000'),
+                    valor_unitario=Decimal('10.50'),
+                    location_destino=self.location_origem,
+                    documento_referencia=f'OC{i}'
+                )
+            # Forçar empate em data_movimentacao para exercitar o desempate por id
+            MovimentacaoEstoque.objects.update(data_movimentacao=timezone.now())
+            esperados = list(
+                MovimentacaoEstoque.objects.order_by('-data_movimentacao', '-id').values_list('id', flat=True)
+            )
+            
+            factory = APIRequestFactory()
+            vistos = []
+            cursor = None
+            for _ in range(10):
+                params = {'page_size': 2}
+                if cursor:
+                    params['cursor'] = cursor
+                request = Request(factory.get('/api/estoque/movimentacoes/', params))
+                paginator = KeysetPagination(('-data_movimentacao', '-id'), page_size=20)
+                pagina = paginator.paginate_queryset(MovimentacaoEstoque.objects.all(), request)
+                vistos.extend(mov.id for mov in pagina)
+                proxima = paginator.get_next_link()
+                if not proxima:
+                    break
+                cursor = parse_qs(urlparse(proxima).query)['cursor'][0]
+            
+            self.assertEqual(vistos, esperados)
+    
+    def test_transferencias_filtros(self):
+        """Testa filtros da listagem de transferências: ids não numéricos (400) e intervalo de datas"""
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from accounts.contexto import ContextoUsuario
+        from estoque.api.viewsets import MovimentacaoEstoqueViewSet
+        
+        with schema_context('public'):
+            usuario = User.objects.create_user(username='transferencias', password='senha123')
+        
+        with schema_context(self.tenant.schema_name):
+            processar_transferencia(
+                produto=self.produto,
+                location_origem=self.location_origem,
+                location_destino=self.location_destino,
+                empresa=self.empresa,
+                quantidade=Decimal('10.000')
+            )
+            
+            view = MovimentacaoEstoqueViewSet.as_view({'get': 'transferencias'})
+            factory = APIRequestFactory()
+            
+            def listar(**params):
+                request = factory.get('/api/estoque/movimentacoes/transferencias/', params)
+                request._contexto_usuario = ContextoUsuario(usuario, empresa=self.empresa)
+                force_authenticate(request, user=usuario)
+                return view(request)
+            
+            self.assertEqual(listar(location_id='abc').status_code, 400)
+            self.assertEqual(listar(produto_id='1 OR 1=1').status_code, 400)
+            
+            hoje = timezone.localdate()
+            response = listar(data_inicio=hoje.isoformat(), data_fim=hoje.isoformat(),
+                              location_id=str(self.location_destino.id))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 1)
+            
+            response = listar(data_fim=(hoje - timedelta(days=1)).isoformat())
+            self.assertEqual(response.data['count'], 0)
+            response = listar(data_inicio=(hoje + timedelta(days=1)).isoformat())
+            self.assertEqual(response.data['count'], 0)
+    
     def test_create_movimentacao_saida(self):
         """Testa criação de movimentação de saída"""
         with schema_context(self.tenant.schema_name):
@@ -1108,6 +1267,217 @@ class EstoqueServicesTests(TestCase):
             
             with self.assertRaises(EstoqueServiceError):
                 validar_filial_pertence_empresa(self.filial, outra_empresa)
+    
+    def test_processar_entradas_em_lote(self):
+        """Testa entrada em lote com custo médio ponderado e estoque novo/existente"""
+        with schema_context(self.tenant.schema_name):
+            Estoque.objects.create(
+                produto=self.produto,
+                location=self.location_entrada,
+                empresa=self.empresa,
+                quantidade_atual=Decimal('50.000'),
+                valor_custo_medio=Decimal('10.00')
+            )
+            
+            resultado = processar_entradas_em_lote(
+                empresa=self.empresa,
+                entradas=[
+                    {'produto': self.produto, 'location': self.location_entrada,
+                     'quantidade': Decimal('50.000'), 'valor_unitario': Decimal('11.00')},
+                    {'produto': self.produto, 'location': self.location_saida,
+                     'quantidade': Decimal('20.000'), 'valor_unitario': Decimal('9.00')},
+                    {'produto': self.produto, 'location': self.location_entrada,
+                     'quantidade': Decimal('100.000'), 'valor_unitario': Decimal('12.50')},
+                ],
+                documento_referencia='OC-LOTE'
+            )
+            
+            self.assertEqual(len(resultado['movimentacoes']), 3)
+            
+            estoque_entrada = Estoque.objects.get(produto=self.produto, location=self.location_entrada)
+            # (50 * 10.00 + 50 * 11.00) / 100 = 10.50; (100 * 10.50 + 100 * 12.50) / 200 = 11.50
+            self.assertEqual(estoque_entrada.quantidade_atual, Decimal('200.000'))
+            self.assertEqual(estoque_entrada.valor_custo_medio, Decimal('11.50'))
+            self.assertEqual(estoque_entrada.quantidade_disponivel, Decimal('200.000'))
+            self.assertEqual(estoque_entrada.valor_total, Decimal('2300.00'))
+            
+            estoque_saida = Estoque.objects.get(produto=self.produto, location=self.location_saida)
+            self.assertEqual(estoque_saida.quantidade_atual, Decimal('20.000'))
+            self.assertEqual(estoque_saida.valor_custo_medio, Decimal('9.00'))
+            
+            movimentacoes = MovimentacaoEstoque.objects.filter(
+                documento_referencia='OC-LOTE',
+                estoque=estoque_entrada
+            ).order_by('id')
+            self.assertEqual(
+                [(m.quantidade_anterior, m.quantidade_posterior) for m in movimentacoes],
+                [(Decimal('50.000'), Decimal('100.000')), (Decimal('100.000'), Decimal('200.000'))]
+            )
+    
+    def test_processar_entradas_em_lote_linha_invalida(self):
+        """Testa que uma linha inválida cancela o lote inteiro"""
+        with schema_context(self.tenant.schema_name):
+            with self.assertRaises(EstoqueServiceError) as context:
+                processar_entradas_em_lote(
+                    empresa=self.empresa,
+                    entradas=[
+                        {'produto': self.produto, 'location': self.location_entrada,
+                         'quantidade': Decimal('10.000'), 'valor_unitario': Decimal('1.00')},
+                        {'produto': self.produto, 'location': self.location_sem_entrada,
+                         'quantidade': Decimal('10.000'), 'valor_unitario': Decimal('1.00')},
+                    ]
+                )
+            
+            self.assertIn('Linha 2', str(context.exception))
+            self.assertFalse(Estoque.objects.filter(produto=self.produto).exists())
+    
+    def test_processar_entradas_em_lote_campo_ausente(self):
+        """Testa que linha sem produto gera EstoqueServiceError (não KeyError)"""
+        with schema_context(self.tenant.schema_name):
+            with self.assertRaises(EstoqueServiceError) as context:
+                processar_entradas_em_lote(
+                    empresa=self.empresa,
+                    entradas=[
+                        {'location': self.location_entrada,
+                         'quantidade': Decimal('10.000'), 'valor_unitario': Decimal('1.00')},
+                    ]
+                )
+            
+            self.assertIn('Linha 1', str(context.exception))
+            self.assertIn('produto', str(context.exception))
+    
+    def test_reconciliar_quantidade_disponivel(self):
+        """Testa reconciliação set-based e modo somente relatório"""
+        with schema_context(self.tenant.schema_name):
+            estoque = Estoque.objects.create(
+                produto=self.produto,
+                location=self.location_entrada,
+                empresa=self.empresa,
+                quantidade_atual=Decimal('100.000'),
+                quantidade_reservada=Decimal('30.000'),
+                valor_custo_medio=Decimal('10.00')
+            )
+            # Simular divergência gravada fora do save()
+            Estoque.objects.filter(pk=estoque.pk).update(quantidade_disponivel=Decimal('65.000'))
+            
+            relatorio = reconciliar_quantidade_disponivel(somente_relatorio=True)
+            self.assertEqual(relatorio['divergentes'], 1)
+            self.assertEqual(relatorio['divergencia_total'], Decimal('5.000'))
+            estoque.refresh_from_db()
+            self.assertEqual(estoque.quantidade_disponivel, Decimal('65.000'))
+            
+            resultado = reconciliar_quantidade_disponivel()
+            self.assertEqual(resultado['ids'], [estoque.pk])
+            estoque.refresh_from_db()
+            self.assertEqual(estoque.quantidade_disponivel, Decimal('70.000'))
+            
+            self.assertEqual(reconciliar_quantidade_disponivel()['divergentes'], 0)
+    
+    def test_processar_custos_incremental(self):
+        """Testa o motor de custos: semeadura, incorporação incremental e FIFO"""
+        with schema_context(self.tenant.schema_name):
+            def entrada(location, quantidade, valor):
+                return processar_entrada_estoque(
+                    produto=self.produto, location=location, empresa=self.empresa,
+                    quantidade=Decimal(quantidade), valor_unitario=Decimal(valor)
+                )['estoque']
+            
+            entrada(self.location_entrada, '10.000', '10.00')
+            
+            # Primeira execução: estado inicial a partir do custo atual, sem histórico
+            resultado = processar_custos(metodo='MEDIO')
+            self.assertEqual(resultado['semeados'], 1)
+            self.assertEqual(resultado['movimentacoes'], 0)
+            
+            # Médio ponderado: (10 x 10 + 10 x 20) / 20 = 15
+            estoque_medio = entrada(self.location_entrada, '10.000', '20.00')
+            Estoque.objects.filter(pk=estoque_medio.pk).update(valor_custo_medio=Decimal('0.00'))
+            resultado = processar_custos(metodo='MEDIO')
+            self.assertEqual(resultado['movimentacoes'], 1)
+            estoque_medio.refresh_from_db()
+            self.assertEqual(estoque_medio.valor_custo_medio, Decimal('15.00'))
+            self.assertEqual(estoque_medio.valor_total, Decimal('300.00'))
+            
+            # Sem movimentações novas, nada é reprocessado
+            self.assertEqual(processar_custos(metodo='MEDIO')['movimentacoes'], 0)
+            
+            # FIFO em estoque novo: a saída consome a camada mais antiga (10 a 10,00 + 5 a 20,00)
+            entrada(self.location_saida, '10.000', '10.00')
+            estoque_fifo = entrada(self.location_saida, '10.000', '20.00')
+            processar_saida_estoque(
+                produto=self.produto, location=self.location_saida, empresa=self.empresa,
+                quantidade=Decimal('15.000'), valor_unitario=Decimal('25.00')
+            )
+            resultado = processar_custos(metodo='FIFO')
+            self.assertEqual(resultado['movimentacoes'], 3)
+            estoque_fifo.refresh_from_db()
+            self.assertEqual(estoque_fifo.valor_custo_medio, Decimal('20.00'))
+            self.assertEqual(estoque_fifo.custo.camadas, [['5.000', '20.00']])
+    
+    def test_calcular_indicadores(self):
+        """Testa snapshots de indicadores por estoque e empresa, e o recálculo incremental"""
+        with schema_context(self.tenant.schema_name):
+            processar_entrada_estoque(
+                produto=self.produto, location=self.location_entrada, empresa=self.empresa,
+                quantidade=Decimal('100.000'), valor_unitario=Decimal('10.00')
+            )
+            processar_saida_estoque(
+                produto=self.produto, location=self.location_entrada, empresa=self.empresa,
+                quantidade=Decimal('30.000'), valor_unitario=Decimal('15.00')
+            )
+            # Estoque sem movimentações: parado
+            Estoque.objects.create(
+                produto=self.produto,
+                location=self.location_saida,
+                empresa=self.empresa,
+                quantidade_atual=Decimal('50.000'),
+                valor_custo_medio=Decimal('10.00')
+            )
+            
+            resultado = calcular_indicadores()
+            self.assertEqual(resultado['recalculados'], 2)
+            self.assertEqual(resultado['snapshots'], 2)
+            
+            movimentado = IndicadorEstoque.objects.get(nivel='ESTOQUE', location=self.location_entrada)
+            self.assertEqual(movimentado.saidas_periodo, Decimal('30.000'))
+            self.assertEqual(movimentado.produtos_parados, 0)
+            parado = IndicadorEstoque.objects.get(nivel='ESTOQUE', location=self.location_saida)
+            self.assertEqual(parado.estoque_medio, Decimal('50.000'))
+            self.assertEqual(parado.produtos_parados, 1)
+            
+            empresa = IndicadorEstoque.objects.get(nivel='EMPRESA', empresa=self.empresa).as_dict()
+            self.assertEqual(empresa['produtos'], 2)
+            self.assertEqual(empresa['produtos_parados'], 1)
+            self.assertEqual(empresa['valor_total_estoque'], '1200.00')
+            # Cobertura: 120 em estoque / (30 saídas em 90 dias) = 360 dias
+            self.assertEqual(empresa['dias_estoque'], 360)
+            
+            # Segunda execução: apenas o estoque com movimentações no período é relido do livro
+            self.assertEqual(calcular_indicadores()['recalculados'], 1)
+    
+    def test_calcular_indicadores_data_referencia(self):
+        """Testa que movimentações depois da data de referência não entram no período"""
+        with schema_context(self.tenant.schema_name):
+            resultado = processar_entrada_estoque(
+                produto=self.produto, location=self.location_entrada, empresa=self.empresa,
+                quantidade=Decimal('100.000'), valor_unitario=Decimal('10.00')
+            )
+            MovimentacaoEstoque.objects.filter(pk=resultado['movimentacao'].pk).update(
+                data_movimentacao=timezone.now() - timedelta(days=10)
+            )
+            # Saída hoje: depois da data de referência (ontem)
+            processar_saida_estoque(
+                produto=self.produto, location=self.location_entrada, empresa=self.empresa,
+                quantidade=Decimal('30.000'), valor_unitario=Decimal('15.00')
+            )
+            
+            calcular_indicadores(data_referencia=timezone.localdate() - timedelta(days=1))
+            
+            indicador = IndicadorEstoque.objects.get(nivel='ESTOQUE', location=self.location_entrada)
+            self.assertEqual(indicador.saidas_periodo, Decimal('0.000'))
+            self.assertIsNone(indicador.ultima_saida)
+            # Saldo de 100 (não os 70 atuais) nos 10 últimos dos 90 dias do período
+            self.assertEqual(indicador.estoque_medio, Decimal('11.111'))
 
 
 @override_settings(
@@ -1283,6 +1653,39 @@ class ReservaEstoqueTests(TestCase):
             self.estoque.refresh_from_db()
             self.assertEqual(self.estoque.quantidade_reservada, Decimal('20.000'))
     
+    def test_reserva_hard_considera_reservas_confirmadas(self):
+        """Reserva HARD nova não pode tomar o estoque já segurado por reservas confirmadas"""
+        with schema_context(self.tenant.schema_name):
+            reserva = criar_reserva(
+                produto=self.produto,
+                location=self.location,
+                empresa=self.empresa,
+                quantidade=Decimal('70.000'),
+                tipo='SOFT',
+                origem='VENDA'
+            )['reserva']
+            confirmar_reserva(reserva)
+            self.estoque.refresh_from_db()
+            
+            # 70 confirmadas + 40 > 100 em quantidade_atual
+            with self.assertRaises(ValidationError):
+                ReservaEstoque.objects.create(
+                    estoque=self.estoque,
+                    tipo='HARD',
+                    origem='VENDA',
+                    status='ATIVA',
+                    quantidade=Decimal('40.000')
+                )
+            
+            nova = ReservaEstoque.objects.create(
+                estoque=self.estoque,
+                tipo='HARD',
+                origem='VENDA',
+                status='ATIVA',
+                quantidade=Decimal('30.000')
+            )
+            self.assertEqual(nova.status, 'ATIVA')
+    
     def test_cancelar_reserva_hard(self):
         """Testa cancelamento de reserva HARD (libera estoque)"""
         with schema_context(self.tenant.schema_name):
@@ -1325,6 +1728,37 @@ class ReservaEstoqueTests(TestCase):
             
             self.assertEqual(reserva.status, 'EXPIRADA')
     
+    def test_expirar_reservas_soft_em_lote(self):
+        """Testa expiração em lote: apenas SOFT ativas vencidas, sem alterar o estoque"""
+        with schema_context(self.tenant.schema_name):
+            def criar(tipo, minutos, status='ATIVA'):
+                return ReservaEstoque.objects.create(
+                    estoque=self.estoque,
+                    tipo=tipo,
+                    origem='ECOMMERCE',
+                    status=status,
+                    quantidade=Decimal('5.000'),
+                    data_expiracao=timezone.now() + timedelta(minutes=minutos) if tipo == 'SOFT' else None
+                )
+            
+            vencidas = [criar('SOFT', -10), criar('SOFT', -1)]
+            vigente = criar('SOFT', 30)
+            cancelada = criar('SOFT', -10, status='CANCELADA')
+            hard = criar('HARD', 0)
+            
+            self.assertEqual(expirar_reservas_soft(), 2)
+            
+            for reserva in vencidas:
+                reserva.refresh_from_db()
+                self.assertEqual(reserva.status, 'EXPIRADA')
+            for reserva, status in ((vigente, 'ATIVA'), (cancelada, 'CANCELADA'), (hard, 'ATIVA')):
+                reserva.refresh_from_db()
+                self.assertEqual(reserva.status, status)
+            
+            self.estoque.refresh_from_db()
+            self.assertEqual(self.estoque.quantidade_reservada, Decimal('0.000'))
+            self.assertEqual(expirar_reservas_soft(), 0)
+    
     def test_reserva_esta_expirada(self):
         """Testa propriedade esta_expirada"""
         with schema_context(self.tenant.schema_name):
@@ -1548,3 +1982,215 @@ class PrevisaoMovimentacaoTests(TestCase):
             # Deve remover da previsão
             self.estoque.refresh_from_db()
             self.assertEqual(self.estoque.quantidade_prevista_entrada, Decimal('0.000'))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+class EstoqueConcorrenciaTests(TransactionTestCase):
+    """
+    Benchmark de contenção: N threads (cada uma com sua conexão, como workers do gunicorn)
+    disputando o mesmo SKU. Usa TransactionTestCase porque as threads precisam enxergar
+    os dados commitados.
+    """
+    
+    NUM_THREADS = 8
+    OPERACOES_POR_THREAD = 20
+    
+    def setUp(self):
+        """Configuração inicial para cada teste"""
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_estoque_concorrencia',
+                name='Tenant de Teste Concorrência',
+                is_active=True
+            )
+        
+        with schema_context(self.tenant.schema_name):
+            self.empresa = Empresa.objects.create(
+                tenant=self.tenant,
+                nome='Empresa Teste',
+                razao_social='Empresa Teste LTDA',
+                cnpj='12345678000190',
+                cidade='São Paulo',
+                estado='SP',
+                is_active=True
+            )
+            
+            self.location_a = Location.objects.create(
+                empresa=self.empresa,
+                nome='Loja A',
+                codigo='LOCA',
+                tipo='LOJA',
+                logradouro='Rua A',
+                numero='1',
+                bairro='Centro',
+                cidade='São Paulo',
+                estado='SP',
+                cep='01234-567',
+                is_active=True
+            )
+            
+            self.location_b = Location.objects.create(
+                empresa=self.empresa,
+                nome='Loja B',
+                codigo='LOCB',
+                tipo='LOJA',
+                logradouro='Rua B',
+                numero='2',
+                bairro='Centro',
+                cidade='São Paulo',
+                estado='SP',
+                cep='01234-567',
+                is_active=True
+            )
+            
+            self.produto = Produto.objects.create(
+                codigo_produto=99,
+                nome='Produto Concorrência',
+                descricao='Produto disputado por várias threads',
+                ativo=True,
+                unidade_medida='UN',
+                valor_custo=Decimal('10.00'),
+                valor_venda=Decimal('15.00'),
+                codigo_ncm='12345678',
+                origem_mercadoria='0',
+                aliquota_icms=Decimal('18.00'),
+                aliquota_ipi=Decimal('0.00')
+            )
+            
+            self.estoque_a = Estoque.objects.create(
+                produto=self.produto,
+                location=self.location_a,
+                empresa=self.empresa,
+                quantidade_atual=Decimal('100.000'),
+                valor_custo_medio=Decimal('10.00')
+            )
+            self.estoque_b = Estoque.objects.create(
+                produto=self.produto,
+                location=self.location_b,
+                empresa=self.empresa,
+                quantidade_atual=Decimal('100.000'),
+                valor_custo_medio=Decimal('10.00')
+            )
+    
+    def tearDown(self):
+        """Remove o schema do tenant criado para o teste"""
+        # Tenant.delete() consultaria, no schema public, tabelas que só existem nos schemas
+        # dos tenants; o registro do tenant é removido pelo flush do TransactionTestCase
+        with schema_context('public'), connection.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS "{self.tenant.schema_name}" CASCADE')
+    
+    def _disparar_threads(self, operacao):
+        """
+        Executa operacao(indice_thread) em NUM_THREADS threads ao mesmo tempo.
+        Retorna (sucessos, falhas, erros_inesperados, segundos).
+        """
+        barreira = threading.Barrier(self.NUM_THREADS)
+        sucessos = []
+        falhas = []
+        erros = []
+        
+        def worker(indice):
+            try:
+                barreira.wait()
+                with schema_context(self.tenant.schema_name):
+                    for _ in range(self.OPERACOES_POR_THREAD):
+                        try:
+                            operacao(indice)
+                            sucessos.append(indice)
+                        except EstoqueServiceError:
+                            falhas.append(indice)
+            except Exception as e:  # Qualquer outro erro (ex: deadlock) falha o teste
+                erros.append(e)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.NUM_THREADS)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sucessos, falhas, erros, time.perf_counter() - inicio
+    
+    def test_saidas_concorrentes_mesmo_sku(self):
+        """Nenhuma venda é perdida nem o estoque fica negativo sob saídas paralelas"""
+        def vender(indice):
+            processar_saida_estoque(
+                produto=self.produto,
+                location=self.location_a,
+                empresa=self.empresa,
+                quantidade=Decimal('1.000'),
+                valor_unitario=Decimal('10.00'),
+                verificar_estoque_minimo=False
+            )
+        
+        sucessos, falhas, erros, segundos = self._disparar_threads(vender)
+        
+        total = self.NUM_THREADS * self.OPERACOES_POR_THREAD
+        self.assertEqual(erros, [])
+        self.assertEqual(len(sucessos), 100, f"{total} operações em {segundos:.2f}s")
+        self.assertEqual(len(falhas), total - 100)
+        
+        with schema_context(self.tenant.schema_name):
+            self.estoque_a.refresh_from_db()
+            self.assertEqual(self.estoque_a.quantidade_atual, Decimal('0.000'))
+            self.assertEqual(self.estoque_a.quantidade_disponivel, Decimal('0.000'))
+            self.assertEqual(
+                MovimentacaoEstoque.objects.filter(estoque=self.estoque_a, tipo='SAIDA').count(),
+                100
+            )
+    
+    def test_reservas_hard_concorrentes_mesmo_sku(self):
+        """Reservas HARD paralelas nunca reservam mais do que o disponível"""
+        def reservar(indice):
+            criar_reserva(
+                produto=self.produto,
+                location=self.location_a,
+                empresa=self.empresa,
+                quantidade=Decimal('1.000'),
+                tipo='HARD'
+            )
+        
+        sucessos, falhas, erros, segundos = self._disparar_threads(reservar)
+        
+        self.assertEqual(erros, [])
+        self.assertEqual(len(sucessos), 100)
+        
+        with schema_context(self.tenant.schema_name):
+            self.estoque_a.refresh_from_db()
+            self.assertEqual(self.estoque_a.quantidade_reservada, Decimal('100.000'))
+            self.assertEqual(self.estoque_a.quantidade_disponivel, Decimal('0.000'))
+    
+    def test_transferencias_cruzadas_sem_deadlock(self):
+        """Transferências A->B e B->A simultâneas não entram em deadlock e conservam o total"""
+        def transferir(indice):
+            origem, destino = (
+                (self.location_a, self.location_b) if indice % 2 == 0
+                else (self.location_b, self.location_a)
+            )
+            processar_transferencia(
+                produto=self.produto,
+                location_origem=origem,
+                location_destino=destino,
+                empresa=self.empresa,
+                quantidade=Decimal('1.000')
+            )
+        
+        sucessos, falhas, erros, segundos = self._disparar_threads(transferir)
+        
+        self.assertEqual(erros, [])
+        self.assertEqual(len(sucessos), self.NUM_THREADS * self.OPERACOES_POR_THREAD)
+        
+        with schema_context(self.tenant.schema_name):
+            self.estoque_a.refresh_from_db()
+            self.estoque_b.refresh_from_db()
+            self.assertEqual(
+                self.estoque_a.quantidade_atual + self.estoque_b.quantidade_atual,
+                Decimal('200.000')
+            )
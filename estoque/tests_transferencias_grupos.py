@@ -1,13 +1,21 @@
 """
 Testes adicionais para transferências e grupos de filiais
 """
+from django.db.models import F
 from django.test import TestCase, override_settings
 from django_tenants.utils import schema_context
 from decimal import Decimal
 from tenants.models import Tenant, Domain, Empresa, Filial
 from cadastros.models import Produto
-from estoque.models import Location, Estoque, GrupoFilial
-from estoque.services import processar_transferencia, EstoqueServiceError
+from estoque.models import Location, Estoque, GrupoFilial, EstoqueConsolidado
+from estoque.consolidacao import (
+    aplicar_variacoes_estoque,
+    calcular_estoque_consolidado,
+    obter_estoque_consolidado,
+    reconstruir_estoque_consolidado,
+    snapshot_estoque,
+)
+from estoque.services import processar_transferencia, cancelar_transferencia, EstoqueServiceError
 from subscriptions.models import Plan
 
 
@@ -139,6 +147,32 @@ class TransferenciaEstoqueTests(TestCase):
             self.assertEqual(estoque_destino.quantidade_atual, Decimal('30.000'))
             self.assertEqual(estoque_destino.valor_custo_medio, Decimal('10.50'))
     
+    def test_processar_transferencia_emparelha_movimentacoes(self):
+        """Testa que saída e entrada da transferência ficam ligadas pelo par explícito"""
+        with schema_context(self.tenant.schema_name):
+            resultado = processar_transferencia(
+                produto=self.produto,
+                location_origem=self.location_origem,
+                location_destino=self.location_destino,
+                empresa=self.empresa,
+                quantidade=Decimal('10.000'),
+                documento_referencia='TRF002'
+            )
+            
+            mov_saida = resultado['movimentacao_saida']
+            mov_entrada = resultado['movimentacao_entrada']
+            mov_saida.refresh_from_db()
+            mov_entrada.refresh_from_db()
+            
+            self.assertEqual(mov_saida.movimentacao_par_id, mov_entrada.id)
+            self.assertEqual(mov_entrada.movimentacao_par_id, mov_saida.id)
+            
+            # Cancelamento usa o par gravado
+            cancelado = cancelar_transferencia(mov_saida.id, motivo='Teste')
+            self.assertEqual(cancelado['movimentacao_entrada'].id, mov_entrada.id)
+            self.assertEqual(cancelado['estoque_origem'].quantidade_atual, Decimal('100.000'))
+            self.assertEqual(cancelado['estoque_destino'].quantidade_atual, Decimal('0.000'))
+    
     def test_processar_transferencia_estoque_insuficiente(self):
         """Testa erro ao transferir com estoque insuficiente"""
         with schema_context(self.tenant.schema_name):
@@ -328,6 +362,102 @@ class GrupoFilialTests(TestCase):
             self.assertEqual(consolidado['quantidade_disponivel'], Decimal('135.000'))  # 90 + 45
             self.assertEqual(consolidado['locations'], 2)
     
+    def test_estoque_consolidado_incremental(self):
+        """Testa que a tabela consolidada acompanha as movimentações e bate com a reconstrução"""
+        with schema_context(self.tenant.schema_name):
+            grupo = GrupoFilial.objects.create(
+                empresa=self.empresa,
+                nome='Região Sudeste',
+                codigo='GRP001'
+            )
+            grupo.filiais.add(self.filial1, self.filial2)
+            
+            processar_transferencia(
+                produto=self.produto,
+                location_origem=self.location1,
+                location_destino=self.location2,
+                empresa=self.empresa,
+                quantidade=Decimal('20.000')
+            )
+            self.estoque1.refresh_from_db()
+            self.estoque1.quantidade_reservada = Decimal('12.000')
+            self.estoque1.save()
+            
+            linha_grupo = EstoqueConsolidado.objects.get(escopo='GRUPO', grupo=grupo, produto=self.produto)
+            linha_empresa = EstoqueConsolidado.objects.get(
+                escopo='EMPRESA', empresa=self.empresa, produto=self.produto
+            )
+            self.assertEqual(linha_grupo.quantidade_atual, Decimal('150.000'))
+            self.assertEqual(linha_grupo.quantidade_reservada, Decimal('17.000'))
+            self.assertEqual(linha_grupo.quantidade_disponivel, Decimal('133.000'))
+            
+            for escopo, linha, grupo_id in (('GRUPO', linha_grupo, grupo.id), ('EMPRESA', linha_empresa, None)):
+                esperado = calcular_estoque_consolidado(escopo, self.empresa.id, grupo_id, self.produto.pk)
+                self.assertEqual(linha.as_dict(), esperado)
+            
+            # Reconstrução completa produz os mesmos valores
+            reconstruir_estoque_consolidado()
+            self.assertEqual(grupo.get_estoque_consolidado(self.produto), linha_grupo.as_dict())
+    
+    def test_estoque_consolidado_total_empresa_na_leitura(self):
+        """Testa que o total da empresa não é materializado e é somado das linhas por produto"""
+        with schema_context(self.tenant.schema_name):
+            reconstruir_estoque_consolidado()
+            self.assertFalse(EstoqueConsolidado.objects.filter(produto__isnull=True).exists())
+            
+            self.estoque2.refresh_from_db()
+            self.estoque2.quantidade_atual = Decimal('70.000')
+            self.estoque2.save()
+            
+            self.assertEqual(
+                obter_estoque_consolidado('EMPRESA', self.empresa.id),
+                calcular_estoque_consolidado('EMPRESA', self.empresa.id)
+            )
+            self.assertEqual(obter_estoque_consolidado('EMPRESA', self.empresa.id)['locations'], 2)
+    
+    def test_estoque_consolidado_lote_mesma_chave(self):
+        """Testa que deltas de várias alterações na mesma linha consolidada são somados uma vez"""
+        with schema_context(self.tenant.schema_name):
+            EstoqueConsolidado.objects.all().delete()
+            anteriores = [snapshot_estoque(self.estoque1), snapshot_estoque(self.estoque2)]
+            Estoque.objects.filter(pk__in=[self.estoque1.pk, self.estoque2.pk]).update(
+                quantidade_atual=F('quantidade_atual') + 10,
+                quantidade_disponivel=F('quantidade_disponivel') + 10,
+            )
+            self.estoque1.refresh_from_db()
+            self.estoque2.refresh_from_db()
+            
+            aplicar_variacoes_estoque([
+                (anteriores[0], snapshot_estoque(self.estoque1)),
+                (anteriores[1], snapshot_estoque(self.estoque2)),
+            ])
+            
+            linha = EstoqueConsolidado.objects.get(escopo='EMPRESA', empresa=self.empresa, produto=self.produto)
+            self.assertEqual(linha.quantidade_atual, Decimal('170.000'))
+            self.assertEqual(
+                linha.as_dict(),
+                calcular_estoque_consolidado('EMPRESA', self.empresa.id, produto_id=self.produto.pk)
+            )
+    
+    def test_estoque_consolidado_grupo_alterado_na_reconstrucao(self):
+        """Testa que a troca de filiais do grupo é aplicada pela reconstrução periódica"""
+        with schema_context(self.tenant.schema_name):
+            grupo = GrupoFilial.objects.create(
+                empresa=self.empresa,
+                nome='Região Sudeste',
+                codigo='GRP001'
+            )
+            grupo.filiais.add(self.filial1, self.filial2)
+            reconstruir_estoque_consolidado()
+            
+            grupo.filiais.remove(self.filial2)
+            linha = EstoqueConsolidado.objects.get(escopo='GRUPO', grupo=grupo, produto=self.produto)
+            self.assertEqual(linha.quantidade_atual, Decimal('150.000'))  # Sem reconstrução síncrona
+            
+            reconstruir_estoque_consolidado()
+            linha = EstoqueConsolidado.objects.get(escopo='GRUPO', grupo=grupo, produto=self.produto)
+            self.assertEqual(linha.quantidade_atual, Decimal('100.000'))
+    
     def test_determinar_melhor_filial_estoque_disponivel(self):
         """Testa determinação de melhor filial por estoque disponível"""
         with schema_context(self.tenant.schema_name):
@@ -69,11 +69,15 @@ export interface RelatorioReservas {
 export interface IndicadoresEstoque {
   rotatividade: string;
   giro_estoque: string;
-  dias_estoque: number;
+  dias_estoque: number | null;
+  produtos: number;
   produtos_parados: number;
   produtos_estoque_minimo: number;
   valor_total_estoque: string;
   custo_medio_geral: string;
+  periodo_inicio: string | null;
+  periodo_fim: string | null;
+  calculado_em: string | null;
 }
 
 class RelatoriosService {
@@ -38,20 +38,8 @@ class TransferenciasService {
 
   async get(id: number): Promise<Transferencia> {
     // id é o movimentacao_saida_id (que é o id retornado na lista)
-    // Buscar na lista e filtrar pelo ID
-    const response = await api.get<ApiResponse<Transferencia>>(`${this.baseUrl}transferencias/`, {
-      params: { page_size: 1000 }
-    });
-    const transferencias = 'results' in response.data ? response.data.results : response.data;
-    const transferencia = Array.isArray(transferencias) 
-      ? transferencias.find(t => t.id === id || t.movimentacao_saida_id === id)
-      : null;
-    
-    if (!transferencia) {
-      throw new Error('Transferência não encontrada');
-    }
-    
-    return transferencia;
+    const response = await api.get<Transferencia>(`${this.baseUrl}transferencias/${id}/`);
+    return response.data;
   }
 
   async cancelar(id: number, motivo: string): Promise<any> {
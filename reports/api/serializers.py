@@ -2,7 +2,8 @@
 Serializers para o módulo de relatórios
 """
 from rest_framework import serializers
-from reports.models import ReportTemplate, ReportConfig
+from django.urls import reverse
+from reports.models import ReportTemplate, ReportConfig, ReportJob
 
 
 class ReportTemplateSerializer(serializers.ModelSerializer):
@@ -44,7 +45,7 @@ class GerarRelatorioSerializer(serializers.Serializer):
     tipo = serializers.CharField(required=True, help_text='Tipo do relatório (ex: estoque-por-location)')
     modulo = serializers.CharField(required=False, help_text='Módulo do sistema (ex: estoque)')
     formato = serializers.ChoiceField(
-        choices=['pdf', 'html', 'xlsx'],
+        choices=['pdf', 'html', 'csv', 'xlsx'],
         default='pdf',
         required=False
     )
@@ -52,4 +53,32 @@ class GerarRelatorioSerializer(serializers.Serializer):
     filtros = serializers.DictField(required=False, default=dict, help_text='Filtros do relatório')
     enviar_email = serializers.BooleanField(default=False, required=False)
     email_destinatario = serializers.EmailField(required=False, allow_null=True)
+    assincrono = serializers.BooleanField(
+        default=False,
+        required=False,
+        help_text='Gerar em segundo plano: retorna o job para consulta/download (pdf/html)'
+    )
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    """Serializer para ReportJob (status da geração assíncrona)"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'tipo', 'modulo', 'formato', 'template_id', 'filtros',
+            'status', 'status_display', 'erro',
+            'created_at', 'iniciado_em', 'concluido_em', 'expira_em',
+            'nome_arquivo', 'tamanho_bytes', 'download_url',
+        ]
+        read_only_fields = fields
+    
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.STATUS_CONCLUIDO:
+            return None
+        url = reverse('report-job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
@@ -6,13 +6,15 @@ from rest_framework.routers import DefaultRouter
 from reports.api.viewsets import (
     ReportTemplateViewSet,
     ReportConfigViewSet,
-    ReportGeneratorViewSet
+    ReportGeneratorViewSet,
+    ReportJobViewSet
 )
 
 router = DefaultRouter()
 router.register(r'templates', ReportTemplateViewSet, basename='report-template')
 router.register(r'config', ReportConfigViewSet, basename='report-config')
 router.register(r'gerar', ReportGeneratorViewSet, basename='report-generator')
+router.register(r'jobs', ReportJobViewSet, basename='report-job')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -3,17 +3,21 @@ ViewSets para o módulo de relatórios
 """
 import logging
 from io import BytesIO
-from django.http import HttpResponse
+from django.http import FileResponse
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from reports.models import ReportTemplate, ReportConfig
+from reports.models import ReportTemplate, ReportConfig, ReportJob
 from reports.api.serializers import (
     ReportTemplateSerializer,
     ReportConfigSerializer,
-    GerarRelatorioSerializer
+    GerarRelatorioSerializer,
+    ReportJobSerializer
 )
+from reports import exportacao, jobs
+from reports.dados import FiltroInvalido, obter_dados_relatorio
 from reports.engine import ReportEngine
 from cadastros.utils import get_current_empresa_filial
 from django.db import connection
@@ -52,7 +56,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = ReportTemplate.objects.all()
         tenant = self._get_current_tenant(self.request)
-        empresa, _ = get_current_empresa_filial(self.request.user)
+        empresa, _ = get_current_empresa_filial(self.request.user, self.request)
         
         # Filtrar por tenant/empresa
         if empresa:
@@ -110,7 +114,7 @@ class ReportConfigViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = ReportConfig.objects.all()
         tenant = self._get_current_tenant(self.request)
-        empresa, _ = get_current_empresa_filial(self.request.user)
+        empresa, _ = get_current_empresa_filial(self.request.user, self.request)
         
         if empresa:
             queryset = queryset.filter(tenant=tenant, empresa=empresa)
@@ -141,8 +145,16 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
             "template_id": null,
             "filtros": {...},
             "enviar_email": false,
-            "email_destinatario": null
+            "email_destinatario": null,
+            "assincrono": false
         }
+        
+        Os formatos csv e xlsx retornam as linhas do relatório por streaming
+        (reports/exportacao.py), sem template.
+        
+        Com "assincrono": true, o relatório é gerado por um worker do Celery e a
+        resposta traz o job (202, ou 200 se um job idêntico foi reaproveitado);
+        acompanhe em /api/reports/jobs/<id>/ e baixe em /api/reports/jobs/<id>/download/.
         """
         serializer = GerarRelatorioSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -170,20 +182,30 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
         try:
             # Obter tenant e empresa
             tenant = _get_current_tenant(request)
-            empresa, _ = get_current_empresa_filial(request.user)
+            empresa, filial = get_current_empresa_filial(request.user, request)
+            
+            if formato in exportacao.FORMATOS:
+                return exportacao.exportar(modulo, tipo, formato, empresa, filtros, tenant=tenant, filial=filial)
+            
+            if data.get('assincrono'):
+                return self._enfileirar(request, tenant, empresa, filial, tipo, modulo, formato, template_id, filtros)
             
             # Criar engine
             engine = ReportEngine(tenant=tenant, empresa=empresa, usuario=request.user)
             
             # Buscar dados do relatório (delegar para módulo específico)
-            relatorio_data = self._get_relatorio_data(tipo, modulo, filtros, tenant, empresa)
+            relatorio_data = self._get_relatorio_data(tipo, modulo, filtros, tenant, empresa, filial)
             
             # Gerar relatório
             if formato == 'pdf':
-                pdf_file = engine.render_pdf(tipo, relatorio_data, modulo, template_id)
-                response = HttpResponse(pdf_file.read(), content_type='application/pdf')
-                response['Content-Disposition'] = f'attachment; filename="relatorio_{tipo}.pdf"'
-                return response
+                # PDF em arquivo temporário (removido ao fechar a resposta)
+                pdf_file = engine.render_pdf_arquivo(tipo, relatorio_data, modulo, template_id)
+                return FileResponse(
+                    pdf_file,
+                    as_attachment=True,
+                    filename=f'relatorio_{tipo}.pdf',
+                    content_type='application/pdf'
+                )
             elif formato == 'html':
                 html_content = engine.render_html(tipo, relatorio_data, modulo, template_id)
                 return Response({'html': html_content})
@@ -193,6 +215,8 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
                     status=status.HTTP_501_NOT_IMPLEMENTED
                 )
                 
+        except FiltroInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Erro ao gerar relatório: {e}", exc_info=True)
             return Response(
@@ -230,7 +254,7 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
         
         try:
             tenant = _get_current_tenant(request)
-            empresa, _ = get_current_empresa_filial(request.user)
+            empresa, _ = get_current_empresa_filial(request.user, request)
             
             engine = ReportEngine(tenant=tenant, empresa=empresa, usuario=request.user)
             
@@ -247,139 +271,29 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    def _get_relatorio_data(self, tipo, modulo, filtros, tenant, empresa):
-        """
-        Busca dados do relatório do módulo específico
-        """
-        # Delegar para módulo específico
-        if modulo == 'estoque':
-            return self._get_estoque_data(tipo, filtros, tenant, empresa)
-        # Adicionar outros módulos aqui
+    def _enfileirar(self, request, tenant, empresa, filial, tipo, modulo, formato, template_id, filtros):
+        """Cria (ou reaproveita) o job de geração assíncrona"""
+        if formato not in jobs.CONTENT_TYPES:
+            return Response(
+                {'error': f'Formato {formato} não disponível na geração assíncrona'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            job, criado = jobs.enfileirar(
+                tenant, empresa, request.user, tipo,
+                modulo=modulo, formato=formato, template_id=template_id, filtros=filtros, filial=filial,
+            )
+        except jobs.LimiteJobsExcedido as e:
+            return Response({'error': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
-        return {}
+        serializer = ReportJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED if criado else status.HTTP_200_OK)
     
-    def _get_estoque_data(self, tipo, filtros, tenant, empresa):
-        """Busca dados de relatórios de estoque"""
-        from django_tenants.utils import schema_context
-        from django.db.models import Sum, Q, F
-        from decimal import Decimal
-        from estoque.models import Estoque, Location
-        from cadastros.models import Produto
-        
-        def buscar_dados():
-            """Função auxiliar para buscar dados dentro do schema context"""
-            if tipo == 'estoque-por-location':
-                # Buscar estoques agrupados por location
-                queryset = Estoque.objects.select_related(
-                    'produto', 'location', 'empresa'
-                ).filter(
-                    empresa=empresa,
-                    quantidade_atual__gt=0  # Apenas estoques com quantidade > 0
-                )
-                
-                # Aplicar filtros
-                location_id = filtros.get('location_id')
-                if location_id:
-                    queryset = queryset.filter(location_id=location_id)
-                
-                produto_id = filtros.get('produto_id')
-                if produto_id:
-                    # Produto usa codigo_produto como PK
-                    queryset = queryset.filter(produto__codigo_produto=produto_id)
-                
-                # Agrupar por location e produto
-                dados = []
-                total_geral = Decimal('0.00')
-                
-                # Primeiro, calcular totais por location
-                location_totals = {}
-                estoques_list = list(queryset.order_by('location__nome', 'produto__nome'))
-                
-                for estoque in estoques_list:
-                    valor_total = estoque.quantidade_atual * estoque.valor_custo_medio
-                    location_id = estoque.location.id
-                    if location_id not in location_totals:
-                        location_totals[location_id] = Decimal('0.00')
-                    location_totals[location_id] += valor_total
-                    total_geral += valor_total
-                
-                # Agora criar lista de dados com location_total
-                for estoque in estoques_list:
-                    valor_total = estoque.quantidade_atual * estoque.valor_custo_medio
-                    location_id = estoque.location.id
-                    
-                    dados.append({
-                        'location_id': location_id,
-                        'location_nome': estoque.location.nome,
-                        'location_codigo': estoque.location.codigo or '',
-                        'produto_id': estoque.produto.codigo_produto,  # Produto usa codigo_produto como PK
-                        'produto_codigo': estoque.produto.codigo_produto,
-                        'produto_nome': estoque.produto.nome,
-                        'produto_unidade_medida': estoque.produto.unidade_medida or '',
-                        'quantidade': str(estoque.quantidade_atual),  # Campo esperado pelo template
-                        'quantidade_atual': str(estoque.quantidade_atual),
-                        'quantidade_reservada': str(estoque.quantidade_reservada),
-                        'quantidade_disponivel': str(estoque.quantidade_disponivel),
-                        'valor_unitario': str(estoque.valor_custo_medio),  # Campo esperado pelo template
-                        'valor_custo_medio': str(estoque.valor_custo_medio),
-                        'valor_total': str(valor_total),
-                        'localizacao_interna': estoque.localizacao_interna or '',
-                        'location_total': str(location_totals[location_id]),  # Total da location
-                    })
-                
-                return {
-                    'dados': dados,
-                    'total_geral': str(total_geral),
-                    'total_itens': len(dados),
-                    'empresa_nome': empresa.nome if empresa else '',
-                }
-            
-            elif tipo == 'estoque-consolidado':
-                # Estoque consolidado por produto (todas as locations)
-                queryset = Estoque.objects.filter(
-                    empresa=empresa,
-                    quantidade_atual__gt=0
-                ).values('produto').annotate(
-                    total_quantidade=Sum('quantidade_atual'),
-                    total_reservada=Sum('quantidade_reservada'),
-                    total_disponivel=Sum('quantidade_disponivel'),
-                    total_valor=Sum(F('quantidade_atual') * F('valor_custo_medio'))
-                )
-                
-                dados = []
-                total_geral = Decimal('0.00')
-                
-                for item in queryset:
-                    # Produto usa codigo_produto como PK
-                    produto = Produto.objects.get(codigo_produto=item['produto'])
-                    total_geral += item['total_valor'] or Decimal('0.00')
-                    
-                    dados.append({
-                        'produto_id': produto.codigo_produto,
-                        'produto_codigo': produto.codigo_produto,
-                        'produto_nome': produto.nome,
-                        'produto_unidade_medida': produto.unidade_medida or '',
-                        'total_quantidade': str(item['total_quantidade'] or Decimal('0.000')),
-                        'total_reservada': str(item['total_reservada'] or Decimal('0.000')),
-                        'total_disponivel': str(item['total_disponivel'] or Decimal('0.000')),
-                        'total_valor': str(item['total_valor'] or Decimal('0.00')),
-                    })
-                
-                return {
-                    'dados': dados,
-                    'total_geral': str(total_geral),
-                    'total_itens': len(dados),
-                    'empresa_nome': empresa.nome if empresa else '',
-                }
-            
-            return {}
-        
-        # Executar dentro do schema context se necessário
-        if tenant:
-            with schema_context(tenant.schema_name):
-                return buscar_dados()
-        else:
-            return buscar_dados()
+    def _get_relatorio_data(self, tipo, modulo, filtros, tenant, empresa, filial=None):
+        """
+        Busca dados do relatório do módulo específico (reports/dados.py)
+        """
+        return obter_dados_relatorio(tipo, modulo, filtros, tenant, empresa, filial)
     
     def _get_dados_exemplo(self, tipo, modulo):
         """Retorna dados de exemplo para preview"""
@@ -399,3 +313,61 @@ class ReportGeneratorViewSet(viewsets.ViewSet):
             }
         return {}
 
+
+class ReportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status e download dos relatórios gerados em segundo plano
+    """
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = ReportJob.objects.select_related('empresa')
+        empresa, filial = get_current_empresa_filial(self.request.user, self.request)
+        
+        # Jobs da empresa/filial atual (mesmo escopo dos dados do relatório): um
+        # usuário de filial não vê relatórios gerados com os dados de toda a empresa
+        if empresa and filial:
+            queryset = queryset.filter(empresa=empresa, filial=filial)
+        elif empresa:
+            queryset = queryset.filter(empresa=empresa)
+        else:
+            queryset = queryset.filter(empresa__isnull=True, owner=self.request.user)
+        
+        status_param = self.request.query_params.get('status')
+        if status_param:
+            queryset = queryset.filter(status=status_param)
+        
+        return queryset.order_by('-created_at')
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Baixa o arquivo do relatório concluído"""
+        job = self.get_object()
+        
+        if job.status == ReportJob.STATUS_EXPIRADO or (job.expira_em and job.expira_em < timezone.now()):
+            return Response(
+                {'error': 'Relatório expirado; gere novamente'},
+                status=status.HTTP_410_GONE
+            )
+        if job.status != ReportJob.STATUS_CONCLUIDO:
+            return Response(
+                {'error': 'Relatório ainda não está disponível', 'status': job.status, 'erro': job.erro or None},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        try:
+            arquivo = jobs.armazenamento().open(job.arquivo, 'rb')
+        except Exception as e:
+            logger.error(f"Erro ao abrir relatório do job {job.pk}: {e}", exc_info=True)
+            return Response(
+                {'error': 'Arquivo do relatório não encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return FileResponse(
+            arquivo,
+            as_attachment=True,
+            filename=job.nome_arquivo,
+            content_type=job.content_type,
+        )
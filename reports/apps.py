@@ -5,3 +5,7 @@ class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
     verbose_name = 'Relatórios'
+
+    def ready(self):
+        # Signals que renovam a versão do cache de templates/configurações
+        from . import cache  # noqa: F401
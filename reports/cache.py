@@ -0,0 +1,155 @@
+"""
+Cache de templates e configurações de relatório (ReportEngine).
+
+Sem cache, cada relatório fazia até duas consultas de ReportConfig (e às vezes
+um create), até cinco de ReportTemplate por chamada de _get_template (chamado
+duas vezes no PDF), lia o arquivo do template do disco e compilava um
+django.template.Template novo.
+
+- Cache compartilhado: o ReportConfig de (tenant, empresa) e o ReportTemplate
+  resolvido de (tenant, empresa, tipo, módulo, template customizado), como
+  valores dos campos (não a instância), inclusive o "não encontrado". As chaves
+  levam a versão dos relatórios do schema, renovada (valor aleatório novo) no
+  commit de cada save/delete de ReportTemplate ou ReportConfig.
+- Em processo: conteúdo dos arquivos de template e templates compilados (pelo
+  texto), que só mudam com deploy/reinício.
+
+Com cache quente, renderizar um relatório não faz consultas de metadados nem
+recompila o template.
+"""
+import logging
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template import Template
+from django.template.loader import get_template
+
+from .models import ReportConfig, ReportTemplate
+
+logger = logging.getLogger(__name__)
+
+# Marca de "não encontrado" no cache compartilhado
+_NAO_ENCONTRADO = '__nao_encontrado__'
+
+
+def _ttl():
+    return getattr(settings, 'REPORTS_CACHE_TTL', 3600)
+
+
+def _chave_versao(schema_name):
+    return f'reports:versao:{schema_name}'
+
+
+def versao_schema(schema_name=None):
+    """Versão atual dos templates/configurações de relatório do schema (criada se não existir)"""
+    chave = _chave_versao(schema_name or connection.schema_name)
+    try:
+        versao = cache.get(chave)
+        if versao is None:
+            cache.add(chave, uuid.uuid4().hex[:12], None)
+            versao = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[ReportsCache] Cache indisponível: {e}')
+        versao = None
+    return versao
+
+
+def renovar_versao(schema_name=None):
+    """Nova versão para o schema: entradas antigas deixam de ser usadas"""
+    try:
+        cache.set(_chave_versao(schema_name or connection.schema_name), uuid.uuid4().hex[:12], None)
+    except Exception as e:
+        logger.warning(f'[ReportsCache] Erro ao renovar versão: {e}')
+
+
+def _serializar(instancia):
+    return {campo.attname: getattr(instancia, campo.attname) for campo in type(instancia)._meta.concrete_fields}
+
+
+def _instanciar(modelo, dados):
+    instancia = modelo(**dados)
+    instancia._state.adding = False
+    instancia._state.db = 'default'
+    return instancia
+
+
+def _obter(modelo, partes, carregar):
+    """
+    Instância do cache compartilhado (chave versionada por schema) ou de carregar().
+
+    Args:
+        modelo: ReportTemplate ou ReportConfig
+        partes: Componentes da chave (ids, tipo, ...)
+        carregar: Função sem argumentos que busca a instância no banco (ou None)
+    """
+    versao = versao_schema()
+    if versao is None:
+        return carregar()
+
+    chave = ':'.join(['reports', modelo.__name__.lower(), connection.schema_name, versao, *map(str, partes)])
+    try:
+        dados = cache.get(chave)
+    except Exception as e:
+        logger.warning(f'[ReportsCache] Cache indisponível: {e}')
+        return carregar()
+
+    if dados is None:
+        instancia = carregar()
+        dados = _serializar(instancia) if instancia is not None else _NAO_ENCONTRADO
+        try:
+            cache.set(chave, dados, _ttl())
+        except Exception as e:
+            logger.warning(f'[ReportsCache] Cache indisponível: {e}')
+        return instancia
+
+    if dados == _NAO_ENCONTRADO:
+        return None
+    return _instanciar(modelo, dados)
+
+
+def obter_config(tenant, empresa, carregar):
+    """ReportConfig de (tenant, empresa) pelo cache; carregar() busca/cria no banco"""
+    return _obter(ReportConfig, (getattr(tenant, 'pk', None), getattr(empresa, 'pk', None)), carregar)
+
+
+def obter_template(tenant, empresa, tipo_relatorio, modulo, custom_template_id, carregar):
+    """ReportTemplate resolvido pela hierarquia de ReportEngine._get_template, pelo cache"""
+    partes = (
+        getattr(tenant, 'pk', None), getattr(empresa, 'pk', None),
+        tipo_relatorio, modulo, custom_template_id,
+    )
+    return _obter(ReportTemplate, partes, carregar)
+
+
+@lru_cache(maxsize=128)
+def conteudo_arquivo(template_path):
+    """Texto (sem renderizar) de um template de arquivo; vazio se não existir"""
+    try:
+        template = get_template(template_path)
+        with open(template.origin.name, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Erro ao carregar template de arquivo {template_path}: {e}")
+        return ""
+
+
+@lru_cache(maxsize=256)
+def compilar(template_content):
+    """django.template.Template compilado, reaproveitado para o mesmo texto"""
+    return Template(template_content)
+
+
+@receiver(post_save, sender=ReportTemplate)
+@receiver(post_delete, sender=ReportTemplate)
+@receiver(post_save, sender=ReportConfig)
+@receiver(post_delete, sender=ReportConfig)
+def _renovar_versao_relatorios(sender, instance, **kwargs):
+    # Só depois do commit: antes disso um render concorrente carregaria a linha
+    # antiga e a guardaria na versão nova. Schema resolvido agora
+    schema_name = connection.schema_name
+    transaction.on_commit(lambda: renovar_versao(schema_name))
@@ -0,0 +1,435 @@
+"""
+Dados dos relatórios por módulo (usados pela API, pelos jobs assíncronos e pela exportação)
+
+Cada módulo registra um provedor com @provedor(modulo): função
+(tipo, filtros, empresa, filial) -> dict com os dados do template, executada no
+schema do tenant. Com filial, os dados ficam restritos à filial e aos registros
+da empresa sem filial (mesma regra de cadastros.utils.filter_by_empresa_filial).
+
+Somas, produtos (quantidade × custo) e subtotais são calculados no PostgreSQL
+(values() + annotate() com GROUP BY): o custo depende do tamanho do relatório,
+não da quantidade de linhas lidas.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django_tenants.utils import schema_context
+
+PROVEDORES = {}
+
+ZERO = Decimal('0.00')
+
+
+class FiltroInvalido(ValueError):
+    """Filtro de relatório com valor inválido"""
+
+
+def provedor(modulo):
+    """Registra o provedor de dados dos relatórios de um módulo"""
+    def registrar(funcao):
+        PROVEDORES[modulo] = funcao
+        return funcao
+    return registrar
+
+
+def obter_dados_relatorio(tipo, modulo, filtros, tenant, empresa, filial=None):
+    """
+    Busca dados do relatório do módulo específico (da filial, se informada)
+
+    Raises:
+        FiltroInvalido: filtro com valor inválido
+    """
+    funcao = PROVEDORES.get(modulo)
+    if funcao is None:
+        return {}
+
+    filtros = filtros or {}
+    # Executar dentro do schema context se necessário
+    if tenant:
+        with schema_context(tenant.schema_name):
+            return funcao(tipo, filtros, empresa, filial)
+    return funcao(tipo, filtros, empresa, filial)
+
+
+# ---------------------------------------------------------------------------
+# Filtros e expressões comuns
+# ---------------------------------------------------------------------------
+
+def filtro_inteiro(filtros, nome):
+    valor = filtros.get(nome)
+    if valor in (None, ''):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise FiltroInvalido(f'Filtro {nome} deve ser numérico')
+
+
+def filtro_data(filtros, nome):
+    valor = filtros.get(nome)
+    if valor in (None, ''):
+        return None
+    data = parse_date(str(valor))
+    if data is None:
+        raise FiltroInvalido(f'Filtro {nome} deve ser uma data (AAAA-MM-DD)')
+    return data
+
+
+def inicio_do_dia(data):
+    """Início do dia no fuso local (limites de período em intervalo de datetime, usando o índice)"""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def fim_exclusivo(data):
+    """Início do dia seguinte (limite superior exclusivo de um período até `data`)"""
+    return inicio_do_dia(data + timedelta(days=1))
+
+
+def filtro_filial(filial, campo='filial'):
+    """
+    Escopo da filial: registros da filial e os sem filial (compartilhados da empresa).
+
+    Sem filial, não restringe (a empresa já é filtrada pelo chamador).
+    """
+    if filial is None:
+        return Q()
+    return Q(**{campo: filial}) | Q(**{f'{campo}__isnull': True})
+
+
+def _decimal(valor, padrao=ZERO):
+    return str(valor if valor is not None else padrao)
+
+
+def valor_estoque():
+    """quantidade_atual × valor_custo_medio, calculado no banco"""
+    return ExpressionWrapper(
+        F('quantidade_atual') * F('valor_custo_medio'),
+        output_field=DecimalField(max_digits=20, decimal_places=6),
+    )
+
+
+def estoques_filtrados(empresa, filtros, filial=None):
+    """
+    Estoques com quantidade > 0 da empresa (e das locations da filial ou sem
+    filial), com os filtros location_id e produto_id
+    """
+    from estoque.models import Estoque
+
+    queryset = Estoque.objects.filter(
+        filtro_filial(filial, 'location__filial'),
+        empresa=empresa,
+        quantidade_atual__gt=0  # Apenas estoques com quantidade > 0
+    )
+    location_id = filtro_inteiro(filtros, 'location_id')
+    if location_id:
+        queryset = queryset.filter(location_id=location_id)
+    produto_id = filtro_inteiro(filtros, 'produto_id')
+    if produto_id:
+        # Produto usa codigo_produto como PK
+        queryset = queryset.filter(produto__codigo_produto=produto_id)
+    return queryset
+
+
+def subtotais_por_location(queryset):
+    """
+    Subtotais por location (GROUP BY location no banco).
+
+    Returns:
+        Lista de dicts (location_id, location_nome, location_codigo, total, itens),
+        ordenada pelo nome da location
+    """
+    return list(
+        queryset.order_by().values('location_id', 'location__nome', 'location__codigo').annotate(
+            total=Sum(valor_estoque()),
+            itens=Count('id'),
+        ).order_by('location__nome', 'location_id')
+    )
+
+
+def contas_filtradas(modelo, empresa, filtros, filial=None):
+    """
+    ContaReceber/ContaPagar da empresa (e compartilhadas), da filial se informada,
+    filtradas por status e vencimento
+    """
+    queryset = modelo.objects.filter(Q(empresa=empresa) | Q(empresa__isnull=True)).filter(filtro_filial(filial))
+    if filtros.get('status'):
+        queryset = queryset.filter(status=filtros['status'])
+    vencimento_inicio = filtro_data(filtros, 'data_inicio')
+    if vencimento_inicio:
+        queryset = queryset.filter(data_vencimento__gte=vencimento_inicio)
+    vencimento_fim = filtro_data(filtros, 'data_fim')
+    if vencimento_fim:
+        queryset = queryset.filter(data_vencimento__lte=vencimento_fim)
+    return queryset
+
+
+# ---------------------------------------------------------------------------
+# Estoque
+# ---------------------------------------------------------------------------
+
+@provedor('estoque')
+def dados_estoque(tipo, filtros, empresa, filial=None):
+    """Busca dados de relatórios de estoque"""
+    empresa_nome = empresa.nome if empresa else ''
+
+    if tipo == 'estoque-por-location':
+        queryset = estoques_filtrados(empresa, filtros, filial)
+
+        # Subtotais por location e total geral (soma dos subtotais) vêm do banco
+        subtotais = subtotais_por_location(queryset)
+        totais = {item['location_id']: item['total'] for item in subtotais}
+        total_geral = sum((item['total'] or ZERO for item in subtotais), ZERO)
+
+        registros = queryset.annotate(valor=valor_estoque()).order_by(
+            'location__nome', 'location_id', 'produto__nome'
+        ).values_list(
+            'location_id', 'location__nome', 'location__codigo',
+            'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+            'quantidade_atual', 'quantidade_reservada', 'quantidade_disponivel',
+            'valor_custo_medio', 'valor', 'localizacao_interna',
+        )
+
+        dados = [
+            {
+                'location_id': location_id,
+                'location_nome': location_nome,
+                'location_codigo': location_codigo or '',
+                'produto_id': produto_codigo,  # Produto usa codigo_produto como PK
+                'produto_codigo': produto_codigo,
+                'produto_nome': produto_nome,
+                'produto_unidade_medida': unidade or '',
+                'quantidade': str(quantidade),  # Campo esperado pelo template
+                'quantidade_atual': str(quantidade),
+                'quantidade_reservada': str(reservada),
+                'quantidade_disponivel': str(disponivel),
+                'valor_unitario': str(custo),  # Campo esperado pelo template
+                'valor_custo_medio': str(custo),
+                'valor_total': str(valor),
+                'localizacao_interna': localizacao or '',
+                'location_total': _decimal(totais.get(location_id)),  # Total da location
+            }
+            for (
+                location_id, location_nome, location_codigo, produto_codigo, produto_nome, unidade,
+                quantidade, reservada, disponivel, custo, valor, localizacao,
+            ) in registros
+        ]
+
+        return {
+            'dados': dados,
+            'subtotais': [
+                {
+                    'location_id': item['location_id'],
+                    'location_nome': item['location__nome'],
+                    'location_codigo': item['location__codigo'] or '',
+                    'total': _decimal(item['total']),
+                    'itens': item['itens'],
+                }
+                for item in subtotais
+            ],
+            'total_geral': str(total_geral),
+            'total_itens': len(dados),
+            'empresa_nome': empresa_nome,
+        }
+
+    elif tipo == 'estoque-consolidado':
+        # Estoque consolidado por produto (todas as locations), com os dados do
+        # produto no mesmo GROUP BY (sem uma consulta por produto)
+        queryset = estoques_filtrados(empresa, filtros, filial).order_by().values(
+            'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+        ).annotate(
+            total_quantidade=Sum('quantidade_atual'),
+            total_reservada=Sum('quantidade_reservada'),
+            total_disponivel=Sum('quantidade_disponivel'),
+            total_valor=Sum(valor_estoque()),
+        ).order_by('produto__nome', 'produto__codigo_produto')
+
+        dados = []
+        total_geral = ZERO
+        for item in queryset:
+            total_geral += item['total_valor'] or ZERO
+            dados.append({
+                'produto_id': item['produto__codigo_produto'],
+                'produto_codigo': item['produto__codigo_produto'],
+                'produto_nome': item['produto__nome'],
+                'produto_unidade_medida': item['produto__unidade_medida'] or '',
+                'total_quantidade': _decimal(item['total_quantidade'], Decimal('0.000')),
+                'total_reservada': _decimal(item['total_reservada'], Decimal('0.000')),
+                'total_disponivel': _decimal(item['total_disponivel'], Decimal('0.000')),
+                'total_valor': _decimal(item['total_valor']),
+            })
+
+        return {
+            'dados': dados,
+            'total_geral': str(total_geral),
+            'total_itens': len(dados),
+            'empresa_nome': empresa_nome,
+        }
+
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# Financeiro
+# ---------------------------------------------------------------------------
+
+@provedor('financeiro')
+def dados_financeiro(tipo, filtros, empresa, filial=None):
+    """Contas a receber e a pagar, com resumo por status calculado no banco"""
+    from financeiro.models import ContaPagar, ContaReceber
+
+    if tipo == 'contas-receber':
+        modelo, pessoa, valor_quitado = ContaReceber, 'cliente', 'valor_recebido'
+    elif tipo == 'contas-pagar':
+        modelo, pessoa, valor_quitado = ContaPagar, 'fornecedor', 'valor_pago'
+    else:
+        return {}
+
+    queryset = contas_filtradas(modelo, empresa, filtros, filial)
+
+    resumo = list(
+        queryset.order_by().values('status').annotate(
+            quantidade=Count('codigo_conta'),
+            total=Sum('valor_total'),
+            quitado=Sum(valor_quitado),
+            pendente=Sum('valor_pendente'),
+        ).order_by('status')
+    )
+
+    registros = queryset.order_by('data_vencimento', 'codigo_conta').values(
+        'codigo_conta', 'numero_documento', 'data_emissao', 'data_vencimento',
+        'valor_total', valor_quitado, 'valor_pendente', 'status', 'forma_pagamento',
+        f'{pessoa}__razao_social', f'{pessoa}__nome_completo', f'{pessoa}__cpf_cnpj',
+    )
+    dados = [
+        {
+            'codigo_conta': item['codigo_conta'],
+            'numero_documento': item['numero_documento'],
+            'pessoa_nome': item[f'{pessoa}__razao_social'] or item[f'{pessoa}__nome_completo'] or '',
+            'pessoa_cpf_cnpj': item[f'{pessoa}__cpf_cnpj'],
+            'data_emissao': item['data_emissao'],
+            'data_vencimento': item['data_vencimento'],
+            'valor_total': str(item['valor_total']),
+            'valor_quitado': str(item[valor_quitado]),
+            'valor_pendente': str(item['valor_pendente']),
+            'status': item['status'],
+            'forma_pagamento': item['forma_pagamento'] or '',
+        }
+        for item in registros
+    ]
+
+    return {
+        'dados': dados,
+        'resumo_status': [
+            {
+                'status': item['status'],
+                'quantidade': item['quantidade'],
+                'total': _decimal(item['total']),
+                'quitado': _decimal(item['quitado']),
+                'pendente': _decimal(item['pendente']),
+            }
+            for item in resumo
+        ],
+        'total_geral': str(sum((item['total'] or ZERO for item in resumo), ZERO)),
+        'total_pendente': str(sum((item['pendente'] or ZERO for item in resumo), ZERO)),
+        'total_itens': len(dados),
+        'empresa_nome': empresa.nome if empresa else '',
+    }
+
+
+# ---------------------------------------------------------------------------
+# Vendas
+# ---------------------------------------------------------------------------
+
+def _pedidos_filtrados(queryset, filtros, prefixo='', filial=None):
+    """Pedidos não cancelados da empresa (e da filial), no período (data_inicio/data_fim) e status"""
+    queryset = queryset.filter(filtro_filial(filial, f'{prefixo}filial'))
+    data_inicio = filtro_data(filtros, 'data_inicio')
+    if data_inicio:
+        queryset = queryset.filter(**{f'{prefixo}data_pedido__gte': inicio_do_dia(data_inicio)})
+    data_fim = filtro_data(filtros, 'data_fim')
+    if data_fim:
+        queryset = queryset.filter(**{f'{prefixo}data_pedido__lt': fim_exclusivo(data_fim)})
+    if filtros.get('status'):
+        queryset = queryset.filter(**{f'{prefixo}status': filtros['status']})
+    else:
+        queryset = queryset.exclude(**{f'{prefixo}status': 'CANCELADO'})
+    return queryset
+
+
+@provedor('vendas')
+def dados_vendas(tipo, filtros, empresa, filial=None):
+    """Vendas por período (dia ou mês) e por produto, agregadas no banco"""
+    from vendas.models import ItemPedido, PedidoVenda
+
+    if tipo == 'vendas-por-periodo':
+        agrupamento = filtros.get('agrupamento', 'dia')
+        if agrupamento not in ('dia', 'mes'):
+            raise FiltroInvalido('Filtro agrupamento deve ser dia ou mes')
+        truncar = TruncDay if agrupamento == 'dia' else TruncMonth
+
+        queryset = _pedidos_filtrados(PedidoVenda.objects.filter(empresa=empresa), filtros, filial=filial)
+        periodos = queryset.order_by().annotate(periodo=truncar('data_pedido')).values('periodo').annotate(
+            pedidos=Count('id'),
+            valor_total=Sum('valor_total'),
+            valor_desconto=Sum('valor_desconto'),
+        ).order_by('periodo')
+
+        dados = []
+        total_geral = ZERO
+        total_pedidos = 0
+        for item in periodos:
+            total_geral += item['valor_total'] or ZERO
+            total_pedidos += item['pedidos']
+            dados.append({
+                'periodo': item['periodo'],
+                'pedidos': item['pedidos'],
+                'valor_total': _decimal(item['valor_total']),
+                'valor_desconto': _decimal(item['valor_desconto']),
+            })
+
+        return {
+            'dados': dados,
+            'agrupamento': agrupamento,
+            'total_geral': str(total_geral),
+            'total_pedidos': total_pedidos,
+            'total_itens': len(dados),
+            'empresa_nome': empresa.nome if empresa else '',
+        }
+
+    elif tipo == 'vendas-por-produto':
+        queryset = _pedidos_filtrados(
+            ItemPedido.objects.filter(pedido__empresa=empresa), filtros, prefixo='pedido__', filial=filial
+        )
+        produtos = queryset.order_by().values(
+            'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+        ).annotate(
+            quantidade=Sum('quantidade'),
+            valor_total=Sum('valor_total'),
+            pedidos=Count('pedido', distinct=True),
+        ).order_by('-valor_total', 'produto__nome')
+
+        dados = []
+        total_geral = ZERO
+        for item in produtos:
+            total_geral += item['valor_total'] or ZERO
+            dados.append({
+                'produto_codigo': item['produto__codigo_produto'],
+                'produto_nome': item['produto__nome'],
+                'produto_unidade_medida': item['produto__unidade_medida'] or '',
+                'quantidade': _decimal(item['quantidade'], Decimal('0.000')),
+                'valor_total': _decimal(item['valor_total']),
+                'pedidos': item['pedidos'],
+            })
+
+        return {
+            'dados': dados,
+            'total_geral': str(total_geral),
+            'total_itens': len(dados),
+            'empresa_nome': empresa.nome if empresa else '',
+        }
+
+    return {}
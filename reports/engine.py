@@ -2,13 +2,18 @@
 Engine de renderização de relatórios
 """
 import logging
+import tempfile
+from functools import lru_cache
 from io import BytesIO
 from typing import Dict, Any, Optional
-from django.template import Template, Context
+from django.template import Context
 from django.template.loader import get_template
 from django.utils import timezone
 from django.conf import settings
 
+from . import cache as cache_relatorios
+from . import pdf_paralelo
+
 logger = logging.getLogger(__name__)
 
 # Import lazy do WeasyPrint para evitar erro se dependências não estiverem instaladas
@@ -23,6 +28,29 @@ except (ImportError, OSError) as e:
     CSS = None
     FontConfiguration = None
 
+# CSS base (página A4)
+CSS_BASE = """
+            @page {
+                size: A4;
+                margin: 2cm;
+            }
+            """
+
+
+# Relatórios que podem ser renderizados em partes e o campo que agrupa as linhas
+# (as partes não dividem o grupo). Só os templates de arquivo desses relatórios
+# (e o base.html) tratam continuacao/parcial/numeracao_externa: acrescentar um
+# tipo aqui exige adaptar o template dele
+AGRUPAMENTO_PARTES = {
+    'estoque-por-location': 'location_id',
+}
+
+
+@lru_cache(maxsize=64)
+def _stylesheet(css_content: str):
+    """Folha de estilo do WeasyPrint já interpretada, reaproveitada entre relatórios"""
+    return CSS(string=css_content)
+
 
 class ReportEngine:
     """
@@ -33,10 +61,12 @@ class ReportEngine:
         self.tenant = tenant
         self.empresa = empresa
         self.usuario = usuario
-        self.config = self._get_config()
+        # Templates resolvidos nesta instância: (tipo, modulo, custom_template_id) -> ReportTemplate
+        self._templates = {}
+        self.config = cache_relatorios.obter_config(self.tenant, self.empresa, self._get_config)
     
     def _get_config(self):
-        """Busca configurações do tenant/empresa"""
+        """Busca configurações do tenant/empresa no banco (use self.config, que passa pelo cache)"""
         from .models import ReportConfig
         
         try:
@@ -76,6 +106,8 @@ class ReportEngine:
         2. Template por empresa + tipo
         3. Template por tenant + tipo
         4. Template padrão do tipo
+        
+        Consulta o banco; use _resolver_template, que passa pelo cache.
         """
         from .models import ReportTemplate
         
@@ -131,18 +163,19 @@ class ReportEngine:
         
         return template
     
+    def _resolver_template(self, tipo_relatorio: str, modulo: str = None, custom_template_id: int = None):
+        """Template do relatório pelo cache (reports/cache.py), memoizado na instância"""
+        chave = (tipo_relatorio, modulo, custom_template_id)
+        if chave not in self._templates:
+            self._templates[chave] = cache_relatorios.obter_template(
+                self.tenant, self.empresa, tipo_relatorio, modulo, custom_template_id,
+                lambda: self._get_template(tipo_relatorio, modulo, custom_template_id),
+            )
+        return self._templates[chave]
+    
     def _load_template_from_file(self, template_path: str) -> str:
-        """Carrega template HTML de arquivo"""
-        try:
-            template = get_template(template_path)
-            # Retornar conteúdo do template (sem renderizar)
-            # Isso é um workaround - idealmente deveríamos ler o arquivo diretamente
-            from django.template.loader import get_template_from_string
-            with open(template.origin.name, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            logger.error(f"Erro ao carregar template de arquivo {template_path}: {e}")
-            return ""
+        """Carrega template HTML de arquivo (lido do disco uma vez por processo)"""
+        return cache_relatorios.conteudo_arquivo(template_path)
     
     def render_html(
         self,
@@ -161,7 +194,7 @@ class ReportEngine:
             custom_template_id: ID de template customizado (opcional)
         """
         # Buscar template
-        template = self._get_template(tipo_relatorio, modulo, custom_template_id)
+        template = self._resolver_template(tipo_relatorio, modulo, custom_template_id)
         
         if not template:
             raise ValueError(f"Template não encontrado para tipo: {tipo_relatorio}")
@@ -184,8 +217,8 @@ class ReportEngine:
         # Preparar contexto
         context = self._prepare_context(data, template)
         
-        # Renderizar conteúdo do template específico
-        django_template = Template(template_content)
+        # Renderizar conteúdo do template específico (compilado uma vez por conteúdo)
+        django_template = cache_relatorios.compilar(template_content)
         rendered_content = django_template.render(Context(context))
         
         # Adicionar conteúdo renderizado ao contexto para o template base
@@ -213,6 +246,38 @@ class ReportEngine:
             modulo: Módulo do sistema
             custom_template_id: ID de template customizado
         """
+        return self.render_pdf_arquivo(tipo_relatorio, data, modulo, custom_template_id, destino=BytesIO())
+    
+    def render_pdf_arquivo(
+        self,
+        tipo_relatorio: str,
+        data: Dict[str, Any],
+        modulo: str = None,
+        custom_template_id: int = None,
+        destino=None,
+        partes: Optional[bool] = None
+    ):
+        """
+        Renderiza o PDF do relatório direto em um arquivo
+        
+        Relatórios de AGRUPAMENTO_PARTES com template de arquivo e com
+        REPORTS_PDF_PARTES_MIN_LINHAS linhas ou mais (em data['dados']) são
+        divididos em partes de REPORTS_PDF_LINHAS_POR_PARTE linhas, renderizadas
+        em paralelo e concatenadas (reports/pdf_paralelo.py).
+        
+        Args:
+            tipo_relatorio: Tipo do relatório
+            data: Dados do relatório
+            modulo: Módulo do sistema
+            custom_template_id: ID de template customizado
+            destino: Arquivo binário para escrita (padrão: arquivo temporário,
+                removido ao ser fechado)
+            partes: Forçar (True) ou impedir (False) a renderização em partes;
+                None decide pela quantidade de linhas
+        
+        Returns:
+            O arquivo de destino, posicionado no início
+        """
         # Verificar se WeasyPrint está disponível
         if not WEASYPRINT_AVAILABLE:
             raise RuntimeError(
@@ -220,46 +285,90 @@ class ReportEngine:
                 "Instale as dependências do sistema: libcairo2-dev, libpango1.0-dev, libgdk-pixbuf-xlib-2.0-dev, libffi-dev"
             )
         
-        # Importar WeasyPrint apenas quando necessário
-        from weasyprint import HTML, CSS
-        from weasyprint.text.fonts import FontConfiguration
+        if destino is None:
+            destino = tempfile.TemporaryFile(suffix='.pdf')
         
-        # Renderizar HTML primeiro
-        html_content = self.render_html(tipo_relatorio, data, modulo, custom_template_id)
-        
-        # Buscar template para obter CSS e orientação
-        template = self._get_template(tipo_relatorio, modulo, custom_template_id)
-        
-        # Preparar CSS
-        css_content = self._get_css(template)
-        
-        # Gerar PDF com WeasyPrint
-        pdf_file = BytesIO()
+        # Template para obter CSS e orientação
+        template = self._resolver_template(tipo_relatorio, modulo, custom_template_id)
+        folhas_css = self._folhas_css(template)
+        if partes is None:
+            partes = self._usar_partes(tipo_relatorio, data, template)
         
         try:
-            font_config = FontConfiguration()
-            html_doc = HTML(string=html_content)
-            
-            # Adicionar CSS
-            stylesheets = [CSS(string=css_content)]
-            
-            # Adicionar CSS customizado do template se houver
-            if template and template.template_css:
-                stylesheets.append(CSS(string=template.template_css))
-            
-            # Gerar PDF
-            html_doc.write_pdf(
-                pdf_file,
-                stylesheets=stylesheets,
-                font_config=font_config
-            )
-            
-            pdf_file.seek(0)
-            return pdf_file
-            
+            if partes:
+                self._render_pdf_partes(tipo_relatorio, data, modulo, custom_template_id, folhas_css, destino)
+            else:
+                html_content = self.render_html(tipo_relatorio, data, modulo, custom_template_id)
+                HTML(string=html_content).write_pdf(
+                    destino,
+                    stylesheets=[_stylesheet(css) for css in folhas_css],
+                    font_config=FontConfiguration()
+                )
         except Exception as e:
             logger.error(f"Erro ao gerar PDF: {e}", exc_info=True)
             raise
+        
+        destino.seek(0)
+        return destino
+    
+    def _usar_partes(self, tipo_relatorio: str, data: Dict[str, Any], template=None) -> bool:
+        """
+        Relatório grande o bastante para a renderização em partes, cujo template
+        trata as partes (AGRUPAMENTO_PARTES; templates customizados do banco não tratam)
+        """
+        if tipo_relatorio not in AGRUPAMENTO_PARTES:
+            return False
+        if template is not None and template.template_customizado and template.template_html:
+            return False
+        linhas = data.get('dados')
+        return (
+            pdf_paralelo.PYPDF_DISPONIVEL
+            and isinstance(linhas, list)
+            and len(linhas) >= getattr(settings, 'REPORTS_PDF_PARTES_MIN_LINHAS', 2000)
+        )
+    
+    def _render_pdf_partes(self, tipo_relatorio, data, modulo, custom_template_id, folhas_css, destino):
+        """
+        Divide data['dados'] em partes, renderiza o HTML de cada uma e gera o PDF
+        delas em paralelo
+        
+        O contexto de cada parte informa a posição para os templates:
+        continuacao (não é a primeira: sem cabeçalho/título), parcial (não é a
+        última: sem totais/rodapé) e numeracao_externa (a numeração das páginas
+        é aplicada ao documento final).
+        """
+        linhas = pdf_paralelo.dividir(
+            data['dados'],
+            getattr(settings, 'REPORTS_PDF_LINHAS_POR_PARTE', 500),
+            AGRUPAMENTO_PARTES.get(tipo_relatorio),
+        )
+        total = len(linhas)
+        partes_html = [
+            self.render_html(tipo_relatorio, {
+                **data,
+                'dados': parte,
+                'parte': indice + 1,
+                'total_partes': total,
+                'continuacao': indice > 0,
+                'parcial': indice < total - 1,
+                'numeracao_externa': True,
+            }, modulo, custom_template_id)
+            for indice, parte in enumerate(linhas)
+        ]
+        paginas = pdf_paralelo.renderizar(
+            partes_html,
+            folhas_css,
+            destino,
+            processos=getattr(settings, 'REPORTS_PDF_PROCESSOS', 0) or None,
+        )
+        logger.info(f"[PDF] {tipo_relatorio}: {len(data['dados'])} linhas em {total} partes, {paginas} páginas")
+    
+    def _folhas_css(self, template=None):
+        """CSS base + CSS customizado do template (texto)"""
+        folhas = [self._get_css(template)]
+        if template and template.template_css:
+            folhas.append(template.template_css)
+        return folhas
     
     def _prepare_context(self, data: Dict[str, Any], template=None) -> Dict[str, Any]:
         """Prepara contexto com dados padrão + dados do relatório"""
@@ -289,23 +398,6 @@ class ReportEngine:
     
     def _get_css(self, template=None) -> str:
         """Retorna CSS base para o relatório"""
-        # Carregar CSS dos componentes
-        try:
-            styles_template = get_template('reports/components/styles.html')
-            css_content = ""
-            # Extrair CSS do template (workaround)
-            # Idealmente, CSS deveria estar em arquivo separado
-            return """
-            @page {
-                size: A4;
-                margin: 2cm;
-            }
-            """
-        except:
-            return """
-            @page {
-                size: A4;
-                margin: 2cm;
-            }
-            """
+        # O CSS dos componentes já vem em reports/components/styles.html (incluído no base.html)
+        return CSS_BASE
 
@@ -0,0 +1,448 @@
+"""
+Exportação de relatórios em CSV e XLSX por streaming.
+
+As linhas são lidas do banco com cursor no servidor
+(.values_list().iterator(chunk_size=REPORTS_EXPORT_CHUNK_SIZE), sem instanciar
+models) e escritas em lotes por geradores entregues ao StreamingHttpResponse:
+o uso de memória não depende da quantidade de linhas.
+
+- CSV: separador ';' e BOM UTF-8 (abre direto no Excel em português)
+- XLSX: planilha única escrita como XML em fluxo dentro de um ZIP que vai sendo
+  esvaziado a cada lote (strings inline, sem tabela de strings compartilhadas)
+
+Fontes de dados: funções (empresa, filtros, filial) -> (cabeçalho, linhas)
+registradas por (módulo, tipo) com @fonte; linhas é um iterável preguiçoso de
+tuplas. Com filial, as linhas ficam no escopo da filial (reports.dados.filtro_filial).
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django_tenants.utils import schema_context
+
+from .dados import (
+    FiltroInvalido,
+    contas_filtradas,
+    estoques_filtrados,
+    filtro_data,
+    filtro_filial,
+    filtro_inteiro,
+    fim_exclusivo,
+    inicio_do_dia,
+    subtotais_por_location,
+    valor_estoque,
+)
+
+FORMATOS = ('csv', 'xlsx')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Linhas por lote escrito na resposta
+LINHAS_POR_LOTE = 500
+
+FONTES = {}
+
+
+def _chunk_size():
+    return getattr(settings, 'REPORTS_EXPORT_CHUNK_SIZE', 2000)
+
+
+def fonte(modulo, tipo):
+    """Registra a fonte de dados de exportação de (módulo, tipo)"""
+    def registrar(funcao):
+        FONTES[(modulo, tipo)] = funcao
+        return funcao
+    return registrar
+
+
+def obter_fonte(modulo, tipo):
+    return FONTES.get((modulo, tipo))
+
+
+# ---------------------------------------------------------------------------
+# Escritores
+# ---------------------------------------------------------------------------
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def linhas_csv(cabecalho, linhas):
+    """
+    Gera o CSV em blocos de bytes (um por lote de LINHAS_POR_LOTE linhas).
+
+    Args:
+        cabecalho: Títulos das colunas
+        linhas: Iterável de tuplas
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(cabecalho)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+
+    pendentes = 0
+    for linha in linhas:
+        if pendentes == 0:
+            buffer.seek(0)
+            buffer.truncate()
+        writer.writerow([_texto(valor) for valor in linha])
+        pendentes += 1
+        if pendentes >= LINHAS_POR_LOTE:
+            yield buffer.getvalue().encode('utf-8')
+            pendentes = 0
+    if pendentes:
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Saida:
+    """Destino não posicionável do ZipFile: acumula bytes até serem entregues"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Estilo 1: negrito (cabeçalho)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _coluna(indice):
+    """Letra da coluna (0 -> A, 26 -> AA)"""
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _celula(referencia, valor, estilo=''):
+    if valor is None or valor == '':
+        return ''
+    if isinstance(valor, bool):
+        return f'<c r="{referencia}"{estilo} t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c r="{referencia}"{estilo}><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS_XML.sub('', _texto(valor)))
+    return f'<c r="{referencia}"{estilo} t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xml(numero, valores, colunas, estilo=''):
+    celulas = ''.join(
+        _celula(f'{coluna}{numero}', valor, estilo)
+        for coluna, valor in zip(colunas, valores)
+    )
+    return f'<row r="{numero}">{celulas}</row>'
+
+
+def linhas_xlsx(cabecalho, linhas, nome_planilha='Relatório'):
+    """
+    Gera o XLSX em blocos de bytes, com memória constante.
+
+    O ZIP é escrito sem posicionamento (descritores de dados após cada
+    arquivo), e o que já foi comprimido é entregue a cada lote.
+
+    Args:
+        cabecalho: Títulos das colunas
+        linhas: Iterável de tuplas
+        nome_planilha: Nome da aba (até 31 caracteres)
+    """
+    colunas = [_coluna(indice) for indice in range(len(cabecalho))]
+    saida = _Saida()
+
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for nome, conteudo in _XLSX_ESTATICOS.items():
+            arquivo_zip.writestr(nome, conteudo)
+        arquivo_zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(nome_planilha[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield saida.esvaziar()
+
+        with arquivo_zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetViews><sheetView workbookViewId="0">'
+                '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                '</sheetView></sheetViews>'
+                '<sheetData>' + _linha_xml(1, cabecalho, colunas, ' s="1"')
+            ).encode('utf-8'))
+
+            lote = []
+            for numero, linha in enumerate(linhas, 2):
+                lote.append(_linha_xml(numero, linha, colunas))
+                if len(lote) >= LINHAS_POR_LOTE:
+                    planilha.write(''.join(lote).encode('utf-8'))
+                    lote = []
+                    dados = saida.esvaziar()
+                    if dados:
+                        yield dados
+            planilha.write((''.join(lote) + '</sheetData></worksheet>').encode('utf-8'))
+
+    yield saida.esvaziar()
+
+
+# ---------------------------------------------------------------------------
+# Resposta
+# ---------------------------------------------------------------------------
+
+def _no_schema(schema_name, linhas):
+    """Itera as linhas no schema do tenant (a resposta é consumida após a view retornar)"""
+    if not schema_name:
+        yield from linhas
+        return
+    with schema_context(schema_name):
+        yield from linhas
+
+
+def exportar(modulo, tipo, formato, empresa, filtros=None, tenant=None, filial=None):
+    """
+    Resposta de streaming com a exportação do relatório.
+
+    Args:
+        modulo: Módulo do relatório (ex: estoque)
+        tipo: Tipo do relatório (ex: movimentacoes)
+        formato: csv ou xlsx
+        empresa: Empresa atual
+        filtros: Filtros do relatório (location_id, data_inicio, ...)
+        tenant: Tenant cujo schema será consultado (padrão: conexão atual)
+        filial: Filial atual (None: todas as filiais da empresa)
+
+    Returns:
+        StreamingHttpResponse
+
+    Raises:
+        FiltroInvalido: formato, tipo ou filtros inválidos
+    """
+    if formato not in FORMATOS:
+        raise FiltroInvalido(f'Formato {formato} não suportado na exportação (use csv ou xlsx)')
+    funcao = obter_fonte(modulo, tipo)
+    if funcao is None:
+        raise FiltroInvalido(f'Exportação não disponível para o relatório {modulo}/{tipo}')
+
+    cabecalho, linhas = funcao(empresa, filtros or {}, filial)
+    linhas = _no_schema(getattr(tenant, 'schema_name', None), linhas)
+
+    if formato == 'csv':
+        conteudo = linhas_csv(cabecalho, linhas)
+    else:
+        conteudo = linhas_xlsx(cabecalho, linhas, nome_planilha=tipo)
+
+    response = StreamingHttpResponse(conteudo, content_type=CONTENT_TYPES[formato])
+    response['Content-Disposition'] = f'attachment; filename="relatorio_{tipo}.{formato}"'
+    # Proxies (nginx) não devem acumular a resposta antes de repassar
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Fontes de dados
+# ---------------------------------------------------------------------------
+
+@fonte('estoque', 'estoque-por-location')
+def estoque_por_location(empresa, filtros, filial=None):
+    queryset = estoques_filtrados(empresa, filtros, filial)
+    cabecalho = [
+        'Location', 'Código Location', 'Código Produto', 'Produto', 'Unidade',
+        'Quantidade', 'Reservada', 'Disponível', 'Custo Médio', 'Valor Total',
+        'Localização Interna', 'Total da Location',
+    ]
+
+    def linhas():
+        # Subtotais por location calculados no banco (uma linha por location)
+        totais = {item['location_id']: item['total'] for item in subtotais_por_location(queryset)}
+        registros = queryset.annotate(valor=valor_estoque()).order_by(
+            'location__nome', 'location_id', 'produto__nome', 'id'
+        ).values_list(
+            'location_id', 'location__nome', 'location__codigo',
+            'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+            'quantidade_atual', 'quantidade_reservada', 'quantidade_disponivel',
+            'valor_custo_medio', 'valor', 'localizacao_interna',
+        )
+        for location_id, *campos in registros.iterator(chunk_size=_chunk_size()):
+            yield (*campos, totais.get(location_id))
+
+    return cabecalho, linhas()
+
+
+@fonte('estoque', 'estoque-consolidado')
+def estoque_consolidado(empresa, filtros, filial=None):
+    queryset = estoques_filtrados(empresa, filtros, filial)
+    cabecalho = [
+        'Código Produto', 'Produto', 'Unidade', 'Quantidade', 'Reservada',
+        'Disponível', 'Valor Total',
+    ]
+    registros = queryset.order_by().values(
+        'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+    ).annotate(
+        total_quantidade=Sum('quantidade_atual'),
+        total_reservada=Sum('quantidade_reservada'),
+        total_disponivel=Sum('quantidade_disponivel'),
+        total_valor=Sum(valor_estoque()),
+    ).order_by('produto__nome', 'produto__codigo_produto').values_list(
+        'produto__codigo_produto', 'produto__nome', 'produto__unidade_medida',
+        'total_quantidade', 'total_reservada', 'total_disponivel', 'total_valor',
+    )
+    return cabecalho, registros.iterator(chunk_size=_chunk_size())
+
+
+@fonte('estoque', 'movimentacoes')
+def movimentacoes(empresa, filtros, filial=None):
+    from estoque.models import MovimentacaoEstoque
+
+    queryset = MovimentacaoEstoque.objects.filter(
+        filtro_filial(filial, 'estoque__location__filial'),
+        estoque__empresa=empresa,
+    )
+    location_id = filtro_inteiro(filtros, 'location_id')
+    if location_id:
+        queryset = queryset.filter(estoque__location_id=location_id)
+    produto_id = filtro_inteiro(filtros, 'produto_id')
+    if produto_id:
+        queryset = queryset.filter(estoque__produto__codigo_produto=produto_id)
+    for campo in ('tipo', 'origem', 'status'):
+        if filtros.get(campo):
+            queryset = queryset.filter(**{campo: filtros[campo]})
+    data_inicio = filtro_data(filtros, 'data_inicio')
+    # Intervalo de datetime (sem __date, que impede o uso do índice em data_movimentacao)
+    if data_inicio:
+        queryset = queryset.filter(data_movimentacao__gte=inicio_do_dia(data_inicio))
+    data_fim = filtro_data(filtros, 'data_fim')
+    if data_fim:
+        queryset = queryset.filter(data_movimentacao__lt=fim_exclusivo(data_fim))
+
+    cabecalho = [
+        'ID', 'Data', 'Tipo', 'Origem', 'Status', 'Código Produto', 'Produto',
+        'Location', 'Quantidade', 'Quantidade Anterior', 'Quantidade Posterior',
+        'Valor Unitário', 'Valor Total', 'Documento', 'Nota Fiscal', 'Série',
+    ]
+    registros = queryset.order_by('-data_movimentacao', '-id').values_list(
+        'id', 'data_movimentacao', 'tipo', 'origem', 'status',
+        'estoque__produto__codigo_produto', 'estoque__produto__nome', 'estoque__location__nome',
+        'quantidade', 'quantidade_anterior', 'quantidade_posterior',
+        'valor_unitario', 'valor_total', 'documento_referencia',
+        'numero_nota_fiscal', 'serie_nota_fiscal',
+    )
+    return cabecalho, registros.iterator(chunk_size=_chunk_size())
+
+
+def _contas(modelo, pessoa, data_pagamento, valor_pago, empresa, filtros, filial):
+    registros = contas_filtradas(modelo, empresa, filtros, filial).order_by('data_vencimento', 'codigo_conta').values_list(
+        'codigo_conta', 'numero_documento',
+        f'{pessoa}__razao_social', f'{pessoa}__nome_completo', f'{pessoa}__cpf_cnpj',
+        'data_emissao', 'data_vencimento', data_pagamento,
+        'valor_total', valor_pago, 'valor_pendente', 'status', 'forma_pagamento',
+    )
+
+    def linhas():
+        for codigo, documento, razao_social, nome, cpf_cnpj, *campos in registros.iterator(chunk_size=_chunk_size()):
+            yield (codigo, documento, razao_social or nome or '', cpf_cnpj, *campos)
+
+    return linhas()
+
+
+@fonte('financeiro', 'contas-receber')
+def contas_receber(empresa, filtros, filial=None):
+    from financeiro.models import ContaReceber
+
+    cabecalho = [
+        'Código', 'Documento', 'Cliente', 'CPF/CNPJ', 'Emissão', 'Vencimento',
+        'Recebimento', 'Valor Total', 'Valor Recebido', 'Valor Pendente', 'Status',
+        'Forma de Pagamento',
+    ]
+    return cabecalho, _contas(
+        ContaReceber, 'cliente', 'data_recebimento', 'valor_recebido', empresa, filtros, filial
+    )
+
+
+@fonte('financeiro', 'contas-pagar')
+def contas_pagar(empresa, filtros, filial=None):
+    from financeiro.models import ContaPagar
+
+    cabecalho = [
+        'Código', 'Documento', 'Fornecedor', 'CPF/CNPJ', 'Emissão', 'Vencimento',
+        'Pagamento', 'Valor Total', 'Valor Pago', 'Valor Pendente', 'Status',
+        'Forma de Pagamento',
+    ]
+    return cabecalho, _contas(
+        ContaPagar, 'fornecedor', 'data_pagamento', 'valor_pago', empresa, filtros, filial
+    )
@@ -0,0 +1,323 @@
+"""
+Geração assíncrona de relatórios (jobs na fila do Celery).
+
+Fluxo:
+1. enfileirar(): deduplica pela chave (empresa, filial, tipo, módulo, formato,
+   template, filtros; sem empresa, também o usuário) — um job ativo ou concluído há menos
+   de REPORTS_DEDUP_JANELA segundos é reaproveitado — e aplica o limite de jobs
+   pendentes por tenant. Pedidos idênticos simultâneos passam por uma trava no
+   cache (cache.add), liberada no commit do job criado
+2. reports.tasks.gerar_relatorio: o worker ocupa uma das
+   REPORTS_MAX_JOBS_SIMULTANEOS vagas do tenant (sem vaga: reagenda, até
+   REPORTS_JOB_TIMEOUT segundos), reivindica o job (pendente → processando numa
+   UPDATE condicional), gera o relatório e grava no armazenamento
+   (settings.REPORTS_STORAGE: disco local ou backend compatível com S3)
+3. O cliente consulta /api/reports/jobs/<id>/ e baixa em .../download/ até
+   expira_em (REPORTS_RESULTADO_TTL); a limpeza periódica remove os arquivos
+"""
+import hashlib
+import json
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .dados import obter_dados_relatorio
+from .engine import ReportEngine
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'html': 'text/html; charset=utf-8',
+}
+
+
+class LimiteJobsExcedido(Exception):
+    """O tenant já tem o máximo de jobs de relatório pendentes"""
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def armazenamento():
+    """Storage dos arquivos gerados (settings.REPORTS_STORAGE: BACKEND + OPTIONS)"""
+    config = _config('REPORTS_STORAGE', {})
+    backend = import_string(config.get('BACKEND', 'django.core.files.storage.FileSystemStorage'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+def chave_dedup(empresa_id, tipo, modulo, formato, template_id, filtros, owner_id=None, filial_id=None):
+    """
+    Hash dos parâmetros que definem o conteúdo do relatório.
+
+    Sem empresa, o conteúdo depende do usuário (empresa/filial do contexto dele):
+    o owner entra na chave para não reaproveitar o relatório de outro usuário.
+    """
+    if empresa_id is not None:
+        owner_id = None
+    conteudo = json.dumps(
+        [empresa_id, filial_id, owner_id, tipo, modulo or '', formato, template_id, filtros or {}],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def _chave_trava_dedup(schema_name, chave):
+    return f'reports:dedup:{schema_name}:{chave}'
+
+
+def _ocupar_trava_dedup(trava):
+    """
+    Ocupa a trava do pedido (cache.add), esperando até REPORTS_DEDUP_TRAVA_ESPERA
+    segundos por quem a ocupa. Returns: True se ocupou.
+    """
+    limite = time.monotonic() + _config('REPORTS_DEDUP_TRAVA_ESPERA', 5)
+    while True:
+        if cache.add(trava, 1, _config('REPORTS_DEDUP_TRAVA_TTL', 30)):
+            return True
+        if time.monotonic() >= limite:
+            return False
+        time.sleep(0.05)
+
+
+def _reaproveitar_ou_criar(chave, tipo, modulo, formato, template_id, filtros, empresa, filial, usuario):
+    """Job ativo/recente com a mesma chave ou um job novo. Returns: (job, criado)"""
+    agora = timezone.now()
+    janela = agora - timedelta(seconds=_config('REPORTS_DEDUP_JANELA', 300))
+    # Jobs ativos há mais que REPORTS_JOB_TIMEOUT (worker perdido) não contam
+    ativos = ReportJob.objects.filter(
+        status__in=ReportJob.STATUS_ATIVOS,
+        created_at__gte=agora - timedelta(seconds=_config('REPORTS_JOB_TIMEOUT', 900)),
+    )
+    existente = (
+        ativos.filter(chave=chave).order_by('-created_at').first()
+    ) or (
+        ReportJob.objects.filter(chave=chave, status=ReportJob.STATUS_CONCLUIDO, concluido_em__gte=janela)
+        .order_by('-concluido_em')
+        .first()
+    )
+    if existente is not None:
+        return existente, False
+
+    limite = _config('REPORTS_MAX_JOBS_PENDENTES', 20)
+    if ativos.count() >= limite:
+        raise LimiteJobsExcedido(
+            f'Limite de {limite} relatórios em processamento atingido; aguarde a conclusão'
+        )
+
+    job = ReportJob.objects.create(
+        tipo=tipo,
+        modulo=modulo or '',
+        formato=formato,
+        template_id=template_id,
+        filtros=filtros,
+        empresa=empresa,
+        filial=filial,
+        chave=chave,
+        owner=usuario,
+    )
+    return job, True
+
+
+def enfileirar(tenant, empresa, usuario, tipo, modulo=None, formato='pdf', template_id=None, filtros=None,
+               filial=None):
+    """
+    Cria (ou reaproveita) o job e o envia para a fila.
+
+    Returns:
+        Tupla (job, criado)
+
+    Raises:
+        LimiteJobsExcedido: se o tenant já tem REPORTS_MAX_JOBS_PENDENTES jobs ativos
+    """
+    from .tasks import gerar_relatorio
+
+    filtros = filtros or {}
+    chave = chave_dedup(
+        getattr(empresa, 'pk', None), tipo, modulo, formato, template_id, filtros,
+        owner_id=getattr(usuario, 'pk', None), filial_id=getattr(filial, 'pk', None),
+    )
+    schema_name = tenant.schema_name if tenant else connection.schema_name
+
+    # Sem a trava, dois pedidos idênticos simultâneos passariam pela busca antes
+    # de qualquer um criar o job. Ela só é liberada no commit do job criado, para
+    # o pedido seguinte já encontrá-lo
+    trava = _chave_trava_dedup(schema_name, chave)
+    travado = _ocupar_trava_dedup(trava)
+    if not travado:
+        logger.warning(f'[Relatórios] Trava de deduplicação ocupada ({trava}); seguindo sem ela')
+    try:
+        job, criado = _reaproveitar_ou_criar(
+            chave, tipo, modulo, formato, template_id, filtros, empresa, filial, usuario
+        )
+    except Exception:
+        if travado:
+            cache.delete(trava)
+        raise
+
+    if criado:
+        # Só enfileira depois do commit (o worker precisa enxergar o job)
+        transaction.on_commit(lambda: gerar_relatorio.delay(schema_name, job.pk))
+    if travado:
+        if criado:
+            transaction.on_commit(lambda: cache.delete(trava))
+        else:
+            cache.delete(trava)
+    return job, criado
+
+
+def _chave_vaga(schema_name, indice):
+    return f'reports:vaga:{schema_name}:{indice}'
+
+
+def ocupar_vaga(schema_name):
+    """
+    Ocupa uma das vagas de processamento do tenant.
+
+    As vagas expiram após REPORTS_JOB_TIMEOUT segundos (worker que morreu no
+    meio da geração não prende a vaga).
+
+    Returns:
+        Chave da vaga ocupada, ou None se todas estiverem ocupadas
+    """
+    for indice in range(_config('REPORTS_MAX_JOBS_SIMULTANEOS', 2)):
+        chave = _chave_vaga(schema_name, indice)
+        if cache.add(chave, 1, _config('REPORTS_JOB_TIMEOUT', 900)):
+            return chave
+    return None
+
+
+def liberar_vaga(chave):
+    cache.delete(chave)
+
+
+def tentativas_sem_vaga():
+    """
+    Reagendamentos sem vaga antes de desistir do job.
+
+    Cobrem REPORTS_JOB_TIMEOUT segundos: depois disso o job pendente já conta
+    como perdido na deduplicação, e uma vaga nunca liberada não reagenda para sempre.
+    """
+    espera = max(1, _config('REPORTS_REAGENDAR_SEGUNDOS', 10))
+    return max(1, math.ceil(_config('REPORTS_JOB_TIMEOUT', 900) / espera))
+
+
+def reivindicar(job_id):
+    """
+    Passa o job de pendente para processando numa única UPDATE condicional.
+
+    Uma mensagem reentregue ou repetida do Celery não gera o mesmo job duas
+    vezes: só quem muda o status processa.
+
+    Returns:
+        O job (com empresa e filial), ou None se ele não estava pendente
+    """
+    agora = timezone.now()
+    reivindicados = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDENTE).update(
+        status=ReportJob.STATUS_PROCESSANDO,
+        iniciado_em=agora,
+        updated_at=agora,
+    )
+    if reivindicados != 1:
+        return None
+    return ReportJob.objects.select_related('empresa', 'filial').get(pk=job_id)
+
+
+def desistir(job_id, motivo):
+    """Marca com erro o job ainda pendente (ex.: sem vaga dentro do prazo)"""
+    agora = timezone.now()
+    return ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDENTE).update(
+        status=ReportJob.STATUS_ERRO,
+        erro=motivo,
+        concluido_em=agora,
+        updated_at=agora,
+    )
+
+
+def _renderizar(job, tenant):
+    """Arquivo com o relatório gerado (PDF em arquivo temporário, sem passar pela memória)"""
+    usuario = get_user_model().objects.filter(pk=job.owner_id).first() if job.owner_id else None
+    engine = ReportEngine(tenant=tenant, empresa=job.empresa, usuario=usuario)
+    dados = obter_dados_relatorio(job.tipo, job.modulo or None, job.filtros, tenant, job.empresa, job.filial)
+    if job.formato == 'pdf':
+        return File(engine.render_pdf_arquivo(job.tipo, dados, job.modulo or None, job.template_id))
+    return ContentFile(engine.render_html(job.tipo, dados, job.modulo or None, job.template_id).encode('utf-8'))
+
+
+def processar(job, tenant):
+    """
+    Gera o relatório do job e grava o resultado (executado no worker, no schema do tenant).
+
+    O job já deve ter sido reivindicado (reivindicar()).
+
+    Returns:
+        O job atualizado (concluído ou com erro)
+    """
+    try:
+        with _renderizar(job, tenant) as conteudo:
+            nome_arquivo = f'relatorio_{job.tipo}.{job.formato}'
+            tamanho = conteudo.size
+            caminho = armazenamento().save(
+                f'reports/{connection.schema_name}/{job.pk}.{job.formato}',
+                conteudo,
+            )
+    except Exception as e:
+        logger.error(f"[ReportJob] Erro ao gerar relatório do job {job.pk}: {e}", exc_info=True)
+        job.status = ReportJob.STATUS_ERRO
+        job.erro = str(e)
+        job.concluido_em = timezone.now()
+        job.save(update_fields=['status', 'erro', 'concluido_em', 'updated_at'])
+        return job
+
+    agora = timezone.now()
+    job.status = ReportJob.STATUS_CONCLUIDO
+    job.arquivo = caminho
+    job.nome_arquivo = nome_arquivo
+    job.content_type = CONTENT_TYPES.get(job.formato, 'application/octet-stream')
+    job.tamanho_bytes = tamanho
+    job.concluido_em = agora
+    job.expira_em = agora + timedelta(seconds=_config('REPORTS_RESULTADO_TTL', 86400))
+    job.save(update_fields=[
+        'status', 'arquivo', 'nome_arquivo', 'content_type', 'tamanho_bytes',
+        'concluido_em', 'expira_em', 'updated_at',
+    ])
+    return job
+
+
+def limpar_expirados():
+    """
+    Remove os arquivos de jobs expirados e marca os jobs como expirados.
+
+    Returns:
+        Quantidade de jobs expirados
+    """
+    storage = armazenamento()
+    expirados = ReportJob.objects.filter(
+        status=ReportJob.STATUS_CONCLUIDO,
+        expira_em__lt=timezone.now(),
+    ).only('id', 'arquivo')
+
+    ids = []
+    for job in expirados.iterator(chunk_size=500):
+        if job.arquivo:
+            try:
+                storage.delete(job.arquivo)
+            except Exception as e:
+                logger.warning(f"[ReportJob] Erro ao remover arquivo do job {job.pk}: {e}")
+        ids.append(job.pk)
+
+    if ids:
+        ReportJob.objects.filter(pk__in=ids).update(status=ReportJob.STATUS_EXPIRADO, arquivo='')
+    return len(ids)
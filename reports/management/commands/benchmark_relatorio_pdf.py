@@ -0,0 +1,125 @@
+"""
+Comando Django para comparar a renderização do PDF em documento único e em partes paralelas
+Uso: python manage.py benchmark_relatorio_pdf <schema> [--linhas 5000] [--locations 50] [--processos 4] [--linhas-por-parte 500]
+"""
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django_tenants.utils import schema_context
+
+from reports.engine import WEASYPRINT_AVAILABLE, ReportEngine
+from reports.models import ReportTemplate
+from reports.pdf_paralelo import PYPDF_DISPONIVEL, PdfReader
+from tenants import resolver
+
+TIPO = 'estoque-por-location'
+MODULO = 'estoque'
+
+
+def dados_sinteticos(linhas, locations):
+    """Relatório de estoque por location com `linhas` itens distribuídos em `locations` locations"""
+    dados = []
+    totais = {}
+    for indice in range(linhas):
+        location_id = indice % locations + 1
+        quantidade = Decimal(indice % 97 + 1)
+        custo = Decimal('12.34') + indice % 13
+        valor = quantidade * custo
+        totais[location_id] = totais.get(location_id, Decimal('0.00')) + valor
+        dados.append({
+            'location_id': location_id,
+            'location_nome': f'Location {location_id:03d}',
+            'produto_codigo': indice + 1,
+            'produto_nome': f'Produto de teste {indice + 1}',
+            'quantidade': str(quantidade),
+            'valor_unitario': str(custo),
+            'valor_total': str(valor),
+        })
+    dados.sort(key=lambda item: (item['location_nome'], item['produto_codigo']))
+    for item in dados:
+        item['location_total'] = str(totais[item['location_id']])
+    return {
+        'dados': dados,
+        'total_geral': str(sum(totais.values(), Decimal('0.00'))),
+        'total_itens': len(dados),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo do PDF de estoque por location em documento único e em partes paralelas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'schema',
+            type=str,
+            help='Schema do tenant (configuração e templates de relatório)'
+        )
+        parser.add_argument(
+            '--linhas',
+            type=int,
+            default=5000,
+            help='Quantidade de linhas do relatório (padrão: 5000)'
+        )
+        parser.add_argument(
+            '--locations',
+            type=int,
+            default=50,
+            help='Quantidade de locations (padrão: 50)'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=0,
+            help='Processos do pool (padrão: REPORTS_PDF_PROCESSOS / quantidade de CPUs)'
+        )
+        parser.add_argument(
+            '--linhas-por-parte',
+            type=int,
+            default=None,
+            help='Linhas por parte (padrão: REPORTS_PDF_LINHAS_POR_PARTE)'
+        )
+
+    def handle(self, *args, **options):
+        if not (WEASYPRINT_AVAILABLE and PYPDF_DISPONIVEL):
+            self.stdout.write(self.style.ERROR('❌ WeasyPrint e pypdf são necessários'))
+            return
+
+        tenant = resolver.resolver_por_schema(options['schema'])
+        if tenant is None:
+            self.stdout.write(self.style.ERROR(f'❌ Schema "{options["schema"]}" não encontrado!'))
+            return
+
+        ajustes = {}
+        if options['processos']:
+            ajustes['REPORTS_PDF_PROCESSOS'] = options['processos']
+        if options['linhas_por_parte']:
+            ajustes['REPORTS_PDF_LINHAS_POR_PARTE'] = options['linhas_por_parte']
+
+        data = dados_sinteticos(max(1, options['linhas']), max(1, options['locations']))
+
+        with schema_context(tenant.schema_name), override_settings(**ajustes):
+            engine = ReportEngine(tenant=tenant)
+            if engine._resolver_template(TIPO, MODULO) is None:
+                # Tenant sem template cadastrado: usar o template de arquivo do módulo
+                engine._templates[(TIPO, MODULO, None)] = ReportTemplate(
+                    nome='Benchmark',
+                    modulo=MODULO,
+                    tipo_relatorio=TIPO,
+                    template_arquivo=f'reports/modules/{MODULO}/estoque_por_location.html',
+                )
+
+            resultados = {}
+            for modo, partes in (('documento único', False), ('partes paralelas', True)):
+                inicio = time.perf_counter()
+                with engine.render_pdf_arquivo(TIPO, data, MODULO, partes=partes) as arquivo:
+                    duracao = time.perf_counter() - inicio
+                    paginas = len(PdfReader(arquivo).pages)
+                resultados[modo] = duracao
+                self.stdout.write(f'{modo:<17} {duracao:8.2f} s  {paginas} páginas')
+
+        self.stdout.write(f'Linhas: {len(data["dados"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ganho: {resultados["documento único"] / resultados["partes paralelas"]:.2f}x'
+        ))
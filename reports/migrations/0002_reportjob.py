@@ -0,0 +1,53 @@
+# Generated by Django 4.2.26 on 2026-10-17 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_last_backup_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Data e hora em que o registro foi criado', verbose_name='Data de Criação')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Data e hora da última modificação do registro', verbose_name='Data de Atualização')),
+                ('is_deleted', models.BooleanField(default=False, help_text='Indica se o registro foi excluído (soft delete)', verbose_name='Excluído')),
+                ('deleted_at', models.DateTimeField(blank=True, help_text='Data e hora em que o registro foi excluído', null=True, verbose_name='Data de Exclusão')),
+                ('tipo', models.CharField(max_length=100, verbose_name='Tipo de Relatório')),
+                ('modulo', models.CharField(blank=True, max_length=50, verbose_name='Módulo')),
+                ('formato', models.CharField(default='pdf', max_length=10, verbose_name='Formato')),
+                ('template_id', models.IntegerField(blank=True, null=True, verbose_name='Template Customizado')),
+                ('filtros', models.JSONField(blank=True, default=dict, verbose_name='Filtros')),
+                ('chave', models.CharField(help_text='Hash de (empresa, tipo, módulo, formato, template, filtros)', max_length=64, verbose_name='Chave de Deduplicação')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro'), ('expirado', 'Expirado')], default='pendente', max_length=20, verbose_name='Status')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('concluido_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')),
+                ('arquivo', models.CharField(blank=True, max_length=255, verbose_name='Arquivo')),
+                ('nome_arquivo', models.CharField(blank=True, max_length=200, verbose_name='Nome do Arquivo')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Content-Type')),
+                ('tamanho_bytes', models.BigIntegerField(blank=True, null=True, verbose_name='Tamanho (bytes)')),
+                ('expira_em', models.DateTimeField(blank=True, null=True, verbose_name='Expira em')),
+                ('created_by', models.ForeignKey(blank=True, help_text='Usuário que criou o registro', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('deleted_by', models.ForeignKey(blank=True, help_text='Usuário que excluiu o registro', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_deleted', to=settings.AUTH_USER_MODEL, verbose_name='Excluído por')),
+                ('empresa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tenants.empresa', verbose_name='Empresa')),
+                ('owner', models.ForeignKey(blank=True, help_text='Proprietário do registro (pode ser diferente de quem criou)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_owned', to=settings.AUTH_USER_MODEL, verbose_name='Proprietário')),
+                ('updated_by', models.ForeignKey(blank=True, help_text='Usuário que fez a última modificação', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL, verbose_name='Atualizado por')),
+            ],
+            options={
+                'verbose_name': 'Job de Relatório',
+                'verbose_name_plural': 'Jobs de Relatórios',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['chave', 'status'], name='reports_rep_chave_146ddb_idx'), models.Index(fields=['status', 'expira_em'], name='reports_rep_status_b60009_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_last_backup_at'),
+        ('reports', '0002_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='filial',
+            field=models.ForeignKey(blank=True, help_text='Filial atual de quem pediu (dados restritos a ela); vazio = toda a empresa', null=True, on_delete=django.db.models.deletion.CASCADE, to='tenants.filial', verbose_name='Filial'),
+        ),
+        migrations.AlterField(
+            model_name='reportjob',
+            name='chave',
+            field=models.CharField(help_text='Hash de (empresa, filial, tipo, módulo, formato, template, filtros)', max_length=64, verbose_name='Chave de Deduplicação'),
+        ),
+    ]
@@ -192,3 +192,82 @@ class ReportConfig(SiscrModelBase):
     def __str__(self):
         empresa_nome = self.empresa.nome if self.empresa else 'Todo Tenant'
         return f"Config: {self.tenant.schema_name} - {empresa_nome}"
+
+
+class ReportJob(SiscrModelBase):
+    """
+    Geração assíncrona de relatório (fila do Celery)
+    
+    O arquivo gerado fica no armazenamento de relatórios (settings.REPORTS_STORAGE)
+    até expira_em; depois é removido pela limpeza periódica.
+    """
+    STATUS_PENDENTE = 'pendente'
+    STATUS_PROCESSANDO = 'processando'
+    STATUS_CONCLUIDO = 'concluido'
+    STATUS_ERRO = 'erro'
+    STATUS_EXPIRADO = 'expirado'
+    STATUS_CHOICES = [
+        (STATUS_PENDENTE, 'Pendente'),
+        (STATUS_PROCESSANDO, 'Processando'),
+        (STATUS_CONCLUIDO, 'Concluído'),
+        (STATUS_ERRO, 'Erro'),
+        (STATUS_EXPIRADO, 'Expirado'),
+    ]
+    STATUS_ATIVOS = (STATUS_PENDENTE, STATUS_PROCESSANDO)
+    
+    # Requisição
+    tipo = models.CharField(max_length=100, verbose_name='Tipo de Relatório')
+    modulo = models.CharField(max_length=50, blank=True, verbose_name='Módulo')
+    formato = models.CharField(max_length=10, default='pdf', verbose_name='Formato')
+    template_id = models.IntegerField(null=True, blank=True, verbose_name='Template Customizado')
+    filtros = models.JSONField(default=dict, blank=True, verbose_name='Filtros')
+    empresa = models.ForeignKey(
+        'tenants.Empresa',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name='Empresa'
+    )
+    filial = models.ForeignKey(
+        'tenants.Filial',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name='Filial',
+        help_text='Filial atual de quem pediu (dados restritos a ela); vazio = toda a empresa'
+    )
+    chave = models.CharField(
+        max_length=64,
+        verbose_name='Chave de Deduplicação',
+        help_text='Hash de (empresa, filial, tipo, módulo, formato, template, filtros)'
+    )
+    
+    # Execução
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDENTE,
+        verbose_name='Status'
+    )
+    erro = models.TextField(blank=True, verbose_name='Erro')
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado em')
+    concluido_em = models.DateTimeField(null=True, blank=True, verbose_name='Concluído em')
+    
+    # Resultado
+    arquivo = models.CharField(max_length=255, blank=True, verbose_name='Arquivo')
+    nome_arquivo = models.CharField(max_length=200, blank=True, verbose_name='Nome do Arquivo')
+    content_type = models.CharField(max_length=100, blank=True, verbose_name='Content-Type')
+    tamanho_bytes = models.BigIntegerField(null=True, blank=True, verbose_name='Tamanho (bytes)')
+    expira_em = models.DateTimeField(null=True, blank=True, verbose_name='Expira em')
+    
+    class Meta:
+        verbose_name = 'Job de Relatório'
+        verbose_name_plural = 'Jobs de Relatórios'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['chave', 'status']),
+            models.Index(fields=['status', 'expira_em']),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.pk}: {self.tipo} ({self.get_status_display()})"
@@ -0,0 +1,203 @@
+"""
+Renderização de PDFs grandes em partes paralelas.
+
+O tempo de layout do WeasyPrint cresce mais que linearmente com o tamanho do
+documento. Para relatórios grandes, o ReportEngine divide as linhas em partes
+(sem quebrar grupos, ex.: uma location, quando possível), renderiza o HTML de
+cada parte e este módulo:
+
+1. Gera o PDF de cada parte num pool de processos (arquivos temporários)
+2. Junta as partes (pypdf) e aplica a numeração "Página X de Y" do documento
+   inteiro, desenhada numa camada gerada pelo WeasyPrint com as mesmas folhas
+   de estilo (a numeração por CSS recomeçaria em cada parte)
+3. Grava o resultado no arquivo de destino, sem montar o PDF em memória
+
+Este módulo não importa o Django: os processos do pool só carregam o WeasyPrint.
+
+Limitação no Celery: os filhos do worker prefork (pool padrão) são processos
+daemon, que não podem criar processos. Nos jobs assíncronos (reports.tasks)
+com prefork, as partes são sempre renderizadas em sequência no próprio filho;
+a divisão em partes continua limitando o tempo de layout de cada documento,
+mas sem paralelismo. Para paralelizar, rodar o worker que consome os jobs de
+relatório com um pool que não seja daemon, ex.:
+`celery -A siscr worker --pool threads --concurrency 2` (cada job usa até
+REPORTS_PDF_PROCESSOS processos próprios).
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_DISPONIVEL = True
+except ImportError:
+    PdfReader = None
+    PdfWriter = None
+    PYPDF_DISPONIVEL = False
+
+# Numeração das páginas do documento final (mesmo estilo de reports/components/footer.html)
+CSS_NUMERACAO = """
+    @page {
+        @bottom-right {
+            content: "Página " counter(page) " de " counter(pages);
+            font-size: 10px;
+            color: #666;
+        }
+    }
+    .pagina + .pagina { break-before: page; }
+"""
+
+
+def dividir(linhas, tamanho, chave=None):
+    """
+    Divide as linhas em partes de até `tamanho` linhas.
+
+    Com `chave`, as partes terminam em mudança de grupo (linhas consecutivas
+    com o mesmo valor de linha[chave]) sempre que possível; um grupo maior que
+    `tamanho` é dividido.
+
+    Returns:
+        Lista de listas de linhas
+    """
+    tamanho = max(1, tamanho)
+    if chave is None:
+        return [linhas[inicio:inicio + tamanho] for inicio in range(0, len(linhas), tamanho)]
+
+    partes = []
+    atual = []
+    grupo = []
+    for linha in linhas:
+        if grupo and linha.get(chave) != grupo[-1].get(chave):
+            if atual and len(atual) + len(grupo) > tamanho:
+                partes.append(atual)
+                atual = []
+            atual.extend(grupo)
+            grupo = []
+        grupo.append(linha)
+        if len(grupo) >= tamanho:
+            if atual:
+                partes.append(atual)
+                atual = []
+            partes.append(grupo)
+            grupo = []
+    if atual and len(atual) + len(grupo) > tamanho:
+        partes.append(atual)
+        atual = []
+    atual.extend(grupo)
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+@lru_cache(maxsize=16)
+def _folha(css):
+    from weasyprint import CSS
+    return CSS(string=css)
+
+
+def _renderizar_parte(html, folhas_css, caminho):
+    """Gera o PDF de uma parte em `caminho` (executado nos processos do pool)"""
+    from weasyprint import HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    HTML(string=html).write_pdf(
+        caminho,
+        stylesheets=[_folha(css) for css in folhas_css],
+        font_config=FontConfiguration(),
+    )
+    return caminho
+
+
+def _numeracao(total_paginas, folhas_css):
+    """PDF com `total_paginas` páginas em branco contendo só a numeração"""
+    from weasyprint import HTML
+
+    html = '<html><body>' + '<div class="pagina"></div>' * total_paginas + '</body></html>'
+    return PdfReader(BytesIO(HTML(string=html).write_pdf(
+        stylesheets=[_folha(css) for css in (*folhas_css, CSS_NUMERACAO)],
+    )))
+
+
+def juntar(caminhos, destino, folhas_css=()):
+    """
+    Concatena os PDFs das partes, numera as páginas e grava em `destino`.
+
+    Args:
+        caminhos: Arquivos das partes, em ordem
+        destino: Arquivo binário aberto para escrita
+        folhas_css: Folhas de estilo do relatório (tamanho/margens da página)
+
+    Returns:
+        Quantidade de páginas
+    """
+    escritor = PdfWriter()
+    for caminho in caminhos:
+        escritor.append(caminho)
+
+    total_paginas = len(escritor.pages)
+    camada = _numeracao(total_paginas, folhas_css)
+    if len(camada.pages) == total_paginas:
+        for pagina, numero in zip(escritor.pages, camada.pages):
+            pagina.merge_page(numero)
+    else:
+        logger.warning(
+            f'[PDF] Camada de numeração com {len(camada.pages)} páginas para {total_paginas}; documento sem numeração'
+        )
+
+    escritor.write(destino)
+    return total_paginas
+
+
+def renderizar(partes_html, folhas_css, destino, processos=None):
+    """
+    Renderiza as partes em paralelo e grava o PDF final em `destino`.
+
+    Sem pool de processos disponível (dentro de processos daemon, como os filhos
+    do worker prefork do Celery, ou se o pool falhar), as partes são
+    renderizadas em sequência.
+
+    Args:
+        partes_html: HTML completo de cada parte
+        folhas_css: Folhas de estilo (texto) aplicadas a todas as partes
+        destino: Arquivo binário aberto para escrita
+        processos: Tamanho do pool (padrão: quantidade de CPUs)
+
+    Returns:
+        Quantidade de páginas
+    """
+    if not PYPDF_DISPONIVEL:
+        raise RuntimeError('pypdf não está instalado (necessário para juntar as partes do PDF)')
+
+    folhas_css = tuple(folhas_css)
+    processos = max(1, min(processos or os.cpu_count() or 1, len(partes_html)))
+
+    with tempfile.TemporaryDirectory(prefix='siscr-pdf-') as diretorio:
+        caminhos = [os.path.join(diretorio, f'parte-{indice:04d}.pdf') for indice in range(len(partes_html))]
+
+        paralelo = processos > 1
+        if paralelo and multiprocessing.current_process().daemon:
+            # Processo daemon não pode ter filhos: nem tentar criar o pool
+            logger.info('[PDF] Processo daemon (ex.: worker prefork do Celery); renderizando as partes em sequência')
+            paralelo = False
+        if paralelo:
+            try:
+                with ProcessPoolExecutor(max_workers=processos) as executor:
+                    list(executor.map(
+                        _renderizar_parte, partes_html, [folhas_css] * len(partes_html), caminhos
+                    ))
+            except (AssertionError, BrokenProcessPool, OSError) as e:
+                logger.warning(f'[PDF] Pool de processos indisponível ({e}); renderizando em sequência')
+                paralelo = False
+
+        if not paralelo:
+            for html, caminho in zip(partes_html, caminhos):
+                _renderizar_parte(html, folhas_css, caminho)
+
+        return juntar(caminhos, destino, folhas_css)
@@ -0,0 +1,67 @@
+"""
+Tarefas do Celery para o módulo de relatórios
+"""
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django_tenants.utils import schema_context
+
+from core.tenant_tasks import disparar_por_tenant
+from tenants import resolver
+
+from . import jobs
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def gerar_relatorio(self, schema_name, job_id):
+    """
+    Gera o relatório de um ReportJob (reports/jobs.py).
+    Sem vaga livre no tenant (REPORTS_MAX_JOBS_SIMULTANEOS), reagenda; depois de
+    jobs.tentativas_sem_vaga() reagendamentos, marca o job com erro.
+    """
+    vaga = jobs.ocupar_vaga(schema_name)
+    if vaga is None:
+        limite = jobs.tentativas_sem_vaga()
+        if self.request.retries >= limite:
+            logger.warning(f"[CELERY] Job de relatório {job_id} ({schema_name}) sem vaga após {limite} tentativas")
+            with schema_context(schema_name):
+                jobs.desistir(job_id, 'Sem vaga de processamento no prazo; tente novamente.')
+            return None
+        raise self.retry(countdown=getattr(settings, 'REPORTS_REAGENDAR_SEGUNDOS', 10), max_retries=limite)
+
+    try:
+        tenant = resolver.resolver_por_schema(schema_name)
+        with schema_context(schema_name):
+            job = jobs.reivindicar(job_id)
+            if job is None:
+                logger.info(f"[CELERY] Job de relatório {job_id} ({schema_name}) não está pendente; ignorado")
+                return None
+            job = jobs.processar(job, tenant)
+            return {'job_id': job.pk, 'status': job.status}
+    finally:
+        jobs.liberar_vaga(vaga)
+
+
+def _limpar_relatorios_tenant(schema_name):
+    """Remove os resultados expirados de um tenant"""
+    expirados = jobs.limpar_expirados()
+    if expirados:
+        logger.info(f"[CELERY] Tenant {schema_name}: {expirados} relatório(s) expirado(s) removido(s)")
+    return {'expired': expirados}
+
+
+@shared_task
+def limpar_relatorios_expirados():
+    """
+    Remove os arquivos de relatórios assíncronos expirados (REPORTS_RESULTADO_TTL).
+    Executa a cada 1 hora, em todos os tenants ativos.
+    """
+    logger.info("[CELERY] Iniciando limpeza de relatórios expirados...")
+    return disparar_por_tenant(
+        'Limpeza de relatórios expirados',
+        'reports.tasks._limpar_relatorios_tenant',
+        tabelas=['reports_reportjob'],
+    )
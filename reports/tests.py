@@ -1,3 +1,501 @@
-from django.test import TestCase
+"""
+Testes do módulo de relatórios
+"""
+import io
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_tenants.utils import schema_context
+
+from reports import cache as cache_relatorios
+from reports import exportacao, jobs, pdf_paralelo
+from reports.dados import FiltroInvalido, obter_dados_relatorio
+from reports.engine import ReportEngine
+from reports.models import ReportConfig, ReportJob, ReportTemplate
+from tenants.models import Domain, Empresa, Filial, Tenant
+
+User = get_user_model()
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+class ReportEngineCacheTests(TestCase):
+    """Testes do cache de templates/configurações do ReportEngine (reports/cache.py)"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_reports',
+                name='Tenant de Teste Relatórios',
+                is_active=True
+            )
+            Domain.objects.create(
+                domain='test-reports.localhost',
+                tenant=self.tenant,
+                is_primary=True
+            )
+        
+        with schema_context(self.tenant.schema_name):
+            self.empresa = Empresa.objects.create(
+                tenant=self.tenant,
+                nome='Empresa Relatórios',
+                razao_social='Empresa Relatórios LTDA',
+                cnpj='12345678000191',
+                is_active=True
+            )
+            ReportConfig.objects.create(tenant=self.tenant, nome_empresa='Empresa Relatórios')
+            self.template = ReportTemplate.objects.create(
+                nome='Estoque por Location',
+                codigo='teste-estoque-por-location',
+                modulo='estoque',
+                tipo_relatorio='estoque-por-location',
+                template_customizado=True,
+                template_html='<p>Total: {{ total_geral }}</p>',
+                tenant=self.tenant,
+                is_active=True,
+            )
+    
+    def _renderizar(self):
+        engine = ReportEngine(tenant=self.tenant, empresa=self.empresa)
+        return engine.render_html('estoque-por-location', {'total_geral': '10.00'}, 'estoque')
+    
+    def test_render_sem_consultas_com_cache_quente(self):
+        """Com o cache quente, a renderização não consulta ReportConfig nem ReportTemplate"""
+        with schema_context(self.tenant.schema_name):
+            html = self._renderizar()
+            self.assertIn('Total: 10.00', html)
+            
+            with self.assertNumQueries(0):
+                html = self._renderizar()
+            self.assertIn('Total: 10.00', html)
+    
+    def test_invalidacao_ao_salvar_template(self):
+        """Salvar o ReportTemplate muda a versão (no commit) e a próxima renderização usa o novo conteúdo"""
+        with schema_context(self.tenant.schema_name):
+            self._renderizar()
+            versao = cache_relatorios.versao_schema()
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                self.template.template_html = '<p>Novo total: {{ total_geral }}</p>'
+                self.template.save()
+                # Versão renovada só depois do commit
+                self.assertEqual(cache_relatorios.versao_schema(), versao)
+            
+            self.assertNotEqual(cache_relatorios.versao_schema(), versao)
+            self.assertIn('Novo total: 10.00', self._renderizar())
+    
+    def test_template_compilado_reaproveitado(self):
+        """O mesmo conteúdo de template é compilado uma única vez"""
+        conteudo = '<p>{{ valor }}</p>'
+        self.assertIs(cache_relatorios.compilar(conteudo), cache_relatorios.compilar(conteudo))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+    REPORTS_MAX_JOBS_PENDENTES=2,
+    REPORTS_MAX_JOBS_SIMULTANEOS=1,
+)
+class ReportJobTests(TestCase):
+    """Testes da geração assíncrona de relatórios (reports/jobs.py)"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        armazenamento = override_settings(REPORTS_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.diretorio},
+        })
+        armazenamento.enable()
+        self.addCleanup(armazenamento.disable)
+        
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_report_jobs',
+                name='Tenant de Teste Jobs',
+                is_active=True
+            )
+            Domain.objects.create(
+                domain='test-report-jobs.localhost',
+                tenant=self.tenant,
+                is_primary=True
+            )
+            self.user = User.objects.create_user(username='jobs', password='testpass123')
+        
+        with schema_context(self.tenant.schema_name):
+            self.empresa = Empresa.objects.create(
+                tenant=self.tenant,
+                nome='Empresa Jobs',
+                razao_social='Empresa Jobs LTDA',
+                cnpj='12345678000272',
+                is_active=True
+            )
+            ReportTemplate.objects.create(
+                nome='Estoque por Location',
+                codigo='teste-jobs-estoque-por-location',
+                modulo='estoque',
+                tipo_relatorio='estoque-por-location',
+                template_customizado=True,
+                template_html='<p>Itens: {{ total_itens }}</p>',
+                tenant=self.tenant,
+                is_active=True,
+            )
+    
+    def _enfileirar(self, **filtros):
+        # Os callbacks de on_commit rodam (liberam a trava de deduplicação); o envio à fila é simulado
+        with mock.patch('reports.tasks.gerar_relatorio.delay'), self.captureOnCommitCallbacks(execute=True):
+            return jobs.enfileirar(
+                self.tenant, self.empresa, self.user, 'estoque-por-location',
+                modulo='estoque', formato='html', filtros=filtros,
+            )
+    
+    def test_dedup_reaproveita_job_ativo(self):
+        """Pedido idêntico com job ativo reaproveita o mesmo job"""
+        with schema_context(self.tenant.schema_name):
+            job, criado = self._enfileirar(location_id=1)
+            repetido, criado_de_novo = self._enfileirar(location_id=1)
+            outro, criado_outro = self._enfileirar(location_id=2)
+        
+        self.assertTrue(criado)
+        self.assertFalse(criado_de_novo)
+        self.assertEqual(repetido.pk, job.pk)
+        self.assertTrue(criado_outro)
+        self.assertNotEqual(outro.pk, job.pk)
+    
+    def test_dedup_sem_empresa_separa_usuarios(self):
+        """Sem empresa, pedidos idênticos de usuários diferentes não compartilham o job"""
+        with schema_context('public'):
+            outro_usuario = User.objects.create_user(username='jobs2', password='testpass123')
+        
+        with schema_context(self.tenant.schema_name):
+            with mock.patch('reports.tasks.gerar_relatorio.delay'), self.captureOnCommitCallbacks(execute=True):
+                job, _ = jobs.enfileirar(self.tenant, None, self.user, 'estoque-por-location', modulo='estoque')
+                repetido, criado_de_novo = jobs.enfileirar(
+                    self.tenant, None, self.user, 'estoque-por-location', modulo='estoque'
+                )
+                outro, criado_outro = jobs.enfileirar(
+                    self.tenant, None, outro_usuario, 'estoque-por-location', modulo='estoque'
+                )
+        
+        self.assertFalse(criado_de_novo)
+        self.assertEqual(repetido.pk, job.pk)
+        self.assertTrue(criado_outro)
+        self.assertNotEqual(outro.pk, job.pk)
+    
+    def test_trava_dedup_ate_o_commit(self):
+        """A trava do pedido fica ocupada até o commit do job criado"""
+        from django.core.cache import cache
+        
+        with schema_context(self.tenant.schema_name):
+            with mock.patch('reports.tasks.gerar_relatorio.delay') as delay:
+                with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                    job, criado = jobs.enfileirar(
+                        self.tenant, self.empresa, self.user, 'estoque-por-location',
+                        modulo='estoque', formato='html',
+                    )
+                trava = jobs._chave_trava_dedup(self.tenant.schema_name, job.chave)
+                self.assertTrue(criado)
+                # Pedido idêntico concorrente ainda não enxergaria o job: a trava o segura
+                self.assertFalse(cache.add(trava, 1))
+                
+                for callback in callbacks:
+                    callback()
+                delay.assert_called_once_with(self.tenant.schema_name, job.pk)
+                self.assertTrue(cache.add(trava, 1))
+    
+    def test_limite_de_jobs_pendentes(self):
+        """Acima de REPORTS_MAX_JOBS_PENDENTES o enfileiramento é recusado"""
+        with schema_context(self.tenant.schema_name):
+            self._enfileirar(location_id=1)
+            self._enfileirar(location_id=2)
+            with self.assertRaises(jobs.LimiteJobsExcedido):
+                self._enfileirar(location_id=3)
+    
+    def test_vagas_por_tenant(self):
+        """Só REPORTS_MAX_JOBS_SIMULTANEOS jobs processam ao mesmo tempo no tenant"""
+        vaga = jobs.ocupar_vaga(self.tenant.schema_name)
+        self.assertIsNotNone(vaga)
+        self.assertIsNone(jobs.ocupar_vaga(self.tenant.schema_name))
+        self.assertIsNotNone(jobs.ocupar_vaga('outro_tenant'))
+        
+        jobs.liberar_vaga(vaga)
+        self.assertIsNotNone(jobs.ocupar_vaga(self.tenant.schema_name))
+    
+    def test_reivindicar_uma_vez(self):
+        """Mensagem repetida não processa o job de novo: só a primeira reivindicação vale"""
+        with schema_context(self.tenant.schema_name):
+            job, _ = self._enfileirar()
+            reivindicado = jobs.reivindicar(job.pk)
+            
+            self.assertEqual(reivindicado.status, ReportJob.STATUS_PROCESSANDO)
+            self.assertIsNotNone(reivindicado.iniciado_em)
+            self.assertIsNone(jobs.reivindicar(job.pk))
+    
+    @override_settings(REPORTS_JOB_TIMEOUT=30, REPORTS_REAGENDAR_SEGUNDOS=10)
+    def test_desiste_sem_vaga_apos_o_limite(self):
+        """Sem vaga por REPORTS_JOB_TIMEOUT segundos, o job fica com erro em vez de reagendar para sempre"""
+        from reports.tasks import gerar_relatorio
+        
+        with schema_context(self.tenant.schema_name):
+            job, _ = self._enfileirar()
+        vaga = jobs.ocupar_vaga(self.tenant.schema_name)
+        try:
+            self.assertEqual(jobs.tentativas_sem_vaga(), 3)
+            gerar_relatorio.apply(args=(self.tenant.schema_name, job.pk), retries=3)
+        finally:
+            jobs.liberar_vaga(vaga)
+        
+        with schema_context(self.tenant.schema_name):
+            job.refresh_from_db()
+            self.assertEqual(job.status, ReportJob.STATUS_ERRO)
+            self.assertIsNone(jobs.reivindicar(job.pk))
+    
+    def test_processar_grava_resultado(self):
+        """O job processado grava o arquivo no armazenamento e fica disponível até expirar"""
+        with schema_context(self.tenant.schema_name):
+            job, _ = self._enfileirar()
+            job = jobs.processar(jobs.reivindicar(job.pk), self.tenant)
+            
+            self.assertEqual(job.status, ReportJob.STATUS_CONCLUIDO, job.erro)
+            self.assertIsNotNone(job.expira_em)
+            with jobs.armazenamento().open(job.arquivo, 'rb') as arquivo:
+                self.assertIn(b'Itens: 0', arquivo.read())
+            
+            # Após o processamento, o mesmo pedido reaproveita o resultado
+            repetido, criado = self._enfileirar()
+            self.assertFalse(criado)
+            self.assertEqual(repetido.pk, job.pk)
+
+
+class ExportacaoStreamingTests(SimpleTestCase):
+    """Testes dos escritores de CSV/XLSX por streaming (reports/exportacao.py)"""
+    
+    cabecalho = ['Código', 'Produto', 'Valor']
+    
+    def _linhas(self, quantidade):
+        return ((i, f'Produto <{i}> & "A"', Decimal('1.50') * i) for i in range(quantidade))
+    
+    def test_csv_em_lotes(self):
+        """O CSV sai em blocos (cabeçalho + um por lote), com BOM e separador ';'"""
+        quantidade = exportacao.LINHAS_POR_LOTE * 2 + 1
+        blocos = list(exportacao.linhas_csv(self.cabecalho, self._linhas(quantidade)))
+        
+        self.assertEqual(len(blocos), 4)
+        conteudo = b''.join(blocos).decode('utf-8')
+        self.assertTrue(conteudo.startswith('\ufeffCódigo;Produto;Valor'))
+        self.assertIn('1;"Produto <1> & ""A""";1.50', conteudo)
+        self.assertEqual(len(conteudo.splitlines()), quantidade + 1)
+    
+    def test_xlsx_valido(self):
+        """O XLSX gerado em blocos é um ZIP válido com as células tipadas"""
+        quantidade = exportacao.LINHAS_POR_LOTE * 3
+        blocos = list(exportacao.linhas_xlsx(self.cabecalho, self._linhas(quantidade)))
+        
+        self.assertGreater(len(blocos), 3)
+        with zipfile.ZipFile(io.BytesIO(b''.join(blocos))) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn(f'<row r="{quantidade + 1}">', planilha)
+        self.assertIn('<c r="C3"><v>1.50</v></c>', planilha)
+        self.assertIn('Produto &lt;1&gt; &amp; "A"', planilha)
+    
+    def test_linhas_consumidas_sob_demanda(self):
+        """O primeiro bloco sai antes de as linhas serem todas lidas"""
+        lidas = []
+        
+        def linhas():
+            for linha in self._linhas(10000):
+                lidas.append(linha[0])
+                yield linha
+        
+        gerador = exportacao.linhas_xlsx(self.cabecalho, linhas())
+        next(gerador)
+        next(gerador)
+        self.assertLess(len(lidas), 10000)
+    
+    def test_formato_e_tipo_invalidos(self):
+        with self.assertRaises(exportacao.FiltroInvalido):
+            exportacao.exportar('estoque', 'movimentacoes', 'ods', empresa=None)
+        with self.assertRaises(exportacao.FiltroInvalido):
+            exportacao.exportar('estoque', 'inexistente', 'csv', empresa=None)
+    
+    def test_filtro_invalido_antes_do_streaming(self):
+        """Filtros inválidos são rejeitados ao montar a resposta, não no meio do download"""
+        with self.assertRaises(exportacao.FiltroInvalido):
+            exportacao.exportar('estoque', 'movimentacoes', 'csv', empresa=None, filtros={'data_inicio': 'ontem'})
+        with self.assertRaises(exportacao.FiltroInvalido):
+            exportacao.exportar('financeiro', 'contas-pagar', 'xlsx', empresa=None, filtros={'data_fim': '31/12'})
+
+
+class ReportDadosEstoqueTests(TestCase):
+    """Testes dos dados de relatório de estoque agregados no banco (reports/dados.py)"""
+    
+    def setUp(self):
+        from cadastros.models import Produto
+        from estoque.models import Estoque, Location
+        
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_report_dados',
+                name='Tenant de Teste Dados',
+                is_active=True
+            )
+            Domain.objects.create(
+                domain='test-report-dados.localhost',
+                tenant=self.tenant,
+                is_primary=True
+            )
+        
+        with schema_context(self.tenant.schema_name):
+            self.empresa = Empresa.objects.create(
+                tenant=self.tenant,
+                nome='Empresa Dados',
+                razao_social='Empresa Dados LTDA',
+                cnpj='12345678000353',
+                is_active=True
+            )
+            locations = [
+                Location.objects.create(
+                    empresa=self.empresa,
+                    nome=nome,
+                    codigo=codigo,
+                    tipo='LOJA',
+                    logradouro='Rua Teste',
+                    numero='123',
+                    bairro='Centro',
+                    cidade='São Paulo',
+                    estado='SP',
+                    cep='01234-567',
+                    is_active=True
+                )
+                for nome, codigo in (('Armazém A', 'LOCA'), ('Loja B', 'LOCB'))
+            ]
+            produtos = [
+                Produto.objects.create(
+                    codigo_produto=codigo,
+                    nome=f'Produto {codigo}',
+                    ativo=True,
+                    unidade_medida='UN',
+                    valor_custo=Decimal('10.00'),
+                    valor_venda=Decimal('15.00'),
+                    codigo_ncm='12345678',
+                    origem_mercadoria='0',
+                    aliquota_icms=Decimal('18.00'),
+                    aliquota_ipi=Decimal('0.00')
+                )
+                for codigo in (1, 2)
+            ]
+            # (location, produto, quantidade, custo médio)
+            for location, produto, quantidade, custo in (
+                (locations[0], produtos[0], '10.000', '2.50'),
+                (locations[0], produtos[1], '4.000', '10.00'),
+                (locations[1], produtos[0], '3.000', '2.50'),
+                (locations[1], produtos[1], '0.000', '10.00'),  # Sem quantidade: fora do relatório
+            ):
+                Estoque.objects.create(
+                    produto=produto,
+                    location=location,
+                    empresa=self.empresa,
+                    quantidade_atual=Decimal(quantidade),
+                    valor_custo_medio=Decimal(custo)
+                )
+    
+    def _dados(self, tipo, filtros=None):
+        return obter_dados_relatorio(tipo, 'estoque', filtros or {}, self.tenant, self.empresa)
+    
+    def test_estoque_por_location(self):
+        """Valores, subtotais por location e total geral calculados no banco"""
+        with schema_context(self.tenant.schema_name):
+            with self.assertNumQueries(2):
+                dados = self._dados('estoque-por-location')
+        
+        self.assertEqual(dados['total_itens'], 3)
+        self.assertEqual(Decimal(dados['total_geral']), Decimal('72.50'))
+        self.assertEqual(
+            [(item['location_nome'], Decimal(item['total']), item['itens']) for item in dados['subtotais']],
+            [('Armazém A', Decimal('65.00'), 2), ('Loja B', Decimal('7.50'), 1)]
+        )
+        primeira = dados['dados'][0]
+        self.assertEqual(primeira['location_nome'], 'Armazém A')
+        self.assertEqual(Decimal(primeira['valor_total']), Decimal('25.00'))
+        self.assertEqual(Decimal(primeira['location_total']), Decimal('65.00'))
+        self.assertEqual(Decimal(dados['dados'][2]['location_total']), Decimal('7.50'))
+    
+    def test_estoque_consolidado_em_uma_consulta(self):
+        """O consolidado traz os dados do produto no GROUP BY (sem consulta por produto)"""
+        with schema_context(self.tenant.schema_name):
+            with self.assertNumQueries(1):
+                dados = self._dados('estoque-consolidado')
+        
+        self.assertEqual(
+            [(item['produto_nome'], Decimal(item['total_quantidade']), Decimal(item['total_valor']))
+             for item in dados['dados']],
+            [('Produto 1', Decimal('13.000'), Decimal('32.50')), ('Produto 2', Decimal('4.000'), Decimal('40.00'))]
+        )
+        self.assertEqual(Decimal(dados['total_geral']), Decimal('72.50'))
+    
+    def test_filtro_invalido(self):
+        with self.assertRaises(FiltroInvalido):
+            self._dados('estoque-por-location', {'location_id': 'abc'})
+    
+    def test_escopo_da_filial(self):
+        """Com filial, relatório e exportação só trazem as locations da filial e as sem filial"""
+        from estoque.models import Location
+        
+        with schema_context(self.tenant.schema_name):
+            filial_a = Filial.objects.create(empresa=self.empresa, nome='Filial A', codigo_filial='FA', is_active=True)
+            filial_b = Filial.objects.create(empresa=self.empresa, nome='Filial B', codigo_filial='FB', is_active=True)
+            Location.objects.filter(codigo='LOCB').update(filial=filial_b)
+            
+            dados = obter_dados_relatorio('estoque-por-location', 'estoque', {}, self.tenant, self.empresa, filial_a)
+            self.assertEqual([item['location_nome'] for item in dados['subtotais']], ['Armazém A'])
+            self.assertEqual(Decimal(dados['total_geral']), Decimal('65.00'))
+            
+            resposta = exportacao.exportar('estoque', 'estoque-por-location', 'csv', self.empresa, filial=filial_a)
+            conteudo = b''.join(resposta.streaming_content).decode('utf-8-sig')
+            self.assertIn('Armazém A', conteudo)
+            self.assertNotIn('Loja B', conteudo)
+            
+            dados = obter_dados_relatorio('estoque-por-location', 'estoque', {}, self.tenant, self.empresa, filial_b)
+            self.assertEqual(dados['total_itens'], 3)
+
+
+class PdfPartesTests(SimpleTestCase):
+    """Testes da divisão do PDF grande em partes (reports/pdf_paralelo.py)"""
+    
+    def _linhas(self, grupos):
+        return [{'location_id': grupo, 'item': i} for grupo, quantidade in grupos for i in range(quantidade)]
+    
+    def test_partes_sem_quebrar_grupos(self):
+        """As partes terminam em mudança de grupo; só grupos maiores que a parte são divididos"""
+        linhas = self._linhas([(1, 3), (2, 4), (3, 10), (4, 1), (5, 2)])
+        partes = pdf_paralelo.dividir(linhas, 5, 'location_id')
+        
+        self.assertEqual(
+            [[linha['location_id'] for linha in parte] for parte in partes],
+            [[1, 1, 1], [2, 2, 2, 2], [3] * 5, [3] * 5, [4, 5, 5]]
+        )
+        self.assertEqual([linha for parte in partes for linha in parte], linhas)
+    
+    def test_partes_sem_agrupamento(self):
+        partes = pdf_paralelo.dividir(self._linhas([(1, 12)]), 5)
+        self.assertEqual([len(parte) for parte in partes], [5, 5, 2])
@@ -2,7 +2,10 @@
 Configuração do Celery para tarefas assíncronas
 """
 import os
+import time
+
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
 from django.conf import settings
 
 # Configurar o módulo de settings do Django
@@ -16,6 +19,31 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-descobrir tarefas em todos os apps instalados
 app.autodiscover_tasks()
 
+# Início de cada task em execução (task_id -> perf_counter), para a métrica de duração
+_inicio_tasks = {}
+
+
+@task_prerun.connect
+def _marcar_inicio_task(task_id=None, **kwargs):
+    _inicio_tasks[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _registrar_duracao_task(task_id=None, task=None, state=None, **kwargs):
+    inicio = _inicio_tasks.pop(task_id, None)
+    if inicio is None:
+        return
+    from core.prometheus import registrar_task
+    registrar_task(getattr(task, 'name', 'desconhecida'), time.perf_counter() - inicio, state)
+
+
+@worker_process_shutdown.connect
+def _encerrar_metricas_processo(pid=None, **kwargs):
+    # Processo filho do prefork encerrado: liberar seus arquivos de métricas (PROMETHEUS_MULTIPROC_DIR)
+    from core.prometheus import processo_encerrado
+    processo_encerrado(pid or os.getpid())
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
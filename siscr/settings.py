@@ -193,6 +193,65 @@ CACHES = {
     }
 }
 
+# Cache de resolução de tenants (tenants/resolver.py), em segundos
+TENANT_RESOLVER_TTL = int(os.environ.get('TENANT_RESOLVER_TTL', '3600'))  # Cache compartilhado
+TENANT_RESOLVER_TTL_LOCAL = int(os.environ.get('TENANT_RESOLVER_TTL_LOCAL', '60'))  # LRU em processo
+TENANT_RESOLVER_TTL_NAO_ENCONTRADO = int(os.environ.get('TENANT_RESOLVER_TTL_NAO_ENCONTRADO', '30'))
+TENANT_RESOLVER_LRU_TAMANHO = int(os.environ.get('TENANT_RESOLVER_LRU_TAMANHO', '1024'))
+# Sem X-Tenant-Domain, rotear pelo claim tenant_schema só de tokens JWT válidos (assinatura/expiração)
+TENANT_JWT_VERIFICAR_TOKEN = os.environ.get('TENANT_JWT_VERIFICAR_TOKEN', 'True').lower() == 'true'
+# Cache do contexto do usuário (empresa/filial atuais, accounts/contexto.py), em segundos
+CONTEXTO_USUARIO_TTL = int(os.environ.get('CONTEXTO_USUARIO_TTL', '60'))
+# Cache de membership/permissões efetivas por usuário + tenant (accounts/acesso.py), em segundos
+ACESSO_TENANT_TTL = int(os.environ.get('ACESSO_TENANT_TTL', '300'))
+# Cache das matrizes de permissões de roles customizados (accounts/matriz_permissoes.py), em segundos
+MATRIZ_PERMISSOES_TTL = int(os.environ.get('MATRIZ_PERMISSOES_TTL', '3600'))
+# Intervalo (segundos) de envio das métricas agregadas em memória ao Redis (core/metrics.py)
+METRICS_FLUSH_INTERVALO = float(os.environ.get('METRICS_FLUSH_INTERVALO', '5'))
+# Token (Bearer) exigido em /api/metrics/prometheus/ (core/prometheus.py); vazio = só com DEBUG
+# Com vários workers, definir também a variável de ambiente PROMETHEUS_MULTIPROC_DIR
+PROMETHEUS_METRICS_TOKEN = os.environ.get('PROMETHEUS_METRICS_TOKEN', '')
+# Diretórios multiprocesso de outros serviços somados na exposição (ex.: o do worker do Celery), separados por vírgula
+PROMETHEUS_MULTIPROC_DIRS_EXTRAS = [
+    d.strip() for d in os.environ.get('PROMETHEUS_MULTIPROC_DIRS_EXTRAS', '').split(',') if d.strip()
+]
+# Profiler de SQL por fingerprint e schema (core/sql_profiler.py, manage.py sql_profile)
+SQL_PROFILER_ATIVO = os.environ.get('SQL_PROFILER_ATIVO', 'False').lower() == 'true'
+SQL_PROFILER_AMOSTRAGEM = float(os.environ.get('SQL_PROFILER_AMOSTRAGEM', '0.05'))  # Fração das requisições
+SQL_PROFILER_EXPLAIN_MS = float(os.environ.get('SQL_PROFILER_EXPLAIN_MS', '100'))  # Captura EXPLAIN acima disso
+SQL_PROFILER_EXPLAIN_INTERVALO = int(os.environ.get('SQL_PROFILER_EXPLAIN_INTERVALO', '3600'))  # Por fingerprint
+# Health checks (core/health.py): validade das probes em cache e idade máxima do heartbeat do Celery
+HEALTH_PROBES_TTL = int(os.environ.get('HEALTH_PROBES_TTL', '60'))
+HEALTH_CELERY_HEARTBEAT_MAX_IDADE = int(os.environ.get('HEALTH_CELERY_HEARTBEAT_MAX_IDADE', '180'))
+# Cache de templates/configurações de relatório (reports/cache.py), em segundos
+REPORTS_CACHE_TTL = int(os.environ.get('REPORTS_CACHE_TTL', '3600'))
+# Relatórios assíncronos (reports/jobs.py)
+# Armazenamento dos arquivos gerados: disco local por padrão; para S3/MinIO use um backend
+# compatível (ex.: 'storages.backends.s3boto3.S3Boto3Storage', do django-storages) com suas OPTIONS
+if os.environ.get('REPORTS_STORAGE_BACKEND'):
+    REPORTS_STORAGE = {'BACKEND': os.environ['REPORTS_STORAGE_BACKEND'], 'OPTIONS': {}}
+else:
+    REPORTS_STORAGE = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('REPORTS_STORAGE_DIR', str(BASE_DIR / 'media' / 'relatorios'))},
+    }
+REPORTS_MAX_JOBS_SIMULTANEOS = int(os.environ.get('REPORTS_MAX_JOBS_SIMULTANEOS', '2'))  # Por tenant, nos workers
+REPORTS_MAX_JOBS_PENDENTES = int(os.environ.get('REPORTS_MAX_JOBS_PENDENTES', '20'))  # Por tenant (429 acima disso)
+REPORTS_RESULTADO_TTL = int(os.environ.get('REPORTS_RESULTADO_TTL', '86400'))  # Segundos até o arquivo expirar
+REPORTS_DEDUP_JANELA = int(os.environ.get('REPORTS_DEDUP_JANELA', '300'))  # Reaproveitar job concluído há menos de N s
+REPORTS_JOB_TIMEOUT = int(os.environ.get('REPORTS_JOB_TIMEOUT', '900'))  # Segundos máximos de geração
+REPORTS_REAGENDAR_SEGUNDOS = int(os.environ.get('REPORTS_REAGENDAR_SEGUNDOS', '10'))  # Espera por vaga livre
+REPORTS_DEDUP_TRAVA_TTL = int(os.environ.get('REPORTS_DEDUP_TRAVA_TTL', '30'))  # Trava de pedidos idênticos simultâneos
+REPORTS_DEDUP_TRAVA_ESPERA = float(os.environ.get('REPORTS_DEDUP_TRAVA_ESPERA', '5'))  # Segundos esperando a trava
+# Exportação CSV/XLSX por streaming (reports/exportacao.py): linhas por busca no cursor do servidor
+REPORTS_EXPORT_CHUNK_SIZE = int(os.environ.get('REPORTS_EXPORT_CHUNK_SIZE', '2000'))
+# PDF grande (reports/pdf_paralelo.py): a partir de N linhas, renderizar em partes paralelas e concatenar
+REPORTS_PDF_PARTES_MIN_LINHAS = int(os.environ.get('REPORTS_PDF_PARTES_MIN_LINHAS', '2000'))
+REPORTS_PDF_LINHAS_POR_PARTE = int(os.environ.get('REPORTS_PDF_LINHAS_POR_PARTE', '500'))
+# 0 = quantidade de CPUs. Filhos do worker prefork do Celery (daemon) não criam processos: lá as
+# partes são renderizadas em sequência (ver reports/pdf_paralelo.py; worker com --pool threads paraleliza)
+REPORTS_PDF_PROCESSOS = int(os.environ.get('REPORTS_PDF_PROCESSOS', '0'))
+
 # ============================================
 # RATE LIMITING SETTINGS
 # ============================================
@@ -266,7 +325,7 @@ LOGIN_REDIRECT_URL = '/admin/'  # Redireciona para admin já que não há mais t
 # ============================================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',  # Reutiliza o token validado no middleware
         'rest_framework.authentication.SessionAuthentication',  # Para admin Django
     ),
     'DEFAULT_PERMISSION_CLASSES': [
@@ -300,7 +359,7 @@ SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
     'SCHEMA_PATH_PREFIX': '/api/',
     'AUTHENTICATION_WHITELIST': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
     'APPEND_COMPONENTS': {
         'securitySchemes': {
@@ -531,6 +590,16 @@ CELERY_ENABLE_UTC = True
 
 # Tarefas periódicas (Beat Schedule)
 CELERY_BEAT_SCHEDULE = {
+    # Heartbeat do Celery e probes de saúde lidas pelo readiness (core/health.py)
+    'atualizar-health': {
+        'task': 'core.tasks.atualizar_health',
+        'schedule': float(os.environ.get('HEALTH_PROBES_INTERVALO', '30')),
+    },
+    # Relatórios assíncronos: remover arquivos expirados (a cada 1 hora)
+    'limpar-relatorios-expirados': {
+        'task': 'reports.tasks.limpar_relatorios_expirados',
+        'schedule': 3600.0,
+    },
     'sync-subscriptions': {
         'task': 'subscriptions.tasks.sync_subscriptions_with_stripe',
         'schedule': 3600.0,  # A cada 1 hora
@@ -575,6 +644,26 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# Fan-out das tarefas periódicas por tenant (core/tenant_tasks.py)
+TENANT_FANOUT_MAX_PARALELO = int(os.environ.get('TENANT_FANOUT_MAX_PARALELO', '8'))
+TENANT_FANOUT_CACHE_TABELAS = int(os.environ.get('TENANT_FANOUT_CACHE_TABELAS', '600'))  # segundos
+
+# ============================================
+# ESTOQUE
+# ============================================
+# Reconciliação de quantidade_disponivel: True apenas mede a divergência (sem gravar)
+ESTOQUE_RECONCILIACAO_SOMENTE_RELATORIO = os.environ.get(
+    'ESTOQUE_RECONCILIACAO_SOMENTE_RELATORIO', 'False'
+).lower() == 'true'
+
+# Método de custeio do motor de custos (estoque/custos.py): MEDIO (médio ponderado) ou FIFO
+ESTOQUE_METODO_CUSTO = os.environ.get('ESTOQUE_METODO_CUSTO', 'MEDIO').upper()
+
+# Indicadores de estoque (estoque/indicadores.py): período em dias e dias sem saída
+# para considerar um produto parado (não deve exceder o período)
+ESTOQUE_INDICADORES_PERIODO_DIAS = int(os.environ.get('ESTOQUE_INDICADORES_PERIODO_DIAS', '90'))
+ESTOQUE_DIAS_PRODUTO_PARADO = int(os.environ.get('ESTOQUE_DIAS_PRODUTO_PARADO', '90'))
+
 # ============================================
 # LOGGING CONFIGURATION
 # ============================================
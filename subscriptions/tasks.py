@@ -5,7 +5,6 @@ import logging
 from celery import shared_task
 from django.utils import timezone
 from django.db import transaction
-from django.db import connection
 from django_tenants.utils import schema_context
 from datetime import timedelta
 import stripe
@@ -14,35 +13,38 @@ from django.conf import settings
 from .models import Subscription
 from .notifications import SubscriptionNotificationService
 from tenants.models import Tenant
+from core.tenant_tasks import disparar_por_tenant
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def sync_subscriptions_with_stripe():
-    """
-    Sincroniza assinaturas locais com o Stripe.
-    Executa a cada 1 hora como backup caso webhooks falhem.
-    """
-    logger.info("[CELERY] Iniciando sincronização de assinaturas com Stripe...")
-    
-    if settings.STRIPE_MODE == 'simulated':
-        logger.info("[CELERY] Modo simulado - pulando sincronização")
-        return
-    
+def _configurar_stripe():
+    """Configura a chave/versão da API do Stripe. Retorna False se não for possível."""
     try:
         stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY_TEST', '') or getattr(settings, 'STRIPE_SECRET_KEY', '')
         stripe.api_version = getattr(settings, 'STRIPE_API_VERSION', '2024-11-20.acacia')
+        return True
     except Exception as e:
         logger.error(f"[CELERY] Erro ao configurar Stripe: {str(e)}")
-        return
+        return False
+
+
+def _schemas_das_assinaturas(subscriptions):
+    """Schemas (distintos) dos tenants de um queryset de assinaturas"""
+    return sorted(set(subscriptions.values_list('tenant__schema_name', flat=True)))
+
+
+def _sincronizar_assinaturas_tenant(schema_name):
+    """Sincroniza com o Stripe as assinaturas de um tenant"""
+    if not _configurar_stripe():
+        return {'synced': 0, 'errors': 1}
     
     synced_count = 0
     error_count = 0
     
-    # Buscar todas as assinaturas ativas ou pending que têm payment_gateway_id
     with schema_context('public'):
         subscriptions = Subscription.objects.filter(
+            tenant__schema_name=schema_name,
             payment_gateway_id__isnull=False
         ).exclude(payment_gateway_id='').select_related('tenant', 'plan')
         
@@ -86,107 +88,111 @@ def sync_subscriptions_with_stripe():
                 )
                 error_count += 1
     
-    logger.info(
-        f"[CELERY] Sincronização concluída: {synced_count} assinaturas sincronizadas, "
-        f"{error_count} erros"
-    )
+    return {'synced': synced_count, 'errors': error_count}
 
 
 @shared_task
-def check_expiring_subscriptions():
+def sync_subscriptions_with_stripe():
     """
-    Verifica assinaturas que estão expirando em breve e envia notificações.
-    Executa uma vez por dia.
+    Sincroniza assinaturas locais com o Stripe.
+    Executa a cada 1 hora como backup caso webhooks falhem.
+    As chamadas ao Stripe são distribuídas por tenant entre os workers.
     """
-    logger.info("[CELERY] Verificando assinaturas expirando...")
+    logger.info("[CELERY] Iniciando sincronização de assinaturas com Stripe...")
     
-    notification_service = SubscriptionNotificationService()
+    if settings.STRIPE_MODE == 'simulated':
+        logger.info("[CELERY] Modo simulado - pulando sincronização")
+        return
     
-    # Verificar assinaturas que expiram em 7 dias
-    seven_days_from_now = timezone.now() + timedelta(days=7)
-    three_days_from_now = timezone.now() + timedelta(days=3)
-    one_day_from_now = timezone.now() + timedelta(days=1)
+    with schema_context('public'):
+        schemas = _schemas_das_assinaturas(
+            Subscription.objects.filter(payment_gateway_id__isnull=False).exclude(payment_gateway_id='')
+        )
+    
+    return disparar_por_tenant(
+        'Sincronização de assinaturas com Stripe',
+        'subscriptions.tasks._sincronizar_assinaturas_tenant',
+        schemas=schemas,
+    )
+
+
+# Janelas de aviso de expiração, da mais próxima para a mais distante
+DIAS_AVISO_EXPIRACAO = (1, 3, 7)
+
+
+def _notificar_expiracao_tenant(schema_name):
+    """Envia o aviso de expiração (7, 3 ou 1 dia) das assinaturas de um tenant"""
+    notification_service = SubscriptionNotificationService()
+    agora = timezone.now()
+    enviados = 0
+    errors = 0
     
     with schema_context('public'):
-        # Assinaturas expirando em 7 dias
-        expiring_7d = Subscription.objects.filter(
-            status__in=['active', 'trial'],
-            current_period_end__lte=seven_days_from_now,
-            current_period_end__gt=three_days_from_now,
-        ).select_related('tenant', 'plan')
-        
-        for subscription in expiring_7d:
-            try:
-                notification_service.send_expiring_notification(subscription, days=7)
-                logger.info(
-                    f"[CELERY] Notificação de expiração (7 dias) enviada para "
-                    f"tenant: {subscription.tenant.name}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"[CELERY] Erro ao enviar notificação de expiração (7 dias) "
-                    f"para tenant {subscription.tenant.name}: {str(e)}",
-                    exc_info=True
-                )
-        
-        # Assinaturas expirando em 3 dias
-        expiring_3d = Subscription.objects.filter(
-            status__in=['active', 'trial'],
-            current_period_end__lte=three_days_from_now,
-            current_period_end__gt=one_day_from_now,
-        ).select_related('tenant', 'plan')
-        
-        for subscription in expiring_3d:
-            try:
-                notification_service.send_expiring_notification(subscription, days=3)
-                logger.info(
-                    f"[CELERY] Notificação de expiração (3 dias) enviada para "
-                    f"tenant: {subscription.tenant.name}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"[CELERY] Erro ao enviar notificação de expiração (3 dias) "
-                    f"para tenant {subscription.tenant.name}: {str(e)}",
-                    exc_info=True
-                )
-        
-        # Assinaturas expirando em 1 dia
-        expiring_1d = Subscription.objects.filter(
+        subscriptions = Subscription.objects.filter(
+            tenant__schema_name=schema_name,
             status__in=['active', 'trial'],
-            current_period_end__lte=one_day_from_now,
-            current_period_end__gt=timezone.now(),
+            current_period_end__gt=agora,
+            current_period_end__lte=agora + timedelta(days=max(DIAS_AVISO_EXPIRACAO)),
         ).select_related('tenant', 'plan')
         
-        for subscription in expiring_1d:
+        for subscription in subscriptions:
+            # Menor janela que contém o fim do período (ex: expira em 2 dias -> aviso de 3 dias)
+            days = next(
+                dias for dias in DIAS_AVISO_EXPIRACAO
+                if subscription.current_period_end <= agora + timedelta(days=dias)
+            )
             try:
-                notification_service.send_expiring_notification(subscription, days=1)
+                notification_service.send_expiring_notification(subscription, days=days)
+                enviados += 1
                 logger.info(
-                    f"[CELERY] Notificação de expiração (1 dia) enviada para "
+                    f"[CELERY] Notificação de expiração ({days} dia(s)) enviada para "
                     f"tenant: {subscription.tenant.name}"
                 )
             except Exception as e:
+                errors += 1
                 logger.error(
-                    f"[CELERY] Erro ao enviar notificação de expiração (1 dia) "
+                    f"[CELERY] Erro ao enviar notificação de expiração ({days} dia(s)) "
                     f"para tenant {subscription.tenant.name}: {str(e)}",
                     exc_info=True
                 )
     
-    logger.info("[CELERY] Verificação de assinaturas expirando concluída")
+    return {'notified': enviados, 'errors': errors}
 
 
 @shared_task
-def suspend_expired_tenants():
+def check_expiring_subscriptions():
     """
-    Suspende tenants com assinaturas expiradas.
-    Executa a cada 1 hora.
+    Verifica assinaturas que estão expirando em breve e envia notificações.
+    Executa uma vez por dia.
     """
-    logger.info("[CELERY] Verificando tenants expirados para suspensão...")
+    logger.info("[CELERY] Verificando assinaturas expirando...")
     
+    agora = timezone.now()
+    with schema_context('public'):
+        schemas = _schemas_das_assinaturas(
+            Subscription.objects.filter(
+                status__in=['active', 'trial'],
+                current_period_end__gt=agora,
+                current_period_end__lte=agora + timedelta(days=max(DIAS_AVISO_EXPIRACAO)),
+            )
+        )
+    
+    return disparar_por_tenant(
+        'Verificação de assinaturas expirando',
+        'subscriptions.tasks._notificar_expiracao_tenant',
+        schemas=schemas,
+    )
+
+
+def _suspender_tenant_expirado(schema_name):
+    """Suspende o tenant se sua assinatura expirou"""
     suspended_count = 0
+    error_count = 0
     
     with schema_context('public'):
         # Buscar assinaturas expiradas que ainda não foram suspensas
         expired_subscriptions = Subscription.objects.filter(
+            tenant__schema_name=schema_name,
             current_period_end__lt=timezone.now(),
             status__in=['active', 'trial', 'past_due'],
         ).select_related('tenant', 'plan')
@@ -199,13 +205,14 @@ def suspend_expired_tenants():
                 if not tenant.is_active:
                     continue
                 
-                # Suspender tenant
-                tenant.is_active = False
-                tenant.save()
-                
-                # Atualizar status da assinatura
-                subscription.status = 'expired'
-                subscription.save()
+                with transaction.atomic():
+                    # Suspender tenant
+                    tenant.is_active = False
+                    tenant.save()
+                    
+                    # Atualizar status da assinatura
+                    subscription.status = 'expired'
+                    subscription.save()
                 
                 # Enviar notificação
                 notification_service = SubscriptionNotificationService()
@@ -221,8 +228,33 @@ def suspend_expired_tenants():
                     f"[CELERY] Erro ao suspender tenant {subscription.tenant.name}: {str(e)}",
                     exc_info=True
                 )
+                error_count += 1
     
-    logger.info(f"[CELERY] Suspensão concluída: {suspended_count} tenants suspensos")
+    return {'suspended': suspended_count, 'errors': error_count}
+
+
+@shared_task
+def suspend_expired_tenants():
+    """
+    Suspende tenants com assinaturas expiradas.
+    Executa a cada 1 hora.
+    """
+    logger.info("[CELERY] Verificando tenants expirados para suspensão...")
+    
+    with schema_context('public'):
+        schemas = _schemas_das_assinaturas(
+            Subscription.objects.filter(
+                current_period_end__lt=timezone.now(),
+                status__in=['active', 'trial', 'past_due'],
+                tenant__is_active=True,
+            )
+        )
+    
+    return disparar_por_tenant(
+        'Suspensão de tenants expirados',
+        'subscriptions.tasks._suspender_tenant_expirado',
+        schemas=schemas,
+    )
 
 
 @shared_task
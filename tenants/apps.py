@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TenantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tenants'
+
+    def ready(self):
+        # Invalidação do cache de resolução de tenant (signals de Domain/Tenant)
+        from . import resolver  # noqa: F401
@@ -0,0 +1,71 @@
+"""
+Comando Django para medir o custo dos middlewares de tenant por requisição
+Uso: python manage.py benchmark_tenant_middleware <dominio> [--requisicoes 1000] [--frio]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from siscr.middleware import (
+    CustomTenantMainMiddleware,
+    PreserveTenantURLsMiddleware,
+    TenantDomainHeaderMiddleware,
+)
+from tenants import resolver
+
+
+class Command(BaseCommand):
+    help = 'Mede tempo e consultas por requisição dos middlewares de tenant (header X-Tenant-Domain)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'dominio',
+            type=str,
+            help='Domínio do tenant enviado no header X-Tenant-Domain'
+        )
+        parser.add_argument(
+            '--requisicoes',
+            type=int,
+            default=1000,
+            help='Quantidade de requisições simuladas (padrão: 1000)'
+        )
+        parser.add_argument(
+            '--frio',
+            action='store_true',
+            help='Esvaziar o cache local do resolvedor a cada requisição (mede o cache compartilhado)'
+        )
+
+    def handle(self, *args, **options):
+        dominio = options['dominio']
+        total = max(1, options['requisicoes'])
+        
+        if resolver.resolver_por_dominio(dominio) is None:
+            self.stdout.write(self.style.ERROR(f'❌ Domínio "{dominio}" não encontrado!'))
+            return
+        
+        # Mesma ordem de settings.MIDDLEWARE
+        cadeia = PreserveTenantURLsMiddleware(lambda request: HttpResponse())
+        cadeia = CustomTenantMainMiddleware(cadeia)
+        cadeia = TenantDomainHeaderMiddleware(cadeia)
+        factory = RequestFactory()
+        
+        # Aquecimento (preenche os caches)
+        cadeia(factory.get('/api/health/', HTTP_X_TENANT_DOMAIN=dominio))
+        
+        reset_queries()
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            for _ in range(total):
+                if options['frio']:
+                    resolver.limpar_cache_local()
+                cadeia(factory.get('/api/health/', HTTP_X_TENANT_DOMAIN=dominio))
+            duracao = time.perf_counter() - inicio
+        connection.set_schema_to_public()
+        
+        self.stdout.write(f'Requisições: {total}')
+        self.stdout.write(f'Tempo médio: {duracao / total * 1_000_000:.1f} µs/requisição')
+        self.stdout.write(f'Consultas: {len(consultas)} ({len(consultas) / total:.3f}/requisição)')
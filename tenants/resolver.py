@@ -0,0 +1,198 @@
+"""
+Resolução de tenant com cache (domínio/schema -> Tenant).
+
+Usado pelos middlewares de tenant (siscr/middleware.py) em toda requisição:
+
+1. LRU em processo (sem I/O), com TTL curto (TENANT_RESOLVER_TTL_LOCAL)
+2. Cache compartilhado (Redis), com TTL longo (TENANT_RESOLVER_TTL)
+3. Banco (schema public), apenas quando os dois caches falham
+
+Os caches são invalidados por signals de Domain e Tenant (save/delete). O LRU
+dos outros processos expira pelo TTL local; o cache compartilhado é apagado na
+hora. Domínios inexistentes também ficam em cache (por pouco tempo), para que
+hosts inválidos não consultem o banco a cada requisição.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django_tenants.utils import schema_context
+
+from core.prometheus import registrar_cache
+
+from .models import Domain, Tenant
+
+logger = logging.getLogger(__name__)
+
+# Marca de "não encontrado" no cache compartilhado
+_NAO_ENCONTRADO = '__nao_encontrado__'
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class _LRU:
+    """LRU em processo com TTL por entrada (thread-safe)"""
+
+    def __init__(self):
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > _config('TENANT_RESOLVER_LRU_TAMANHO', 1024):
+                self._itens.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+
+_lru = _LRU()
+
+
+def _serializar(tenant):
+    """Valores dos campos do Tenant (o cache compartilhado não guarda a instância)"""
+    return {campo.attname: getattr(tenant, campo.attname) for campo in Tenant._meta.concrete_fields}
+
+
+def _instanciar(dados):
+    tenant = Tenant(**dados)
+    tenant._state.adding = False
+    tenant._state.db = 'default'
+    return tenant
+
+
+def _resolver(chave, buscar):
+    """
+    Busca na ordem LRU -> cache compartilhado -> banco.
+
+    Returns:
+        Tenant ou None
+    """
+    dados = _lru.get(chave)
+    registrar_cache('tenant_resolver_local', dados is not None)
+    if dados is None:
+        try:
+            dados = cache.get(chave)
+        except Exception as e:
+            logger.warning(f'[TenantResolver] Cache indisponível: {e}')
+            dados = None
+
+        registrar_cache('tenant_resolver', dados is not None)
+        if dados is None:
+            with schema_context('public'):
+                tenant = buscar()
+            dados = _serializar(tenant) if tenant is not None else _NAO_ENCONTRADO
+            ttl = _config('TENANT_RESOLVER_TTL', 3600) if tenant is not None else _config('TENANT_RESOLVER_TTL_NAO_ENCONTRADO', 30)
+            try:
+                cache.set(chave, dados, ttl)
+            except Exception as e:
+                logger.warning(f'[TenantResolver] Cache indisponível: {e}')
+
+        ttl_local = _config('TENANT_RESOLVER_TTL_LOCAL', 60)
+        if dados == _NAO_ENCONTRADO:
+            ttl_local = min(ttl_local, _config('TENANT_RESOLVER_TTL_NAO_ENCONTRADO', 30))
+        _lru.set(chave, dados, ttl_local)
+
+    if dados == _NAO_ENCONTRADO:
+        return None
+    # Instância nova a cada requisição: alterações em request.tenant não vazam para o cache
+    return _instanciar(dados)
+
+
+def _chave_dominio(dominio):
+    return f'tenant_resolver:dominio:{dominio}'
+
+
+def _chave_schema(schema_name):
+    return f'tenant_resolver:schema:{schema_name}'
+
+
+def resolver_por_dominio(dominio):
+    """Tenant do domínio (Domain.domain), ou None se não existir"""
+    def buscar():
+        domain = Domain.objects.select_related('tenant').filter(domain=dominio).first()
+        return domain.tenant if domain else None
+    return _resolver(_chave_dominio(dominio), buscar)
+
+
+def resolver_por_schema(schema_name):
+    """Tenant pelo schema_name, ou None se não existir"""
+    def buscar():
+        return Tenant.objects.filter(schema_name=schema_name).first()
+    return _resolver(_chave_schema(schema_name), buscar)
+
+
+def invalidar(dominios=(), schemas=()):
+    """Remove domínios/schemas dos caches (local e compartilhado)"""
+    chaves = [_chave_dominio(d) for d in dominios if d] + [_chave_schema(s) for s in schemas if s]
+    for chave in chaves:
+        _lru.delete(chave)
+    try:
+        cache.delete_many(chaves)
+    except Exception as e:
+        logger.warning(f'[TenantResolver] Erro ao invalidar cache: {e}')
+
+
+def limpar_cache_local():
+    """Esvazia o LRU do processo (testes/benchmark)"""
+    _lru.clear()
+
+
+def _invalidar_tenant(tenant):
+    with schema_context('public'):
+        dominios = list(Domain.objects.filter(tenant_id=tenant.pk).values_list('domain', flat=True))
+    invalidar(dominios=dominios, schemas=[tenant.schema_name])
+
+
+@receiver(pre_save, sender=Domain)
+def _guardar_dominio_anterior(sender, instance, **kwargs):
+    """Guarda o domínio anterior para invalidar também o nome antigo (renomeação)"""
+    if instance.pk:
+        instance._dominio_anterior = (
+            Domain.objects.filter(pk=instance.pk).values_list('domain', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def _invalidar_dominio(sender, instance, **kwargs):
+    invalidar(
+        dominios=[instance.domain, getattr(instance, '_dominio_anterior', None)],
+        schemas=[],
+    )
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def _invalidar_tenant_alterado(sender, instance, **kwargs):
+    try:
+        _invalidar_tenant(instance)
+    except Exception:
+        # Tenant excluído: os domínios já foram removidos em cascata
+        invalidar(schemas=[instance.schema_name])
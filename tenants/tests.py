@@ -1,3 +1,78 @@
-from django.test import TestCase
+"""
+Testes para resolução de tenants
+"""
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django_tenants.utils import schema_context
 
-# Create your tests here.
+from siscr.middleware import TenantDomainHeaderMiddleware
+from tenants import resolver
+from tenants.models import Tenant, Domain
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+class TenantResolverTests(TestCase):
+    """Testes do resolvedor de tenants com cache"""
+    
+    def setUp(self):
+        resolver.limpar_cache_local()
+        with schema_context('public'):
+            self.tenant = Tenant.objects.create(
+                schema_name='test_tenant',
+                name='Tenant de Teste',
+                is_active=True
+            )
+            self.domain = Domain.objects.create(
+                domain='test.localhost',
+                tenant=self.tenant,
+                is_primary=True
+            )
+        self.factory = RequestFactory()
+        self.middleware = TenantDomainHeaderMiddleware(lambda request: HttpResponse())
+    
+    def tearDown(self):
+        resolver.limpar_cache_local()
+        connection.set_schema_to_public()
+    
+    def test_requisicao_com_cache_nao_consulta_banco(self):
+        """Com o tenant em cache, o middleware não faz nenhuma consulta"""
+        self.middleware(self.factory.get('/api/health/', HTTP_X_TENANT_DOMAIN='test.localhost'))
+        
+        request = self.factory.get('/api/health/', HTTP_X_TENANT_DOMAIN='test.localhost')
+        with self.assertNumQueries(0):
+            self.middleware(request)
+        self.assertEqual(request.tenant.schema_name, 'test_tenant')
+        self.assertTrue(request._tenant_identified_by_header)
+        
+        # Só o cache compartilhado (outro processo): também sem consultas
+        resolver.limpar_cache_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolver_por_dominio('test.localhost').pk, self.tenant.pk)
+    
+    def test_dominio_inexistente_em_cache(self):
+        """Domínio inexistente consulta o banco uma vez e fica em cache negativo"""
+        self.assertIsNone(resolver.resolver_por_dominio('nao-existe.localhost'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolver.resolver_por_dominio('nao-existe.localhost'))
+    
+    def test_invalidacao_ao_alterar_dominio_e_tenant(self):
+        """Signals de Domain e Tenant invalidam o cache"""
+        self.assertIsNotNone(resolver.resolver_por_dominio('test.localhost'))
+        self.assertEqual(resolver.resolver_por_schema('test_tenant').name, 'Tenant de Teste')
+        
+        with schema_context('public'):
+            self.domain.domain = 'novo.localhost'
+            self.domain.save()
+            self.tenant.name = 'Tenant Renomeado'
+            self.tenant.save()
+        
+        self.assertIsNone(resolver.resolver_por_dominio('test.localhost'))
+        self.assertEqual(resolver.resolver_por_dominio('novo.localhost').pk, self.tenant.pk)
+        self.assertEqual(resolver.resolver_por_schema('test_tenant').name, 'Tenant Renomeado')